@@ -0,0 +1,428 @@
+"""
+Leave analytics for quarterly planning (GET /leave-requests/analytics):
+absence rate, distribution by month and weekday, approval latency and top
+reasons over the whole leave_requests history.
+
+LeaveColumns keeps the leave requests as columnar NumPy arrays - dates as
+datetime64, status / type / reason as small integer codes - and follows
+the writes of every worker through the change log (the revisions behind
+?since=, see changes.ChangeFollower): a status change rewrites one row
+in place, new requests are appended a page at a time, deleted ones are
+masked out (and compacted away once they are a quarter of the rows). The
+dicts are read from storage once per process, not on every report.
+
+report() computes the aggregates with vectorized operations only.
+reference_report() computes the same report row by row in pure Python,
+for parity checks.
+"""
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import statistics
+import threading
+
+import numpy as np
+from tinydb.table import Document
+
+from changes import ChangeFollower, ChangeLog
+from storage import StorageEngine, StorageTable
+
+
+STATUSES = ('pending', 'approved', 'rejected')
+TYPES = ('absence', 'conge')
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+LATENCY_PERCENTILES = (50, 90)
+
+_STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+_TYPE_CODES = {type: code for code, type in enumerate(TYPES)}
+_HOUR = np.timedelta64(3600, 's')
+
+
+def normalize_reason(reason) -> str:
+    """Reasons are grouped case and whitespace insensitively."""
+    return ' '.join(str(reason or '').split()).lower()
+
+
+def _dates(values: List[Optional[str]], unit: str) -> np.ndarray:
+    """ISO strings -> datetime64[unit], NaT for missing or invalid ones."""
+    try:
+        return np.array(values, dtype=f'datetime64[{unit}]')
+    except ValueError:
+        result = np.empty(len(values), dtype=f'datetime64[{unit}]')
+        for index, value in enumerate(values):
+            try:
+                result[index] = np.datetime64(value, unit)
+            except (ValueError, TypeError):
+                result[index] = np.datetime64('NaT')
+        return result
+
+
+class LeaveColumns(ChangeFollower):
+    """Columnar copy of a leave requests table, kept up to date."""
+
+    # New rows are appended a page at a time
+    CATCH_UP_PAGE = 20000
+
+    COLUMNS = {
+        'type': np.int8, 'status': np.int8, 'reason': np.int32, 'days': np.int32,
+        'start': 'datetime64[D]', 'end': 'datetime64[D]',
+        'created': 'datetime64[us]', 'updated': 'datetime64[us]', 'live': np.bool_
+    }
+
+    def __init__(self, engine: StorageEngine, table: StorageTable, change_log: ChangeLog):
+        self.lock = threading.Lock()
+        super().__init__(engine, table, change_log)
+
+    def _reset(self):
+        super()._reset()
+        self.columns: Dict[str, np.ndarray] = {
+            name: np.empty(0, dtype=dtype) for name, dtype in self.COLUMNS.items()
+        }
+        self.reasons: List[str] = []
+        self._reason_codes: Dict[str, int] = {}
+        self._rows: Dict[int, int] = {}
+        self._size = 0
+
+    def catch_up(self):
+        """Apply the changes committed (by any worker) since the last call. Hold `lock`."""
+        super().catch_up()
+        if self._size - len(self._rows) > max(1024, self._size // 4):
+            self._compact()
+
+    def _apply(self, changes: List[Tuple[int, Optional[Document]]]):
+        new = []
+        for doc_id, document in changes:
+            row = self._rows.get(doc_id)
+            if document is None:
+                if row is not None:
+                    self.columns['live'][row] = False
+                    del self._rows[doc_id]
+            elif row is not None:
+                self._write(row, self._encode([document]))
+            else:
+                new.append(document)
+        self.append(new)
+
+    def _encode(self, documents: List[dict]) -> Dict[str, np.ndarray]:
+        """Column values of some documents."""
+        reasons = []
+        for document in documents:
+            reason = normalize_reason(document.get('reason'))
+            code = self._reason_codes.get(reason)
+            if code is None:
+                code = self._reason_codes[reason] = len(self.reasons)
+                self.reasons.append(reason)
+            reasons.append(code)
+        return {
+            'type': np.array([_TYPE_CODES.get(d.get('type'), -1) for d in documents], dtype=np.int8),
+            'status': np.array([_STATUS_CODES.get(d.get('status'), -1) for d in documents], dtype=np.int8),
+            'reason': np.array(reasons, dtype=np.int32),
+            'days': np.array([d.get('days_count') or 0 for d in documents], dtype=np.int32),
+            'start': _dates([d.get('start_date') for d in documents], 'D'),
+            'end': _dates([d.get('end_date') for d in documents], 'D'),
+            'created': _dates([d.get('created_at') for d in documents], 'us'),
+            'updated': _dates([d.get('updated_at') for d in documents], 'us'),
+            'live': np.ones(len(documents), dtype=np.bool_)
+        }
+
+    def _write(self, row: int, values: Dict[str, np.ndarray]):
+        for name, column in self.columns.items():
+            column[row] = values[name][0]
+
+    def append(self, documents: List[dict]):
+        """Add new documents (doc_id -> row), growing the arrays geometrically."""
+        if not documents:
+            return
+        values = self._encode(documents)
+        size = self._size + len(documents)
+        capacity = len(self.columns['live'])
+        if size > capacity:
+            capacity = max(size, capacity * 2)
+            for name, column in self.columns.items():
+                grown = np.zeros(capacity, dtype=column.dtype)
+                grown[:self._size] = column[:self._size]
+                self.columns[name] = grown
+        for name, column in self.columns.items():
+            column[self._size:size] = values[name]
+        for row, document in enumerate(documents, self._size):
+            self._rows[document.doc_id] = row
+        self._size = size
+
+    def _compact(self):
+        """Drop the rows of deleted documents."""
+        live = self.columns['live'][:self._size]
+        new_rows = np.cumsum(live) - 1
+        self.columns = {name: column[:self._size][live] for name, column in self.columns.items()}
+        self._rows = {doc_id: int(new_rows[row]) for doc_id, row in self._rows.items()}
+        self._size = len(self.columns['live'])
+
+    def view(self) -> Dict[str, np.ndarray]:
+        """Live rows, column by column. Hold `lock` while using them."""
+        if len(self._rows) == self._size:
+            # Nothing deleted: slices, no copy
+            return {name: column[:self._size] for name, column in self.columns.items() if name != 'live'}
+        live = self.columns['live'][:self._size]
+        return {name: column[:self._size][live] for name, column in self.columns.items() if name != 'live'}
+
+
+def report(columns: Dict[str, np.ndarray], reasons: List[str], employees: int,
+           first_day: Optional[str] = None, last_day: Optional[str] = None, top: int = 10) -> dict:
+    """Vectorized aggregates of the leave requests starting in [first_day, last_day]."""
+    start, end = columns['start'], columns['end']
+    selected = ~np.isnat(start)
+    skipped = int(np.count_nonzero(~selected))
+    if first_day is not None:
+        selected &= start >= np.datetime64(first_day, 'D')
+    if last_day is not None:
+        selected &= start <= np.datetime64(last_day, 'D')
+    start, end = start[selected], end[selected]
+    type, status, days = columns['type'][selected], columns['status'][selected], columns['days'][selected]
+    approved = status == _STATUS_CODES['approved']
+
+    # Period: the requested one, else the span of the selected requests
+    if first_day is not None:
+        period_start = np.datetime64(first_day, 'D')
+    else:
+        period_start = start.min() if len(start) else None
+    if last_day is not None:
+        period_end = np.datetime64(last_day, 'D')
+    else:
+        valid_end = end[~np.isnat(end)]
+        period_end = max(start.max(), valid_end.max()) if len(valid_end) else (start.max() if len(start) else None)
+    working_days = (
+        int(np.busday_count(period_start, period_end + np.timedelta64(1, 'D')))
+        if period_start is not None and period_end is not None and period_end >= period_start else 0
+    )
+    capacity = employees * working_days
+
+    by_status = {
+        name: {'requests': int(np.count_nonzero(status == code)), 'days': int(days[status == code].sum())}
+        for name, code in _STATUS_CODES.items()
+    }
+    by_type = {}
+    for name, code in _TYPE_CODES.items():
+        mask = type == code
+        approved_days = int(days[mask & approved].sum())
+        by_type[name] = {
+            'requests': int(np.count_nonzero(mask)),
+            'days': int(days[mask].sum()),
+            'approved_days': approved_days,
+            'absence_rate': approved_days / capacity if capacity else 0.0
+        }
+    approved_days = int(days[approved].sum())
+
+    # By month of the start date
+    # (months counted from the first one: a bincount instead of sorting the rows)
+    month_number = start.astype('datetime64[M]').astype(np.int64)
+    first_month = int(month_number.min()) if len(month_number) else 0
+    month_index = month_number - first_month
+    month_requests = np.bincount(month_index)
+    month_days = np.bincount(month_index, weights=days, minlength=len(month_requests))
+    month_approved = np.bincount(month_index, weights=np.where(approved, days, 0), minlength=len(month_requests))
+    by_month = [
+        {
+            'month': str(np.datetime64(first_month + int(offset), 'M')),
+            'requests': int(month_requests[offset]),
+            'days': int(month_days[offset]),
+            'approved_days': int(month_approved[offset])
+        }
+        for offset in np.flatnonzero(month_requests)
+    ]
+
+    # By weekday: requests starting on it, and approved days off falling on it
+    start_weekday = (start.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+    starts = np.bincount(start_weekday, minlength=7)
+    spans = approved & ~np.isnat(end) & (end >= start)
+    first_weekday = start_weekday[spans]
+    length = (end[spans] - start[spans]).astype(np.int64) + 1
+    # Every full week gives one day to each weekday; the remaining r < 7 days
+    # go to the r weekdays from the first one: count the (first weekday, r) pairs
+    full_weeks = int((length // 7).sum())
+    pairs = np.bincount(first_weekday * 7 + length % 7, minlength=49).reshape(7, 7)
+    weekday = np.arange(7)
+    covers = (weekday[None, :, None] - weekday[:, None, None]) % 7 < weekday[None, None, :]
+    days_off = [full_weeks + int(count) for count in (pairs[:, None, :] * covers).sum(axis=(0, 2))]
+    by_weekday = [
+        {'weekday': name, 'starts': int(starts[index]), 'days_off': days_off[index]}
+        for index, name in enumerate(WEEKDAYS)
+    ]
+
+    # Approval latency of the decided requests
+    created, updated = columns['created'][selected], columns['updated'][selected]
+    decided = (status != _STATUS_CODES['pending']) & (status >= 0) & ~np.isnat(created) & ~np.isnat(updated)
+    latency = (updated[decided] - created[decided]) / _HOUR
+    latency_status = status[decided]
+    approval_latency = _latency(latency)
+    approval_latency['by_status'] = {
+        name: _latency(latency[latency_status == _STATUS_CODES[name]]) for name in ('approved', 'rejected')
+    }
+
+    # Top reasons: most frequent first, ties by reason
+    counts = np.bincount(columns['reason'][selected], minlength=len(reasons))
+    candidates = np.flatnonzero(counts)
+    if len(candidates) > top > 0:
+        threshold = np.partition(counts[candidates], len(candidates) - top)[len(candidates) - top]
+        candidates = candidates[counts[candidates] >= threshold]
+    ranked = sorted(candidates.tolist(), key=lambda code: (-counts[code], reasons[code]))[:top]
+    top_reasons = [{'reason': reasons[code], 'requests': int(counts[code])} for code in ranked]
+
+    return {
+        'period': {
+            'from': str(period_start) if period_start is not None else None,
+            'to': str(period_end) if period_end is not None else None,
+            'working_days': working_days
+        },
+        'requests': int(len(start)),
+        'skipped_invalid_dates': skipped,
+        'absence_rate': {
+            'employees': employees,
+            'approved_days': approved_days,
+            'rate': approved_days / capacity if capacity else 0.0
+        },
+        'by_status': by_status,
+        'by_type': by_type,
+        'by_month': by_month,
+        'by_weekday': by_weekday,
+        'approval_latency_hours': approval_latency,
+        'top_reasons': top_reasons
+    }
+
+
+def _latency(hours: np.ndarray) -> dict:
+    if not len(hours):
+        return {'decided': 0, 'mean': None, 'max': None, **{f'p{q}': None for q in LATENCY_PERCENTILES}}
+    percentiles = np.percentile(hours, LATENCY_PERCENTILES)
+    return {
+        'decided': int(len(hours)),
+        'mean': float(hours.mean()),
+        'max': float(hours.max()),
+        **{f'p{q}': float(value) for q, value in zip(LATENCY_PERCENTILES, percentiles)}
+    }
+
+
+# ==================== PURE PYTHON REFERENCE ====================
+
+def _day(value) -> Optional[date]:
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _instant(value) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """Linear interpolation between closest ranks (numpy's default)."""
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def _reference_latency(hours: List[float]) -> dict:
+    if not hours:
+        return {'decided': 0, 'mean': None, 'max': None, **{f'p{q}': None for q in LATENCY_PERCENTILES}}
+    return {
+        'decided': len(hours),
+        'mean': statistics.fmean(hours),
+        'max': max(hours),
+        **{f'p{q}': _percentile(hours, q) for q in LATENCY_PERCENTILES}
+    }
+
+
+def reference_report(requests: Iterable[dict], employees: int, first_day: Optional[str] = None,
+                     last_day: Optional[str] = None, top: int = 10) -> dict:
+    """report(), row by row over the documents (parity checks)."""
+    first = date.fromisoformat(first_day) if first_day is not None else None
+    last = date.fromisoformat(last_day) if last_day is not None else None
+    selected, skipped = [], 0
+    for request in requests:
+        start = _day(request.get('start_date'))
+        if start is None:
+            skipped += 1
+        elif (first is None or start >= first) and (last is None or start <= last):
+            selected.append((request, start, _day(request.get('end_date'))))
+
+    period_start = first if first is not None else min((start for _, start, _ in selected), default=None)
+    if last is not None:
+        period_end = last
+    else:
+        ends = [end for _, _, end in selected if end is not None]
+        period_end = max([start for _, start, _ in selected] + ends) if ends else (
+            max((start for _, start, _ in selected), default=None))
+    working_days = 0
+    if period_start is not None and period_end is not None and period_end >= period_start:
+        working_days = sum(
+            1 for ordinal in range(period_start.toordinal(), period_end.toordinal() + 1)
+            if date.fromordinal(ordinal).weekday() < 5
+        )
+    capacity = employees * working_days
+
+    by_status = {name: {'requests': 0, 'days': 0} for name in STATUSES}
+    by_type = {name: {'requests': 0, 'days': 0, 'approved_days': 0} for name in TYPES}
+    by_month: Dict[str, dict] = {}
+    starts, days_off = [0] * 7, [0] * 7
+    latencies: Dict[str, List[float]] = {'approved': [], 'rejected': []}
+    reasons: Dict[str, int] = {}
+    approved_days = 0
+    for request, start, end in selected:
+        days = request.get('days_count') or 0
+        status = request.get('status')
+        approved = status == 'approved'
+        if status in by_status:
+            by_status[status]['requests'] += 1
+            by_status[status]['days'] += days
+        if request.get('type') in by_type:
+            counters = by_type[request['type']]
+            counters['requests'] += 1
+            counters['days'] += days
+            counters['approved_days'] += days if approved else 0
+        if approved:
+            approved_days += days
+        month = by_month.setdefault(start.strftime('%Y-%m'), {'requests': 0, 'days': 0, 'approved_days': 0})
+        month['requests'] += 1
+        month['days'] += days
+        month['approved_days'] += days if approved else 0
+        starts[start.weekday()] += 1
+        if approved and end is not None and end >= start:
+            for ordinal in range(start.toordinal(), end.toordinal() + 1):
+                days_off[date.fromordinal(ordinal).weekday()] += 1
+        created, updated = _instant(request.get('created_at')), _instant(request.get('updated_at'))
+        if status in latencies and created is not None and updated is not None:
+            latencies[status].append((updated - created).total_seconds() / 3600)
+        reason = normalize_reason(request.get('reason'))
+        reasons[reason] = reasons.get(reason, 0) + 1
+
+    for counters in by_type.values():
+        counters['absence_rate'] = counters['approved_days'] / capacity if capacity else 0.0
+    ranked = sorted(reasons, key=lambda reason: (-reasons[reason], reason))[:top]
+    approval_latency = _reference_latency(latencies['approved'] + latencies['rejected'])
+    approval_latency['by_status'] = {status: _reference_latency(hours) for status, hours in latencies.items()}
+    return {
+        'period': {
+            'from': period_start.isoformat() if period_start is not None else None,
+            'to': period_end.isoformat() if period_end is not None else None,
+            'working_days': working_days
+        },
+        'requests': len(selected),
+        'skipped_invalid_dates': skipped,
+        'absence_rate': {
+            'employees': employees,
+            'approved_days': approved_days,
+            'rate': approved_days / capacity if capacity else 0.0
+        },
+        'by_status': by_status,
+        'by_type': by_type,
+        'by_month': [{'month': month, **by_month[month]} for month in sorted(by_month)],
+        'by_weekday': [
+            {'weekday': name, 'starts': starts[index], 'days_off': days_off[index]}
+            for index, name in enumerate(WEEKDAYS)
+        ],
+        'approval_latency_hours': approval_latency,
+        'top_reasons': [{'reason': reason, 'requests': reasons[reason]} for reason in ranked]
+    }
@@ -0,0 +1,148 @@
+"""
+Group commit for Database writes.
+
+At shift start hundreds of logins arrive together and each one performs
+several writes (login attempts, OTP storage, OTP removal). WriteBatcher
+keeps a single engine transaction open for a short window: every mutation
+arriving meanwhile joins it, and the whole batch is flushed once. Callers
+return only after the flush covering their write succeeded. Each write runs
+in a savepoint of the batch: one that fails is undone alone, the others
+are still committed.
+"""
+from typing import Callable, Optional, TypeVar
+import threading
+import time
+
+from storage import StorageEngine
+
+
+T = TypeVar('T')
+
+
+class _Batch:
+    def __init__(self):
+        self.size = 0
+        self.opened_at = time.perf_counter()
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+class WriteBatcher:
+    """Coalesces writes arriving within `window_ms` into one flush."""
+
+    def __init__(self, engine: StorageEngine, window_ms: float, max_size: int):
+        self._engine = engine
+        self._window = window_ms / 1000
+        self._max_size = max_size
+        self._local = threading.local()
+        self._batch: Optional[_Batch] = None
+        self._wakeup = threading.Event()
+        self._closed = False
+
+        # Metrics
+        self._batches = 0
+        self._writes = 0
+        self._max_batch_size = 0
+        self._last_batch_size = 0
+        self._total_flush_time = 0.0
+        self._max_flush_time = 0.0
+        self._total_batch_latency = 0.0
+
+        self._flusher = None
+        if self.enabled:
+            self._flusher = threading.Thread(target=self._flush_loop, name='db-write-batcher', daemon=True)
+            self._flusher.start()
+
+    @property
+    def enabled(self) -> bool:
+        return self._window > 0
+
+    def run(self, operation: Callable[[], T]) -> T:
+        """Execute a write operation and return once it is durable."""
+        if not self.enabled or getattr(self._local, 'active', False):
+            # Batching disabled, or a write nested in another one: the
+            # outer operation already waits for the flush.
+            with self._engine.savepoint():
+                return operation()
+
+        self._local.active = True
+        try:
+            with self._engine.lock:
+                batch = self._batch
+                if batch is None:
+                    batch = self._batch = _Batch()
+                    self._engine.begin()
+                    self._wakeup.set()
+                with self._engine.savepoint():
+                    result = operation()
+                batch.size += 1
+                if batch.size >= self._max_size:
+                    self._flush(batch)
+        finally:
+            self._local.active = False
+
+        batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+        return result
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._closed:
+                return
+            # Let concurrent writers join the batch
+            time.sleep(self._window)
+            with self._engine.lock:
+                if self._batch is not None:
+                    self._flush(self._batch)
+
+    def _flush(self, batch: _Batch):
+        """Commit the open batch. Called with the engine lock held."""
+        started = time.perf_counter()
+        try:
+            self._engine.commit()
+        except BaseException as exc:
+            batch.error = exc
+        finished = time.perf_counter()
+        self._batch = None
+
+        self._batches += 1
+        self._writes += batch.size
+        self._last_batch_size = batch.size
+        self._max_batch_size = max(self._max_batch_size, batch.size)
+        self._total_flush_time += finished - started
+        self._max_flush_time = max(self._max_flush_time, finished - started)
+        self._total_batch_latency += finished - batch.opened_at
+
+        batch.done.set()
+
+    def stats(self) -> dict:
+        """Batch size and flush latency metrics."""
+        with self._engine.lock:
+            batches = self._batches or 1
+            return {
+                "enabled": self.enabled,
+                "window_ms": self._window * 1000,
+                "max_size": self._max_size,
+                "batches": self._batches,
+                "writes": self._writes,
+                "avg_batch_size": round(self._writes / batches, 2),
+                "max_batch_size": self._max_batch_size,
+                "last_batch_size": self._last_batch_size,
+                "avg_flush_ms": round(self._total_flush_time / batches * 1000, 3),
+                "max_flush_ms": round(self._max_flush_time * 1000, 3),
+                # Time from the first write of a batch until it is durable
+                "avg_batch_latency_ms": round(self._total_batch_latency / batches * 1000, 3),
+            }
+
+    def close(self):
+        """Flush the open batch and stop the flusher thread."""
+        with self._engine.lock:
+            if self._batch is not None:
+                self._flush(self._batch)
+            self._closed = True
+        self._wakeup.set()
+        if self._flusher is not None:
+            self._flusher.join()
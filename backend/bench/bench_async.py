@@ -0,0 +1,70 @@
+"""
+Event loop lag while concurrent coroutines write to the database, calling
+Database directly (blocking the loop) vs awaiting AsyncDatabase.
+
+    python bench/bench_async.py --backends tinydb sqlite wal --calls 500
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from common import database_path
+
+
+async def measure(call, calls: int, concurrency: int):
+    """Run `calls` coroutines, `concurrency` at a time, while a 10ms ticker measures the loop lag."""
+    lags, running = [], True
+
+    async def ticker():
+        while running:
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - start - 0.01)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await call(i)
+
+    task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    elapsed = time.perf_counter() - start
+    running = False
+    await task
+    lags.sort()
+    return calls / elapsed, statistics.median(lags), lags[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+', default=['tinydb', 'sqlite', 'wal'])
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--rows', type=int, default=5000, help='users in the table beforehand')
+    args = parser.parse_args()
+
+    from database import Database, AsyncDatabase
+    for backend in args.backends:
+        database = Database(database_path(backend), backend)
+        with database.engine.transaction():
+            database.users.insert_many({'email': f'user{i}@example.com', 'role': 'employee'} for i in range(args.rows))
+        async_database = AsyncDatabase(database)
+
+        async def blocking(i):
+            database.record_login_attempt(f'user{i % 100}@example.com', False)
+
+        async def awaited(i):
+            await async_database.record_login_attempt(f'user{i % 100}@example.com', False)
+
+        for label, call in (('Database', blocking), ('AsyncDatabase', awaited)):
+            rate, lag, worst = asyncio.run(measure(call, args.calls, args.concurrency))
+            print(f'{backend:>7} {label:>13}: {rate:.0f} writes/s, '
+                  f'loop lag p50 {lag * 1e3:.1f} ms, max {worst * 1e3:.0f} ms')
+        async_database.close()
+
+
+if __name__ == '__main__':
+    main()
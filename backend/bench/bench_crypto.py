@@ -0,0 +1,70 @@
+"""
+Message encryption throughput: legacy AES-256-CBC vs the versioned AES-GCM
+format, through the Base64 string API and the raw-bytes API, and the cost
+of rejecting a wrong key.
+
+    python bench/bench_crypto.py --sizes 1024 1048576
+"""
+import argparse
+import base64
+import json
+import os
+
+from common import timeit, format_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1024, 1 << 20], help='plaintext sizes in bytes')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from security import aes_encrypt, aes_decrypt, encrypt_bytes, decrypt_bytes, DecryptionError
+
+    def cbc_encrypt(plaintext: str, key: bytes):
+        iv = os.urandom(16)
+        data = plaintext.encode()
+        padding = 16 - len(data) % 16
+        encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+        encrypted = encryptor.update(data + bytes([padding]) * padding) + encryptor.finalize()
+        return base64.b64encode(encrypted).decode(), base64.b64encode(iv).decode()
+
+    def cbc_wrong_key():
+        # What a wrong key cost before: decrypt everything, then fail to parse
+        try:
+            json.loads(aes_decrypt(cbc_content, cbc_iv, wrong_key))
+        except ValueError:
+            pass
+
+    def gcm_wrong_key():
+        try:
+            decrypt_bytes(blob, wrong_key)
+        except DecryptionError:
+            pass
+
+    key, wrong_key = os.urandom(32), os.urandom(32)
+    for size in args.sizes:
+        plaintext = json.dumps({'x': 'a' * max(0, size - 10)})
+        raw = plaintext.encode()
+        cbc_content, cbc_iv = cbc_encrypt(plaintext, key)
+        gcm_content, gcm_iv = aes_encrypt(plaintext, key)
+        blob = encrypt_bytes(raw, key)
+        cases = {
+            'CBC string enc': lambda: cbc_encrypt(plaintext, key),
+            'CBC string dec': lambda: aes_decrypt(cbc_content, cbc_iv, key),
+            'GCM string enc': lambda: aes_encrypt(plaintext, key),
+            'GCM string dec': lambda: aes_decrypt(gcm_content, gcm_iv, key),
+            'GCM bytes enc': lambda: encrypt_bytes(raw, key),
+            'GCM bytes dec': lambda: decrypt_bytes(blob, key),
+            'wrong key, CBC': cbc_wrong_key,
+            'wrong key, GCM': gcm_wrong_key,
+        }
+        print(f'--- {size} bytes')
+        for label, function in cases.items():
+            seconds = timeit(function, args.repeat)
+            print(f'{label:>16} {format_seconds(seconds):>10} {size / seconds / 1e6:10.1f} MB/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Sequential modp1536 POST /handshake/exchange through the app: latency
+percentiles and keypair pool hit rate, for a given pool size and exponent
+size.
+
+    python bench/bench_handshake.py --exchanges 100 --pool-size 64 --exponent-bits 256
+"""
+import argparse
+import os
+import secrets
+import statistics
+import time
+
+import common  # test environment, before the app is imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--exchanges', type=int, default=100)
+    parser.add_argument('--pool-size', type=int, default=64, help='DH_KEYPAIR_POOL_SIZE (0 = inline)')
+    parser.add_argument('--exponent-bits', type=int, default=0, help='DH_EXPONENT_BITS (0 = full size)')
+    args = parser.parse_args()
+    os.environ['DH_KEYPAIR_POOL_SIZE'] = str(args.pool_size)
+    os.environ['DH_EXPONENT_BITS'] = str(args.exponent_bits)
+
+    from fastapi.testclient import TestClient
+    import main as app_module
+    from database import db
+
+    def login(client, email, password):
+        client.post('/auth/login', json={'email': email, 'password': password})
+        otp_code = db.otp_codes.find_one(email=email)['code']
+        response = client.post('/auth/verify-otp', json={'email': email, 'otp_code': otp_code})
+        return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+    with TestClient(app_module.app) as client:
+        employee = login(client, 'abdoumerabet374@gmail.com', 'emp123')
+        admin = login(client, 'zeydody@gmail.com', 'admin123')
+        p = int(client.get('/handshake/params').json()['p'], 16)
+        # Let the pool fill before measuring
+        time.sleep(2 if args.pool_size else 0)
+        timings = []
+        for _ in range(args.exchanges):
+            public_key = hex(pow(2, secrets.randbits(256) | 1 << 255, p))
+            start = time.perf_counter()
+            response = client.post('/handshake/exchange', headers=employee, json={'public_key': public_key})
+            timings.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+        pools = client.get('/admin/handshake-metrics', headers=admin).json()['keypair_pools']
+    timings.sort()
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    miss_rate = ', '.join(f"{name} {pool['miss_rate']}" for name, pool in pools.items()) or 'no pool'
+    print(f'pool {args.pool_size}, exponent bits {args.exponent_bits or "full"}: '
+          f'p50 {statistics.median(timings) * 1e3:.1f} ms, p99 {p99 * 1e3:.1f} ms, miss rate {miss_rate}')
+
+
+if __name__ == '__main__':
+    main()
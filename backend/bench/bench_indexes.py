@@ -0,0 +1,34 @@
+"""
+get_user_by_email on TinyDB: full scan of the table vs the in-memory hash
+index of indexes.IndexedTable, for several table sizes.
+
+    python bench/bench_indexes.py --rows 10000 100000
+"""
+import argparse
+import random
+
+from common import database_path, timeit, format_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000], help='users in the table')
+    parser.add_argument('--repeat', type=int, default=50, help='lookups timed per mode')
+    args = parser.parse_args()
+
+    from database import Database
+    for rows in args.rows:
+        database = Database(database_path('tinydb'), 'tinydb')
+        with database.engine.transaction():
+            database.users.insert_many(
+                {'email': f'user{i}@example.com', 'password_hash': 'x', 'role': 'employee'} for i in range(rows)
+            )
+        emails = [f'user{random.randrange(rows)}@example.com' for _ in range(args.repeat)]
+        scan = timeit(lambda: database.users._table.find(email=random.choice(emails)), args.repeat)
+        indexed = timeit(lambda: database.users.find(email=random.choice(emails)), args.repeat)
+        print(f'{rows} users: scan {format_seconds(scan)}, index {format_seconds(indexed)}')
+        database.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Full list endpoints (/leave-requests/all, /messages/received,
+/admin/messages) through the app, in ms and us per row, for growing
+table sizes.
+
+    python bench/bench_lists.py --backend sqlite --sizes 5000 25000 50000
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+import common  # test environment, before the app is imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', default='sqlite', help='DATABASE_BACKEND')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5000, 25000, 50000], help='rows per table')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    os.environ['DATABASE_BACKEND'] = args.backend
+    if args.backend == 'sqlite':
+        os.environ['DATABASE_PATH'] = os.path.join(common.DATA_DIR, 'db.sqlite3')
+    os.environ.setdefault('DH_KEYPAIR_POOL_SIZE', '0')
+
+    from fastapi.testclient import TestClient
+    import main as app_module
+    from database import db
+
+    def login(client, email, password):
+        client.post('/auth/login', json={'email': email, 'password': password})
+        otp_code = db.otp_codes.find_one(email=email)['code']
+        response = client.post('/auth/verify-otp', json={'email': email, 'otp_code': otp_code})
+        return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+    def timed(client, url, headers):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            response = client.get(url, headers=headers)
+            timings.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+        return statistics.median(timings)
+
+    rng = random.Random(1)
+    with TestClient(app_module.app) as client:
+        hr = login(client, 'zakarialaidi6@gmail.com', 'hr123')
+        admin = login(client, 'zeydody@gmail.com', 'admin123')
+        with db.engine.transaction():
+            employees = db.users.insert_many(
+                {'email': f'user{i}@example.com', 'password_hash': 'x', 'role': 'employee'} for i in range(1000)
+            )
+        rows = 0
+        for size in args.sizes:
+            with db.engine.transaction():
+                for i in range(rows, size):
+                    employee = rng.choice(employees)
+                    request_id = db.leave_requests.insert({
+                        'employee_id': employee, 'employee_email': 'x', 'type': 'conge',
+                        'start_date': '2025-01-01', 'end_date': '2025-01-02', 'reason': 'r', 'days_count': 1,
+                        'status': 'pending', 'hr_comment': None, 'created_at': 'x', 'updated_at': None
+                    })
+                    db.communication_auth.insert({
+                        'leave_request_id': request_id, 'employee_id': employee, 'employee_email': 'x',
+                        'status': 'rejected' if i % 10 == 0 else 'message_sent', 'created_at': 'x',
+                        'approved_at': None, 'rejected_at': None
+                    })
+                    db.messages.insert({
+                        'from_id': employee, 'to_id': 2, 'encrypted_content': b'\x02' + os.urandom(60),
+                        'iv': '', 'timestamp': 'x', 'decrypted': False
+                    })
+            db.rebuild_hr_leave_view()
+            rows = size
+            results = [
+                (url, timed(client, url, headers))
+                for url, headers in (('/leave-requests/all', hr), ('/messages/received', hr), ('/admin/messages', admin))
+            ]
+            print(f'[{args.backend}] {size} rows: ' + ', '.join(
+                f'{url} {seconds * 1e3:.0f} ms ({seconds / size * 1e6:.0f} us/row)' for url, seconds in results
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Concurrent POST /auth/login through the ASGI app: logins per second and
+event loop lag (10ms ticker) while bcrypt runs on the hashing pool.
+
+    python bench/bench_login.py --logins 64 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import common  # test environment, before the app is imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=64, help='concurrent logins')
+    parser.add_argument('--workers', type=int, default=0, help='PASSWORD_HASH_WORKERS (0 = one per core)')
+    parser.add_argument('--max-pending', type=int, default=10000, help='PASSWORD_HASH_MAX_PENDING')
+    args = parser.parse_args()
+    os.environ['PASSWORD_HASH_WORKERS'] = str(args.workers)
+    os.environ['PASSWORD_HASH_MAX_PENDING'] = str(args.max_pending)
+    os.environ.setdefault('DH_KEYPAIR_POOL_SIZE', '0')
+
+    import httpx
+    import main as app_module
+
+    async def run():
+        async with app_module.lifespan(app_module.app):
+            transport = httpx.ASGITransport(app=app_module.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+                lags, running = [], True
+
+                async def ticker():
+                    while running:
+                        start = time.perf_counter()
+                        await asyncio.sleep(0.01)
+                        lags.append(time.perf_counter() - start - 0.01)
+
+                task = asyncio.create_task(ticker())
+                start = time.perf_counter()
+                responses = await asyncio.gather(*(
+                    client.post('/auth/login', json={'email': 'abdoumerabet374@gmail.com', 'password': 'emp123'})
+                    for _ in range(args.logins)
+                ))
+                elapsed = time.perf_counter() - start
+                running = False
+                await task
+        statuses = {}
+        for response in responses:
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        lags.sort()
+        print(f'workers={args.workers}: {args.logins / elapsed:.1f} logins/s, statuses {statuses}, '
+              f'loop lag p50 {statistics.median(lags) * 1e3:.1f} ms, max {lags[-1] * 1e3:.0f} ms')
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
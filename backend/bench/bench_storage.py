@@ -0,0 +1,37 @@
+"""
+Hot Database lookups and writes on each storage engine with a large users
+table: get_user_by_email and record_login_attempt.
+
+    python bench/bench_storage.py --rows 100000
+"""
+import argparse
+import random
+
+from common import database_path, timeit, format_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='users in the table')
+    parser.add_argument('--repeat', type=int, default=200, help='calls timed per operation')
+    parser.add_argument('--backends', nargs='+', default=['tinydb', 'sqlite', 'wal'])
+    args = parser.parse_args()
+
+    from database import Database
+    for backend in args.backends:
+        database = Database(database_path(backend), backend)
+        with database.engine.transaction():
+            database.users.insert_many(
+                {'email': f'user{i}@example.com', 'password_hash': 'x', 'role': 'employee'}
+                for i in range(args.rows)
+            )
+        emails = [f'user{random.randrange(args.rows)}@example.com' for _ in range(args.repeat)]
+        lookup = timeit(lambda: database.get_user_by_email(emails.pop()), args.repeat)
+        attempt = timeit(lambda: database.record_login_attempt('user0@example.com', False), args.repeat)
+        print(f'{backend:>7} {args.rows} users: get_user_by_email {format_seconds(lookup)}, '
+              f'record_login_attempt {format_seconds(attempt)}')
+        database.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Encrypted messages stored as Base64 strings vs raw bytes: size on disk and
+time to read and decrypt them all, per storage engine.
+
+    python bench/bench_transport.py --messages 10000 --size 1024
+"""
+import argparse
+import base64
+import os
+import time
+
+from common import database_path
+
+
+def disk_size(path: str) -> int:
+    directory = os.path.dirname(path)
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--size', type=int, default=1024, help='plaintext bytes per message')
+    parser.add_argument('--backends', nargs='+', default=['tinydb', 'sqlite', 'wal'])
+    args = parser.parse_args()
+
+    from database import Database
+    from security import encrypt_bytes, aes_decrypt
+    key = os.urandom(32)
+    blobs = [encrypt_bytes(os.urandom(args.size // 2).hex().encode(), key) for _ in range(args.messages)]
+    for backend in args.backends:
+        for label, encode in (('base64', lambda blob: base64.b64encode(blob).decode()), ('bytes', lambda blob: blob)):
+            path = database_path(backend)
+            database = Database(path, backend)
+            with database.engine.transaction():
+                database.messages.insert_many(
+                    {'from_id': 3, 'to_id': 2, 'encrypted_content': encode(blob), 'iv': ''} for blob in blobs
+                )
+            database.close()
+            size = disk_size(path)
+            start = time.perf_counter()
+            database = Database(path, backend)
+            loaded = time.perf_counter() - start
+            start = time.perf_counter()
+            for message in database.get_messages_for_user(2):
+                aes_decrypt(message['encrypted_content'], message['iv'], key)
+            elapsed = time.perf_counter() - start
+            database.close()
+            print(f'{backend:>7} {label:>6}: {size / 2 ** 20:.2f} MiB on disk, open {loaded * 1e3:.0f} ms, '
+                  f'read+decrypt all {elapsed * 1e3:.0f} ms')
+
+
+if __name__ == '__main__':
+    main()
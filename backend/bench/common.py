@@ -0,0 +1,50 @@
+"""
+Shared setup of the benchmark scripts. Import it before any backend module:
+it points the settings at a throwaway data directory (config.settings is
+read from the environment on first import) and puts backend/ on sys.path.
+
+Run the scripts from backend/, e.g.  python bench/storage.py --help
+"""
+import os
+import sys
+import statistics
+import tempfile
+import time
+
+DATA_DIR = tempfile.mkdtemp(prefix='hr-bench-')
+for name, value in {
+    'MAIL_USERNAME': 'bench@example.com',
+    'MAIL_PASSWORD': 'bench',
+    'MAIL_FROM': 'bench@example.com',
+    'MAIL_SERVER': '127.0.0.1',
+    'MAIL_PORT': '1',
+    'SECRET_KEY': 'bench-secret-key',
+    'DATABASE_PATH': os.path.join(DATA_DIR, 'db.json'),
+    'DOCUMENT_BLOB_DIR': os.path.join(DATA_DIR, 'document_blobs'),
+}.items():
+    os.environ.setdefault(name, value)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def database_path(backend: str, name: str = 'db') -> str:
+    """A fresh database file in the data directory."""
+    directory = tempfile.mkdtemp(dir=DATA_DIR)
+    return os.path.join(directory, f'{name}.sqlite3' if backend == 'sqlite' else f'{name}.json')
+
+
+def timeit(function, repeat: int) -> float:
+    """Median seconds per call of `function` over `repeat` calls."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds >= 1:
+        return f'{seconds:.2f} s'
+    if seconds >= 1e-3:
+        return f'{seconds * 1e3:.2f} ms'
+    return f'{seconds * 1e6:.1f} us'
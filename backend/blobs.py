@@ -0,0 +1,202 @@
+"""
+Encrypted file storage for document bodies.
+
+Each body is a file <directory>/<blob_id>.blob encrypted with AES-256-GCM
+in fixed-size chunks, following the STREAM construction (Hoang, Reyhanitabar,
+Rogaway, Vizár 2015):
+
+    header   = b'HRB1' || chunk_size (u32) || salt (16) || nonce_prefix (7)
+    chunk i  = AES-GCM(key, nonce_prefix || i (u32) || last (u8), plaintext_i, aad=header)
+    key      = HKDF-SHA256(master_key, salt, info=b'hr-system document blob ' || blob_id)
+
+Every chunk holds exactly chunk_size plaintext bytes except the last one,
+which is shorter (possibly empty) and flagged as last. Reordered, truncated
+or appended chunks, and files swapped between blobs, fail authentication.
+Because chunks have a fixed size, the plaintext size follows from the file
+size, and any byte range is read by decrypting only the chunks it covers:
+memory use does not depend on the size of the document.
+
+Blobs are immutable: new content is written to a new blob (temporary file,
+fsync, rename) and the old one deleted, so readers never see a partial file.
+"""
+from typing import Iterator, Optional, Tuple
+import os
+import re
+import secrets
+import struct
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+
+MAGIC = b'HRB1'
+SALT_SIZE = 16
+NONCE_PREFIX_SIZE = 7
+TAG_SIZE = 16
+HEADER_FORMAT = '>4sI%ds%ds' % (SALT_SIZE, NONCE_PREFIX_SIZE)
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAX_CHUNKS = 2 ** 32
+
+_BLOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class BlobIntegrityError(ValueError):
+    """The blob file is corrupt, truncated or was tampered with."""
+
+
+def _derive_key(master_key: bytes, salt: bytes, blob_id: str) -> AESGCM:
+    key = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        info=b'hr-system document blob ' + blob_id.encode('ascii'),
+    ).derive(master_key)
+    return AESGCM(key)
+
+
+def _nonce(prefix: bytes, index: int, last: bool) -> bytes:
+    return prefix + struct.pack('>IB', index, 1 if last else 0)
+
+
+class BlobWriter:
+    """Encrypts a body chunk by chunk while it is being received."""
+
+    def __init__(self, store: "BlobStore", blob_id: str):
+        self.blob_id = blob_id
+        self.size = 0
+        self._chunk_size = store.chunk_size
+        self._path = store.path(blob_id)
+        self._tmp_path = self._path + '.tmp'
+        salt = os.urandom(SALT_SIZE)
+        self._prefix = os.urandom(NONCE_PREFIX_SIZE)
+        self._header = struct.pack(HEADER_FORMAT, MAGIC, self._chunk_size, salt, self._prefix)
+        self._aead = _derive_key(store.master_key, salt, blob_id)
+        self._buffer = bytearray()
+        self._index = 0
+        self._file = open(self._tmp_path, 'wb')
+        self._file.write(self._header)
+
+    def write(self, data: bytes):
+        self._buffer += data
+        chunk_size = self._chunk_size
+        full = len(self._buffer) // chunk_size
+        if not full:
+            return
+        view = memoryview(self._buffer)
+        for offset in range(0, full * chunk_size, chunk_size):
+            self._write_chunk(view[offset:offset + chunk_size], last=False)
+        view.release()
+        del self._buffer[:full * chunk_size]
+
+    def _write_chunk(self, chunk, last: bool):
+        if self._index >= MAX_CHUNKS:
+            raise ValueError("Document trop volumineux")
+        nonce = _nonce(self._prefix, self._index, last)
+        self._file.write(self._aead.encrypt(nonce, bytes(chunk), self._header))
+        self.size += len(chunk)
+        self._index += 1
+
+    def close(self) -> Tuple[str, int]:
+        """Write the last chunk and publish the blob. Returns (blob_id, size)."""
+        # Always shorter than chunk_size (possibly empty): marks the end
+        self._write_chunk(self._buffer, last=True)
+        self._buffer = bytearray()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp_path, self._path)
+        return self.blob_id, self.size
+
+    def abort(self):
+        """Discard a partially written blob."""
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class BlobStore:
+    """Directory of encrypted blobs sharing one master key."""
+
+    def __init__(self, directory: str, master_key: bytes, chunk_size: int = 64 * 1024):
+        if not 0 < chunk_size < 2 ** 32:
+            raise ValueError(f"Invalid blob chunk size: {chunk_size}")
+        self.directory = directory
+        self.master_key = master_key
+        self.chunk_size = chunk_size
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, blob_id: str) -> str:
+        if not _BLOB_ID.match(blob_id):
+            raise ValueError(f"Invalid blob id: {blob_id!r}")
+        return os.path.join(self.directory, blob_id + '.blob')
+
+    def create(self) -> BlobWriter:
+        return BlobWriter(self, secrets.token_hex(16))
+
+    def write_bytes(self, data: bytes) -> Tuple[str, int]:
+        """Store a whole body at once. Returns (blob_id, size)."""
+        writer = self.create()
+        try:
+            writer.write(data)
+            return writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+
+    def _layout(self, f, blob_id: str) -> Tuple[AESGCM, bytes, bytes, int, int, int]:
+        """(aead, header, nonce prefix, chunk size, number of chunks, plaintext size)."""
+        header = f.read(HEADER_SIZE)
+        if len(header) != HEADER_SIZE:
+            raise BlobIntegrityError("En-tête de blob tronqué")
+        magic, chunk_size, salt, prefix = struct.unpack(HEADER_FORMAT, header)
+        if magic != MAGIC or chunk_size == 0:
+            raise BlobIntegrityError("Format de blob inconnu")
+        data_size = os.fstat(f.fileno()).st_size - HEADER_SIZE - TAG_SIZE
+        if data_size < 0:
+            raise BlobIntegrityError("Blob tronqué")
+        full_chunks, remainder = divmod(data_size, chunk_size + TAG_SIZE)
+        if remainder >= chunk_size:
+            raise BlobIntegrityError("Blob tronqué")
+        size = full_chunks * chunk_size + remainder
+        return _derive_key(self.master_key, salt, blob_id), header, prefix, chunk_size, full_chunks + 1, size
+
+    def size(self, blob_id: str) -> int:
+        """Plaintext size, from the file size alone."""
+        with open(self.path(blob_id), 'rb') as f:
+            return self._layout(f, blob_id)[5]
+
+    def read(self, blob_id: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Decrypted bytes [start, end) of a blob, one chunk at a time. Raises
+        BlobIntegrityError (possibly mid-stream) if a chunk fails authentication.
+        """
+        with open(self.path(blob_id), 'rb') as f:
+            aead, header, prefix, chunk_size, chunks, size = self._layout(f, blob_id)
+            end = size if end is None else min(end, size)
+            if start >= end:
+                return
+            index = start // chunk_size
+            f.seek(HEADER_SIZE + index * (chunk_size + TAG_SIZE))
+            while index < chunks:
+                chunk_start = index * chunk_size
+                if chunk_start >= end:
+                    break
+                last = index == chunks - 1
+                encrypted = f.read(chunk_size + TAG_SIZE)
+                try:
+                    chunk = aead.decrypt(_nonce(prefix, index, last), encrypted, header)
+                except InvalidTag:
+                    raise BlobIntegrityError(f"Bloc {index} du blob altéré")
+                yield chunk[max(0, start - chunk_start):end - chunk_start]
+                index += 1
+
+    def delete(self, blob_id: str):
+        try:
+            os.remove(self.path(blob_id))
+        except FileNotFoundError:
+            pass
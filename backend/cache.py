@@ -0,0 +1,110 @@
+"""
+Small in-process caches.
+
+TTLCache is an LRU map whose entries also expire after a fixed time. It is
+thread-safe and counts hits and misses so that its efficiency can be
+checked from the admin metrics. An optional `on_evict` callback sees every
+value that leaves the cache (expiry, eviction, replacement, invalidation),
+e.g. to wipe key material.
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+import threading
+import time
+
+
+class TTLCache:
+    """LRU cache of at most `max_size` entries, each valid for `ttl_seconds`."""
+
+    def __init__(self, max_size: int, ttl_seconds: float,
+                 on_evict: Optional[Callable[[Any], None]] = None):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._on_evict = on_evict
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+        if entry is not None:
+            self._evicted([value])
+        return None
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        """Store a value; `ttl_seconds` may shorten (never extend) the default TTL."""
+        if not self.enabled:
+            return
+        ttl = self.ttl if ttl_seconds is None else min(ttl_seconds, self.ttl)
+        if ttl <= 0:
+            return
+        dropped = []
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None and previous[0] is not value:
+                dropped.append(previous[0])
+            self._entries[key] = (value, time.monotonic() + ttl)
+            while len(self._entries) > self.max_size:
+                dropped.append(self._entries.popitem(last=False)[1][0])
+                self.evictions += 1
+        self._evicted(dropped)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.invalidations += 1
+        if entry is not None:
+            self._evicted([entry[0]])
+
+    def invalidate_where(self, predicate: Callable[[Any], bool]):
+        """Drop every entry whose value matches the predicate."""
+        with self._lock:
+            stale = [key for key, (value, _) in self._entries.items() if predicate(value)]
+            dropped = [self._entries.pop(key)[0] for key in stale]
+            self.invalidations += len(stale)
+        self._evicted(dropped)
+
+    def clear(self):
+        with self._lock:
+            dropped = [value for value, _ in self._entries.values()]
+            self.invalidations += len(dropped)
+            self._entries.clear()
+        self._evicted(dropped)
+
+    def _evicted(self, values: list):
+        # Outside the lock: the callback may be slow or use the cache
+        if self._on_evict is not None:
+            for value in values:
+                self._on_evict(value)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
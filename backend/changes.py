@@ -0,0 +1,239 @@
+"""
+Change tracking for incremental sync (?since= on the list endpoints).
+
+Every write to a tracked table records (table, doc_id) in the `changes`
+table. The auto-incremented doc_id of that row is the revision of the
+change, and each document keeps only its latest row (the previous one is
+removed), so "what changed in `table` since revision R" is a scan of
+`changes` after R instead of a scan of the table, and the log does not grow
+with the number of updates.
+
+Removed documents leave a tombstone (deleted=True) carrying the users that
+could see them (`audience`), so that clients drop them on the next sync.
+Tombstones older than CHANGE_LOG_RETENTION_DAYS are pruned; a sync cursor
+older than the last pruned one can no longer be answered (full reload).
+
+ChangeFollower is the base of the in-memory copies of a tracked table
+(intervals.IntervalIndex, analytics.LeaveColumns): they follow the writes
+of every worker through the same revisions.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from tinydb.table import Document
+from storage import StorageTable, StorageEngine
+
+
+class ChangeLog:
+    """Latest revision of every document of the tracked tables."""
+
+    # Tombstones written by this process between two prunes
+    PRUNE_EVERY = 1000
+
+    def __init__(self, engine: StorageEngine, changes: StorageTable, state: StorageTable,
+                 retention_days: int):
+        self._engine = engine
+        self._changes = changes
+        self._state = state
+        self._retention = timedelta(days=retention_days)
+        self._tombstones = 0
+
+    def record(self, table: str, doc_ids: Iterable[int], deleted: bool = False,
+               audience: Iterable[int] = ()):
+        """New revision for each document. Call it in the transaction of the write."""
+        audience = set(audience)
+        with self._engine.transaction():
+            at = datetime.utcnow().isoformat()
+            revisions, previous_ids = [], []
+            for doc_id in dict.fromkeys(doc_ids):
+                previous = self._changes.find(table=table, doc_id=doc_id)
+                # Users who lost the document must still learn it on their next
+                # sync, even if it changed again in the meantime
+                merged = audience.union(*(change['audience'] for change in previous))
+                revisions.append({
+                    'table': table,
+                    'doc_id': doc_id,
+                    'deleted': deleted,
+                    'audience': sorted(merged),
+                    'at': at
+                })
+                previous_ids.extend(change.doc_id for change in previous)
+            # Insert before removing: the newest revision is never deleted,
+            # so engines numbering from max(doc_id) + 1 never reuse one.
+            # One call each, whatever the number of documents.
+            self._changes.insert_many(revisions)
+            self._changes.remove(previous_ids)
+            if deleted:
+                self._tombstones += len(revisions)
+        if self._tombstones >= self.PRUNE_EVERY:
+            self.prune()
+
+    def since(self, table: str, revision: int, limit: int) -> List[Document]:
+        """Up to `limit` changes of `table` after `revision`, oldest first (doc_id = revision)."""
+        return self._changes.scan(revision, limit, table=table)
+
+    def pruned_revision(self) -> int:
+        """Sync cursors before this revision may have missed a deletion."""
+        state = self._state.get(1)
+        return state['pruned_revision'] if state else 0
+
+    def prune(self, now: Optional[datetime] = None) -> int:
+        """Drop tombstones past the retention period. Returns how many were removed."""
+        self._tombstones = 0
+        cutoff = ((now or datetime.utcnow()) - self._retention).isoformat()
+        with self._engine.transaction():
+            expired = [change.doc_id for change in self._changes.find(deleted=True) if change['at'] < cutoff]
+            # Keep the newest revision, see record()
+            if expired and not self._changes.scan(max(expired), 1):
+                expired.remove(max(expired))
+            if not expired:
+                return 0
+            self._changes.remove(expired)
+            pruned = max(max(expired), self.pruned_revision())
+            if self._state.get(1):
+                self._state.update({'pruned_revision': pruned}, [1])
+            else:
+                self._state.insert({'pruned_revision': pruned})
+        return len(expired)
+
+    def backfill(self, table: StorageTable):
+        """Give a revision to the documents of a table tracked for the first time."""
+        with self._engine.transaction():
+            if self._changes.scan(0, 1, table=table.name) or not len(table):
+                return
+            doc_ids = []
+            after_id = 0
+            while True:
+                chunk = table.scan(after_id, 1000)
+                if not chunk:
+                    break
+                doc_ids.extend(document.doc_id for document in chunk)
+                after_id = chunk[-1].doc_id
+            self.record(table.name, doc_ids)
+
+
+class ChangeFollower:
+    """
+    In-memory state derived from a tracked table, kept up to date by
+    catch_up(). Subclasses reset their state in _reset() and apply each page
+    of changes in _apply().
+    """
+
+    # Changes read per change log page while catching up
+    CATCH_UP_PAGE = 5000
+
+    def __init__(self, engine: StorageEngine, table: StorageTable, change_log: ChangeLog):
+        self._engine = engine
+        self._table = table
+        self._change_log = change_log
+        self._reset()
+
+    def _reset(self):
+        """Forget everything: the next catch_up() reads the whole log."""
+        self._revision = 0
+
+    def _apply(self, changes: List[Tuple[int, Optional[Document]]]):
+        """Apply a page of (doc_id, current document or None if deleted), oldest first."""
+        raise NotImplementedError
+
+    def catch_up(self):
+        """Apply the changes committed (by any worker) since the last call."""
+        with self._engine.snapshot():
+            if 0 < self._revision < self._change_log.pruned_revision():
+                # Deletions we have not seen may have been pruned from the log
+                self._reset()
+            while True:
+                changes = self._change_log.since(self._table.name, self._revision, self.CATCH_UP_PAGE)
+                if not changes:
+                    break
+                documents = self._table.get_many(
+                    change['doc_id'] for change in changes if not change['deleted']
+                )
+                self._apply([(change['doc_id'], documents.get(change['doc_id'])) for change in changes])
+                self._revision = changes[-1].doc_id
+
+
+class TrackedTable(StorageTable):
+    """
+    StorageTable decorator recording every write in a ChangeLog.
+
+    `owner_field` names the field holding the user a removed document
+    belonged to; it becomes the audience of the tombstone.
+    """
+
+    def __init__(self, table: StorageTable, change_log: ChangeLog, engine: StorageEngine,
+                 owner_field: Optional[str] = None):
+        self.name = table.name
+        self._table = table
+        self._change_log = change_log
+        self._engine = engine
+        self._owner_field = owner_field
+
+    def insert(self, fields: dict) -> int:
+        with self._engine.transaction():
+            doc_id = self._table.insert(fields)
+            self._change_log.record(self.name, [doc_id])
+            return doc_id
+
+    def insert_many(self, documents: Iterable[dict]) -> List[int]:
+        with self._engine.transaction():
+            doc_ids = self._table.insert_many(documents)
+            self._change_log.record(self.name, doc_ids)
+            return doc_ids
+
+    def get(self, doc_id: int) -> Optional[Document]:
+        return self._table.get(doc_id)
+
+    def all(self) -> List[Document]:
+        return self._table.all()
+
+    def find(self, **criteria) -> List[Document]:
+        return self._table.find(**criteria)
+
+    def scan(self, after_id: int = 0, limit: int = 500, **criteria) -> List[Document]:
+        return self._table.scan(after_id, limit, **criteria)
+
+    def get_many(self, doc_ids: Iterable[int]) -> Dict[int, Document]:
+        return self._table.get_many(doc_ids)
+
+    def find_in(self, field: str, values: Iterable) -> List[Document]:
+        return self._table.find_in(field, values)
+
+    def update(self, fields: dict, doc_ids: Iterable[int]):
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return
+        with self._engine.transaction():
+            self._table.update(fields, doc_ids)
+            self._change_log.record(self.name, doc_ids)
+
+    def update_many(self, changes: Dict[int, dict]):
+        if not changes:
+            return
+        with self._engine.transaction():
+            self._table.update_many(changes)
+            self._change_log.record(self.name, list(changes))
+
+    def remove(self, doc_ids: Iterable[int]):
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return
+        with self._engine.transaction():
+            self._remove_tracked([self._table.get(doc_id) for doc_id in doc_ids])
+
+    def truncate(self):
+        with self._engine.transaction():
+            self._remove_tracked(self._table.all())
+
+    def _remove_tracked(self, documents: List[Optional[Document]]):
+        documents = [document for document in documents if document is not None]
+        if not documents:
+            return
+        self._table.remove([document.doc_id for document in documents])
+        for document in documents:
+            owner = document.get(self._owner_field) if self._owner_field else None
+            self._change_log.record(
+                self.name, [document.doc_id], deleted=True, audience=[owner] if owner is not None else ()
+            )
+
+    def __len__(self) -> int:
+        return len(self._table)
@@ -14,9 +14,62 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
+    # bcrypt threads (0 = one per CPU core) and queued hashes before 503
+    PASSWORD_HASH_WORKERS: int = 0
+    PASSWORD_HASH_MAX_PENDING: int = 64
+    # Resolved users of recent tokens, so get_current_user skips the lookup (0 = off)
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 30
+    PRINCIPAL_CACHE_MAX_SIZE: int = 4096
+    # AES keys derived from DH sessions, wiped when evicted (0 = off)
+    SESSION_KEY_CACHE_TTL_SECONDS: float = 3600
+    SESSION_KEY_CACHE_MAX_SIZE: int = 1024
+    # POST /messages/decrypt-batch: threads (0 = one per CPU core), messages per task, IDs per request
+    MESSAGE_DECRYPT_WORKERS: int = 0
+    MESSAGE_DECRYPT_CHUNK_SIZE: int = 256
+    MESSAGE_DECRYPT_BATCH_MAX_SIZE: int = 20000
+    # PUT /leave-requests/status-batch: updates per request (one transaction)
+    LEAVE_STATUS_BATCH_MAX_SIZE: int = 20000
+    # cleanup-incompatible job: processes (0 = one per CPU core, 1 = a thread), messages per chunk, IDs per delete
+    CLEANUP_JOB_WORKERS: int = 0
+    CLEANUP_JOB_CHUNK_SIZE: int = 500
+    CLEANUP_JOB_DELETE_BATCH_SIZE: int = 1000
+    
+    # List endpoints: page size (?limit=) and change log for ?since= syncs
+    LIST_PAGE_DEFAULT_SIZE: int = 100
+    LIST_PAGE_MAX_SIZE: int = 1000
+    CHANGE_LOG_RETENTION_DAYS: int = 30
+    
+    # Server push (GET /events): open streams per worker, frames queued per
+    # stream before the client is told to resync, seconds between keepalives
+    EVENTS_MAX_CONNECTIONS: int = 10000
+    EVENTS_QUEUE_SIZE: int = 64
+    EVENTS_HEARTBEAT_SECONDS: float = 20
+    
+    # Document bodies: larger ones go to encrypted chunked blob files
+    DOCUMENT_BLOB_DIR: str = "document_blobs"
+    DOCUMENT_BLOB_KEY: str = ""  # 32 bytes hex; empty = derived from SECRET_KEY
+    DOCUMENT_BLOB_CHUNK_SIZE: int = 64 * 1024
+    DOCUMENT_INLINE_MAX_BYTES: int = 64 * 1024
     
     # Database
     DATABASE_PATH: str = "db.json"
+    DATABASE_BACKEND: str = "tinydb"  # tinydb (JSON file), sqlite (WAL) or wal (append-only log)
+    WAL_FSYNC_POLICY: str = "group"  # always, group or os
+    WAL_GROUP_COMMIT_MS: int = 5
+    WAL_COMPACT_THRESHOLD_BYTES: int = 16 * 1024 * 1024
+    # Threads running blocking database calls for the async endpoints
+    DATABASE_IO_WORKERS: int = 32
+    # Group commit: writes arriving within the window share one flush (0 = off)
+    WRITE_BATCH_WINDOW_MS: float = 2
+    WRITE_BATCH_MAX_SIZE: int = 256
+    
+    # Diffie-Hellman private key size in bits: 0 = full size (1536), or a
+    # short exponent of at least 256 bits for ~6x faster handshakes
+    DH_EXPONENT_BITS: int = 0
+    # Ephemeral DH keypairs generated ahead of time by background processes
+    DH_KEYPAIR_POOL_SIZE: int = 64  # 0 = generate on the request path
+    DH_KEYPAIR_POOL_REFILL_THRESHOLD: int = 16
+    DH_KEYPAIR_POOL_WORKERS: int = 1
     
     # OTP Configuration
     OTP_EXPIRATION_MINUTES: int = 5
@@ -1,33 +1,213 @@
-from tinydb import TinyDB, Query
-from typing import Optional, List
+from typing import Optional, List, Callable, Union, Iterable, Dict, Set
 from datetime import datetime, timedelta
+from functools import wraps, partial
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
 from config import settings
-import os
+from storage import create_engine
+from indexes import IndexedTable
+from changes import ChangeLog, TrackedTable
+from views import HRLeaveRequestView
+from leave_stats import LeaveStats
+from analytics import LeaveColumns, report as leave_report
+from intervals import IntervalIndex, OverlappingLeaveRequestError, interval_of
+from batching import WriteBatcher
+
+
+def _block_expired(attempt_data: dict) -> bool:
+    """Five failed attempts or more, the last one over five minutes ago."""
+    if attempt_data.get('failed_count', 0) < 5:
+        return False
+    return datetime.fromisoformat(attempt_data['last_attempt']) + timedelta(minutes=5) <= datetime.utcnow()
+
+
+def write_operation(method):
+    """
+    Run a mutating Database method through the write batcher (group commit).
+    Events it publishes are delivered once the write is durable.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        pending = self._pending_events
+        if getattr(pending, 'events', None) is not None:
+            # Nested in another write operation: delivered with the outer one,
+            # unless its writes are undone
+            published = len(pending.events)
+            try:
+                return self.batcher.run(lambda: method(self, *args, **kwargs))
+            except BaseException:
+                del pending.events[published:]
+                raise
+        pending.events = []
+        try:
+            result = self.batcher.run(lambda: method(self, *args, **kwargs))
+            events = pending.events
+        finally:
+            pending.events = None
+        for event in events:
+            self._deliver_event(event)
+        return result
+    return wrapper
 
 
 class Database:
-    def __init__(self, db_path: str = None):
-        """Initialize TinyDB database."""
+    def __init__(self, db_path: str = None, backend: str = None):
+        """Initialize the database on the configured storage engine."""
         if db_path is None:
             db_path = settings.DATABASE_PATH
+        if backend is None:
+            backend = settings.DATABASE_BACKEND
         
-        self.db = TinyDB(db_path)
-        self.users = self.db.table('users')
-        self.otp_codes = self.db.table('otp_codes')
-        self.messages = self.db.table('messages')
-        self.trusted_params = self.db.table('trusted_params')
-        self.sessions = self.db.table('sessions')  # Store DH sessions
-        self.login_attempts = self.db.table('login_attempts')  # Track login attempts
-        self.otp_attempts = self.db.table('otp_attempts')  # Track OTP attempts
-        self.leave_requests = self.db.table('leave_requests')  # Leave/Absence requests
-        self.communication_auth = self.db.table('communication_auth')  # Communication authorization requests
+        self.backend = backend
+        self.engine = create_engine(backend, db_path)
+        table = self._table
+        # Revision of every document of the tables listed by ?since= endpoints
+        self.change_log = ChangeLog(
+            self.engine,
+            table('changes', indexes=[('table', 'doc_id'), 'table', 'deleted']),
+            table('change_log_state'),
+            settings.CHANGE_LOG_RETENTION_DAYS
+        )
+        # Indexes are declared for the fields used by find() on hot paths
+        self.users = table('users', indexes=['email', 'role'])
+        self.otp_codes = table('otp_codes', indexes=['email'])
+        self.messages = table('messages', indexes=['to_id'], owner_field='to_id')
+        self.trusted_params = table('trusted_params')
+        self.sessions = table('sessions', indexes=['user_id'])  # Store DH sessions
+        self.login_attempts = table('login_attempts', indexes=['email'])  # Track login attempts
+        self.otp_attempts = table('otp_attempts', indexes=['email'])  # Track OTP attempts
+        self.leave_requests = table('leave_requests', indexes=['employee_id'], owner_field='employee_id')  # Leave/Absence requests
+        self.communication_auth = table('communication_auth', indexes=['leave_request_id', 'employee_id', 'status'], owner_field='employee_id')  # Communication authorization requests
         
         # ============ DAC FEATURES ============
-        self.documents = self.db.table('documents')  # Documents (Fonctionnalité 1)
-        self.document_acls = self.db.table('document_acls')  # ACL pour documents
-        self.delegations = self.db.table('delegations')  # Délégations (Fonctionnalité 2)
+        self.documents = table('documents', indexes=['owner_id'], owner_field='owner_id')  # Documents (Fonctionnalité 1)
+        self.document_acls = table('document_acls', indexes=[('document_id', 'user_id'), 'user_id'])  # ACL pour documents
+        self.delegations = table('delegations', indexes=['delegate_id', 'delegator_id'])  # Délégations (Fonctionnalité 2)
+        
+        # Leave requests visible to HR, by status (materialized view, see views.py)
+        self.hr_leave_requests = table('hr_leave_requests', indexes=['leave_request_id', 'status'])
+        self.hr_leave_view = HRLeaveRequestView(
+            self.engine, self.hr_leave_requests, self.leave_requests, self.communication_auth
+        )
+        if not len(self.hr_leave_view) and len(self.leave_requests):
+            self.hr_leave_view.rebuild()
+        # Days requested per employee / type / month (GET /leave-requests/stats, see leave_stats.py)
+        self.leave_stats_table = table('leave_stats', indexes=[('employee_id', 'type', 'month'), ('employee_id', 'month'), 'employee_id', 'month'])
+        self.leave_stats = LeaveStats(self.engine, self.leave_stats_table, self.leave_requests)
+        if not len(self.leave_stats) and len(self.leave_requests):
+            self.leave_stats.recompute()
+        # Columnar copy of the leave requests (GET /leave-requests/analytics), loaded on first use
+        self.leave_columns = LeaveColumns(self.engine, self.leave_requests, self.change_log)
+        # Leave requests by dates (GET /leave-requests/calendar), built on first use
+        self.leave_calendar = IntervalIndex(
+            self.engine, self.leave_requests, self.change_log, 'start_date', 'end_date'
+        )
+        
+        self.batcher = WriteBatcher(self.engine, settings.WRITE_BATCH_WINDOW_MS, settings.WRITE_BATCH_MAX_SIZE)
+        self._subscribers = {}
+        self._event_listeners = []
+        self._pending_events = threading.local()
+    
+    def _table(self, name: str, indexes: list = (), owner_field: str = None):
+        """
+        Open a table, adding in-memory hash indexes if the engine has none.
+        With an `owner_field`, writes are recorded in the change log (see
+        changes.py); it names the user a deleted document belonged to.
+        """
+        storage_table = self.engine.table(name, indexes)
+        if indexes and not self.engine.native_indexes:
+            storage_table = IndexedTable(storage_table, indexes, self.engine)
+        if owner_field:
+            storage_table = TrackedTable(storage_table, self.change_log, self.engine, owner_field)
+            self.change_log.backfill(storage_table)
+        return storage_table
+    
+    def subscribe(self, table: str, callback: Callable[[int], None]):
+        """
+        Call `callback(doc_id)` whenever this process changes a document of
+        `table` (for `sessions` and `delegations`: the user id). Used to invalidate caches
+        built on top of the database.
+        """
+        self._subscribers.setdefault(table, []).append(callback)
+    
+    def _notify(self, table: str, doc_id: int):
+        for callback in self._subscribers.get(table, ()):
+            callback(doc_id)
+    
+    def add_event_listener(self, callback: Callable[[dict], None]):
+        """
+        Call `callback(event)` after each durable write of this process that
+        publishes an event ({'type': 'leave_request.created', 'id': ...}, see
+        events.py), on the thread that made the write.
+        """
+        self._event_listeners.append(callback)
+    
+    def _publish(self, event_type: str, **fields):
+        event = {'type': event_type, **fields}
+        pending = getattr(self._pending_events, 'events', None)
+        if pending is not None:
+            pending.append(event)
+        else:
+            self._deliver_event(event)
+    
+    def _deliver_event(self, event: dict):
+        for callback in self._event_listeners:
+            try:
+                callback(event)
+            except Exception as exc:
+                # The write is already durable: never fail it for a listener
+                print(f"Event listener failed on {event['type']}: {exc!r}")
+    
+    def get_storage_metrics(self) -> dict:
+        """Storage engine and write batching metrics."""
+        return {
+            'backend': self.backend,
+            'write_batching': self.batcher.stats()
+        }
+    
+    def verify_indexes(self) -> List[str]:
+        """Self-check: compare every in-memory index with a full rebuild."""
+        problems = []
+        for table in vars(self).values():
+            if isinstance(table, TrackedTable):
+                table = table._table
+            if isinstance(table, IndexedTable):
+                problems.extend(table.verify())
+        return problems
+    
+    def get_changes(self, table: str, since: int, limit: int) -> List[tuple]:
+        """
+        Up to `limit` changes of a tracked table after revision `since`:
+        (revision, doc_id, document or None if deleted, audience of the deletion).
+        """
+        tracked = getattr(self, table)
+        with self.engine.snapshot():
+            return [
+                (change.doc_id, change['doc_id'],
+                 None if change['deleted'] else tracked.get(change['doc_id']),
+                 change['audience'])
+                for change in self.change_log.since(table, since, limit)
+            ]
+    
+    def get_pruned_revision(self) -> int:
+        """Sync cursors older than this revision must reload everything."""
+        return self.change_log.pruned_revision()
+    
+    def scan_leave_requests(self, after_id: int = 0, limit: int = 100, **criteria) -> List[dict]:
+        """Next page of leave requests by increasing ID."""
+        return self.leave_requests.scan(after_id, limit, **criteria)
+    
+    def scan_communication_auths(self, after_id: int = 0, limit: int = 100) -> List[dict]:
+        """Next page of communication authorizations by increasing ID."""
+        return self.communication_auth.scan(after_id, limit)
+    
+    def scan_documents(self, after_id: int = 0, limit: int = 100, **criteria) -> List[dict]:
+        """Next page of documents by increasing ID."""
+        return self.documents.scan(after_id, limit, **criteria)
     
     # User Operations
+    @write_operation
     def create_user(self, email: str, password_hash: str, role: str, public_key_cert: str = None) -> int:
         """Create a new user."""
         user_id = self.users.insert({
@@ -39,32 +219,48 @@ class Database:
         })
         return user_id
     
+    @write_operation
+    def create_users_if_empty(self, users: List[dict]) -> List[int]:
+        """
+        Create the given users (create_user() keyword arguments) only if there
+        is no account yet. Atomic, so that concurrent workers seed only once.
+        """
+        if len(self.users):
+            return []
+        return [self.create_user(**user) for user in users]
+    
     def get_user_by_email(self, email: str) -> Optional[dict]:
         """Get user by email."""
-        User = Query()
-        result = self.users.search(User.email == email)
-        return result[0] if result else None
+        return self.users.find_one(email=email)
     
     def get_user_by_id(self, user_id: int) -> Optional[dict]:
         """Get user by ID."""
-        result = self.users.get(doc_id=user_id)
-        return result
+        return self.users.get(user_id)
+    
+    def get_users_by_ids(self, user_ids: Iterable[int]) -> Dict[int, dict]:
+        """Get several users by ID in one read: {user_id: user}, unknown IDs left out."""
+        return self.users.get_many(user_ids)
+    
+    def count_users(self) -> int:
+        """Count user accounts."""
+        return len(self.users)
     
     def get_users_by_role(self, role: str) -> List[dict]:
         """Get all users with a specific role."""
-        User = Query()
-        return self.users.search(User.role == role)
+        return self.users.find(role=role)
     
+    @write_operation
     def update_user_public_key(self, user_id: int, public_key: str):
         """Update user's public key certificate."""
-        self.users.update({'public_key_certificate': public_key}, doc_ids=[user_id])
+        self.users.update({'public_key_certificate': public_key}, [user_id])
+        self._notify('users', user_id)
     
     # OTP Operations
+    @write_operation
     def store_otp(self, email: str, code: str):
         """Store OTP code with expiration."""
-        OTP = Query()
         # Remove existing OTP for this email
-        self.otp_codes.remove(OTP.email == email)
+        self.otp_codes.remove_where(email=email)
         
         expiration = datetime.utcnow() + timedelta(minutes=settings.OTP_EXPIRATION_MINUTES)
         self.otp_codes.insert({
@@ -73,29 +269,27 @@ class Database:
             'expiration': expiration.isoformat()
         })
     
+    @write_operation
     def verify_otp(self, email: str, code: str) -> bool:
         """Verify OTP code."""
-        OTP = Query()
-        result = self.otp_codes.search(
-            (OTP.email == email) & (OTP.code == code)
-        )
+        otp_data = self.otp_codes.find_one(email=email, code=code)
         
-        if not result:
+        if not otp_data:
             return False
         
-        otp_data = result[0]
         expiration = datetime.fromisoformat(otp_data['expiration'])
         
         if datetime.utcnow() > expiration:
             # OTP expired, remove it
-            self.otp_codes.remove(doc_ids=[otp_data.doc_id])
+            self.otp_codes.remove([otp_data.doc_id])
             return False
         
         # Valid OTP, remove it (one-time use)
-        self.otp_codes.remove(doc_ids=[otp_data.doc_id])
+        self.otp_codes.remove([otp_data.doc_id])
         return True
     
     # Trusted Parameters (DH)
+    @write_operation
     def store_dh_params(self, p: str, g: str):
         """Store global DH parameters."""
         # Clear existing params
@@ -113,33 +307,46 @@ class Database:
         return all_params[0] if all_params else None
     
     # Session Management (for DH)
-    def store_session(self, user_id: int, private_key: str, shared_secret: str = None):
+    @write_operation
+    def store_session(self, user_id: int, private_key: str, shared_secret: str = None,
+                      group: str = 'modp1536'):
         """Store DH session data."""
-        Session = Query()
         # Remove existing session
-        self.sessions.remove(Session.user_id == user_id)
+        previous = self.sessions.find_one(user_id=user_id)
+        self.sessions.remove_where(user_id=user_id)
         
         self.sessions.insert({
             'user_id': user_id,
             'private_key': private_key,
             'shared_secret': shared_secret,
+            'group': group,  # Key agreement group the secret comes from
+            # Bumped whenever the secret changes: keys derived from it are cached per epoch
+            'epoch': (previous.get('epoch', 0) if previous else 0) + 1,
             'created_at': datetime.utcnow().isoformat()
         })
+        self._notify('sessions', user_id)
     
     def get_session(self, user_id: int) -> Optional[dict]:
         """Get DH session data."""
-        Session = Query()
-        result = self.sessions.search(Session.user_id == user_id)
-        return result[0] if result else None
+        return self.sessions.find_one(user_id=user_id)
     
-    def update_session_secret(self, user_id: int, shared_secret: str):
+    @write_operation
+    def update_session_secret(self, user_id: int, shared_secret: str, group: str = 'modp1536'):
         """Update shared secret in session."""
-        Session = Query()
-        self.sessions.update({'shared_secret': shared_secret}, Session.user_id == user_id)
+        session = self.sessions.find_one(user_id=user_id)
+        if session is None:
+            return
+        self.sessions.update_where({
+            'shared_secret': shared_secret,
+            'group': group,
+            'epoch': session.get('epoch', 0) + 1
+        }, user_id=user_id)
+        self._notify('sessions', user_id)
     
     # Message Operations
-    def store_message(self, from_id: int, to_id: int, encrypted_content: str, iv: str) -> int:
-        """Store encrypted message."""
+    @write_operation
+    def store_message(self, from_id: int, to_id: int, encrypted_content: Union[str, bytes], iv: str = "") -> int:
+        """Store encrypted message (raw bytes for versioned blobs, Base64 for legacy CBC)."""
         msg_id = self.messages.insert({
             'from_id': from_id,
             'to_id': to_id,
@@ -148,28 +355,67 @@ class Database:
             'timestamp': datetime.utcnow().isoformat(),
             'decrypted': False
         })
+        self._publish('message.received', id=msg_id, from_id=from_id, to_id=to_id)
         return msg_id
     
     def get_messages_for_user(self, user_id: int) -> List[dict]:
         """Get all messages sent to a user."""
-        Message = Query()
-        return self.messages.search(Message.to_id == user_id)
+        return self.messages.find(to_id=user_id)
     
     def get_all_messages(self) -> List[dict]:
         """Get all messages (for admin/HR view)."""
         return self.messages.all()
     
+    def get_message(self, message_id: int) -> Optional[dict]:
+        """Get a specific message by ID."""
+        return self.messages.get(message_id)
+    
+    def get_messages(self, message_ids: List[int]) -> List[Optional[dict]]:
+        """Get several messages by ID in one consistent read (None for unknown IDs)."""
+        with self.engine.snapshot():
+            return [self.messages.get(message_id) for message_id in message_ids]
+    
+    def get_unread_messages_for_user(self, user_id: int, limit: int = None) -> List[dict]:
+        """Messages sent to a user that were never decrypted, by increasing ID (the first `limit` ones)."""
+        unread = []
+        after_id = 0
+        while limit is None or len(unread) < limit:
+            chunk = self.messages.scan(after_id, 500, to_id=user_id)
+            if not chunk:
+                break
+            unread.extend(msg for msg in chunk if not msg.get('decrypted'))
+            after_id = chunk[-1].doc_id
+        return unread[:limit]
+    
+    def scan_messages(self, after_id: int = 0, limit: int = 500, **criteria) -> List[dict]:
+        """Next chunk of messages by increasing ID (walk the table without loading it)."""
+        return self.messages.scan(after_id, limit, **criteria)
+    
+    def count_messages(self) -> int:
+        """Count stored messages."""
+        return len(self.messages)
+    
+    @write_operation
+    def mark_messages_decrypted(self, message_ids: List[int]):
+        """Flag messages as decrypted (read)."""
+        if message_ids:
+            self.messages.update({'decrypted': True}, message_ids)
+    
+    @write_operation
+    def delete_messages(self, message_ids: List[int]):
+        """Delete messages by ID."""
+        self.messages.remove(message_ids)
+    
     # Login Attempts Management
+    @write_operation
     def record_login_attempt(self, email: str, success: bool):
         """Record a login attempt."""
-        Attempt = Query()
-        attempts = self.login_attempts.search(Attempt.email == email)
+        attempt_data = self.login_attempts.find_one(email=email)
         
-        if attempts:
-            attempt_data = attempts[0]
+        if attempt_data:
             if success:
                 # Reset attempts on success
-                self.login_attempts.remove(doc_ids=[attempt_data.doc_id])
+                self.login_attempts.remove([attempt_data.doc_id])
             else:
                 # Increment failed attempts
                 failed_count = attempt_data.get('failed_count', 0) + 1
@@ -177,7 +423,7 @@ class Database:
                 self.login_attempts.update({
                     'failed_count': failed_count,
                     'last_attempt': last_attempt
-                }, doc_ids=[attempt_data.doc_id])
+                }, [attempt_data.doc_id])
         else:
             # First attempt
             if not success:
@@ -189,13 +435,11 @@ class Database:
     
     def is_login_blocked(self, email: str) -> tuple[bool, int]:
         """Check if login is blocked for this email. Returns (is_blocked, remaining_seconds)."""
-        Attempt = Query()
-        attempts = self.login_attempts.search(Attempt.email == email)
+        attempt_data = self.login_attempts.find_one(email=email)
         
-        if not attempts:
+        if not attempt_data:
             return False, 0
         
-        attempt_data = attempts[0]
         failed_count = attempt_data.get('failed_count', 0)
         
         if failed_count >= 5:
@@ -208,22 +452,29 @@ class Database:
                 return True, remaining
             else:
                 # Block period expired, reset
-                self.login_attempts.remove(doc_ids=[attempt_data.doc_id])
+                self.reset_expired_login_attempts(email)
                 return False, 0
         
         return False, 0
     
+    @write_operation
+    def reset_expired_login_attempts(self, email: str):
+        """Forget the failed logins of an email whose block period is over."""
+        attempt_data = self.login_attempts.find_one(email=email)
+        # Checked again in the write transaction: a failure recorded meanwhile restarts the block
+        if attempt_data and _block_expired(attempt_data):
+            self.login_attempts.remove([attempt_data.doc_id])
+    
     # OTP Attempts Management
+    @write_operation
     def record_otp_attempt(self, email: str, success: bool):
         """Record an OTP verification attempt."""
-        Attempt = Query()
-        attempts = self.otp_attempts.search(Attempt.email == email)
+        attempt_data = self.otp_attempts.find_one(email=email)
         
-        if attempts:
-            attempt_data = attempts[0]
+        if attempt_data:
             if success:
                 # Reset attempts on success
-                self.otp_attempts.remove(doc_ids=[attempt_data.doc_id])
+                self.otp_attempts.remove([attempt_data.doc_id])
             else:
                 # Increment failed attempts
                 failed_count = attempt_data.get('failed_count', 0) + 1
@@ -231,7 +482,7 @@ class Database:
                 self.otp_attempts.update({
                     'failed_count': failed_count,
                     'last_attempt': last_attempt
-                }, doc_ids=[attempt_data.doc_id])
+                }, [attempt_data.doc_id])
         else:
             # First attempt
             if not success:
@@ -243,13 +494,11 @@ class Database:
     
     def is_otp_blocked(self, email: str) -> tuple[bool, int]:
         """Check if OTP verification is blocked for this email. Returns (is_blocked, remaining_seconds)."""
-        Attempt = Query()
-        attempts = self.otp_attempts.search(Attempt.email == email)
+        attempt_data = self.otp_attempts.find_one(email=email)
         
-        if not attempts:
+        if not attempt_data:
             return False, 0
         
-        attempt_data = attempts[0]
         failed_count = attempt_data.get('failed_count', 0)
         
         if failed_count >= 5:
@@ -262,27 +511,51 @@ class Database:
                 return True, remaining
             else:
                 # Block period expired, reset
-                self.otp_attempts.remove(doc_ids=[attempt_data.doc_id])
+                self.reset_expired_otp_attempts(email)
                 return False, 0
         
         return False, 0
     
+    @write_operation
+    def reset_expired_otp_attempts(self, email: str):
+        """Forget the failed OTP attempts of an email whose block period is over."""
+        attempt_data = self.otp_attempts.find_one(email=email)
+        # Checked again in the write transaction: a failure recorded meanwhile restarts the block
+        if attempt_data and _block_expired(attempt_data):
+            self.otp_attempts.remove([attempt_data.doc_id])
+    
+    @write_operation
     def reset_otp_attempts(self, email: str):
         """Reset OTP attempts for an email."""
-        Attempt = Query()
-        self.otp_attempts.remove(Attempt.email == email)
+        self.otp_attempts.remove_where(email=email)
     
+    @write_operation
     def cancel_otp(self, email: str):
         """Cancel current OTP and reset attempts."""
-        OTP = Query()
-        self.otp_codes.remove(OTP.email == email)
+        self.otp_codes.remove_where(email=email)
         self.reset_otp_attempts(email)
     
     # Leave Request Operations
+    @write_operation
     def create_leave_request(self, employee_id: int, employee_email: str, 
                             type: str, start_date: str, end_date: str, 
                             reason: str, days_count: int) -> int:
-        """Create a new leave/absence request."""
+        """
+        Create a new leave/absence request.
+        Raises ValueError for invalid dates and OverlappingLeaveRequestError
+        if the employee already has a request (not rejected) over these dates.
+        """
+        dates = {'start_date': start_date, 'end_date': end_date}
+        interval = interval_of(dates, 'start_date', 'end_date')
+        if interval is None:
+            raise ValueError("Invalid dates")
+        # Checked in the write transaction: no other worker can insert meanwhile
+        for other in self.leave_requests.find(employee_id=employee_id):
+            other_interval = interval_of(other, 'start_date', 'end_date')
+            if (other['status'] != 'rejected' and other_interval is not None
+                    and other_interval[0] <= interval[1] and other_interval[1] >= interval[0]):
+                raise OverlappingLeaveRequestError(other.doc_id)
+        
         request_id = self.leave_requests.insert({
             'employee_id': employee_id,
             'employee_email': employee_email,
@@ -296,34 +569,128 @@ class Database:
             'created_at': datetime.utcnow().isoformat(),
             'updated_at': None
         })
+        self.hr_leave_view.refresh(request_id)
+        self.leave_stats.apply(None, self.leave_requests.get(request_id))
+        self._publish('leave_request.created', id=request_id, employee_id=employee_id, status='pending')
         return request_id
     
     def get_leave_request(self, request_id: int) -> Optional[dict]:
         """Get a specific leave request by ID."""
-        return self.leave_requests.get(doc_id=request_id)
+        return self.leave_requests.get(request_id)
     
     def get_leave_requests_by_employee(self, employee_id: int) -> List[dict]:
         """Get all leave requests for a specific employee."""
-        Request = Query()
-        return self.leave_requests.search(Request.employee_id == employee_id)
+        return self.leave_requests.find(employee_id=employee_id)
     
     def get_all_leave_requests(self) -> List[dict]:
         """Get all leave requests (for HR Manager)."""
         return self.leave_requests.all()
     
+    def get_leave_requests_between(self, first_day: str, last_day: str) -> List[dict]:
+        """Leave requests sharing at least one day with [first_day, last_day] ('YYYY-MM-DD'), by ID."""
+        request_ids = self.leave_calendar.overlapping(first_day, last_day)
+        requests = self.leave_requests.get_many(request_ids)
+        return [requests[request_id] for request_id in request_ids if request_id in requests]
+    
+    def get_leave_stats(self, employee_id: int = None, month: str = None) -> List[dict]:
+        """
+        Leave accounting rows (see leave_stats.py): all-time totals of every
+        employee, or of one employee with its months, or one month.
+        """
+        if employee_id is not None:
+            rows = self.leave_stats.totals(employee_id) + self.leave_stats.monthly(employee_id)
+            return [row for row in rows if month is None or row['month'] in (None, month)]
+        if month is not None:
+            return self.leave_stats.month(month)
+        return self.leave_stats.all_totals()
+    
+    @write_operation
+    def recompute_leave_stats(self) -> int:
+        """Rebuild the leave accounting counters from the leave requests."""
+        return self.leave_stats.recompute()
+    
+    def verify_leave_stats(self) -> List[str]:
+        """Self-check: compare the leave accounting counters with a full recount."""
+        return self.leave_stats.verify()
+    
+    def get_leave_analytics(self, first_day: str = None, last_day: str = None, top: int = 10) -> dict:
+        """Vectorized leave analytics over the leave requests starting in [first_day, last_day] (see analytics.py)."""
+        employees = len(self.users.find(role='employee'))
+        columns = self.leave_columns
+        with columns.lock:
+            columns.catch_up()
+            return leave_report(columns.view(), columns.reasons, employees, first_day, last_day, top)
+    
+    def get_hr_visible_leave_requests(self, status: str = None) -> List[dict]:
+        """Leave requests HR may see, optionally only those with `status` (O(result), from the view)."""
+        return self.hr_leave_view.read(status)
+    
+    def get_hr_visible_leave_request_ids(self, leave_request_ids: Iterable[int], status: str = None) -> Set[int]:
+        """Which of these leave requests HR may see (and have `status` if given)."""
+        return self.hr_leave_view.visible_ids(leave_request_ids, status)
+    
+    @write_operation
+    def rebuild_hr_leave_view(self) -> int:
+        """Recompute the HR-visible leave requests view from scratch."""
+        return self.hr_leave_view.rebuild()
+    
+    def verify_hr_leave_view(self) -> List[str]:
+        """Self-check: compare the HR-visible leave requests view with the naive query."""
+        return self.hr_leave_view.verify()
+    
+    @write_operation
     def update_leave_request_status(self, request_id: int, status: str, hr_comment: str = None):
         """Update the status of a leave request (HR Manager only)."""
+        before = self.leave_requests.get(request_id)
         self.leave_requests.update({
             'status': status,
             'hr_comment': hr_comment,
             'updated_at': datetime.utcnow().isoformat()
-        }, doc_ids=[request_id])
+        }, [request_id])
+        self.hr_leave_view.refresh(request_id)
+        request = self.leave_requests.get(request_id)
+        self.leave_stats.apply(before, request)
+        if request:
+            self._publish('leave_request.status', id=request_id, employee_id=request['employee_id'], status=status)
     
+    @write_operation
+    def update_leave_request_statuses(self, updates: List[tuple]) -> List[int]:
+        """
+        Apply many (request_id, status, hr_comment) status updates in one
+        transaction (PUT /leave-requests/status-batch). Requests that do not
+        exist are skipped (the last update wins for a repeated ID); returns
+        the IDs that were updated.
+        """
+        updated_at = datetime.utcnow().isoformat()
+        changes = {
+            request_id: {'status': status, 'hr_comment': hr_comment, 'updated_at': updated_at}
+            for request_id, status, hr_comment in updates
+        }
+        before = self.leave_requests.get_many(changes)
+        changes = {request_id: fields for request_id, fields in changes.items() if request_id in before}
+        # One write per table for the whole batch (see StorageTable.update_many)
+        self.leave_requests.update_many(changes)
+        after = {request_id: {**before[request_id], **fields} for request_id, fields in changes.items()}
+        
+        updated = list(after)
+        self.hr_leave_view.refresh_many(updated, after)
+        self.leave_stats.apply_many((before[request_id], after[request_id]) for request_id in updated)
+        for request_id in updated:
+            request = after[request_id]
+            self._publish('leave_request.status', id=request_id, employee_id=request['employee_id'],
+                          status=request['status'])
+        return updated
+    
+    @write_operation
     def delete_leave_request(self, request_id: int):
         """Delete a leave request (employee can delete their own pending requests)."""
-        self.leave_requests.remove(doc_ids=[request_id])
+        before = self.leave_requests.get(request_id)
+        self.leave_requests.remove([request_id])
+        self.hr_leave_view.refresh(request_id)
+        self.leave_stats.apply(before, None)
     
     # Communication Authorization Operations
+    @write_operation
     def create_communication_auth(self, leave_request_id: int, employee_id: int, employee_email: str) -> int:
         """Create a new communication authorization request for admin approval."""
         auth_id = self.communication_auth.insert({
@@ -335,27 +702,38 @@ class Database:
             'approved_at': None,
             'rejected_at': None
         })
+        self._publish('communication_auth.created', id=auth_id, leave_request_id=leave_request_id,
+                      employee_id=employee_id, status='pending_admin')
         return auth_id
     
     def get_communication_auth(self, auth_id: int) -> Optional[dict]:
         """Get a specific communication authorization by ID."""
-        return self.communication_auth.get(doc_id=auth_id)
+        return self.communication_auth.get(auth_id)
     
     def get_communication_auth_by_leave_request(self, leave_request_id: int) -> Optional[dict]:
         """Get communication authorization by leave request ID."""
-        Auth = Query()
-        result = self.communication_auth.search(Auth.leave_request_id == leave_request_id)
-        return result[0] if result else None
+        return self.communication_auth.find_one(leave_request_id=leave_request_id)
+    
+    def get_communication_auths_by_leave_requests(self, leave_request_ids: Iterable[int]) -> Dict[int, dict]:
+        """
+        Communication authorization of several leave requests in one read:
+        {leave_request_id: auth}, requests without one left out.
+        """
+        auths = {}
+        for auth in self.communication_auth.find_in('leave_request_id', leave_request_ids):
+            # Same one as get_communication_auth_by_leave_request: the oldest
+            auths.setdefault(auth['leave_request_id'], auth)
+        return auths
     
     def get_pending_communication_auths(self) -> List[dict]:
         """Get all pending communication authorizations (for Admin)."""
-        Auth = Query()
-        return self.communication_auth.search(Auth.status == 'pending_admin')
+        return self.communication_auth.find(status='pending_admin')
     
     def get_all_communication_auths(self) -> List[dict]:
         """Get all communication authorizations (for Admin)."""
         return self.communication_auth.all()
     
+    @write_operation
     def update_communication_auth_status(self, auth_id: int, status: str):
         """Update communication authorization status."""
         update_data = {'status': status}
@@ -363,25 +741,38 @@ class Database:
             update_data['approved_at'] = datetime.utcnow().isoformat()
         elif status == 'rejected':
             update_data['rejected_at'] = datetime.utcnow().isoformat()
-        self.communication_auth.update(update_data, doc_ids=[auth_id])
+        self.communication_auth.update(update_data, [auth_id])
+        auth = self.communication_auth.get(auth_id)
+        if auth:
+            # A rejected authorization hides the leave request from HR
+            self.change_log.record('leave_requests', [auth['leave_request_id']])
+            self.hr_leave_view.refresh(auth['leave_request_id'])
+            self._publish('communication_auth.status', id=auth_id, leave_request_id=auth['leave_request_id'],
+                          employee_id=auth['employee_id'], status=status)
     
     def get_communication_auth_by_employee(self, employee_id: int) -> List[dict]:
         """Get all communication authorizations for an employee."""
-        Auth = Query()
-        return self.communication_auth.search(Auth.employee_id == employee_id)
+        return self.communication_auth.find(employee_id=employee_id)
     
     # ================================================================
     # FONCTIONNALITÉ 1: GESTION DES DOCUMENTS (DAC - Matrice HRU)
     # ================================================================
     
+    @write_operation
     def create_document(self, owner_id: int, owner_email: str, title: str, 
-                       content: str, is_confidential: bool = False) -> int:
-        """Créer un nouveau document. Le créateur devient propriétaire (own)."""
+                       content: Optional[str], is_confidential: bool = False,
+                       blob_id: str = None, content_size: int = None) -> int:
+        """
+        Créer un nouveau document. Le créateur devient propriétaire (own).
+        Le contenu est soit en ligne (`content`), soit dans un blob chiffré (`blob_id`).
+        """
         doc_id = self.documents.insert({
             'owner_id': owner_id,
             'owner_email': owner_email,
             'title': title,
             'content': content,
+            'blob_id': blob_id,
+            'content_size': len(content.encode('utf-8')) if content is not None else content_size,
             'is_confidential': is_confidential,
             'created_at': datetime.utcnow().isoformat()
         })
@@ -389,35 +780,66 @@ class Database:
     
     def get_document(self, doc_id: int) -> Optional[dict]:
         """Récupérer un document par ID."""
-        return self.documents.get(doc_id=doc_id)
+        return self.documents.get(doc_id)
+    
+    def get_documents_by_ids(self, doc_ids: Iterable[int]) -> Dict[int, dict]:
+        """Récupérer plusieurs documents en une lecture: {doc_id: document}."""
+        return self.documents.get_many(doc_ids)
     
     def get_documents_by_owner(self, owner_id: int) -> List[dict]:
         """Récupérer tous les documents d'un propriétaire."""
-        Doc = Query()
-        return self.documents.search(Doc.owner_id == owner_id)
+        return self.documents.find(owner_id=owner_id)
     
     def get_all_documents(self) -> List[dict]:
         """Récupérer tous les documents."""
         return self.documents.all()
     
-    def delete_document(self, doc_id: int):
-        """Supprimer un document et ses ACLs."""
-        self.documents.remove(doc_ids=[doc_id])
-        ACL = Query()
-        self.document_acls.remove(ACL.document_id == doc_id)
+    @write_operation
+    def delete_document(self, doc_id: int) -> Optional[str]:
+        """Supprimer un document et ses ACLs. Retourne son blob (à supprimer par l'appelant), s'il en a un."""
+        document = self.documents.get(doc_id)
+        acls = self.document_acls.find(document_id=doc_id)
+        self.documents.remove([doc_id])
+        self.document_acls.remove([acl.doc_id for acl in acls])
+        if document:
+            # Les utilisateurs avec qui il était partagé doivent aussi l'oublier
+            self.change_log.record('documents', [doc_id], deleted=True,
+                                   audience=[document['owner_id']] + [acl['user_id'] for acl in acls])
+            return document.get('blob_id')
+        return None
     
-    def update_document(self, doc_id: int, title: str = None, content: str = None, is_confidential: bool = None):
-        """Mettre à jour un document (requiert permission 'write')."""
+    @write_operation
+    def update_document(self, doc_id: int, title: str = None, content: str = None, is_confidential: bool = None,
+                        blob_id: str = None, content_size: int = None, content_type: str = None) -> Optional[dict]:
+        """
+        Mettre à jour un document (requiert permission 'write'). Le contenu est
+        remplacé par `content` (en ligne) ou par le blob chiffré `blob_id`.
+        Retourne le document avant la mise à jour, None s'il n'existe plus :
+        l'appelant supprime alors le nouveau blob, sinon l'ancien si le
+        contenu a été remplacé.
+        """
+        previous = self.documents.get(doc_id)
+        if previous is None:
+            return None
         update_data = {'updated_at': datetime.utcnow().isoformat()}
         if title is not None:
             update_data['title'] = title
-        if content is not None:
+        if blob_id is not None:
+            update_data['content'] = None
+            update_data['blob_id'] = blob_id
+            update_data['content_size'] = content_size
+            update_data['content_type'] = content_type
+        elif content is not None:
             update_data['content'] = content
+            update_data['blob_id'] = None
+            update_data['content_size'] = len(content.encode('utf-8'))
         if is_confidential is not None:
             update_data['is_confidential'] = is_confidential
-        self.documents.update(update_data, doc_ids=[doc_id])
+        self.documents.update(update_data, [doc_id])
+        return previous
     
     # ACL Operations (Matrice d'accès)
+    @write_operation
     def create_document_acl(self, document_id: int, user_id: int, user_email: str,
                            permissions: List[str], can_reshare: bool, 
                            granted_by: int, granted_by_email: str, is_dac_mode: bool) -> int:
@@ -433,31 +855,32 @@ class Database:
             'is_dac_mode': is_dac_mode,
             'created_at': datetime.utcnow().isoformat()
         })
+        self.change_log.record('documents', [document_id])
         return acl_id
     
     def get_document_acl(self, acl_id: int) -> Optional[dict]:
         """Récupérer une ACL par ID."""
-        return self.document_acls.get(doc_id=acl_id)
+        return self.document_acls.get(acl_id)
     
     def get_acls_for_document(self, document_id: int) -> List[dict]:
         """Récupérer toutes les ACLs d'un document."""
-        ACL = Query()
-        return self.document_acls.search(ACL.document_id == document_id)
+        return self.document_acls.find(document_id=document_id)
     
     def get_acls_for_user(self, user_id: int) -> List[dict]:
         """Récupérer toutes les ACLs d'un utilisateur."""
-        ACL = Query()
-        return self.document_acls.search(ACL.user_id == user_id)
+        return self.document_acls.find(user_id=user_id)
     
     def get_user_document_acl(self, document_id: int, user_id: int) -> Optional[dict]:
         """Vérifier si un utilisateur a des droits sur un document."""
-        ACL = Query()
-        result = self.document_acls.search((ACL.document_id == document_id) & (ACL.user_id == user_id))
-        return result[0] if result else None
+        return self.document_acls.find_one(document_id=document_id, user_id=user_id)
     
+    @write_operation
     def delete_document_acl(self, acl_id: int):
         """Révoquer une ACL (REVOKE operation dans HRU)."""
-        self.document_acls.remove(doc_ids=[acl_id])
+        acl = self.document_acls.get(acl_id)
+        self.document_acls.remove([acl_id])
+        if acl:
+            self.change_log.record('documents', [acl['document_id']], audience=[acl['user_id']])
     
     def get_all_document_acls(self) -> List[dict]:
         """Récupérer toutes les ACLs (pour visualisation de la matrice)."""
@@ -467,6 +890,7 @@ class Database:
     # FONCTIONNALITÉ 2: DÉLÉGATION DE DROITS (DAC - Take-Grant)
     # ================================================================
     
+    @write_operation
     def create_delegation(self, delegator_id: int, delegator_email: str,
                          delegate_id: int, delegate_email: str,
                          rights: List[str], can_redelegate: bool,
@@ -487,23 +911,20 @@ class Database:
             'is_active': True,
             'created_at': datetime.utcnow().isoformat()
         })
+        self._notify('delegations', delegate_id)
         return delegation_id
     
     def get_delegation(self, delegation_id: int) -> Optional[dict]:
         """Récupérer une délégation par ID."""
-        return self.delegations.get(doc_id=delegation_id)
+        return self.delegations.get(delegation_id)
     
     def get_delegations_by_delegator(self, delegator_id: int) -> List[dict]:
         """Récupérer toutes les délégations créées par un utilisateur."""
-        Delegation = Query()
-        return self.delegations.search(Delegation.delegator_id == delegator_id)
+        return self.delegations.find(delegator_id=delegator_id)
     
     def get_active_delegations_by_delegator(self, delegator_id: int) -> List[dict]:
         """Récupérer les délégations actives créées par un utilisateur."""
-        Delegation = Query()
-        all_delegations = self.delegations.search(
-            (Delegation.delegator_id == delegator_id) & (Delegation.is_active == True)
-        )
+        all_delegations = self.delegations.find(delegator_id=delegator_id, is_active=True)
         # Filtrer les expirées
         now = datetime.utcnow()
         active = []
@@ -518,15 +939,11 @@ class Database:
     
     def get_delegations_for_delegate(self, delegate_id: int) -> List[dict]:
         """Récupérer toutes les délégations reçues par un utilisateur."""
-        Delegation = Query()
-        return self.delegations.search(Delegation.delegate_id == delegate_id)
+        return self.delegations.find(delegate_id=delegate_id)
     
     def get_active_delegations_for_delegate(self, delegate_id: int) -> List[dict]:
         """Récupérer les délégations actives et non expirées."""
-        Delegation = Query()
-        all_delegations = self.delegations.search(
-            (Delegation.delegate_id == delegate_id) & (Delegation.is_active == True)
-        )
+        all_delegations = self.delegations.find(delegate_id=delegate_id, is_active=True)
         # Filtrer les expirées
         now = datetime.utcnow()
         active = []
@@ -539,9 +956,13 @@ class Database:
                 active.append(d)  # DAC mode sans expiration
         return active
     
+    @write_operation
     def revoke_delegation(self, delegation_id: int):
         """Révoquer une délégation."""
-        self.delegations.update({'is_active': False}, doc_ids=[delegation_id])
+        self.delegations.update({'is_active': False}, [delegation_id])
+        delegation = self.delegations.get(delegation_id)
+        if delegation:
+            self._notify('delegations', delegation['delegate_id'])
     
     def get_all_delegations(self) -> List[dict]:
         """Récupérer toutes les délégations (pour visualisation)."""
@@ -550,8 +971,7 @@ class Database:
     def get_delegation_chain(self, user_id: int) -> List[dict]:
         """Récupérer la chaîne de délégation pour un utilisateur."""
         chain = []
-        Delegation = Query()
-        current = self.delegations.search(Delegation.delegate_id == user_id)
+        current = self.delegations.find(delegate_id=user_id)
         for d in current:
             chain.append(d)
             if d['delegator_id'] != user_id:
@@ -578,8 +998,50 @@ class Database:
     
     def close(self):
         """Close database connection."""
-        self.db.close()
+        self.batcher.close()
+        self.engine.close()
+
+
+
+class AsyncDatabase:
+    """
+    Awaitable facade over Database for the FastAPI handlers.
+    
+    Every call runs on a dedicated I/O thread pool, so file I/O, JSON
+    encoding and group-commit waits never block the event loop:
+        user = await adb.get_user_by_email(email)
+    """
+    
+    def __init__(self, database: Database, max_workers: int = None):
+        if max_workers is None:
+            max_workers = settings.DATABASE_IO_WORKERS
+        self.sync = database
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db-io')
+    
+    async def run(self, func, *args, **kwargs):
+        """Run any blocking callable on the database I/O pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+    
+    def __getattr__(self, name: str):
+        method = getattr(self.sync, name)
+        if name.startswith('_') or not callable(method):
+            raise AttributeError(name)
+        
+        @wraps(method)
+        async def async_method(*args, **kwargs):
+            return await self.run(method, *args, **kwargs)
+        
+        # Cache the wrapper so __getattr__ only runs once per method
+        setattr(self, name, async_method)
+        return async_method
+    
+    def close(self):
+        """Wait for pending calls, then close the database."""
+        self._executor.shutdown(wait=True)
+        self.sync.close()
 
 
-# Global database instance
+# Global database instances
 db = Database()
+adb = AsyncDatabase(db)
@@ -0,0 +1,339 @@
+"""
+Key agreement for the /handshake endpoints.
+
+Two groups can be negotiated: "modp1536" (classic finite-field DH, the
+original protocol) and "x25519" (elliptic curve, via `cryptography`).
+
+Finite-field Diffie-Hellman uses a fixed generator.
+
+The group (p, g) never changes, so g^x mod p is computed with the
+fixed-base windowed method: the table holds g^(d * 2^(w*i)) for every
+w-bit digit d and position i, and g^x is the product of one entry per digit
+of x. That is about 1536/w multiplications instead of the ~1800 of a full
+pow(), and no squaring at all.
+
+Private keys are either full size (uniform in [2, p-2]) or, when
+DH_EXPONENT_BITS is set, short exponents of that many bits. For a
+safe-prime group such as RFC 3526 MODP-1536, 256 bits already exceed the
+security of the modulus.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import List, Optional, Tuple
+import multiprocessing
+import secrets
+import threading
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives import serialization
+
+from config import settings
+
+
+MODP_1536 = 'modp1536'
+X25519 = 'x25519'
+# Advertised by /handshake/params, modp first: the default for old clients
+HANDSHAKE_GROUPS = (MODP_1536, X25519)
+
+# Short exponents below this size would be weaker than the group itself
+MIN_EXPONENT_BITS = 256
+
+
+class ModpGroup:
+    """A DH group (p, g) with a precomputed fixed-base table for g."""
+
+    def __init__(self, p: int, g: int, exponent_bits: int = 0, window_bits: int = 6):
+        if exponent_bits and not MIN_EXPONENT_BITS <= exponent_bits < p.bit_length():
+            raise ValueError(
+                f"DH_EXPONENT_BITS must be 0 (full size) or between {MIN_EXPONENT_BITS} "
+                f"and {p.bit_length() - 1}, got {exponent_bits}"
+            )
+        self.p = p
+        self.g = g
+        self.exponent_bits = exponent_bits
+        self.window_bits = window_bits
+        self._table: Optional[List[List[int]]] = None
+        self._table_lock = threading.Lock()
+
+    def generate_private_key(self) -> int:
+        if self.exponent_bits:
+            # Exactly `exponent_bits` bits, so the key size leaks nothing
+            return secrets.randbits(self.exponent_bits - 1) | (1 << (self.exponent_bits - 1))
+        return secrets.randbelow(self.p - 3) + 2
+
+    def public_key(self, private_key: int) -> int:
+        """g^private_key mod p from the precomputed table."""
+        if not 0 < private_key < self.p:
+            return pow(self.g, private_key, self.p)
+        table = self._get_table()
+        p = self.p
+        mask = (1 << self.window_bits) - 1
+        result = 1
+        for row in table:
+            if not private_key:
+                break
+            digit = private_key & mask
+            if digit:
+                result = result * row[digit] % p
+            private_key >>= self.window_bits
+        return result
+
+    def shared_secret(self, other_public_key: int, private_key: int) -> int:
+        """other_public_key^private_key mod p (variable base: plain pow)."""
+        return pow(other_public_key, private_key, self.p)
+
+    def _get_table(self) -> List[List[int]]:
+        # Built on first use (~190ms for MODP-1536 with 6-bit windows)
+        if self._table is None:
+            with self._table_lock:
+                if self._table is None:
+                    self._table = self._build_table()
+        return self._table
+
+    def _build_table(self) -> List[List[int]]:
+        p, w = self.p, self.window_bits
+        rows = -(-p.bit_length() // w)
+        table = []
+        base = self.g  # g^(2^(w*i))
+        for _ in range(rows):
+            row = [1] * (1 << w)
+            power = 1
+            for digit in range(1, 1 << w):
+                power = power * base % p
+                row[digit] = power
+            table.append(row)
+            base = power * base % p
+        return table
+
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+
+def get_group(p: int, g: int, exponent_bits: int = None) -> ModpGroup:
+    """The shared ModpGroup for (p, g), created once per process."""
+    if exponent_bits is None:
+        exponent_bits = settings.DH_EXPONENT_BITS
+    key = (p, g, exponent_bits)
+    group = _groups.get(key)
+    if group is None:
+        with _groups_lock:
+            group = _groups.get(key)
+            if group is None:
+                group = _groups[key] = ModpGroup(p, g, exponent_bits)
+    return group
+
+
+# ==================== EPHEMERAL KEYPAIR POOL ====================
+
+def _generate_keypairs(p: int, g: int, exponent_bits: int, count: int) -> List[Tuple[int, int]]:
+    """Runs in a pool process: `count` fresh (private, public) pairs."""
+    group = get_group(p, g, exponent_bits)
+    pairs = []
+    for _ in range(count):
+        private_key = group.generate_private_key()
+        pairs.append((private_key, group.public_key(private_key)))
+    return pairs
+
+
+class KeypairPool:
+    """
+    Ready-made (private, public) pairs for a ModpGroup, so that a handshake
+    only pays for the shared secret.
+
+    Pairs are generated in background processes. When the depth falls to
+    `refill_threshold`, batches are queued until it is back at `size`. Every
+    pair is handed out once (popped under the lock, never kept anywhere
+    else). When the pool is empty, take() generates a pair inline and
+    counts a miss.
+    """
+
+    BATCH_SIZE = 16
+
+    def __init__(self, group: ModpGroup, size: int, refill_threshold: int, workers: int):
+        self.group = group
+        self.size = size
+        self.refill_threshold = min(refill_threshold, size)
+        self._workers = workers
+        self._pairs = deque()
+        # Reentrant: a done callback may run in the thread that submitted
+        self._lock = threading.RLock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self._closed = False
+
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.refill_errors = 0
+
+        with self._lock:
+            self._refill()
+
+    def take(self) -> Tuple[int, int]:
+        with self._lock:
+            pair = self._pairs.popleft() if self._pairs else None
+            if pair is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self._refill()
+        if pair is None:
+            private_key = self.group.generate_private_key()
+            pair = (private_key, self.group.public_key(private_key))
+        return pair
+
+    def _refill(self):
+        """Queue batches up to `size` once the depth hit the threshold. Lock held."""
+        if self._closed or self.size <= 0:
+            return
+        if len(self._pairs) + self._in_flight > self.refill_threshold:
+            return
+        if self._executor is None:
+            # spawn: forking a process running the server threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        while len(self._pairs) + self._in_flight < self.size:
+            count = min(self.BATCH_SIZE, self.size - len(self._pairs) - self._in_flight)
+            try:
+                future = self._executor.submit(
+                    _generate_keypairs, self.group.p, self.group.g, self.group.exponent_bits, count
+                )
+            except RuntimeError:
+                # Executor broken or shut down: requests fall back to inline generation
+                self.refill_errors += 1
+                return
+            self._in_flight += count
+            future.add_done_callback(partial(self._refilled, count))
+
+    def _refilled(self, count: int, future):
+        try:
+            pairs = future.result()
+        except BaseException:
+            pairs = []
+        with self._lock:
+            self._in_flight -= count
+            if self._closed:
+                return
+            if not pairs:
+                self.refill_errors += 1
+            else:
+                self._pairs.extend(pairs)
+                self.generated += len(pairs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            taken = self.hits + self.misses
+            return {
+                "depth": len(self._pairs),
+                "size": self.size,
+                "refill_threshold": self.refill_threshold,
+                "in_flight": self._in_flight,
+                "taken": taken,
+                "hits": self.hits,
+                "misses": self.misses,
+                "miss_rate": round(self.misses / taken, 4) if taken else 0.0,
+                "generated": self.generated,
+                "refill_errors": self.refill_errors,
+            }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._pairs.clear()
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+_pools = {}
+
+
+def get_keypair_pool(p: int, g: int) -> KeypairPool:
+    """The shared KeypairPool of (p, g), started on first use."""
+    group = get_group(p, g)
+    key = (p, g, group.exponent_bits)
+    pool = _pools.get(key)
+    if pool is None:
+        with _groups_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = KeypairPool(
+                    group,
+                    settings.DH_KEYPAIR_POOL_SIZE,
+                    settings.DH_KEYPAIR_POOL_REFILL_THRESHOLD,
+                    settings.DH_KEYPAIR_POOL_WORKERS
+                )
+    return pool
+
+
+def keypair_pool_stats() -> dict:
+    """Depth and miss rate of every pool, keyed like the handshake groups."""
+    with _groups_lock:
+        pools = list(_pools.values())
+    return {f"modp{pool.group.p.bit_length()}": pool.stats() for pool in pools}
+
+
+def close_keypair_pools():
+    """Stop the background generators (application shutdown)."""
+    with _groups_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+# ==================== X25519 ====================
+
+def x25519_exchange(peer_public_key: bytes) -> Tuple[bytes, bytes]:
+    """
+    Answer a client's X25519 public key with a fresh ephemeral key pair.
+    Returns (our raw public key, raw shared secret). Raises ValueError for
+    malformed or low-order peer keys.
+    """
+    private_key = X25519PrivateKey.generate()
+    shared_secret = private_key.exchange(X25519PublicKey.from_public_bytes(peer_public_key))
+    public_key = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.Raw,
+        format=serialization.PublicFormat.Raw
+    )
+    return public_key, shared_secret
+
+
+# ==================== METRICS ====================
+
+class HandshakeMetrics:
+    """Per-group handshake latency (count, average, p50/p99 of recent ones, max)."""
+
+    def __init__(self, window: int = 1024):
+        self._window = window
+        self._lock = threading.Lock()
+        self._groups = {}
+
+    def record(self, group: str, seconds: float):
+        with self._lock:
+            stats = self._groups.get(group)
+            if stats is None:
+                stats = self._groups[group] = {
+                    'count': 0, 'total': 0.0, 'max': 0.0, 'recent': deque(maxlen=self._window)
+                }
+            stats['count'] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            stats['recent'].append(seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = {}
+            for group, stats in self._groups.items():
+                recent = sorted(stats['recent'])
+                result[group] = {
+                    'count': stats['count'],
+                    'avg_ms': round(stats['total'] / stats['count'] * 1000, 3),
+                    'p50_ms': round(recent[len(recent) // 2] * 1000, 3),
+                    'p99_ms': round(recent[min(len(recent) - 1, len(recent) * 99 // 100)] * 1000, 3),
+                    'max_ms': round(stats['max'] * 1000, 3),
+                }
+            return result
@@ -0,0 +1,223 @@
+"""
+Server push (GET /events, Server-Sent Events) so that dashboards learn about
+new leave requests, status changes, pending communication authorizations and
+messages without refetching their lists.
+
+Database publishes an event once the write carrying it is durable (see
+Database.add_event_listener); EventBroker picks the connected users allowed
+to see it and queues the encoded frame on their streams. Events only carry
+ids and statuses: clients refetch the rows with ?since= (cursor of the list
+endpoints). Each stream holds at most `queue_size` frames; a client that
+does not keep up gets a single `resync` event instead of the backlog.
+
+Events are published by the worker process that made the write: with
+several uvicorn workers, a stream only sees the writes of its own worker.
+"""
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set
+import asyncio
+import json
+import threading
+import time
+
+
+def encode_event(event_type: str, data: dict) -> bytes:
+    """One SSE frame."""
+    return f"event: {event_type}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+READY = b"retry: 5000\n" + encode_event("ready", {})
+RESYNC = encode_event("resync", {})
+EXPIRED = encode_event("expired", {})
+KEEPALIVE = b": keepalive\n\n"
+_CLOSE = b""
+
+
+class EventStream:
+    """
+    Pending frames of one connection. A plain list and a future that only
+    exists while the stream waits: an idle stream costs a few hundred bytes
+    on top of the request itself (an asyncio.Queue is ~3 KB).
+    """
+
+    __slots__ = ('user_id', 'role', '_frames', '_size', '_waiter')
+
+    def __init__(self, user_id: int, role: str, queue_size: int):
+        self.user_id = user_id
+        self.role = role
+        self._frames: List[bytes] = []
+        self._size = queue_size
+        self._waiter: Optional[asyncio.Future] = None
+
+    def put(self, frame: bytes):
+        """Queue a frame (event loop thread). A full queue is replaced by one resync."""
+        if len(self._frames) >= self._size:
+            self._frames.clear()
+            if frame is not _CLOSE:
+                frame = RESYNC
+        self._frames.append(frame)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def next(self, timeout: float) -> Optional[bytes]:
+        """Next frame, None after `timeout` seconds, _CLOSE when the broker shuts down."""
+        if not self._frames:
+            loop = asyncio.get_running_loop()
+            self._waiter = loop.create_future()
+            timer = loop.call_later(timeout, _wake, self._waiter)
+            try:
+                await self._waiter
+            finally:
+                timer.cancel()
+                self._waiter = None
+            if not self._frames:
+                return None
+        return self._frames.pop(0)
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class DelegatedRights:
+    """
+    Active delegated rights of every delegate, loaded in one read and
+    reloaded after a delegation change (or `refresh_seconds`, for changes
+    made by other workers).
+    """
+
+    def __init__(self, load: Callable[[], List[dict]], refresh_seconds: float = 60):
+        self._load = load
+        self._refresh = refresh_seconds
+        self._lock = threading.Lock()
+        self._holders: Optional[Dict[str, Dict[int, List[Optional[str]]]]] = None
+        self._loaded_at = 0.0
+
+    def invalidate(self, *args):
+        with self._lock:
+            self._holders = None
+
+    def holders(self, right: str) -> Set[int]:
+        """Users holding `right` through an active, non expired delegation."""
+        with self._lock:
+            if self._holders is None or time.monotonic() - self._loaded_at > self._refresh:
+                holders = {}
+                for delegation in self._load():
+                    if not delegation.get('is_active'):
+                        continue
+                    for granted in delegation['rights']:
+                        holders.setdefault(granted, {}).setdefault(
+                            delegation['delegate_id'], []
+                        ).append(delegation.get('expires_at'))
+                self._holders = holders
+                self._loaded_at = time.monotonic()
+            delegates = self._holders.get(right, {})
+        now = datetime.utcnow().isoformat()
+        return {
+            user_id for user_id, expirations in delegates.items()
+            if any(expires_at is None or expires_at > now for expires_at in expirations)
+        }
+
+
+class EventBroker:
+    """Connected streams, indexed by user and role, and event fan-out."""
+
+    def __init__(self, rights: DelegatedRights, max_connections: int, queue_size: int):
+        self._rights = rights
+        self._max_connections = max_connections
+        self._queue_size = queue_size
+        self._lock = threading.Lock()
+        self._by_user: Dict[int, Set[EventStream]] = {}
+        self._by_role: Dict[str, Set[EventStream]] = {}
+        self._count = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Metrics
+        self._published = 0
+        self._delivered = 0
+
+    @property
+    def full(self) -> bool:
+        """The connection limit is reached: refuse new streams."""
+        return self._count >= self._max_connections
+
+    def register(self, user_id: int, role: str) -> EventStream:
+        """New stream for a user (event loop thread)."""
+        self._loop = asyncio.get_running_loop()
+        stream = EventStream(user_id, role, self._queue_size)
+        with self._lock:
+            self._by_user.setdefault(user_id, set()).add(stream)
+            self._by_role.setdefault(role, set()).add(stream)
+            self._count += 1
+        return stream
+
+    def unregister(self, stream: EventStream):
+        with self._lock:
+            if stream not in self._by_user.get(stream.user_id, ()):
+                return
+            for index, key in ((self._by_user, stream.user_id), (self._by_role, stream.role)):
+                streams = index[key]
+                streams.discard(stream)
+                if not streams:
+                    del index[key]
+            self._count -= 1
+
+    def publish(self, event: dict):
+        """
+        Deliver a database event (any thread) to the streams allowed to see it.
+        Called once the write is durable.
+        """
+        event = dict(event)
+        event_type = event.pop('type')
+        users, roles, right = _audience(event_type, event)
+        loop = self._loop
+        self._published += 1
+        if loop is None or not self._count:
+            return
+        holders = self._rights.holders(right) if right else ()
+        with self._lock:
+            if not self._count:
+                return
+            streams = set()
+            for role in roles:
+                streams.update(self._by_role.get(role, ()))
+            for user_id in (*users, *holders):
+                streams.update(self._by_user.get(user_id, ()))
+        if streams:
+            self._delivered += len(streams)
+            loop.call_soon_threadsafe(_deliver, streams, encode_event(event_type, event))
+
+    def close(self):
+        """End every stream (shutdown)."""
+        with self._lock:
+            streams = [stream for streams in self._by_user.values() for stream in streams]
+        if streams and self._loop is not None:
+            _deliver(streams, _CLOSE)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'connections': self._count,
+                'users': len(self._by_user),
+                'published': self._published,
+                'delivered': self._delivered
+            }
+
+
+def _deliver(streams: Iterable[EventStream], frame: bytes):
+    for stream in streams:
+        stream.put(frame)
+
+
+def _audience(event_type: str, event: dict) -> tuple:
+    """(user ids, roles, delegated right) that may see an event."""
+    if event_type.startswith('leave_request.'):
+        # Same readers as /leave-requests/my-requests and /leave-requests/all
+        return (event['employee_id'],), ('hr_manager',), 'view_requests'
+    if event_type.startswith('communication_auth.'):
+        return (event['employee_id'],), ('admin',), None
+    if event_type == 'message.received':
+        # The recipient, and admins through /admin/messages
+        return (event['to_id'],), ('admin',), None
+    return (), (), None
@@ -0,0 +1,232 @@
+"""
+In-memory secondary indexes for storage engines without native indexes.
+
+IndexedTable wraps a StorageTable and keeps one hash index per declared
+field tuple (e.g. ('email',) or ('document_id', 'user_id')), so that
+find() on indexed fields is a dict lookup instead of a full table scan.
+The indexes are rebuilt when the engine reloads data written by another
+process (StorageEngine.generation).
+"""
+from typing import Optional, List, Iterable, Dict, Set
+from tinydb.table import Document
+from storage import StorageTable, StorageEngine, IndexSpec, _normalize_indexes, _matches
+
+
+class HashIndex:
+    """Maps a tuple of field values to the set of matching doc_ids."""
+
+    def __init__(self, fields: tuple):
+        self.fields = fields
+        self.entries: Dict[tuple, Set[int]] = {}
+
+    def key(self, document: dict) -> Optional[tuple]:
+        # Documents missing one of the fields never match find() on it
+        if any(field not in document for field in self.fields):
+            return None
+        return tuple(document[field] for field in self.fields)
+
+    def add(self, doc_id: int, document: dict):
+        key = self.key(document)
+        if key is not None:
+            self.entries.setdefault(key, set()).add(doc_id)
+
+    def discard(self, doc_id: int, document: dict):
+        key = self.key(document)
+        if key is None:
+            return
+        doc_ids = self.entries.get(key)
+        if doc_ids is not None:
+            doc_ids.discard(doc_id)
+            if not doc_ids:
+                del self.entries[key]
+
+    def lookup(self, criteria: dict) -> Set[int]:
+        return self.entries.get(tuple(criteria[field] for field in self.fields), set())
+
+    def clear(self):
+        self.entries.clear()
+
+
+class IndexedTable(StorageTable):
+    """StorageTable decorator maintaining hash indexes on every write path."""
+
+    def __init__(self, table: StorageTable, indexes: Iterable[IndexSpec], engine: StorageEngine):
+        self.name = table.name
+        self._table = table
+        self._engine = engine
+        self._indexes = [HashIndex(fields) for fields in _normalize_indexes(indexes)]
+        self._indexed_fields = {field for index in self._indexes for field in index.fields}
+        self.rebuild()
+
+    def rebuild(self):
+        """Recompute every index from the table contents."""
+        with self._engine.snapshot():
+            for index in self._indexes:
+                index.clear()
+            for document in self._table.all():
+                for index in self._indexes:
+                    index.add(document.doc_id, document)
+            self._generation = self._engine.generation
+
+    def _sync(self):
+        """Rebuild if the engine reloaded the table since the last build."""
+        if self._generation != self._engine.generation:
+            self.rebuild()
+
+    def verify(self) -> List[str]:
+        """Compare the live indexes with freshly built ones. Returns the mismatches."""
+        with self._engine.snapshot():
+            self._sync()
+            documents = self._table.all()
+            problems = []
+            for index in self._indexes:
+                expected = HashIndex(index.fields)
+                for document in documents:
+                    expected.add(document.doc_id, document)
+                for key in index.entries.keys() | expected.entries.keys():
+                    indexed = index.entries.get(key, set())
+                    actual = expected.entries.get(key, set())
+                    if indexed != actual:
+                        problems.append(
+                            f"{self.name}{list(index.fields)}={list(key)}: "
+                            f"indexed {sorted(indexed)}, expected {sorted(actual)}"
+                        )
+            return problems
+
+    def _index_for(self, criteria: dict) -> Optional[HashIndex]:
+        """Pick the most selective index fully covered by the criteria."""
+        best = None
+        for index in self._indexes:
+            if all(field in criteria for field in index.fields):
+                if best is None or len(index.fields) > len(best.fields):
+                    best = index
+        return best
+
+    def insert(self, fields: dict) -> int:
+        with self._engine.transaction():
+            self._sync()
+            doc_id = self._table.insert(fields)
+            for index in self._indexes:
+                index.add(doc_id, fields)
+            return doc_id
+
+    def insert_many(self, documents: Iterable[dict]) -> List[int]:
+        documents = list(documents)
+        with self._engine.transaction():
+            self._sync()
+            doc_ids = self._table.insert_many(documents)
+            for doc_id, fields in zip(doc_ids, documents):
+                for index in self._indexes:
+                    index.add(doc_id, fields)
+            return doc_ids
+
+    def get(self, doc_id: int) -> Optional[Document]:
+        return self._table.get(doc_id)
+
+    def all(self) -> List[Document]:
+        return self._table.all()
+
+    def scan(self, after_id: int = 0, limit: int = 500, **criteria) -> List[Document]:
+        if not criteria:
+            return self._table.scan(after_id, limit)
+        with self._engine.snapshot():
+            self._sync()
+            index = self._index_for(criteria)
+            if index is None:
+                return self._table.scan(after_id, limit, **criteria)
+            return self._lookup(
+                sorted(doc_id for doc_id in index.lookup(criteria) if doc_id > after_id), criteria, limit
+            )
+
+    def find(self, **criteria) -> List[Document]:
+        with self._engine.snapshot():
+            self._sync()
+            index = self._index_for(criteria)
+            if index is None:
+                return self._table.find(**criteria)
+            return self._lookup(sorted(index.lookup(criteria)), criteria)
+
+    def get_many(self, doc_ids: Iterable[int]) -> Dict[int, Document]:
+        return self._table.get_many(doc_ids)
+
+    def find_in(self, field: str, values: Iterable) -> List[Document]:
+        index = next((index for index in self._indexes if index.fields == (field,)), None)
+        if index is None:
+            return self._table.find_in(field, values)
+        with self._engine.snapshot():
+            self._sync()
+            doc_ids = set()
+            for value in set(values):
+                doc_ids.update(index.entries.get((value,), ()))
+            documents = self._table.get_many(doc_ids)
+            return [documents[doc_id] for doc_id in sorted(documents)]
+
+    def _lookup(self, doc_ids: List[int], criteria: dict, limit: Optional[int] = None) -> List[Document]:
+        """Fetch index candidates, keeping those matching every criterion."""
+        result = []
+        for doc_id in doc_ids:
+            document = self._table.get(doc_id)
+            if document is not None and _matches(document, criteria):
+                result.append(document)
+                if len(result) == limit:
+                    break
+        return result
+
+    def update(self, fields: dict, doc_ids: Iterable[int]):
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return
+        with self._engine.transaction():
+            self._sync()
+            if self._indexed_fields.isdisjoint(fields):
+                self._table.update(fields, doc_ids)
+                return
+
+            old_documents = [self._table.get(doc_id) for doc_id in doc_ids]
+            self._table.update(fields, doc_ids)
+            for document in old_documents:
+                if document is None:
+                    continue
+                new_document = {**document, **fields}
+                for index in self._indexes:
+                    index.discard(document.doc_id, document)
+                    index.add(document.doc_id, new_document)
+
+    def update_many(self, changes: Dict[int, dict]):
+        if not changes:
+            return
+        with self._engine.transaction():
+            self._sync()
+            if all(self._indexed_fields.isdisjoint(fields) for fields in changes.values()):
+                self._table.update_many(changes)
+                return
+
+            old_documents = self._table.get_many(changes)
+            self._table.update_many(changes)
+            for doc_id, document in old_documents.items():
+                new_document = {**document, **changes[doc_id]}
+                for index in self._indexes:
+                    index.discard(doc_id, document)
+                    index.add(doc_id, new_document)
+
+    def remove(self, doc_ids: Iterable[int]):
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return
+        with self._engine.transaction():
+            self._sync()
+            old_documents = [self._table.get(doc_id) for doc_id in doc_ids]
+            self._table.remove(doc_ids)
+            for document in old_documents:
+                if document is not None:
+                    for index in self._indexes:
+                        index.discard(document.doc_id, document)
+
+    def truncate(self):
+        with self._engine.transaction():
+            self._table.truncate()
+            for index in self._indexes:
+                index.clear()
+
+    def __len__(self) -> int:
+        return len(self._table)
@@ -0,0 +1,193 @@
+"""
+Interval index over leave requests: "who is off between X and Y"
+(GET /leave-requests/calendar) without scanning and parsing every row.
+
+Dates are stored as 'YYYY-MM-DD' strings; the index works on day numbers
+(date.toordinal(), 1 to 3652059), both ends included.
+
+IntervalTree is a centered interval tree whose centers are fixed: the
+nodes are the day numbers themselves, laid out as a perfect binary search
+tree (day d is at the depth given by its trailing zero bits). An interval
+belongs to the day of its range with the most trailing zeros, the highest
+node it contains, so adding or removing one only touches its node - no
+rebalancing, no rebuild. Each node keeps its intervals sorted by start and
+by end; intervals are also bucketed by start day.
+
+The intervals overlapping [first, last] are those containing `first` (a
+root-to-leaf walk of DEPTH nodes, a bisect per node) plus those starting
+in (first, last] (a bisect in the sorted start days, then whole buckets):
+O(log n + k) for k results, no row is parsed.
+
+IntervalIndex keeps a tree over a table and follows the writes of every
+worker through the change log (the revisions behind ?since=) before each
+query. Updates that leave the dates alone (status changes) cost nothing.
+"""
+from bisect import bisect_left, bisect_right, insort
+from datetime import date
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import threading
+
+from tinydb.table import Document
+
+from changes import ChangeFollower, ChangeLog
+from storage import StorageEngine, StorageTable
+
+
+class OverlappingLeaveRequestError(ValueError):
+    """The employee already has a leave request over these dates."""
+
+    def __init__(self, request_id: int):
+        super().__init__(f"Overlaps leave request {request_id}")
+        self.request_id = request_id
+
+
+@lru_cache(maxsize=65536)
+def parse_day(value: str) -> int:
+    """'YYYY-MM-DD' -> day number. Cached: equal days share one int object."""
+    return date.fromisoformat(value).toordinal()
+
+
+def interval_of(document: dict, start_field: str, end_field: str) -> Optional[Tuple[int, int]]:
+    """(first day, last day) of a document, None if its dates are missing or invalid."""
+    try:
+        first, last = parse_day(document[start_field]), parse_day(document[end_field])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return (first, last) if first <= last else None
+
+
+# date.max.toordinal() < 2 ** DEPTH: every day is a node of the tree
+DEPTH = date.max.toordinal().bit_length()
+ROOT = 1 << (DEPTH - 1)
+
+
+def _node_of(first: int, last: int) -> int:
+    """The day of [first, last] with the most trailing zero bits (highest node)."""
+    if first == last:
+        return first
+    bits = (first ^ last).bit_length()
+    node = (last >> bits) << bits
+    if node == first:
+        return first
+    return (last >> (bits - 1)) << (bits - 1)
+
+
+class IntervalTree:
+    """Dynamic set of (first day, last day, id) intervals."""
+
+    def __init__(self):
+        # node -> (starts, ids by start, ends, ids by end)
+        self._nodes: Dict[int, Tuple[List[int], List[int], List[int], List[int]]] = {}
+        self._by_start: Dict[int, List[int]] = {}
+        self._start_days: List[int] = []
+        self._size = 0
+
+    def add(self, doc_id: int, first: int, last: int):
+        key = _node_of(first, last)
+        node = self._nodes.get(key)
+        if node is None:
+            node = self._nodes[key] = ([], [], [], [])
+        starts, start_ids, ends, end_ids = node
+        index = bisect_right(starts, first)
+        starts.insert(index, first)
+        start_ids.insert(index, doc_id)
+        index = bisect_right(ends, last)
+        ends.insert(index, last)
+        end_ids.insert(index, doc_id)
+
+        bucket = self._by_start.get(first)
+        if bucket is None:
+            bucket = self._by_start[first] = []
+            insort(self._start_days, first)
+        bucket.append(doc_id)
+        self._size += 1
+
+    def discard(self, doc_id: int, first: int, last: int):
+        """Remove an interval added with these exact bounds."""
+        key = _node_of(first, last)
+        starts, start_ids, ends, end_ids = self._nodes[key]
+        index = start_ids.index(doc_id, bisect_left(starts, first), bisect_right(starts, first))
+        del starts[index], start_ids[index]
+        index = end_ids.index(doc_id, bisect_left(ends, last), bisect_right(ends, last))
+        del ends[index], end_ids[index]
+        if not starts:
+            del self._nodes[key]
+
+        bucket = self._by_start[first]
+        bucket.remove(doc_id)
+        if not bucket:
+            del self._by_start[first]
+            del self._start_days[bisect_left(self._start_days, first)]
+        self._size -= 1
+
+    def overlapping(self, first: int, last: int) -> List[int]:
+        """IDs of the intervals sharing at least one day with [first, last]."""
+        result = []
+        # Intervals containing `first`: all on its root-to-leaf path
+        center, step = ROOT, ROOT >> 1
+        while True:
+            node = self._nodes.get(center)
+            if node is not None:
+                starts, start_ids, ends, end_ids = node
+                if first < center:
+                    result.extend(start_ids[:bisect_right(starts, first)])
+                elif first > center:
+                    result.extend(end_ids[bisect_left(ends, first):])
+                else:
+                    result.extend(start_ids)
+            if first == center or not step:
+                break
+            center = center - step if first < center else center + step
+            step >>= 1
+        # Intervals starting in (first, last]
+        days = self._start_days
+        for day in days[bisect_right(days, first):bisect_right(days, last)]:
+            result.extend(self._by_start[day])
+        return result
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class IntervalIndex(ChangeFollower):
+    """IntervalTree over the (start_field, end_field) dates of a tracked table."""
+
+    def __init__(self, engine: StorageEngine, table: StorageTable, change_log: ChangeLog,
+                 start_field: str, end_field: str):
+        self._start_field = start_field
+        self._end_field = end_field
+        self._lock = threading.Lock()
+        super().__init__(engine, table, change_log)
+
+    def _reset(self):
+        super()._reset()
+        self._tree = IntervalTree()
+        self._intervals: Dict[int, Tuple[int, int]] = {}
+
+    def overlapping(self, first: str, last: str) -> List[int]:
+        """IDs of the documents whose dates share at least one day with [first, last], sorted."""
+        first, last = parse_day(first), parse_day(last)
+        with self._lock:
+            self.catch_up()
+            result = self._tree.overlapping(first, last)
+        result.sort()
+        return result
+
+    def _apply(self, changes: List[Tuple[int, Optional[Document]]]):
+        for doc_id, document in changes:
+            interval = document and interval_of(document, self._start_field, self._end_field)
+            previous = self._intervals.get(doc_id)
+            # Dates changed, or an ID reused by the engine after a deletion
+            if interval == previous:
+                continue
+            if previous is not None:
+                self._tree.discard(doc_id, *previous)
+                del self._intervals[doc_id]
+            if interval is not None:
+                self._tree.add(doc_id, *interval)
+                self._intervals[doc_id] = interval
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._intervals)
@@ -0,0 +1,105 @@
+"""
+Background jobs started from the API.
+
+A Job runs as an asyncio task of the worker process that accepted the
+request and records its progress, so that the client can poll
+GET /jobs/{job_id} instead of holding a request open. Jobs are kept in
+memory: with several uvicorn workers, the status is only known to the
+worker that started the job.
+"""
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import secrets
+import traceback
+
+
+class Job:
+    """State and progress counters of one background job."""
+
+    def __init__(self, kind: str, owner_id: int):
+        self.id = secrets.token_hex(8)
+        self.kind = kind
+        self.owner_id = owner_id
+        self.status = "pending"  # pending, running, completed or failed
+        self.progress: Dict[str, int] = {}
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow().isoformat()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobRegistry:
+    """Starts jobs on the running event loop and keeps the recent ones."""
+
+    def __init__(self, max_finished: int = 100):
+        self._max_finished = max_finished
+        self._jobs: Dict[str, Job] = {}
+        self._tasks = set()  # The loop only keeps weak references to tasks
+
+    def start(self, kind: str, owner_id: int, run: Callable[[Job], Awaitable[dict]]) -> Job:
+        """Create a job and schedule `run(job)`; its return value becomes job.result."""
+        job = Job(kind, owner_id)
+        self._jobs[job.id] = job
+        self._prune()
+        task = asyncio.get_running_loop().create_task(self._run(job, run))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: Job, run: Callable[[Job], Awaitable[dict]]):
+        job.status = "running"
+        job.started_at = datetime.utcnow().isoformat()
+        try:
+            job.result = await run(job)
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.error = "cancelled"
+            job.status = "failed"
+            raise
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e) or type(e).__name__
+            job.status = "failed"
+        finally:
+            job.finished_at = datetime.utcnow().isoformat()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def active(self, kind: str) -> Optional[Job]:
+        """The unfinished job of this kind, if any."""
+        for job in self._jobs.values():
+            if job.kind == kind and not job.finished:
+                return job
+        return None
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self._max_finished)]:
+            del self._jobs[job_id]
+
+    async def cancel_all(self):
+        """Cancel running jobs (application shutdown)."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
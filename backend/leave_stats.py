@@ -0,0 +1,155 @@
+"""
+Leave accounting (GET /leave-requests/stats): running totals of requested
+days per employee, type (absence / conge) and month, by status.
+
+The `leave_stats` table keeps one row per (employee_id, type, month) and
+one all-time row per (employee_id, type) with month None:
+
+    {'employee_id': 3, 'type': 'conge', 'month': '2025-07',
+     'days': {'pending': 0, 'approved': 5, 'rejected': 2},
+     'requests': {'pending': 0, 'approved': 1, 'rejected': 1}}
+
+A request counts in the month of its start date. Database applies the
+difference between the old and new version of a leave request in the same
+transaction as every write (creation, status change, deletion), so the
+totals of an employee are one indexed read whatever the number of requests.
+recompute() rebuilds the table from the leave requests and verify()
+compares it with a full recount.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+from tinydb.table import Document
+from storage import StorageTable, StorageEngine
+
+
+STATUSES = ('pending', 'approved', 'rejected')
+
+# (employee_id, type, month or None) -> {'days': {...}, 'requests': {...}}
+Totals = Dict[Tuple[int, str, Optional[str]], dict]
+
+
+def _keys(request: dict) -> List[tuple]:
+    """Rows a leave request counts in: its month and the all-time total."""
+    month = str(request.get('start_date') or '')[:7] or None
+    keys = [(request['employee_id'], request['type'], None)]
+    if month is not None:
+        keys.append((request['employee_id'], request['type'], month))
+    return keys
+
+
+def _empty() -> dict:
+    return {'days': dict.fromkeys(STATUSES, 0), 'requests': dict.fromkeys(STATUSES, 0)}
+
+
+def _count(totals: Totals, request: dict, sign: int):
+    status = request['status']
+    if status not in STATUSES:
+        return
+    for key in _keys(request):
+        counters = totals.setdefault(key, _empty())
+        counters['days'][status] += sign * request['days_count']
+        counters['requests'][status] += sign
+
+
+class LeaveStats:
+    """Per employee / type / month totals of leave requests, by status."""
+
+    def __init__(self, engine: StorageEngine, table: StorageTable, leave_requests: StorageTable):
+        self._engine = engine
+        self._table = table
+        self._leave_requests = leave_requests
+
+    def apply(self, before: Optional[dict], after: Optional[dict]):
+        """
+        Account for a leave request going from `before` to `after` (None when
+        created / deleted). Call it in the transaction of the write.
+        """
+        self.apply_many([(before, after)])
+
+    def apply_many(self, changes: Iterable[Tuple[Optional[dict], Optional[dict]]]):
+        """apply() for many (before, after) pairs: each counter row is written once."""
+        delta: Totals = {}
+        for before, after in changes:
+            if before is not None:
+                _count(delta, before, -1)
+            if after is not None:
+                _count(delta, after, +1)
+        with self._engine.transaction():
+            added, updated = [], {}
+            for (employee_id, type, month), change in delta.items():
+                if not any(change['requests'].values()) and not any(change['days'].values()):
+                    continue
+                rows = self._table.find(employee_id=employee_id, type=type, month=month)
+                if not rows:
+                    added.append({'employee_id': employee_id, 'type': type, 'month': month, **change})
+                    continue
+                row = rows[0]
+                updated[row.doc_id] = {
+                    field: {status: row[field][status] + change[field][status] for status in STATUSES}
+                    for field in ('days', 'requests')
+                }
+            self._table.insert_many(added)
+            self._table.update_many(updated)
+
+    def totals(self, employee_id: int) -> List[Document]:
+        """All-time rows of an employee (one per type)."""
+        return self._table.find(employee_id=employee_id, month=None)
+
+    def monthly(self, employee_id: int) -> List[Document]:
+        """Per-month rows of an employee."""
+        return [row for row in self._table.find(employee_id=employee_id) if row['month'] is not None]
+
+    def month(self, month: str) -> List[Document]:
+        """Rows of every employee for one month ('YYYY-MM')."""
+        return self._table.find(month=month)
+
+    def all_totals(self) -> List[Document]:
+        """All-time rows of every employee."""
+        return self._table.find(month=None)
+
+    def _expected(self) -> Totals:
+        """Full recount from the leave requests."""
+        totals: Totals = {}
+        for request in self._leave_requests.all():
+            _count(totals, request, +1)
+        return totals
+
+    def recompute(self) -> int:
+        """Rebuild the counters from the leave requests. Returns the number of rows."""
+        with self._engine.transaction():
+            expected = self._expected()
+            self._table.truncate()
+            self._table.insert_many(
+                {'employee_id': employee_id, 'type': type, 'month': month, **expected[employee_id, type, month]}
+                for employee_id, type, month in sorted(expected, key=_sort_key)
+            )
+        return len(expected)
+
+    def verify(self) -> List[str]:
+        """Compare the counters with a full recount. Returns the mismatches."""
+        with self._engine.snapshot():
+            expected = self._expected()
+            rows = self._table.all()
+        problems = []
+        actual: Totals = {}
+        for row in rows:
+            key = (row['employee_id'], row['type'], row['month'])
+            if key in actual:
+                problems.append(f"leave_stats: duplicate row for {list(key)}")
+            actual[key] = {'days': row['days'], 'requests': row['requests']}
+        zero = _empty()
+        for key in sorted(expected.keys() | actual.keys(), key=_sort_key):
+            # A row brought back to zero by a deletion equals a missing one
+            if expected.get(key, zero) != actual.get(key, zero):
+                problems.append(
+                    f"leave_stats{list(key)}: counted {actual.get(key)}, expected {expected.get(key)}"
+                )
+        return problems
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+
+def _sort_key(key: tuple) -> tuple:
+    """Order rows by employee, type, then all-time before the months."""
+    employee_id, type, month = key
+    return (employee_id, type, month or '')
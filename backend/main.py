@@ -1,18 +1,33 @@
-from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks, Request, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import ValidationError
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
-from typing import Optional
+from typing import Awaitable, Callable, Literal, Optional
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from collections import deque
+import asyncio
+import base64
 import json
-from datetime import datetime, timedelta
+import multiprocessing
+import os
+import struct
+import time
+from datetime import date, datetime, timedelta
 
 from config import settings
 from models import (
     LoginRequest, OTPVerifyRequest, Token, UserCreate, User,
     DHParams, DHExchangeRequest, DHExchangeResponse,
-    EncryptedMessage, LeaveRequest, MessageInDB,
-    LeaveRequestCreate, LeaveRequestUpdate, LeaveRequestResponse,
+    EncryptedMessage, MessageDecryptBatch, LeaveRequest, MessageInDB,
+    LeaveRequestCreate, LeaveRequestUpdate, LeaveRequestResponse, LeaveStatsResponse,
+    LeaveRequestStatusBatch, LeaveRequestStatusBatchResponse, LeaveRequestStatusBatchResult,
     CommunicationAuthResponse, CommunicationAuthUpdate,
     # DAC Models
     DocumentCreate, DocumentUpdate, DocumentResponse, DocumentShareDAC, DocumentShareSecure, DocumentACLEntry,
@@ -20,56 +35,64 @@ from models import (
 )
 from typing import List
 from security import (
-    verify_password, get_password_hash, create_access_token,
+    verify_password_async, get_password_hash_async, PasswordHashingBusy, create_access_token,
     decode_access_token, generate_otp,
-    generate_dh_parameters, generate_dh_private_key,
-    calculate_dh_public_key, calculate_dh_shared_secret,
-    derive_aes_key_from_secret, aes_decrypt, aes_encrypt
+    generate_dh_parameters, generate_dh_keypair, calculate_dh_shared_secret,
+    derive_aes_key_from_secret, aes_decrypt, encrypt_bytes, is_message_blob, DecryptionError,
+    SessionKeyManager, MessageKey, find_incompatible_messages, document_blob_master_key
 )
-from database import db
+from dh import (
+    HANDSHAKE_GROUPS, MODP_1536, X25519, x25519_exchange, HandshakeMetrics,
+    get_keypair_pool, keypair_pool_stats, close_keypair_pools
+)
+from database import adb
+from cache import TTLCache
+from jobs import Job, JobRegistry
+from blobs import BlobStore, BlobIntegrityError
+from events import EventBroker, DelegatedRights, READY, EXPIRED, KEEPALIVE
+from intervals import OverlappingLeaveRequestError
 
 # Startup Event: Initialize TTP (Trusted Third Party)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize the system on startup."""
     # Generate and store DH parameters if not exists
-    params = db.get_dh_params()
+    params = await adb.get_dh_params()
     if not params:
         print("Generating Diffie-Hellman parameters...")
         p, g = generate_dh_parameters()
-        db.store_dh_params(hex(p), hex(g))
+        await adb.store_dh_params(hex(p), hex(g))
         print(f"DH Parameters generated: p={hex(p)[:20]}..., g={g}")
+    else:
+        p, g = int(params['p'], 16), int(params['g'], 16)
+    
+    # Start filling the ephemeral keypair pool in the background
+    get_keypair_pool(p, g)
     
     # Create default users if database is empty
-    if not db.users.all():
-        print("Creating default users...")
-        
-        # Create IT Admin
-        admin_id = db.create_user(
-            email="zeydody@gmail.com",
-            password_hash=get_password_hash("admin123"),
-            role="admin"
-        )
-        print(f"Admin created: zeydody@gmail.com / admin123 (ID: {admin_id})")
-        
-        # Create HR Manager
-        hr_id = db.create_user(
-            email="zakarialaidi6@gmail.com",
-            password_hash=get_password_hash("hr123"),
-            role="hr_manager"
-        )
-        print(f"HR Manager created: zakarialaidi6@gmail.com / hr123 (ID: {hr_id})")
-        
-        # Create Employee
-        emp_id = db.create_user(
-            email="abdoumerabet374@gmail.com",
-            password_hash=get_password_hash("emp123"),
-            role="employee"
-        )
-        print(f"Employee created: abdoumerabet374@gmail.com / emp123 (ID: {emp_id})")
+    if not await adb.count_users():
+        default_users = [
+            ("Admin", "zeydody@gmail.com", "admin123", "admin"),
+            ("HR Manager", "zakarialaidi6@gmail.com", "hr123", "hr_manager"),
+            ("Employee", "abdoumerabet374@gmail.com", "emp123", "employee"),
+        ]
+        # With several workers, only the first one to get there creates them
+        created_ids = await adb.create_users_if_empty([
+            {"email": email, "password_hash": await get_password_hash_async(password), "role": role}
+            for _, email, password, role in default_users
+        ])
+        if created_ids:
+            print("Default users created:")
+        for (label, email, password, _), user_id in zip(default_users, created_ids):
+            print(f"{label} created: {email} / {password} (ID: {user_id})")
     
     yield
-    # Cleanup (if needed)
+    # Cleanup: end event streams, stop jobs and keypair generation, flush pending writes and close the storage engine
+    event_broker.close()
+    await jobs.cancel_all()
+    close_keypair_pools()
+    message_decrypt_executor.shutdown(wait=True)
+    adb.close()
 
 
 # Initialize FastAPI
@@ -82,7 +105,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["*"],
+    # "*" is taken literally by browsers on credentialed requests
+    expose_headers=["*", "X-Next-Cursor", "X-Sync-Cursor"],
 )
 
 # Email Configuration
@@ -102,6 +126,53 @@ fast_mail = FastMail(mail_config)
 
 # Security
 security = HTTPBearer()
+# GET /events also takes the token as ?token= (EventSource cannot send headers)
+optional_security = HTTPBearer(auto_error=False)
+
+
+@app.exception_handler(PasswordHashingBusy)
+async def password_hashing_busy_handler(request, exc: PasswordHashingBusy):
+    """The bcrypt pool is saturated: ask the client to retry shortly."""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Serveur occupé, réessayez dans quelques secondes"},
+        headers={"Retry-After": "1"}
+    )
+
+
+# Authenticated users of recent tokens, keyed by token subject. The JWT is
+# still verified on every request; only the user lookup is skipped.
+principal_cache = TTLCache(settings.PRINCIPAL_CACHE_MAX_SIZE, settings.PRINCIPAL_CACHE_TTL_SECONDS)
+
+
+def invalidate_principal(user_id: int):
+    """Drop the cached principal of a user whose record changed."""
+    principal_cache.invalidate_where(lambda principal: principal['id'] == user_id)
+
+
+adb.sync.subscribe('users', invalidate_principal)
+
+# AES keys of established DH sessions: derived once, not on every decrypt
+session_keys = SessionKeyManager(settings.SESSION_KEY_CACHE_MAX_SIZE, settings.SESSION_KEY_CACHE_TTL_SECONDS)
+adb.sync.subscribe('sessions', session_keys.invalidate_user)
+
+# Threads decrypting POST /messages/decrypt-batch chunks off the event loop
+message_decrypt_workers = settings.MESSAGE_DECRYPT_WORKERS or os.cpu_count() or 1
+message_decrypt_executor = ThreadPoolExecutor(max_workers=message_decrypt_workers, thread_name_prefix='decrypt')
+
+# Background jobs (cleanup-incompatible) polled through GET /jobs/{job_id}
+jobs = JobRegistry()
+
+# Encrypted, chunked storage of large document bodies
+document_blobs = BlobStore(
+    settings.DOCUMENT_BLOB_DIR, document_blob_master_key(), settings.DOCUMENT_BLOB_CHUNK_SIZE
+)
+
+# Server push: database events fanned out to the GET /events streams
+delegated_rights = DelegatedRights(adb.sync.get_all_delegations)
+adb.sync.subscribe('delegations', delegated_rights.invalidate)
+event_broker = EventBroker(delegated_rights, settings.EVENTS_MAX_CONNECTIONS, settings.EVENTS_QUEUE_SIZE)
+adb.sync.add_event_listener(event_broker.publish)
 
 
 # Dependency: Get Current User from JWT
@@ -123,17 +194,22 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail="Invalid token payload"
         )
     
-    user = db.get_user_by_email(email)
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found"
-        )
+    principal = principal_cache.get(email)
+    if principal is None:
+        user = await adb.get_user_by_email(email)
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found"
+            )
+        
+        # Include the document ID in the returned dict for easy access
+        principal = dict(user)
+        principal['id'] = user.doc_id
+        principal_cache.set(email, principal)
     
-    # Include the document ID in the returned dict for easy access
-    user_dict = dict(user)
-    user_dict['id'] = user.doc_id
-    return user_dict
+    # Endpoints get their own copy: the cached one is shared
+    return dict(principal)
 
 
 # Background task to send email
@@ -167,7 +243,7 @@ async def login(request: LoginRequest, background_tasks: BackgroundTasks):
     If valid, generate and send OTP.
     """
     # Check if login is blocked
-    is_blocked, remaining_seconds = db.is_login_blocked(request.email)
+    is_blocked, remaining_seconds = await adb.is_login_blocked(request.email)
     if is_blocked:
         minutes = remaining_seconds // 60
         seconds = remaining_seconds % 60
@@ -177,28 +253,28 @@ async def login(request: LoginRequest, background_tasks: BackgroundTasks):
         )
     
     # Check if user exists
-    user = db.get_user_by_email(request.email)
+    user = await adb.get_user_by_email(request.email)
     if not user:
-        db.record_login_attempt(request.email, False)
+        await adb.record_login_attempt(request.email, False)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Erreur utilisateur n'existe pas"
         )
     
     # Verify password
-    if not verify_password(request.password, user['password_hash']):
-        db.record_login_attempt(request.email, False)
+    if not await verify_password_async(request.password, user['password_hash']):
+        await adb.record_login_attempt(request.email, False)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Mot de passe incorrect"
         )
     
     # Success - reset login attempts
-    db.record_login_attempt(request.email, True)
+    await adb.record_login_attempt(request.email, True)
     
     # Generate OTP
     otp_code = generate_otp(settings.OTP_LENGTH)
-    db.store_otp(request.email, otp_code)
+    await adb.store_otp(request.email, otp_code)
     
     # Send OTP via email
     background_tasks.add_task(send_otp_email, request.email, otp_code)
@@ -215,7 +291,7 @@ async def verify_otp(request: OTPVerifyRequest):
     Step 2: Verify OTP and issue JWT token.
     """
     # Check if OTP verification is blocked
-    is_blocked, remaining_seconds = db.is_otp_blocked(request.email)
+    is_blocked, remaining_seconds = await adb.is_otp_blocked(request.email)
     if is_blocked:
         minutes = remaining_seconds // 60
         seconds = remaining_seconds % 60
@@ -225,20 +301,20 @@ async def verify_otp(request: OTPVerifyRequest):
         )
     
     # Verify OTP
-    if not db.verify_otp(request.email, request.otp_code):
-        db.record_otp_attempt(request.email, False)
+    if not await adb.verify_otp(request.email, request.otp_code):
+        await adb.record_otp_attempt(request.email, False)
         # Invalider l'OTP existant pour forcer l'utilisateur à recommencer
-        db.cancel_otp(request.email)
+        await adb.cancel_otp(request.email)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Code OTP invalide. Veuillez vous reconnecter."
         )
     
     # Success - reset OTP attempts
-    db.record_otp_attempt(request.email, True)
+    await adb.record_otp_attempt(request.email, True)
     
     # Get user
-    user = db.get_user_by_email(request.email)
+    user = await adb.get_user_by_email(request.email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -263,7 +339,7 @@ async def resend_otp(request: LoginRequest, background_tasks: BackgroundTasks):
     Resend OTP code. Expires the old one and generates a new one.
     """
     # Check if OTP verification is blocked
-    is_blocked, remaining_seconds = db.is_otp_blocked(request.email)
+    is_blocked, remaining_seconds = await adb.is_otp_blocked(request.email)
     if is_blocked:
         minutes = remaining_seconds // 60
         seconds = remaining_seconds % 60
@@ -273,8 +349,8 @@ async def resend_otp(request: LoginRequest, background_tasks: BackgroundTasks):
         )
     
     # Verify user exists and password is correct
-    user = db.get_user_by_email(request.email)
-    if not user or not verify_password(request.password, user['password_hash']):
+    user = await adb.get_user_by_email(request.email)
+    if not user or not await verify_password_async(request.password, user['password_hash']):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
@@ -282,7 +358,7 @@ async def resend_otp(request: LoginRequest, background_tasks: BackgroundTasks):
     
     # Generate new OTP (this will automatically remove the old one)
     otp_code = generate_otp(settings.OTP_LENGTH)
-    db.store_otp(request.email, otp_code)
+    await adb.store_otp(request.email, otp_code)
     
     # Send OTP via email
     background_tasks.add_task(send_otp_email, request.email, otp_code)
@@ -306,7 +382,7 @@ async def cancel_otp(request: dict):
         )
     
     # Cancel OTP and reset attempts
-    db.cancel_otp(email)
+    await adb.cancel_otp(email)
     
     return {"message": "OTP session cancelled"}
 
@@ -324,19 +400,23 @@ async def get_me(current_user: dict = Depends(get_current_user)):
 
 # ==================== DIFFIE-HELLMAN HANDSHAKE ====================
 
+# Latency of /handshake/exchange per key agreement group
+handshake_metrics = HandshakeMetrics()
+
+
 @app.get("/handshake/params", response_model=DHParams)
 async def get_dh_params():
     """
     Get global Diffie-Hellman parameters (p, g) from TTP.
     """
-    params = db.get_dh_params()
+    params = await adb.get_dh_params()
     if not params:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="DH parameters not initialized"
         )
     
-    return DHParams(p=params['p'], g=params['g'])
+    return DHParams(p=params['p'], g=params['g'], groups=list(HANDSHAKE_GROUPS))
 
 
 @app.post("/handshake/exchange", response_model=DHExchangeResponse)
@@ -347,9 +427,44 @@ async def dh_exchange(
     """
     Diffie-Hellman Key Exchange.
     Employee sends their public key A, server (HR) responds with public key B.
+    The client picks the group among those advertised by /handshake/params
+    (modp1536 by default, or x25519).
     """
+    started = time.perf_counter()
+    
+    # Get or create HR Manager's private key for this session
+    hr_users = await adb.get_users_by_role("hr_manager")
+    if not hr_users:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="HR Manager not found"
+        )
+    
+    hr_user = hr_users[0]
+    hr_user_id = hr_user.doc_id
+    
+    if request.group == X25519:
+        # Ephemeral server key for every exchange, secret derived with HKDF
+        try:
+            client_public_key = bytes.fromhex(request.public_key.removeprefix('0x'))
+            hr_public_key, shared_secret = x25519_exchange(client_public_key)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid public key format"
+            )
+        
+        await adb.store_session(current_user['id'], hex(0), shared_secret.hex(), group=X25519)
+        if await adb.get_session(hr_user_id):
+            await adb.update_session_secret(hr_user_id, shared_secret.hex(), group=X25519)
+        else:
+            await adb.store_session(hr_user_id, hex(0), shared_secret.hex(), group=X25519)
+        
+        handshake_metrics.record(X25519, time.perf_counter() - started)
+        return DHExchangeResponse(public_key=hr_public_key.hex(), group=X25519)
+    
     # Get DH parameters
-    params = db.get_dh_params()
+    params = await adb.get_dh_params()
     p = int(params['p'], 16)
     g = int(params['g'], 16)
     
@@ -362,53 +477,203 @@ async def dh_exchange(
             detail="Invalid public key format"
         )
     
-    # Get or create HR Manager's private key for this session
-    hr_users = db.get_users_by_role("hr_manager")
-    if not hr_users:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="HR Manager not found"
-        )
-    
-    hr_user = hr_users[0]
-    hr_user_id = hr_user.doc_id
-    
-    # Check if HR has a session
-    hr_session = db.get_session(hr_user_id)
-    if not hr_session:
-        # Generate new private key for HR
-        hr_private_key = generate_dh_private_key(p)
-        db.store_session(hr_user_id, hex(hr_private_key))
-    else:
-        hr_private_key = int(hr_session['private_key'], 16)
-    
-    # Calculate HR's public key B
-    hr_public_key = calculate_dh_public_key(g, hr_private_key, p)
+    # Fresh ephemeral key pair (b, B) for HR, pre-generated by the pool.
+    # Off the event loop: an empty pool generates it inline.
+    loop = asyncio.get_running_loop()
+    hr_private_key, hr_public_key = await loop.run_in_executor(None, generate_dh_keypair, p, g)
     
-    # Calculate shared secret S = A^b mod p
-    shared_secret = calculate_dh_shared_secret(client_public_key, hr_private_key, p)
+    # Calculate shared secret S = A^b mod p (a full modexp, off the event loop too)
+    shared_secret = await loop.run_in_executor(
+        None, calculate_dh_shared_secret, client_public_key, hr_private_key, p
+    )
     
     # Store shared secret for this employee
-    db.store_session(current_user.doc_id, hex(0), hex(shared_secret))  # Private key not needed for employee
+    await adb.store_session(current_user['id'], hex(0), hex(shared_secret))  # Private key not needed for employee
+    
+    # Store HR's session with the shared secret
+    await adb.store_session(hr_user_id, hex(hr_private_key), hex(shared_secret))
     
-    # Update HR's session with shared secret
-    db.update_session_secret(hr_user_id, hex(shared_secret))
+    handshake_metrics.record(MODP_1536, time.perf_counter() - started)
+    return DHExchangeResponse(public_key=hex(hr_public_key), group=MODP_1536)
+
+
+# ==================== PAGINATION & INCREMENTAL SYNC ====================
+#
+# List endpoints return every row by default. With ?limit= (and ?cursor=)
+# they return one page in ID order, and X-Next-Cursor when there is a next
+# page. With ?since= they return only the rows created or changed since the
+# sync that produced the cursor (?since=0 for a first full sync): rows that
+# were deleted or are no longer visible come back as {"id": ..., "deleted":
+# true}, and X-Sync-Cursor is the cursor for the next sync (X-Next-Cursor
+# too when more changes are pending). Cursors are opaque to clients; a sync
+# cursor older than the deletions kept in the change log gets 410 (start
+# again with ?since=0).
+
+def _encode_cursor(kind: str, value: int) -> str:
+    return base64.urlsafe_b64encode(f"{kind}:{value}".encode('ascii')).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(kind: str, cursor: str) -> int:
+    if cursor == "0" and kind == "s":
+        return 0
+    try:
+        prefix, value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii').split(':')
+        if prefix == kind and int(value) >= 0:
+            return int(value)
+    except (ValueError, UnicodeDecodeError):
+        pass
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Curseur invalide"
+    )
+
+
+class ListQuery:
+    """Query parameters of the paginated list endpoints."""
     
-    return DHExchangeResponse(public_key=hex(hr_public_key))
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, description="Taille de page"),
+        cursor: Optional[str] = Query(None, description="X-Next-Cursor de la page précédente"),
+        since: Optional[str] = Query(None, description="X-Sync-Cursor de la dernière synchronisation, ou 0")
+    ):
+        if cursor is not None and since is not None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="cursor et since sont exclusifs"
+            )
+        self.paginated = limit is not None or cursor is not None or since is not None
+        self.limit = min(limit or settings.LIST_PAGE_DEFAULT_SIZE, settings.LIST_PAGE_MAX_SIZE)
+        self.after_id = _decode_cursor("p", cursor) if cursor is not None else 0
+        self.since = _decode_cursor("s", since) if since is not None else None
+    
+    def page_headers(self, page: list) -> dict:
+        """X-Next-Cursor if a full page was read (rows filtered out afterwards still count)."""
+        if len(page) < self.limit:
+            return {}
+        return {"X-Next-Cursor": _encode_cursor("p", page[-1].doc_id)}
+
+
+async def _sync_changes(
+    table: str,
+    query: ListQuery,
+    visible: Callable[[List[dict]], Awaitable[List[dict]]],
+    must_forget: Callable[[List[int]], bool]
+) -> tuple:
+    """
+    Changes of `table` for ?since=: (visible documents, IDs the client must
+    delete, response headers). `visible(documents)` keeps the documents the
+    caller sees (one call per page: join in bulk); `must_forget(audience)`
+    says whether a document that was deleted or is not visible must be
+    reported as deleted.
+    """
+    # since=0 (first sync) needs no tombstones and is always possible
+    if 0 < query.since < await adb.get_pruned_revision():
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Curseur de synchronisation expiré: rechargez la liste complète"
+        )
+    changes = await adb.get_changes(table, query.since, query.limit)
+    documents = await visible([document for _, _, document, _ in changes if document is not None])
+    shown = {document.doc_id for document in documents}
+    deleted = [
+        doc_id for _, doc_id, _, audience in changes
+        if doc_id not in shown and must_forget(audience)
+    ]
+    revision = changes[-1][0] if changes else query.since
+    headers = {"X-Sync-Cursor": _encode_cursor("s", revision)}
+    if len(changes) == query.limit:
+        headers["X-Next-Cursor"] = headers["X-Sync-Cursor"]
+    return documents, deleted, headers
+
+
+def _list_response(rows: list, headers: dict) -> JSONResponse:
+    return JSONResponse(jsonable_encoder(rows), headers=headers)
+
+
+async def _visible_to_all(documents: List[dict]) -> List[dict]:
+    return documents
+
+
+def _forget_always(audience: List[int]) -> bool:
+    return True
 
 
 # ==================== ENCRYPTED MESSAGING ====================
 
-@app.post("/requests/leave")
+# Binary transport: with Content-Type / Accept: application/octet-stream,
+# ciphertexts travel as raw bytes instead of Base64 inside JSON.
+BINARY_MEDIA_TYPE = "application/octet-stream"
+
+
+def _accepts_binary(request: Request) -> bool:
+    return BINARY_MEDIA_TYPE in request.headers.get('accept', '')
+
+
+def _message_content_base64(message: dict) -> str:
+    content = message['encrypted_content']
+    if isinstance(content, str):  # Legacy CBC message
+        return content
+    return base64.b64encode(content).decode('ascii')
+
+
+def _message_content_bytes(message: dict) -> bytes:
+    content = message['encrypted_content']
+    if isinstance(content, str):
+        return base64.b64decode(content)
+    return content
+
+
+def _message_frame(header: dict, payload: bytes) -> bytes:
+    """
+    One message of a binary listing:
+        header length (u32) || payload length (u32) || header (JSON) || payload
+    """
+    header = json.dumps(header, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return struct.pack('>II', len(header), len(payload)) + header + payload
+
+
+@app.post("/requests/leave", openapi_extra={"requestBody": {"required": True, "content": {
+    "application/json": {"schema": EncryptedMessage.model_json_schema()},
+    BINARY_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}},
+}}})
 async def submit_leave_request(
-    message: EncryptedMessage,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """
     Employee submits encrypted leave request.
+    
+    Body: an EncryptedMessage (JSON), or the versioned blob itself with
+    Content-Type: application/octet-stream.
     """
+    body = await request.body()
+    content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    if content_type == BINARY_MEDIA_TYPE:
+        encrypted_content, iv = body, ""
+    else:
+        try:
+            message = EncryptedMessage.model_validate_json(body)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors(include_url=False), body=body)
+        encrypted_content, iv = message.encrypted_content, message.iv
+        if not iv:
+            # Versioned blobs are stored as raw bytes
+            try:
+                encrypted_content = base64.b64decode(encrypted_content, validate=True)
+            except ValueError:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="encrypted_content n'est pas du Base64 valide"
+                )
+    if not iv and not is_message_blob(encrypted_content):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Format de message chiffré invalide"
+        )
+    
     # Get HR Manager
-    hr_users = db.get_users_by_role("hr_manager")
+    hr_users = await adb.get_users_by_role("hr_manager")
     if not hr_users:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -418,11 +683,11 @@ async def submit_leave_request(
     hr_user = hr_users[0]
     
     # Store encrypted message
-    msg_id = db.store_message(
-        from_id=current_user.doc_id,
+    msg_id = await adb.store_message(
+        from_id=current_user['id'],
         to_id=hr_user.doc_id,
-        encrypted_content=message.encrypted_content,
-        iv=message.iv
+        encrypted_content=encrypted_content,
+        iv=iv
     )
     
     return {
@@ -431,25 +696,60 @@ async def submit_leave_request(
     }
 
 
-@app.get("/messages/received")
-async def get_received_messages(current_user: dict = Depends(get_current_user)):
+@app.get("/messages/received", responses={200: {"content": {BINARY_MEDIA_TYPE: {}}}})
+async def get_received_messages(
+    request: Request,
+    query: ListQuery = Depends(),
+    current_user: dict = Depends(get_current_user)
+):
     """
-    Get all encrypted messages received by current user.
+    Get all encrypted messages received by current user (paginated with
+    ?limit= / ?cursor=, or incremental with ?since=).
+    
+    With Accept: application/octet-stream, the messages come back as
+    consecutive frames (see _message_frame): the JSON header holds id,
+    from_email, from_role, timestamp and iv, the payload is the raw ciphertext.
     """
-    messages = db.get_messages_for_user(current_user.doc_id)
+    user_id = current_user['id']
+    deleted = []
+    headers = {}
+    if query.since is not None:
+        async def visible(messages: List[dict]) -> List[dict]:
+            return [message for message in messages if message['to_id'] == user_id]
+        messages, deleted, headers = await _sync_changes(
+            'messages', query, visible, lambda audience: user_id in audience
+        )
+    elif query.paginated:
+        messages = await adb.scan_messages(query.after_id, query.limit, to_id=user_id)
+        headers = query.page_headers(messages)
+    else:
+        messages = await adb.get_messages_for_user(user_id)
     
+    binary = _accepts_binary(request)
+    senders = await adb.get_users_by_ids(msg['from_id'] for msg in messages)
     result = []
     for msg in messages:
-        sender = db.get_user_by_id(msg['from_id'])
-        result.append({
+        sender = senders.get(msg['from_id'])
+        header = {
             "id": msg.doc_id,
             "from_email": sender['email'] if sender else "Unknown",
             "from_role": sender['role'] if sender else "Unknown",
-            "encrypted_content": msg['encrypted_content'],
             "iv": msg['iv'],
             "timestamp": msg['timestamp']
-        })
-    
+        }
+        if binary:
+            result.append(_message_frame(header, _message_content_bytes(msg)))
+        else:
+            header["encrypted_content"] = _message_content_base64(msg)
+            result.append(header)
+    for message_id in deleted:
+        tombstone = {"id": message_id, "deleted": True}
+        result.append(_message_frame(tombstone, b"") if binary else tombstone)
+    
+    if binary:
+        return Response(b"".join(result), media_type=BINARY_MEDIA_TYPE, headers=headers)
+    if query.paginated:
+        return _list_response(result, headers)
     return result
 
 
@@ -469,7 +769,7 @@ async def decrypt_message(
         )
     
     # Get message
-    message = db.messages.get(doc_id=message_id)
+    message = await adb.get_message(message_id)
     if not message:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -477,7 +777,7 @@ async def decrypt_message(
         )
     
     # Get HR's session to retrieve shared secret
-    hr_session = db.get_session(current_user.doc_id)
+    hr_session = await adb.get_session(current_user['id'])
     if not hr_session or not hr_session.get('shared_secret'):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -485,8 +785,7 @@ async def decrypt_message(
         )
     
     # Derive AES key from shared secret
-    shared_secret = int(hr_session['shared_secret'], 16)
-    aes_key = derive_aes_key_from_secret(shared_secret)
+    aes_key = session_keys.get_key(hr_session)
     
     # Decrypt message
     try:
@@ -498,6 +797,7 @@ async def decrypt_message(
         
         # Parse JSON
         leave_request = json.loads(decrypted_content)
+        await adb.mark_messages_decrypted([message_id])
         
         return {
             "message_id": message_id,
@@ -505,7 +805,7 @@ async def decrypt_message(
             "from_id": message['from_id'],
             "timestamp": message['timestamp']
         }
-    except UnicodeDecodeError:
+    except DecryptionError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Échec du déchiffrement: Ce message a été chiffré avec une clé différente. "
@@ -525,6 +825,126 @@ async def decrypt_message(
         )
 
 
+def _decrypt_message_chunk(chunk: list, aes_key: bytes) -> tuple:
+    """
+    Decrypt (message_id, message) pairs for decrypt-batch. Returns the NDJSON
+    lines and the IDs that were decrypted; failures become error lines.
+    """
+    # One cipher context for the whole chunk
+    aes_key = MessageKey(aes_key)
+    lines = []
+    decrypted_ids = []
+    for message_id, message in chunk:
+        if message is None:
+            result = {"message_id": message_id, "error": "Message non trouvé"}
+        else:
+            try:
+                result = {
+                    "message_id": message_id,
+                    "decrypted_content": json.loads(
+                        aes_decrypt(message['encrypted_content'], message['iv'], aes_key)
+                    ),
+                    "from_id": message['from_id'],
+                    "timestamp": message['timestamp']
+                }
+                decrypted_ids.append(message_id)
+            except DecryptionError:
+                result = {"message_id": message_id,
+                          "error": "Échec du déchiffrement: clé différente ou message altéré"}
+            except json.JSONDecodeError:
+                result = {"message_id": message_id,
+                          "error": "Échec du déchiffrement: le contenu n'est pas un JSON valide"}
+        lines.append(json.dumps(result, ensure_ascii=False))
+    return ("\n".join(lines) + "\n" if lines else ""), decrypted_ids
+
+
+@app.post("/messages/decrypt-batch")
+async def decrypt_messages_batch(
+    request: MessageDecryptBatch,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Decrypt many messages in one request (HR Manager only).
+    
+    Streams one NDJSON line per message, in request order: the decrypted
+    content, or an "error" for that message only. The last line is a
+    summary. Decrypted messages are no longer unread. all_unread takes the
+    MESSAGE_DECRYPT_BATCH_MAX_SIZE oldest unread messages at most, the
+    summary tells whether others remain (more_unread).
+    """
+    if current_user['role'] != "hr_manager":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only HR Manager can decrypt messages"
+        )
+    
+    more_unread = None
+    if request.all_unread:
+        # The oldest ones first: the others stay unread for the next request
+        messages = await adb.get_unread_messages_for_user(
+            current_user['id'], settings.MESSAGE_DECRYPT_BATCH_MAX_SIZE + 1
+        )
+        more_unread = len(messages) > settings.MESSAGE_DECRYPT_BATCH_MAX_SIZE
+        messages = messages[:settings.MESSAGE_DECRYPT_BATCH_MAX_SIZE]
+        message_ids = [message.doc_id for message in messages]
+    elif request.message_ids:
+        message_ids = list(dict.fromkeys(request.message_ids))
+        if len(message_ids) > settings.MESSAGE_DECRYPT_BATCH_MAX_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Au plus {settings.MESSAGE_DECRYPT_BATCH_MAX_SIZE} messages par requête"
+            )
+        messages = await adb.get_messages(message_ids)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Indiquez message_ids ou all_unread"
+        )
+    
+    hr_session = await adb.get_session(current_user['id'])
+    if not hr_session or not hr_session.get('shared_secret'):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Shared secret not established. Complete handshake first."
+        )
+    # A copy: cached session keys are wiped when the session changes while the batch streams
+    aes_key = bytes(session_keys.get_key(hr_session))
+    
+    pairs = list(zip(message_ids, messages))
+    chunk_size = max(1, settings.MESSAGE_DECRYPT_CHUNK_SIZE)
+    max_in_flight = 2 * message_decrypt_workers
+    
+    async def results():
+        loop = asyncio.get_running_loop()
+        pending = deque()
+        decrypted_ids = []
+        for start in range(0, len(pairs), chunk_size):
+            pending.append(loop.run_in_executor(
+                message_decrypt_executor, _decrypt_message_chunk, pairs[start:start + chunk_size], aes_key
+            ))
+            # Bounded read-ahead: chunks are yielded in order as they complete
+            if len(pending) >= max_in_flight:
+                text, ids = await pending.popleft()
+                decrypted_ids.extend(ids)
+                yield text
+        while pending:
+            text, ids = await pending.popleft()
+            decrypted_ids.extend(ids)
+            yield text
+        
+        await adb.mark_messages_decrypted(decrypted_ids)
+        summary = {
+            "total": len(pairs),
+            "decrypted": len(decrypted_ids),
+            "failed": len(pairs) - len(decrypted_ids)
+        }
+        if more_unread is not None:
+            summary["more_unread"] = more_unread
+        yield json.dumps({"summary": summary}) + "\n"
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
 @app.delete("/messages/{message_id}")
 async def delete_message(
     message_id: int,
@@ -539,22 +959,97 @@ async def delete_message(
             detail="Seuls le DRH et l'Admin peuvent supprimer des messages"
         )
     
-    message = db.messages.get(doc_id=message_id)
+    message = await adb.get_message(message_id)
     if not message:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Message non trouvé"
         )
     
-    db.messages.remove(doc_ids=[message_id])
+    await adb.delete_messages([message_id])
     
     return {"message": "Message supprimé avec succès"}
 
 
-@app.post("/messages/cleanup-incompatible")
+CLEANUP_JOB = "cleanup-incompatible"
+
+
+async def _cleanup_incompatible_job(job: Job, hr_user_id: int, epoch: int, aes_key: bytes) -> dict:
+    """
+    Walk the messages chunk by chunk, test them in parallel and delete the
+    ones `aes_key` cannot decrypt, in batches. Stops if the HR session
+    changes meanwhile: messages may then be encrypted with the new key.
+    """
+    job.progress.update(total=await adb.count_messages(), scanned=0, incompatible=0, deleted=0)
+    workers = settings.CLEANUP_JOB_WORKERS or os.cpu_count() or 1
+    # One worker: the default thread pool is enough. Otherwise separate
+    # processes, so that chunks are really tested in parallel.
+    executor = ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('spawn')
+    ) if workers > 1 else None
+    loop = asyncio.get_running_loop()
+    pending = deque()
+    to_delete = []
+    deleted_ids = []
+    
+    async def test_next():
+        nonlocal executor
+        items, future = pending.popleft()
+        try:
+            incompatible = await future
+        except BrokenProcessPool:
+            # e.g. workers that cannot start: finish on the thread pool
+            executor = None
+            incompatible = await loop.run_in_executor(None, find_incompatible_messages, items, aes_key)
+        job.progress['scanned'] += len(items)
+        job.progress['incompatible'] += len(incompatible)
+        to_delete.extend(incompatible)
+    
+    async def delete_batch():
+        session = await adb.get_session(hr_user_id)
+        if not session or session.get('epoch', 0) != epoch:
+            raise RuntimeError("La session DH du DRH a changé pendant le nettoyage")
+        await adb.delete_messages(to_delete)
+        deleted_ids.extend(to_delete)
+        job.progress['deleted'] += len(to_delete)
+        to_delete.clear()
+    
+    try:
+        after_id = 0
+        while True:
+            chunk = await adb.scan_messages(after_id, settings.CLEANUP_JOB_CHUNK_SIZE)
+            if chunk:
+                after_id = chunk[-1].doc_id
+                items = [(msg.doc_id, msg['encrypted_content'], msg['iv']) for msg in chunk]
+                pending.append((items, loop.run_in_executor(executor, find_incompatible_messages, items, aes_key)))
+            # Bounded read-ahead; drain everything once the scan is over
+            while pending and (not chunk or len(pending) >= 2 * workers):
+                await test_next()
+                if len(to_delete) >= settings.CLEANUP_JOB_DELETE_BATCH_SIZE:
+                    await delete_batch()
+            if not chunk:
+                break
+        if to_delete:
+            await delete_batch()
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    return {
+        "message": f"{len(deleted_ids)} message(s) incompatible(s) supprimé(s)",
+        "deleted_count": len(deleted_ids),
+        "deleted_ids": deleted_ids
+    }
+
+
+@app.post("/messages/cleanup-incompatible", status_code=status.HTTP_202_ACCEPTED)
 async def cleanup_incompatible_messages(current_user: dict = Depends(get_current_user)):
     """
     Tester et nettoyer les messages incompatibles (ne peuvent pas être déchiffrés).
+    
+    Le nettoyage tourne en tâche de fond : la réponse contient le job
+    (job_id) dont l'avancement se suit avec GET /jobs/{job_id}. Un seul
+    nettoyage à la fois : s'il y en a déjà un en cours, il est renvoyé.
     """
     if current_user['role'] not in ["hr_manager", "admin"]:
         raise HTTPException(
@@ -563,37 +1058,43 @@ async def cleanup_incompatible_messages(current_user: dict = Depends(get_current
         )
     
     # Get HR's session
-    hr_session = db.get_session(current_user.doc_id)
+    hr_session = await adb.get_session(current_user['id'])
     if not hr_session or not hr_session.get('shared_secret'):
-        return {
+        return JSONResponse(content={
             "message": "Aucun secret partagé. Impossible de tester les messages.",
             "deleted_count": 0
-        }
-    
-    # Derive AES key
-    shared_secret = int(hr_session['shared_secret'], 16)
-    aes_key = derive_aes_key_from_secret(shared_secret)
-    
-    # Test all messages
-    all_messages = db.messages.all()
-    incompatible_ids = []
-    
-    for msg in all_messages:
-        try:
-            decrypted = aes_decrypt(msg['encrypted_content'], msg['iv'], aes_key)
-            json.loads(decrypted)  # Verify it's valid JSON
-        except:
-            incompatible_ids.append(msg.doc_id)
+        })
     
-    # Delete incompatible messages
-    if incompatible_ids:
-        db.messages.remove(doc_ids=incompatible_ids)
+    job = jobs.active(CLEANUP_JOB)
+    if job is None:
+        # A copy: cached session keys are wiped when the session changes
+        aes_key = bytes(session_keys.get_key(hr_session))
+        job = jobs.start(CLEANUP_JOB, current_user['id'], partial(
+            _cleanup_incompatible_job,
+            hr_user_id=current_user['id'], epoch=hr_session.get('epoch', 0), aes_key=aes_key
+        ))
     
-    return {
-        "message": f"{len(incompatible_ids)} message(s) incompatible(s) supprimé(s)",
-        "deleted_count": len(incompatible_ids),
-        "deleted_ids": incompatible_ids
-    }
+    return {"message": "Nettoyage lancé", **job.to_dict()}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Avancement d'une tâche de fond (créateur ou Admin).
+    Les tâches sont connues du seul processus worker qui les exécute.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Tâche non trouvée"
+        )
+    if job.owner_id != current_user['id'] and current_user['role'] != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Accès refusé"
+        )
+    return job.to_dict()
 
 
 # ==================== LEAVE/ABSENCE REQUEST ENDPOINTS ====================
@@ -615,20 +1116,31 @@ async def create_leave_request(
         )
     
     # Create the leave request
-    request_id = db.create_leave_request(
-        employee_id=current_user.doc_id,
-        employee_email=current_user['email'],
-        type=request_data.type,
-        start_date=request_data.start_date,
-        end_date=request_data.end_date,
-        reason=request_data.reason,
-        days_count=request_data.days_count
-    )
+    try:
+        request_id = await adb.create_leave_request(
+            employee_id=current_user['id'],
+            employee_email=current_user['email'],
+            type=request_data.type,
+            start_date=request_data.start_date,
+            end_date=request_data.end_date,
+            reason=request_data.reason,
+            days_count=request_data.days_count
+        )
+    except OverlappingLeaveRequestError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Cette demande chevauche votre demande n°{e.request_id}"
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Dates invalides (format AAAA-MM-JJ, fin après le début)"
+        )
     
     # Create a communication authorization request for admin approval
-    auth_id = db.create_communication_auth(
+    auth_id = await adb.create_communication_auth(
         leave_request_id=request_id,
-        employee_id=current_user.doc_id,
+        employee_id=current_user['id'],
         employee_email=current_user['email']
     )
     
@@ -640,11 +1152,32 @@ async def create_leave_request(
     }
 
 
+def _leave_request_response(req: dict) -> LeaveRequestResponse:
+    return LeaveRequestResponse(
+        id=req.doc_id,
+        employee_id=req['employee_id'],
+        employee_email=req['employee_email'],
+        type=req['type'],
+        start_date=req['start_date'],
+        end_date=req['end_date'],
+        reason=req['reason'],
+        days_count=req['days_count'],
+        status=req['status'],
+        hr_comment=req.get('hr_comment'),
+        created_at=req['created_at'],
+        updated_at=req.get('updated_at')
+    )
+
+
 @app.get("/leave-requests/my-requests", response_model=List[LeaveRequestResponse])
-async def get_my_leave_requests(current_user: dict = Depends(get_current_user)):
+async def get_my_leave_requests(
+    query: ListQuery = Depends(),
+    current_user: dict = Depends(get_current_user)
+):
     """
     Employee views their own leave requests.
     Only employees can access this endpoint.
+    Paginated with ?limit= / ?cursor=, incremental with ?since=.
     """
     if current_user['role'] != "employee":
         raise HTTPException(
@@ -652,36 +1185,50 @@ async def get_my_leave_requests(current_user: dict = Depends(get_current_user)):
             detail="Accès refusé"
         )
     
-    requests = db.get_leave_requests_by_employee(current_user.doc_id)
+    user_id = current_user['id']
+    if query.since is not None:
+        async def visible(requests: List[dict]) -> List[dict]:
+            return [req for req in requests if req['employee_id'] == user_id]
+        requests, deleted, headers = await _sync_changes(
+            'leave_requests', query, visible, lambda audience: user_id in audience
+        )
+        rows = [_leave_request_response(req) for req in requests]
+        return _list_response(rows + [{"id": i, "deleted": True} for i in deleted], headers)
     
-    result = []
-    for req in requests:
-        result.append(LeaveRequestResponse(
-            id=req.doc_id,
-            employee_id=req['employee_id'],
-            employee_email=req['employee_email'],
-            type=req['type'],
-            start_date=req['start_date'],
-            end_date=req['end_date'],
-            reason=req['reason'],
-            days_count=req['days_count'],
-            status=req['status'],
-            hr_comment=req.get('hr_comment'),
-            created_at=req['created_at'],
-            updated_at=req.get('updated_at')
-        ))
+    if query.paginated:
+        requests = await adb.scan_leave_requests(query.after_id, query.limit, employee_id=user_id)
+        return _list_response([_leave_request_response(req) for req in requests], query.page_headers(requests))
     
-    return result
+    requests = await adb.get_leave_requests_by_employee(user_id)
+    return [_leave_request_response(req) for req in requests]
+
+
+def _visible_to_hr(leave_status: Optional[str] = None):
+    """
+    Ne pas afficher les demandes dont l'autorisation de communication a été
+    refusée par l'admin (vue hr_leave_requests, lue en une fois pour toute la
+    liste), ni celles d'un autre statut que `leave_status`.
+    """
+    async def visible(requests: List[dict]) -> List[dict]:
+        ids = await adb.get_hr_visible_leave_request_ids([req.doc_id for req in requests], leave_status)
+        return [req for req in requests if req.doc_id in ids]
+    return visible
 
 
 @app.get("/leave-requests/all", response_model=List[LeaveRequestResponse])
-async def get_all_leave_requests(current_user: dict = Depends(get_current_user)):
+async def get_all_leave_requests(
+    query: ListQuery = Depends(),
+    leave_status: Optional[Literal["pending", "approved", "rejected"]] = Query(None, alias="status"),
+    current_user: dict = Depends(get_current_user)
+):
     """
     HR Manager views all leave requests.
     HR Managers OR users with delegated 'view_requests' right can access.
+    Paginated with ?limit= / ?cursor=, incremental with ?since=,
+    filtered with ?status=pending|approved|rejected.
     """
     is_hr = current_user['role'] == "hr_manager"
-    has_delegation = db.user_has_delegated_right(current_user['id'], 'view_requests')
+    has_delegation = await adb.user_has_delegated_right(current_user['id'], 'view_requests')
     
     if not is_hr and not has_delegation:
         raise HTTPException(
@@ -689,33 +1236,124 @@ async def get_all_leave_requests(current_user: dict = Depends(get_current_user))
             detail="Seul le DRH ou un délégué autorisé peut voir toutes les demandes"
         )
     
-    requests = db.get_all_leave_requests()
+    if query.since is not None:
+        requests, deleted, headers = await _sync_changes(
+            'leave_requests', query, _visible_to_hr(leave_status), _forget_always
+        )
+        rows = [_leave_request_response(req) for req in requests]
+        return _list_response(rows + [{"id": i, "deleted": True} for i in deleted], headers)
     
-    result = []
-    for req in requests:
-        # Vérifier si cette demande a été autorisée par l'admin
-        # Ne pas afficher les demandes dont l'autorisation a été refusée
-        comm_auth = db.get_communication_auth_by_leave_request(req.doc_id)
-        if comm_auth and comm_auth['status'] == 'rejected':
-            # Demande refusée par l'admin, ne pas l'afficher au RH
-            continue
-        
-        result.append(LeaveRequestResponse(
-            id=req.doc_id,
-            employee_id=req['employee_id'],
-            employee_email=req['employee_email'],
-            type=req['type'],
-            start_date=req['start_date'],
-            end_date=req['end_date'],
-            reason=req['reason'],
-            days_count=req['days_count'],
-            status=req['status'],
-            hr_comment=req.get('hr_comment'),
-            created_at=req['created_at'],
-            updated_at=req.get('updated_at')
-        ))
+    if query.paginated:
+        criteria = {'status': leave_status} if leave_status else {}
+        page = await adb.scan_leave_requests(query.after_id, query.limit, **criteria)
+        result = [_leave_request_response(req) for req in await _visible_to_hr()(page)]
+        return _list_response(result, query.page_headers(page))
     
-    return result
+    # Materialized view: O(result) whatever the number of requests
+    requests = await adb.get_hr_visible_leave_requests(leave_status)
+    return [_leave_request_response(req) for req in requests]
+
+
+@app.get("/leave-requests/stats", response_model=List[LeaveStatsResponse])
+async def get_leave_stats(
+    employee_id: Optional[int] = Query(None),
+    month: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Leave accounting: days requested per employee, type and month, by status
+    (running totals, no scan of the leave requests).
+    - without parameters: all-time totals of every employee
+    - ?employee_id=: totals of one employee and its months (?month= keeps one)
+    - ?month=YYYY-MM: every employee for that month
+    Employees only see their own figures.
+    """
+    if current_user['role'] == "employee":
+        has_delegation = await adb.user_has_delegated_right(current_user['id'], 'view_requests')
+        if not has_delegation:
+            if employee_id not in (None, current_user['id']):
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="Accès refusé aux statistiques d'un autre employé"
+                )
+            employee_id = current_user['id']
+    elif current_user['role'] != "hr_manager":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Seul le DRH ou un délégué autorisé peut voir les statistiques"
+        )
+    
+    rows = await adb.get_leave_stats(employee_id, month)
+    return [
+        LeaveStatsResponse(
+            employee_id=row['employee_id'], type=row['type'], month=row['month'],
+            days=row['days'], requests=row['requests']
+        )
+        for row in rows
+    ]
+
+
+@app.get("/leave-requests/analytics", response_model=dict)
+async def get_leave_analytics(
+    first_day: Optional[date] = Query(None, alias="from"),
+    last_day: Optional[date] = Query(None, alias="to"),
+    top: int = Query(10, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Planning analytics over the leave requests starting in [from, to] (whole
+    history by default): absence rate, distribution by month and weekday,
+    approval latency, top reasons. Computed on columnar NumPy arrays.
+    HR Manager and admin only.
+    """
+    if current_user['role'] not in ("hr_manager", "admin"):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Seuls le DRH et l'admin peuvent voir les statistiques d'absence"
+        )
+    if first_day is not None and last_day is not None and last_day < first_day:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="La date de fin précède la date de début"
+        )
+    
+    return await adb.get_leave_analytics(
+        first_day.isoformat() if first_day else None,
+        last_day.isoformat() if last_day else None,
+        top
+    )
+
+
+@app.get("/leave-requests/calendar", response_model=List[LeaveRequestResponse])
+async def get_leave_calendar(
+    first_day: date = Query(..., alias="from"),
+    last_day: date = Query(..., alias="to"),
+    leave_status: Optional[Literal["pending", "approved", "rejected"]] = Query(None, alias="status"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Who is off between two dates: leave requests sharing at least one day
+    with [from, to] (YYYY-MM-DD, inclusive), from the interval index.
+    Same readers and visibility as /leave-requests/all.
+    """
+    is_hr = current_user['role'] == "hr_manager"
+    has_delegation = await adb.user_has_delegated_right(current_user['id'], 'view_requests')
+    
+    if not is_hr and not has_delegation:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Seul le DRH ou un délégué autorisé peut voir le calendrier des absences"
+        )
+    if last_day < first_day:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="La date de fin précède la date de début"
+        )
+    
+    requests = await adb.get_leave_requests_between(first_day.isoformat(), last_day.isoformat())
+    requests = await _visible_to_hr(leave_status)(requests)
+    requests.sort(key=lambda req: (req['start_date'], req.doc_id))
+    return [_leave_request_response(req) for req in requests]
 
 
 @app.put("/leave-requests/{request_id}/status")
@@ -729,7 +1367,7 @@ async def update_leave_request_status(
     HR Managers OR users with delegated 'approve_leave' right can update.
     """
     is_hr = current_user['role'] == "hr_manager"
-    has_delegation = db.user_has_delegated_right(current_user['id'], 'approve_leave')
+    has_delegation = await adb.user_has_delegated_right(current_user['id'], 'approve_leave')
     
     if not is_hr and not has_delegation:
         raise HTTPException(
@@ -738,7 +1376,7 @@ async def update_leave_request_status(
         )
     
     # Check if request exists
-    request = db.get_leave_request(request_id)
+    request = await adb.get_leave_request(request_id)
     if not request:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -746,7 +1384,7 @@ async def update_leave_request_status(
         )
     
     # Update status
-    db.update_leave_request_status(
+    await adb.update_leave_request_status(
         request_id=request_id,
         status=update_data.status,
         hr_comment=update_data.hr_comment
@@ -755,6 +1393,60 @@ async def update_leave_request_status(
     return {"message": f"Demande {update_data.status} avec succès"}
 
 
+@app.put("/leave-requests/status-batch", response_model=LeaveRequestStatusBatchResponse)
+async def update_leave_request_statuses(
+    batch: LeaveRequestStatusBatch,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Approve / reject many leave requests at once (same rights as
+    PUT /leave-requests/{id}/status, checked once). All updates are applied
+    in a single transaction; one result per item, in request order: the new
+    status, or an "error" for that item only (unknown or repeated ID).
+    """
+    is_hr = current_user['role'] == "hr_manager"
+    has_delegation = await adb.user_has_delegated_right(current_user['id'], 'approve_leave')
+    
+    if not is_hr and not has_delegation:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Seul le DRH ou un délégué autorisé peut valider les demandes"
+        )
+    
+    if len(batch.updates) > settings.LEAVE_STATUS_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Au plus {settings.LEAVE_STATUS_BATCH_MAX_SIZE} demandes par requête"
+        )
+    
+    # An ID given twice would depend on the order of application: refuse the repeats
+    seen, repeated = set(), set()
+    for index, item in enumerate(batch.updates):
+        if item.id in seen:
+            repeated.add(index)
+        seen.add(item.id)
+    updates = [
+        (item.id, item.status, item.hr_comment)
+        for index, item in enumerate(batch.updates) if index not in repeated
+    ]
+    updated = set(await adb.update_leave_request_statuses(updates))
+    
+    results = []
+    for index, item in enumerate(batch.updates):
+        if index in repeated:
+            results.append(LeaveRequestStatusBatchResult(id=item.id, error="Demande en double dans le lot"))
+        elif item.id not in updated:
+            results.append(LeaveRequestStatusBatchResult(id=item.id, error="Demande non trouvée"))
+        else:
+            results.append(LeaveRequestStatusBatchResult(id=item.id, status=item.status))
+    
+    return LeaveRequestStatusBatchResponse(
+        updated=len(updated),
+        failed=len(results) - len(updated),
+        results=results
+    )
+
+
 @app.delete("/leave-requests/{request_id}")
 async def delete_leave_request(
     request_id: int,
@@ -771,14 +1463,14 @@ async def delete_leave_request(
         )
     
     # Check if request exists and belongs to the user
-    request = db.get_leave_request(request_id)
+    request = await adb.get_leave_request(request_id)
     if not request:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Demande non trouvée"
         )
     
-    if request['employee_id'] != current_user.doc_id:
+    if request['employee_id'] != current_user['id']:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Vous ne pouvez supprimer que vos propres demandes"
@@ -790,13 +1482,26 @@ async def delete_leave_request(
             detail="Vous ne pouvez supprimer que les demandes en attente"
         )
     
-    db.delete_leave_request(request_id)
+    await adb.delete_leave_request(request_id)
     
     return {"message": "Demande supprimée avec succès"}
 
 
 # ==================== COMMUNICATION AUTHORIZATION ENDPOINTS ====================
 
+def _communication_auth_response(auth: dict) -> CommunicationAuthResponse:
+    return CommunicationAuthResponse(
+        id=auth.doc_id,
+        leave_request_id=auth['leave_request_id'],
+        employee_id=auth['employee_id'],
+        employee_email=auth['employee_email'],
+        status=auth['status'],
+        created_at=auth['created_at'],
+        approved_at=auth.get('approved_at'),
+        rejected_at=auth.get('rejected_at')
+    )
+
+
 @app.get("/communication-auth/pending", response_model=List[CommunicationAuthResponse])
 async def get_pending_communication_auths(current_user: dict = Depends(get_current_user)):
     """
@@ -808,26 +1513,18 @@ async def get_pending_communication_auths(current_user: dict = Depends(get_curre
             detail="Seul l'admin peut voir les demandes d'autorisation"
         )
     
-    auths = db.get_pending_communication_auths()
-    result = []
-    for auth in auths:
-        result.append(CommunicationAuthResponse(
-            id=auth.doc_id,
-            leave_request_id=auth['leave_request_id'],
-            employee_id=auth['employee_id'],
-            employee_email=auth['employee_email'],
-            status=auth['status'],
-            created_at=auth['created_at'],
-            approved_at=auth.get('approved_at'),
-            rejected_at=auth.get('rejected_at')
-        ))
-    return result
+    auths = await adb.get_pending_communication_auths()
+    return [_communication_auth_response(auth) for auth in auths]
 
 
 @app.get("/communication-auth/all", response_model=List[CommunicationAuthResponse])
-async def get_all_communication_auths(current_user: dict = Depends(get_current_user)):
+async def get_all_communication_auths(
+    query: ListQuery = Depends(),
+    current_user: dict = Depends(get_current_user)
+):
     """
     Admin gets all communication authorization requests.
+    Paginated with ?limit= / ?cursor=, incremental with ?since=.
     """
     if current_user['role'] != "admin":
         raise HTTPException(
@@ -835,20 +1532,17 @@ async def get_all_communication_auths(current_user: dict = Depends(get_current_u
             detail="Seul l'admin peut voir les demandes d'autorisation"
         )
     
-    auths = db.get_all_communication_auths()
-    result = []
-    for auth in auths:
-        result.append(CommunicationAuthResponse(
-            id=auth.doc_id,
-            leave_request_id=auth['leave_request_id'],
-            employee_id=auth['employee_id'],
-            employee_email=auth['employee_email'],
-            status=auth['status'],
-            created_at=auth['created_at'],
-            approved_at=auth.get('approved_at'),
-            rejected_at=auth.get('rejected_at')
-        ))
-    return result
+    if query.since is not None:
+        auths, deleted, headers = await _sync_changes('communication_auth', query, _visible_to_all, _forget_always)
+        rows = [_communication_auth_response(auth) for auth in auths]
+        return _list_response(rows + [{"id": i, "deleted": True} for i in deleted], headers)
+    
+    if query.paginated:
+        auths = await adb.scan_communication_auths(query.after_id, query.limit)
+        return _list_response([_communication_auth_response(auth) for auth in auths], query.page_headers(auths))
+    
+    auths = await adb.get_all_communication_auths()
+    return [_communication_auth_response(auth) for auth in auths]
 
 
 @app.put("/communication-auth/{auth_id}")
@@ -869,7 +1563,7 @@ async def update_communication_auth(
         )
     
     # Get the communication auth
-    auth = db.get_communication_auth(auth_id)
+    auth = await adb.get_communication_auth(auth_id)
     if not auth:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -884,10 +1578,10 @@ async def update_communication_auth(
     
     if update_data.action == "reject":
         # Reject the authorization
-        db.update_communication_auth_status(auth_id, 'rejected')
+        await adb.update_communication_auth_status(auth_id, 'rejected')
         
         # Also update the leave request status - commentaire pour l'employé
-        db.update_leave_request_status(
+        await adb.update_leave_request_status(
             auth['leave_request_id'], 
             'rejected', 
             "Demande d'envoi de requête non autorisée par l'admin"
@@ -897,10 +1591,10 @@ async def update_communication_auth(
     
     elif update_data.action == "approve":
         # Update status to approved
-        db.update_communication_auth_status(auth_id, 'approved')
+        await adb.update_communication_auth_status(auth_id, 'approved')
         
         # Get the leave request data
-        leave_request = db.get_leave_request(auth['leave_request_id'])
+        leave_request = await adb.get_leave_request(auth['leave_request_id'])
         if not leave_request:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -908,7 +1602,7 @@ async def update_communication_auth(
             )
         
         # Get DH params
-        params = db.get_dh_params()
+        params = await adb.get_dh_params()
         if not params:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -918,23 +1612,25 @@ async def update_communication_auth(
         p = int(params['p'], 16)
         g = int(params['g'], 16)
         
-        # Generate server-side keys for this communication
-        server_private_key = generate_dh_private_key(p)
-        server_public_key = calculate_dh_public_key(g, server_private_key, p)
+        # Generate server-side keys for this communication (off the event loop)
+        loop = asyncio.get_running_loop()
+        server_private_key, server_public_key = await loop.run_in_executor(None, generate_dh_keypair, p, g)
         
         # Store session with private key
-        db.store_session(auth['employee_id'], hex(server_private_key))
+        await adb.store_session(auth['employee_id'], hex(server_private_key))
         
         # For now, we simulate the key exchange and encrypt the message
         # In a real scenario, we would use the client's public key
         # Here we use a simplified approach where the server handles the encryption
         
         # Create a shared secret (simplified - server creates and stores both keys)
-        shared_secret = calculate_dh_shared_secret(server_public_key, server_private_key, p)
+        shared_secret = await loop.run_in_executor(
+            None, calculate_dh_shared_secret, server_public_key, server_private_key, p
+        )
         aes_key = derive_aes_key_from_secret(shared_secret)
         
         # Update session with shared secret
-        db.update_session_secret(auth['employee_id'], hex(shared_secret))
+        await adb.update_session_secret(auth['employee_id'], hex(shared_secret))
         
         # Prepare the leave request content
         leave_content = json.dumps({
@@ -946,11 +1642,11 @@ async def update_communication_auth(
             "type": leave_request['type']
         })
         
-        # Encrypt the content using aes_encrypt from security.py
-        encrypted_content, iv = aes_encrypt(leave_content, aes_key)
+        # Encrypt the content (versioned AES-GCM blob, stored as raw bytes)
+        encrypted_content = encrypt_bytes(leave_content.encode('utf-8'), aes_key)
         
         # Get HR manager
-        hr_users = db.get_users_by_role("hr_manager")
+        hr_users = await adb.get_users_by_role("hr_manager")
         if not hr_users:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -959,15 +1655,14 @@ async def update_communication_auth(
         hr_manager = hr_users[0]
         
         # Store the encrypted message
-        msg_id = db.store_message(
+        msg_id = await adb.store_message(
             from_id=auth['employee_id'],
             to_id=hr_manager.doc_id,
-            encrypted_content=encrypted_content,
-            iv=iv
+            encrypted_content=encrypted_content
         )
         
         # Update authorization status
-        db.update_communication_auth_status(auth_id, 'message_sent')
+        await adb.update_communication_auth_status(auth_id, 'message_sent')
         
         return {
             "message": "Communication autorisée. Clés générées et message chiffré envoyé au RH.",
@@ -986,7 +1681,7 @@ async def get_my_communication_auths(current_user: dict = Depends(get_current_us
             detail="Accès refusé"
         )
     
-    auths = db.get_communication_auth_by_employee(current_user.doc_id)
+    auths = await adb.get_communication_auth_by_employee(current_user['id'])
     result = []
     for auth in auths:
         result.append({
@@ -1017,7 +1712,7 @@ async def create_user(
         )
     
     # Check if user already exists
-    existing_user = db.get_user_by_email(user_data.email)
+    existing_user = await adb.get_user_by_email(user_data.email)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -1025,13 +1720,13 @@ async def create_user(
         )
     
     # Create user
-    user_id = db.create_user(
+    user_id = await adb.create_user(
         email=user_data.email,
-        password_hash=get_password_hash(user_data.password),
+        password_hash=await get_password_hash_async(user_data.password),
         role=user_data.role
     )
     
-    created_user = db.get_user_by_id(user_id)
+    created_user = await adb.get_user_by_id(user_id)
     
     return User(
         id=created_user.doc_id,
@@ -1041,9 +1736,13 @@ async def create_user(
 
 
 @app.get("/admin/messages")
-async def get_all_messages_admin(current_user: dict = Depends(get_current_user)):
+async def get_all_messages_admin(
+    query: ListQuery = Depends(),
+    current_user: dict = Depends(get_current_user)
+):
     """
     Admin view: Get all messages in the system.
+    Paginated with ?limit= / ?cursor=, incremental with ?since=.
     """
     if current_user['role'] != "admin":
         raise HTTPException(
@@ -1051,12 +1750,23 @@ async def get_all_messages_admin(current_user: dict = Depends(get_current_user))
             detail="Only admin can view all messages"
         )
     
-    messages = db.get_all_messages()
+    deleted = []
+    headers = {}
+    if query.since is not None:
+        messages, deleted, headers = await _sync_changes('messages', query, _visible_to_all, _forget_always)
+    elif query.paginated:
+        messages = await adb.scan_messages(query.after_id, query.limit)
+        headers = query.page_headers(messages)
+    else:
+        messages = await adb.get_all_messages()
     
+    users = await adb.get_users_by_ids(
+        user_id for msg in messages for user_id in (msg['from_id'], msg['to_id'])
+    )
     result = []
     for msg in messages:
-        sender = db.get_user_by_id(msg['from_id'])
-        receiver = db.get_user_by_id(msg['to_id'])
+        sender = users.get(msg['from_id'])
+        receiver = users.get(msg['to_id'])
         
         result.append({
             "id": msg.doc_id,
@@ -1066,9 +1776,172 @@ async def get_all_messages_admin(current_user: dict = Depends(get_current_user))
             "encrypted": True
         })
     
+    if query.paginated:
+        return _list_response(result + [{"id": i, "deleted": True} for i in deleted], headers)
     return result
 
 
+@app.get("/admin/storage-metrics")
+async def get_storage_metrics(current_user: dict = Depends(get_current_user)):
+    """
+    Admin view: storage backend and write batching metrics
+    (batch sizes, flush latency).
+    """
+    if current_user['role'] != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can view storage metrics"
+        )
+    
+    return await adb.get_storage_metrics()
+
+
+@app.get("/admin/handshake-metrics")
+async def get_handshake_metrics(current_user: dict = Depends(get_current_user)):
+    """
+    Admin view: /handshake/exchange latency per key agreement group
+    (modp1536, x25519) and depth / miss rate of the DH keypair pool,
+    for this worker process.
+    """
+    if current_user['role'] != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can view handshake metrics"
+        )
+    
+    return {
+        "latency": handshake_metrics.stats(),
+        "keypair_pools": keypair_pool_stats()
+    }
+
+
+@app.get("/admin/cache-metrics")
+async def get_cache_metrics(current_user: dict = Depends(get_current_user)):
+    """
+    Admin view: in-process caches (size, hits/misses, invalidations).
+    Each worker process has its own caches.
+    """
+    if current_user['role'] != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can view cache metrics"
+        )
+    
+    return {
+        "principal_cache": principal_cache.stats(),
+        "session_keys": session_keys.stats()
+    }
+
+
+@app.get("/admin/event-metrics")
+async def get_event_metrics(current_user: dict = Depends(get_current_user)):
+    """
+    Admin view: open GET /events streams and events published / delivered
+    by this worker process.
+    """
+    if current_user['role'] != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can view event metrics"
+        )
+    
+    return event_broker.stats()
+
+
+@app.post("/admin/hr-view/rebuild")
+async def rebuild_hr_view(current_user: dict = Depends(get_current_user)):
+    """
+    Admin: compare the HR-visible leave requests view (GET /leave-requests/all)
+    with the naive query, then recompute it from scratch.
+    """
+    if current_user['role'] != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can rebuild the HR view"
+        )
+
+    problems = await adb.verify_hr_leave_view()
+    visible = await adb.rebuild_hr_leave_view()
+    return {"problems": problems, "visible_requests": visible}
+
+
+@app.post("/admin/leave-stats/recompute")
+async def recompute_leave_stats(current_user: dict = Depends(get_current_user)):
+    """
+    Admin: compare the leave accounting counters (GET /leave-requests/stats)
+    with a full recount of the leave requests, then rebuild them.
+    """
+    if current_user['role'] != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can recompute leave statistics"
+        )
+
+    problems = await adb.verify_leave_stats()
+    rows = await adb.recompute_leave_stats()
+    return {"problems": problems, "rows": rows}
+
+
+# ==================== PUSH EVENTS (SSE) ====================
+
+@app.get("/events", response_class=StreamingResponse, responses={200: {"content": {"text/event-stream": {}}}})
+async def event_stream(
+    token: Optional[str] = Query(None, description="JWT, for clients that cannot set the Authorization header"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
+    """
+    Server-Sent Events stream of the changes the user may see:
+    leave_request.created / leave_request.status (the employee, HR and
+    delegates with 'view_requests'), communication_auth.created /
+    communication_auth.status (the employee and admins), message.received
+    (the recipient and admins). Events carry ids and statuses only: refetch
+    with ?since=. `ready` is sent on connect and `resync` when events were
+    dropped (client too slow): refetch in both cases. The stream ends with
+    `expired` when the token expires.
+    """
+    if credentials is None:
+        if not token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Not authenticated"
+            )
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    user = await get_current_user(credentials)
+    expires_at = decode_access_token(credentials.credentials).get('exp', float('inf'))
+    
+    if event_broker.full:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Trop de connexions, réessayez plus tard",
+            headers={"Retry-After": "5"}
+        )
+    
+    async def frames():
+        # Registered once streaming starts: the finally clause then always runs
+        stream = event_broker.register(user['id'], user['role'])
+        try:
+            yield READY
+            while True:
+                remaining = expires_at - time.time()
+                if remaining <= 0:
+                    yield EXPIRED
+                    return
+                frame = await stream.next(min(settings.EVENTS_HEARTBEAT_SECONDS, remaining))
+                if frame is None:
+                    yield KEEPALIVE
+                elif not frame:
+                    return  # Shutdown
+                else:
+                    yield frame
+        finally:
+            event_broker.unregister(stream)
+    
+    return StreamingResponse(frames(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # Reverse proxies must not buffer the stream
+    })
+
+
 # ==================== HEALTH CHECK ====================
 
 @app.get("/")
@@ -1094,6 +1967,77 @@ async def root():
 # SOLUTION: Flag "transfer_only" (can_reshare=False) empêche la re-propagation
 # ================================================================
 
+async def _store_document_content(content: str) -> tuple:
+    """
+    (inline content, blob_id, size): bodies above DOCUMENT_INLINE_MAX_BYTES
+    go to an encrypted blob instead of the documents table.
+    """
+    data = content.encode('utf-8')
+    if len(data) <= settings.DOCUMENT_INLINE_MAX_BYTES:
+        return content, None, len(data)
+    loop = asyncio.get_running_loop()
+    blob_id, size = await loop.run_in_executor(None, document_blobs.write_bytes, data)
+    return None, blob_id, size
+
+
+async def _replace_document(doc_id: int, new_blob_id: Optional[str], **changes):
+    """
+    adb.update_document(doc_id, **changes), then delete the blob that is no
+    longer referenced: the replaced one, or the new one if the update did
+    not happen (document deleted meanwhile: 404, or a failed write).
+    """
+    try:
+        previous = await adb.update_document(doc_id, **changes)
+    except BaseException:
+        if new_blob_id:
+            document_blobs.delete(new_blob_id)
+        raise
+    if previous is None:
+        if new_blob_id:
+            document_blobs.delete(new_blob_id)
+        raise HTTPException(status_code=404, detail="Document non trouvé")
+    replaced = changes.get('content') is not None or new_blob_id is not None
+    if replaced and previous.get('blob_id'):
+        document_blobs.delete(previous['blob_id'])
+
+
+def _document_permissions(doc: dict, user: dict, user_acl: Optional[dict]) -> List[str]:
+    """Droits de l'utilisateur sur le document (propriétaire: tous)."""
+    if doc['owner_id'] == user['id']:
+        return ["own", "read", "write", "share"]
+    return user_acl.get('permissions', []) if user_acl else []
+
+
+def _parse_range(range_header: Optional[str], size: int) -> Optional[tuple]:
+    """
+    [start, end) of a single `Range: bytes=...` request, or None for the
+    whole body (no header, or several ranges). Raises 416 when unsatisfiable.
+    """
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, _, last = spec.strip().partition('-')
+    try:
+        if first:
+            start = int(first)
+            end = int(last) + 1 if last else size
+        else:
+            # Suffix range: the last N bytes
+            start, end = max(0, size - int(last)), size
+    except ValueError:
+        return None
+    end = min(end, size)
+    if start < 0 or start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Plage demandée invalide",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+
 @app.post("/documents", tags=["DAC - Documents"])
 async def create_document(
     doc: DocumentCreate,
@@ -1105,13 +2049,21 @@ async def create_document(
     """
     user = await get_current_user(credentials)
     
-    doc_id = db.create_document(
-        owner_id=user['id'],
-        owner_email=user['email'],
-        title=doc.title,
-        content=doc.content,
-        is_confidential=doc.is_confidential
-    )
+    content, blob_id, content_size = await _store_document_content(doc.content)
+    try:
+        doc_id = await adb.create_document(
+            owner_id=user['id'],
+            owner_email=user['email'],
+            title=doc.title,
+            content=content,
+            is_confidential=doc.is_confidential,
+            blob_id=blob_id,
+            content_size=content_size
+        )
+    except BaseException:
+        if blob_id:
+            document_blobs.delete(blob_id)
+        raise
     
     return {
         "message": "Document créé avec succès",
@@ -1133,13 +2085,13 @@ async def update_document(
     """
     user = await get_current_user(credentials)
     
-    doc = db.get_document(doc_id)
+    doc = await adb.get_document(doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document non trouvé")
     
     # Vérifier les droits de modification
     is_owner = doc['owner_id'] == user['id']
-    user_acl = db.get_user_document_acl(doc_id, user['id'])
+    user_acl = await adb.get_user_document_acl(doc_id, user['id'])
     
     if not is_owner:
         if not user_acl:
@@ -1147,23 +2099,30 @@ async def update_document(
         if 'write' not in user_acl.get('permissions', []):
             raise HTTPException(status_code=403, detail="Permission 'write' requise pour modifier ce document")
     
-    # Effectuer la mise à jour
-    db.update_document(
-        doc_id=doc_id,
+    # Effectuer la mise à jour (titre et contenu dans la même écriture)
+    content, blob_id, content_size = update_data.content, None, None
+    if content is not None:
+        content, blob_id, content_size = await _store_document_content(content)
+    await _replace_document(
+        doc_id, blob_id,
         title=update_data.title,
-        content=update_data.content,
-        is_confidential=update_data.is_confidential
+        content=content,
+        is_confidential=update_data.is_confidential,
+        blob_id=blob_id,
+        content_size=content_size,
+        content_type="text/plain; charset=utf-8" if blob_id else None
     )
     
     # Récupérer le document mis à jour
-    updated_doc = db.get_document(doc_id)
+    updated_doc = await adb.get_document(doc_id)
     
     return {
         "message": "Document modifié avec succès",
         "document": {
             "id": updated_doc.doc_id,
             "title": updated_doc['title'],
-            "content": updated_doc['content'],
+            "content": updated_doc.get('content'),
+            "content_size": updated_doc.get('content_size'),
             "is_confidential": updated_doc['is_confidential'],
             "owner_email": updated_doc['owner_email'],
             "updated_at": updated_doc.get('updated_at')
@@ -1173,54 +2132,206 @@ async def update_document(
     }
 
 
+def _owned_document_row(doc: dict) -> dict:
+    return {
+        "id": doc.doc_id,
+        "title": doc['title'],
+        "content": doc.get('content'),  # None: stored as a blob, see content_url
+        "content_size": doc.get('content_size'),
+        "content_url": f"/documents/{doc.doc_id}/content",
+        "is_confidential": doc['is_confidential'],
+        "owner_email": doc['owner_email'],
+        "is_owner": True,
+        "permissions": ["own", "read", "write", "share"],
+        "created_at": doc['created_at']
+    }
+
+
+def _shared_document_row(doc: dict, acl: dict) -> dict:
+    return {
+        "id": doc.doc_id,
+        "title": doc['title'],
+        "content": doc.get('content') if 'read' in acl['permissions'] else "[ACCÈS REFUSÉ]",
+        "content_size": doc.get('content_size'),
+        "content_url": f"/documents/{doc.doc_id}/content",
+        "is_confidential": doc['is_confidential'],
+        "owner_email": doc['owner_email'],
+        "is_owner": False,
+        "permissions": acl['permissions'],
+        "can_reshare": acl['can_reshare'],
+        "is_dac_mode": acl['is_dac_mode'],
+        "granted_by": acl['granted_by_email'],
+        "created_at": acl['created_at']
+    }
+
+
 @app.get("/documents", tags=["DAC - Documents"])
 async def get_my_documents(
+    query: ListQuery = Depends(),
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
-    """Récupérer mes documents (propriétaire) et ceux partagés avec moi."""
+    """
+    Récupérer mes documents (propriétaire) et ceux partagés avec moi.
+    Pagination (?limit= / ?cursor=) par ID de document sur les deux listes;
+    avec ?since=, seulement les changements, et deleted_documents.
+    """
     user = await get_current_user(credentials)
+    user_id = user['id']
     
-    # Documents dont je suis propriétaire
-    owned = db.get_documents_by_owner(user['id'])
-    owned_docs = []
-    for doc in owned:
-        owned_docs.append({
-            "id": doc.doc_id,
-            "title": doc['title'],
-            "content": doc['content'],
-            "is_confidential": doc['is_confidential'],
-            "owner_email": doc['owner_email'],
-            "is_owner": True,
-            "permissions": ["own", "read", "write", "share"],
-            "created_at": doc['created_at']
-        })
+    if query.since is not None:
+        acls = {}
+        
+        async def visible(docs: List[dict]) -> List[dict]:
+            shared = {}
+            for acl in await adb.get_acls_for_user(user_id):
+                shared.setdefault(acl['document_id'], acl)  # Comme get_user_document_acl: la plus ancienne
+            for doc in docs:
+                if doc['owner_id'] != user_id and doc.doc_id in shared:
+                    acls[doc.doc_id] = shared[doc.doc_id]
+            return [doc for doc in docs if doc['owner_id'] == user_id or doc.doc_id in acls]
+        
+        documents, deleted, headers = await _sync_changes(
+            'documents', query, visible, lambda audience: user_id in audience
+        )
+        return _list_response({
+            "owned_documents": [_owned_document_row(doc) for doc in documents if doc.doc_id not in acls],
+            "shared_documents": [_shared_document_row(doc, acls[doc.doc_id]) for doc in documents if doc.doc_id in acls],
+            "deleted_documents": deleted
+        }, headers)
+    
+    if query.paginated:
+        # Documents dont je suis propriétaire / partagés avec moi, après le
+        # curseur; la page garde les `limit` plus petits IDs des deux listes
+        owned = await adb.scan_documents(query.after_id, query.limit, owner_id=user_id)
+        acls = sorted(
+            (acl for acl in await adb.get_acls_for_user(user_id) if acl['document_id'] > query.after_id),
+            key=lambda acl: acl['document_id']
+        )
+        doc_ids = sorted({doc.doc_id for doc in owned} | {acl['document_id'] for acl in acls[:query.limit]})
+        headers = {}
+        if len(owned) == query.limit or len(doc_ids) > query.limit or len(acls) > query.limit:
+            doc_ids = doc_ids[:query.limit]
+            headers["X-Next-Cursor"] = _encode_cursor("p", doc_ids[-1])
+        last_id = doc_ids[-1] if doc_ids else 0
+        owned = [doc for doc in owned if doc.doc_id <= last_id]
+        acls = [acl for acl in acls if acl['document_id'] <= last_id]
+    else:
+        # Documents dont je suis propriétaire
+        owned = await adb.get_documents_by_owner(user_id)
+        # Documents partagés avec moi
+        acls = await adb.get_acls_for_user(user_id)
+    
+    owned_docs = [_owned_document_row(doc) for doc in owned]
+    shared = await adb.get_documents_by_ids(acl['document_id'] for acl in acls)
+    shared_docs = [
+        _shared_document_row(shared[acl['document_id']], acl)
+        for acl in acls if acl['document_id'] in shared
+    ]
+    
+    result = {
+        "owned_documents": owned_docs,
+        "shared_documents": shared_docs
+    }
+    if query.paginated:
+        return _list_response(result, headers)
+    return result
+
+
+@app.put("/documents/{doc_id}/content", tags=["DAC - Documents"])
+async def upload_document_content(
+    doc_id: int,
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """
+    Remplacer le contenu d'un document par le corps brut de la requête
+    (requiert permission 'write'). Le corps est chiffré par blocs au fil de
+    la réception : la taille du document n'est pas limitée par la mémoire.
+    """
+    user = await get_current_user(credentials)
     
-    # Documents partagés avec moi
-    acls = db.get_acls_for_user(user['id'])
-    shared_docs = []
-    for acl in acls:
-        doc = db.get_document(acl['document_id'])
-        if doc:
-            shared_docs.append({
-                "id": doc.doc_id,
-                "title": doc['title'],
-                "content": doc['content'] if 'read' in acl['permissions'] else "[ACCÈS REFUSÉ]",
-                "is_confidential": doc['is_confidential'],
-                "owner_email": doc['owner_email'],
-                "is_owner": False,
-                "permissions": acl['permissions'],
-                "can_reshare": acl['can_reshare'],
-                "is_dac_mode": acl['is_dac_mode'],
-                "granted_by": acl['granted_by_email'],
-                "created_at": acl['created_at']
-            })
+    doc = await adb.get_document(doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document non trouvé")
+    user_acl = await adb.get_user_document_acl(doc_id, user['id'])
+    if 'write' not in _document_permissions(doc, user, user_acl):
+        raise HTTPException(status_code=403, detail="Permission 'write' requise pour modifier ce document")
+    
+    loop = asyncio.get_running_loop()
+    writer = await loop.run_in_executor(None, document_blobs.create)
+    try:
+        # Encrypt and write ~1 MiB at a time, off the event loop
+        pending = bytearray()
+        async for piece in request.stream():
+            pending += piece
+            if len(pending) >= 1024 * 1024:
+                await loop.run_in_executor(None, writer.write, bytes(pending))
+                pending.clear()
+        await loop.run_in_executor(None, writer.write, bytes(pending))
+        blob_id, size = await loop.run_in_executor(None, writer.close)
+    except BaseException:
+        writer.abort()
+        raise
+    
+    content_type = request.headers.get('content-type', 'application/octet-stream')
+    await _replace_document(doc_id, blob_id, blob_id=blob_id, content_size=size, content_type=content_type)
     
     return {
-        "owned_documents": owned_docs,
-        "shared_documents": shared_docs
+        "message": "Contenu du document enregistré",
+        "document_id": doc_id,
+        "content_size": size,
+        "modified_by": user['email']
     }
 
 
+@app.get("/documents/{doc_id}/content", tags=["DAC - Documents"])
+async def download_document_content(
+    doc_id: int,
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """
+    Télécharger le contenu d'un document (requiert permission 'read'), en
+    flux. Supporte les requêtes `Range: bytes=debut-fin` (réponse 206).
+    """
+    user = await get_current_user(credentials)
+    
+    doc = await adb.get_document(doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document non trouvé")
+    user_acl = await adb.get_user_document_acl(doc_id, user['id'])
+    if 'read' not in _document_permissions(doc, user, user_acl):
+        raise HTTPException(status_code=403, detail="Permission 'read' requise pour lire ce document")
+    
+    blob_id = doc.get('blob_id')
+    if blob_id:
+        loop = asyncio.get_running_loop()
+        try:
+            size = await loop.run_in_executor(None, document_blobs.size, blob_id)
+        except (FileNotFoundError, BlobIntegrityError):
+            raise HTTPException(status_code=500, detail="Contenu du document illisible ou altéré")
+        media_type = doc.get('content_type') or 'application/octet-stream'
+    else:
+        data = (doc.get('content') or '').encode('utf-8')
+        size = len(data)
+        media_type = 'text/plain; charset=utf-8'
+    
+    byte_range = _parse_range(request.headers.get('range'), size)
+    start, end = byte_range or (0, size)
+    headers = {"Accept-Ranges": "bytes", "Content-Length": str(end - start)}
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    
+    # Sync iterators are run in a thread pool by StreamingResponse
+    body = document_blobs.read(blob_id, start, end) if blob_id else iter([data[start:end]])
+    return StreamingResponse(
+        body,
+        status_code=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+        media_type=media_type,
+        headers=headers
+    )
+
+
 @app.post("/documents/share/dac", tags=["DAC - Documents"])
 async def share_document_dac(
     share: DocumentShareDAC,
@@ -1236,13 +2347,13 @@ async def share_document_dac(
     user = await get_current_user(credentials)
     
     # Vérifier que le document existe
-    doc = db.get_document(share.document_id)
+    doc = await adb.get_document(share.document_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document non trouvé")
     
     # Vérifier les droits de partage
     is_owner = doc['owner_id'] == user['id']
-    user_acl = db.get_user_document_acl(share.document_id, user['id'])
+    user_acl = await adb.get_user_document_acl(share.document_id, user['id'])
     
     if not is_owner:
         if not user_acl:
@@ -1254,19 +2365,19 @@ async def share_document_dac(
             )
     
     # Vérifier que le destinataire existe
-    target = db.get_user_by_id(share.target_user_id)
+    target = await adb.get_user_by_id(share.target_user_id)
     if not target:
         raise HTTPException(status_code=404, detail="Utilisateur destinataire non trouvé")
     
     # Vérifier si déjà partagé
-    existing = db.get_user_document_acl(share.document_id, share.target_user_id)
+    existing = await adb.get_user_document_acl(share.document_id, share.target_user_id)
     if existing:
         raise HTTPException(status_code=400, detail="Document déjà partagé avec cet utilisateur")
     
     # Créer l'ACL avec can_reshare=True si 'share' dans permissions (FAIBLESSE DAC!)
     can_reshare = 'share' in share.permissions
     
-    acl_id = db.create_document_acl(
+    acl_id = await adb.create_document_acl(
         document_id=share.document_id,
         user_id=share.target_user_id,
         user_email=target['email'],
@@ -1305,13 +2416,13 @@ async def share_document_secure(
     user = await get_current_user(credentials)
     
     # Vérifier que le document existe
-    doc = db.get_document(share.document_id)
+    doc = await adb.get_document(share.document_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document non trouvé")
     
     # Seul le propriétaire peut partager en mode sécurisé (ou ceux avec can_reshare ET share.can_reshare=True)
     is_owner = doc['owner_id'] == user['id']
-    user_acl = db.get_user_document_acl(share.document_id, user['id'])
+    user_acl = await adb.get_user_document_acl(share.document_id, user['id'])
     
     if not is_owner:
         if not user_acl:
@@ -1320,16 +2431,16 @@ async def share_document_secure(
             raise HTTPException(status_code=403, detail="Vous ne pouvez pas partager ce document")
     
     # Vérifier que le destinataire existe
-    target = db.get_user_by_id(share.target_user_id)
+    target = await adb.get_user_by_id(share.target_user_id)
     if not target:
         raise HTTPException(status_code=404, detail="Utilisateur destinataire non trouvé")
     
     # Vérifier si déjà partagé
-    existing = db.get_user_document_acl(share.document_id, share.target_user_id)
+    existing = await adb.get_user_document_acl(share.document_id, share.target_user_id)
     if existing:
         raise HTTPException(status_code=400, detail="Document déjà partagé avec cet utilisateur")
     
-    acl_id = db.create_document_acl(
+    acl_id = await adb.create_document_acl(
         document_id=share.document_id,
         user_id=share.target_user_id,
         user_email=target['email'],
@@ -1364,8 +2475,8 @@ async def get_acl_matrix(
     if user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Admin uniquement")
     
-    documents = db.get_all_documents()
-    acls = db.get_all_document_acls()
+    documents = await adb.get_all_documents()
+    acls = await adb.get_all_document_acls()
     
     # Construire la matrice
     matrix = {}
@@ -1380,9 +2491,10 @@ async def get_acl_matrix(
         matrix[owner_email][doc_name] = ["own", "read", "write", "share"]
     
     # Ajouter les ACLs
+    acl_docs = {doc.doc_id: doc for doc in documents}
     for acl in acls:
         user_email = acl['user_email']
-        doc = db.get_document(acl['document_id'])
+        doc = acl_docs.get(acl['document_id'])
         if doc:
             doc_name = f"doc_{acl['document_id']}:{doc['title'][:20]}"
             
@@ -1424,20 +2536,20 @@ async def revoke_document_access(
     """
     user = await get_current_user(credentials)
     
-    doc = db.get_document(doc_id)
+    doc = await adb.get_document(doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document non trouvé")
     
     if doc['owner_id'] != user['id']:
         raise HTTPException(status_code=403, detail="Seul le propriétaire peut révoquer les accès")
     
-    acl = db.get_user_document_acl(doc_id, user_id)
+    acl = await adb.get_user_document_acl(doc_id, user_id)
     if not acl:
         raise HTTPException(status_code=404, detail="Cet utilisateur n'a pas accès au document")
     
-    db.delete_document_acl(acl.doc_id)
+    await adb.delete_document_acl(acl.doc_id)
     
-    target = db.get_user_by_id(user_id)
+    target = await adb.get_user_by_id(user_id)
     
     return {
         "message": "Accès révoqué avec succès",
@@ -1474,14 +2586,14 @@ async def create_delegation_dac(
     
     # HR/Admin peuvent toujours déléguer, OU un utilisateur avec droit 'delegate' délégué
     is_hr_or_admin = user['role'] in ['hr_manager', 'admin']
-    has_delegate_right = db.user_has_delegated_right(user['id'], 'delegate')
+    has_delegate_right = await adb.user_has_delegated_right(user['id'], 'delegate')
     
     if not is_hr_or_admin and not has_delegate_right:
         raise HTTPException(status_code=403, detail="Vous n'avez pas le droit de déléguer")
     
     # Si c'est un utilisateur délégué, il ne peut déléguer que les droits qu'il a reçus
     if not is_hr_or_admin:
-        user_rights = db.get_user_delegated_rights(user['id'])
+        user_rights = await adb.get_user_delegated_rights(user['id'])
         for right in delegation.rights:
             if right not in user_rights:
                 raise HTTPException(
@@ -1490,7 +2602,7 @@ async def create_delegation_dac(
                 )
     
     # Vérifier que le délégué existe
-    delegate = db.get_user_by_id(delegation.delegate_to_user_id)
+    delegate = await adb.get_user_by_id(delegation.delegate_to_user_id)
     if not delegate:
         raise HTTPException(status_code=404, detail="Utilisateur délégué non trouvé")
     
@@ -1500,7 +2612,7 @@ async def create_delegation_dac(
     
     can_redelegate = 'delegate' in delegation.rights
     
-    delegation_id = db.create_delegation(
+    delegation_id = await adb.create_delegation(
         delegator_id=user['id'],
         delegator_email=user['email'],
         delegate_id=delegation.delegate_to_user_id,
@@ -1548,16 +2660,16 @@ async def create_delegation_secure(
     # Pour les utilisateurs délégués, vérifier s'ils ont le droit de re-déléguer
     # En mode sécurisé, can_redelegate = True signifie qu'on peut re-déléguer
     # En mode DAC, le droit 'delegate' dans rights permet de re-déléguer
-    user_delegations = db.get_active_delegations_for_delegate(user['id'])
+    user_delegations = await adb.get_active_delegations_for_delegate(user['id'])
     can_redelegate_secure = any(d.get('can_redelegate', False) for d in user_delegations)
-    has_delegate_right = db.user_has_delegated_right(user['id'], 'delegate')
+    has_delegate_right = await adb.user_has_delegated_right(user['id'], 'delegate')
     
     if not is_hr_or_admin and not has_delegate_right and not can_redelegate_secure:
         raise HTTPException(status_code=403, detail="Vous n'avez pas le droit de déléguer")
     
     # Si c'est un utilisateur délégué, il ne peut déléguer que les droits qu'il a reçus
     if not is_hr_or_admin:
-        user_rights = db.get_user_delegated_rights(user['id'])
+        user_rights = await adb.get_user_delegated_rights(user['id'])
         for right in delegation.rights:
             if right not in user_rights:
                 raise HTTPException(
@@ -1566,7 +2678,7 @@ async def create_delegation_secure(
                 )
     
     # Vérifier que le délégué existe
-    delegate = db.get_user_by_id(delegation.delegate_to_user_id)
+    delegate = await adb.get_user_by_id(delegation.delegate_to_user_id)
     if not delegate:
         raise HTTPException(status_code=404, detail="Utilisateur délégué non trouvé")
     
@@ -1614,7 +2726,7 @@ async def create_delegation_secure(
     else:
         expires_at = requested_expires_at.isoformat()
     
-    delegation_id = db.create_delegation(
+    delegation_id = await adb.create_delegation(
         delegator_id=user['id'],
         delegator_email=user['email'],
         delegate_id=delegation.delegate_to_user_id,
@@ -1651,8 +2763,8 @@ async def get_my_delegations(
     """Récupérer mes délégations (données et reçues) - uniquement les actives."""
     user = await get_current_user(credentials)
     
-    given = db.get_active_delegations_by_delegator(user['id'])
-    received = db.get_active_delegations_for_delegate(user['id'])
+    given = await adb.get_active_delegations_by_delegator(user['id'])
+    received = await adb.get_active_delegations_for_delegate(user['id'])
     
     return {
         "delegations_given": [{
@@ -1684,8 +2796,8 @@ async def get_my_delegated_rights(
 ):
     """Récupérer les droits délégués actifs de l'utilisateur."""
     user = await get_current_user(credentials)
-    rights = db.get_user_delegated_rights(user['id'])
-    delegations = db.get_active_delegations_for_delegate(user['id'])
+    rights = await adb.get_user_delegated_rights(user['id'])
+    delegations = await adb.get_active_delegations_for_delegate(user['id'])
     
     return {
         "delegated_rights": rights,
@@ -1708,7 +2820,7 @@ async def get_delegation_graph(
     if user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Admin uniquement")
     
-    all_delegations = db.get_all_delegations()
+    all_delegations = await adb.get_all_delegations()
     
     nodes = set()
     edges = []
@@ -1777,14 +2889,14 @@ async def revoke_delegation(
     """Révoquer une délégation."""
     user = await get_current_user(credentials)
     
-    delegation = db.get_delegation(delegation_id)
+    delegation = await adb.get_delegation(delegation_id)
     if not delegation:
         raise HTTPException(status_code=404, detail="Délégation non trouvée")
     
     if delegation['delegator_id'] != user['id'] and user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Vous ne pouvez pas révoquer cette délégation")
     
-    db.revoke_delegation(delegation_id)
+    await adb.revoke_delegation(delegation_id)
     
     return {
         "message": "Délégation révoquée",
@@ -1801,7 +2913,7 @@ async def list_users(
     
     all_users = []
     for role in ['admin', 'hr_manager', 'employee']:
-        users = db.get_users_by_role(role)
+        users = await adb.get_users_by_role(role)
         for u in users:
             if u.doc_id != user['id']:  # Exclure l'utilisateur courant
                 all_users.append({
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, Literal, List
+from typing import Optional, Literal, List, Dict
 from datetime import datetime
 
 
@@ -49,20 +49,28 @@ class TokenData(BaseModel):
 class DHParams(BaseModel):
     p: str  # Prime number as string (hex)
     g: str  # Generator as string (hex)
+    groups: List[str] = ["modp1536"]  # Key agreement groups the server accepts
 
 
 class DHExchangeRequest(BaseModel):
-    public_key: str  # Client's public key A (hex string)
+    public_key: str  # Client's public key A (hex string; 32 raw bytes for x25519)
+    group: Literal["modp1536", "x25519"] = "modp1536"
 
 
 class DHExchangeResponse(BaseModel):
-    public_key: str  # Server's public key B (hex string)
+    public_key: str  # Server's public key B (hex string; 32 raw bytes for x25519)
+    group: str = "modp1536"
 
 
 # Encrypted Message Models
 class EncryptedMessage(BaseModel):
     encrypted_content: str  # Base64 encoded
-    iv: str  # Initialization Vector (Base64)
+    iv: str = ""  # Legacy AES-CBC IV (Base64); empty for versioned AES-GCM blobs
+
+
+class MessageDecryptBatch(BaseModel):
+    message_ids: Optional[List[int]] = None  # Explicit IDs, in output order
+    all_unread: bool = False  # Or every message of the inbox never decrypted
 
 
 class LeaveRequest(BaseModel):
@@ -94,6 +102,26 @@ class LeaveRequestUpdate(BaseModel):
     hr_comment: Optional[str] = None
 
 
+class LeaveRequestStatusBatchItem(LeaveRequestUpdate):
+    id: int  # ID de la demande
+
+
+class LeaveRequestStatusBatch(BaseModel):
+    updates: List[LeaveRequestStatusBatchItem]  # Appliquées dans une seule transaction
+
+
+class LeaveRequestStatusBatchResult(BaseModel):
+    id: int
+    status: Optional[str] = None  # Nouveau statut si la mise à jour est appliquée
+    error: Optional[str] = None  # Sinon, la raison
+
+
+class LeaveRequestStatusBatchResponse(BaseModel):
+    updated: int
+    failed: int
+    results: List[LeaveRequestStatusBatchResult]  # Dans l'ordre de la requête
+
+
 class LeaveRequestResponse(BaseModel):
     id: int
     employee_id: int
@@ -109,6 +137,14 @@ class LeaveRequestResponse(BaseModel):
     updated_at: Optional[str] = None
 
 
+class LeaveStatsResponse(BaseModel):
+    employee_id: int
+    type: str
+    month: Optional[str] = None  # YYYY-MM du début de la demande, None = total tous mois
+    days: Dict[str, int]  # Jours demandés par statut (pending, approved, rejected)
+    requests: Dict[str, int]  # Nombre de demandes par statut
+
+
 # OTP Models
 class OTPInDB(BaseModel):
     email: str
@@ -143,7 +179,7 @@ class CommunicationAuthUpdate(BaseModel):
 class DocumentCreate(BaseModel):
     """Création d'un document par un employé (propriétaire)"""
     title: str
-    content: str
+    content: str = ""  # Le contenu peut aussi être envoyé ensuite: PUT /documents/{id}/content
     is_confidential: bool = False
 
 
@@ -160,7 +196,7 @@ class DocumentResponse(BaseModel):
     owner_id: int
     owner_email: str
     title: str
-    content: str
+    content: str = ""  # Le contenu peut aussi être envoyé ensuite: PUT /documents/{id}/content
     is_confidential: bool
     created_at: str
 
@@ -1,12 +1,21 @@
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Union
 from config import settings
+from dh import get_group, get_keypair_pool, MODP_1536, X25519
+from cache import TTLCache
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives import serialization, hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
 import secrets
+import json
 import os
 import base64
 import random
@@ -26,6 +35,42 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+# Password Hashing Pool
+# bcrypt costs ~200ms of CPU per call and releases the GIL, so running it on
+# a thread pool keeps the event loop free and uses every core.
+_password_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS or os.cpu_count(),
+    thread_name_prefix='password-hash'
+)
+# Backpressure: beyond this many queued or running hashes, fail fast
+# instead of letting the queue (and every caller's latency) grow unbounded.
+_password_hash_slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_MAX_PENDING)
+
+
+class PasswordHashingBusy(Exception):
+    """Too many password hashes are already pending."""
+
+
+async def _run_password_hashing(func, *args):
+    if not _password_hash_slots.acquire(blocking=False):
+        raise PasswordHashingBusy()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_password_hash_executor, func, *args)
+    finally:
+        _password_hash_slots.release()
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password() on the hashing pool."""
+    return await _run_password_hashing(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """get_password_hash() on the hashing pool."""
+    return await _run_password_hashing(get_password_hash, password)
+
+
 # JWT Token Management
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token."""
@@ -79,16 +124,25 @@ def generate_dh_parameters():
     return p, g
 
 
-def generate_dh_private_key(p: int) -> int:
-    """Generate a random private key for DH."""
-    # Private key should be in range [2, p-2]
-    bit_length = p.bit_length()
-    return secrets.randbelow(p - 3) + 2
+def generate_dh_private_key(p: int, g: int = 2) -> int:
+    """
+    Generate a random private key for DH: in range [2, p-2], or a short
+    exponent of DH_EXPONENT_BITS bits if configured.
+    """
+    return get_group(p, g).generate_private_key()
+
+
+def generate_dh_keypair(p: int, g: int) -> tuple[int, int]:
+    """
+    Single-use (private_key, public_key) pair, taken from the background
+    keypair pool (generated inline if the pool is empty or disabled).
+    """
+    return get_keypair_pool(p, g).take()
 
 
 def calculate_dh_public_key(g: int, private_key: int, p: int) -> int:
-    """Calculate public key: g^private_key mod p."""
-    return pow(g, private_key, p)
+    """Calculate public key: g^private_key mod p (precomputed fixed-base table)."""
+    return get_group(p, g).public_key(private_key)
 
 
 def calculate_dh_shared_secret(other_public_key: int, private_key: int, p: int) -> int:
@@ -106,44 +160,233 @@ def derive_aes_key_from_secret(shared_secret: int) -> bytes:
     return sha256(secret_bytes).digest()
 
 
+# Binds X25519-derived keys to this protocol (frontend/src/crypto.js uses the same)
+X25519_HKDF_INFO = b'hr-system handshake x25519 aes-256'
+
+
+def derive_aes_key_from_x25519(shared_secret: bytes) -> bytes:
+    """Derive a 256-bit AES key from an X25519 shared secret with HKDF-SHA256."""
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=X25519_HKDF_INFO,
+    ).derive(shared_secret)
+
+
+def derive_session_aes_key(session: dict) -> bytes:
+    """AES key of a DH session, according to the group it was negotiated with."""
+    if session.get('group', MODP_1536) == X25519:
+        return derive_aes_key_from_x25519(bytes.fromhex(session['shared_secret']))
+    return derive_aes_key_from_secret(int(session['shared_secret'], 16))
+
+
+def document_blob_master_key() -> bytes:
+    """Master key of the encrypted document blobs (blobs.py)."""
+    if settings.DOCUMENT_BLOB_KEY:
+        key = bytes.fromhex(settings.DOCUMENT_BLOB_KEY)
+        if len(key) != 32:
+            raise ValueError("DOCUMENT_BLOB_KEY must be 32 bytes (64 hex characters)")
+        return key
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b'hr-system document blob master key',
+    ).derive(settings.SECRET_KEY.encode('utf-8'))
+
+
 # AES Encryption/Decryption
-def aes_encrypt(plaintext: str, key: bytes) -> tuple[str, str]:
+#
+# Messages use a versioned AEAD format: a version byte, then the payload of
+# that version. Version 2 is AES-256-GCM:
+#
+#     0x02 || nonce (12 bytes) || ciphertext || tag (16 bytes)
+#
+# with the version byte as associated data. A versioned blob travels in
+# `encrypted_content` with an empty `iv`; a non-empty `iv` means a legacy
+# AES-256-CBC message (format 1), which stays readable. Versioned blobs are
+# stored as raw bytes; JSON clients see them Base64-encoded.
+
+MESSAGE_FORMAT_CBC = 0x01
+MESSAGE_FORMAT_GCM = 0x02
+GCM_NONCE_SIZE = 12
+GCM_TAG_SIZE = 16
+
+
+class DecryptionError(ValueError):
+    """Wrong key, tampered or truncated message, or unknown format version."""
+
+
+class MessageKey(bytearray):
     """
-    Encrypt plaintext using AES-256-CBC.
-    Returns (encrypted_content_base64, iv_base64).
+    AES key carrying its AES-GCM context, so that the key schedule is set up
+    once for all the messages it encrypts or decrypts, not once per message.
+    A plain bytes key works too, with a fresh context every time.
     """
-    # Generate random IV
-    iv = os.urandom(16)
-    
-    # Pad plaintext to be multiple of 16 bytes
-    plaintext_bytes = plaintext.encode('utf-8')
-    padding_length = 16 - (len(plaintext_bytes) % 16)
-    padded_plaintext = plaintext_bytes + bytes([padding_length] * padding_length)
-    
-    # Encrypt
-    cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-    encryptor = cipher.encryptor()
-    encrypted = encryptor.update(padded_plaintext) + encryptor.finalize()
-    
-    # Return base64 encoded
-    return base64.b64encode(encrypted).decode('utf-8'), base64.b64encode(iv).decode('utf-8')
 
+    def __init__(self, key: bytes):
+        super().__init__(key)
+        self.cipher: Optional[AESGCM] = AESGCM(bytes(key))
+
+    def wipe(self):
+        """Drop the context and overwrite the key with zeros."""
+        self.cipher = None
+        self[:] = bytes(len(self))
+
+
+def _aes_gcm(key: bytes) -> AESGCM:
+    context = getattr(key, 'cipher', None)
+    if context is None:
+        context = AESGCM(bytes(key))
+    return context
+
+
+def encrypt_bytes(plaintext: bytes, key: bytes) -> bytes:
+    """Encrypt raw bytes into a version 2 (AES-256-GCM) blob."""
+    header = bytes([MESSAGE_FORMAT_GCM])
+    nonce = os.urandom(GCM_NONCE_SIZE)
+    return header + nonce + _aes_gcm(key).encrypt(nonce, plaintext, header)
+
+
+def is_message_blob(blob: bytes) -> bool:
+    """Well-formed versioned blob (format and length only, nothing is decrypted)."""
+    return len(blob) >= 1 + GCM_NONCE_SIZE + GCM_TAG_SIZE and blob[0] == MESSAGE_FORMAT_GCM
 
-def aes_decrypt(encrypted_content_base64: str, iv_base64: str, key: bytes) -> str:
+
+def decrypt_bytes(blob: bytes, key: bytes) -> bytes:
     """
-    Decrypt AES-256-CBC encrypted content.
+    Decrypt a versioned blob. The tag check fails in constant time on a wrong
+    key or tampered data, before anything is decrypted.
     """
-    # Decode from base64
-    encrypted = base64.b64decode(encrypted_content_base64)
-    iv = base64.b64decode(iv_base64)
-    
-    # Decrypt
+    if len(blob) < 1 + GCM_NONCE_SIZE + GCM_TAG_SIZE:
+        raise DecryptionError("Message tronqué")
+    if blob[0] != MESSAGE_FORMAT_GCM:
+        raise DecryptionError(f"Version de format inconnue: {blob[0]}")
+    nonce = blob[1:1 + GCM_NONCE_SIZE]
+    try:
+        return _aes_gcm(key).decrypt(nonce, blob[1 + GCM_NONCE_SIZE:], blob[:1])
+    except InvalidTag:
+        raise DecryptionError("Échec de l'authentification du message (clé incorrecte ou message altéré)")
+
+
+def _cbc_decrypt(encrypted: bytes, iv: bytes, key: bytes) -> bytes:
+    """Legacy format 1: AES-256-CBC with PKCS#7 padding."""
+    if len(iv) != 16 or not encrypted or len(encrypted) % 16:
+        raise DecryptionError("Message CBC invalide")
     cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
     decryptor = cipher.decryptor()
     decrypted_padded = decryptor.update(encrypted) + decryptor.finalize()
-    
+
     # Remove padding
     padding_length = decrypted_padded[-1]
-    decrypted = decrypted_padded[:-padding_length]
-    
-    return decrypted.decode('utf-8')
+    if not 1 <= padding_length <= 16 or decrypted_padded[-padding_length:] != bytes([padding_length] * padding_length):
+        raise DecryptionError("Padding CBC invalide (clé incorrecte)")
+    return decrypted_padded[:-padding_length]
+
+
+def _cbc_padding_ok(encrypted: bytes, iv: bytes, key: bytes) -> bool:
+    """
+    Decrypt only the last CBC block and check its padding. A wrong key fails
+    this test with probability ~255/256 without decrypting the message.
+    """
+    if len(iv) != 16 or not encrypted or len(encrypted) % 16:
+        return False
+    previous = encrypted[-32:-16] if len(encrypted) > 16 else iv
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(previous), backend=default_backend()).decryptor()
+    last = decryptor.update(encrypted[-16:]) + decryptor.finalize()
+    padding_length = last[-1]
+    return 1 <= padding_length <= 16 and last[-padding_length:] == bytes([padding_length] * padding_length)
+
+
+def find_incompatible_messages(messages: list, key: bytes) -> list:
+    """
+    IDs of the (message_id, encrypted_content, iv) tuples that `key` cannot
+    turn into JSON (encrypted_content as in aes_decrypt). Module-level so that process pools can run it.
+
+    Versioned blobs fail at the GCM tag check; legacy CBC messages are first
+    screened with a one-block padding check.
+    """
+    incompatible = []
+    for message_id, encrypted_content, iv in messages:
+        try:
+            if iv and not _cbc_padding_ok(base64.b64decode(encrypted_content), base64.b64decode(iv), key):
+                raise DecryptionError("Padding CBC invalide")
+            json.loads(aes_decrypt(encrypted_content, iv, key))
+        except ValueError:  # DecryptionError, JSONDecodeError, bad Base64
+            incompatible.append(message_id)
+    return incompatible
+
+
+def aes_encrypt(plaintext: str, key: bytes) -> tuple[str, str]:
+    """
+    Encrypt plaintext with AES-256-GCM.
+    Returns (encrypted_content_base64, iv_base64); the IV is empty because
+    the nonce is part of the versioned blob.
+    """
+    blob = encrypt_bytes(plaintext.encode('utf-8'), key)
+    return base64.b64encode(blob).decode('utf-8'), ""
+
+
+def aes_decrypt(encrypted_content: Union[str, bytes], iv_base64: str, key: bytes) -> str:
+    """
+    Decrypt a message: versioned blob when `iv_base64` is empty, legacy
+    AES-256-CBC otherwise. `encrypted_content` is Base64 or, as stored for
+    versioned blobs, raw bytes. Raises DecryptionError.
+    """
+    try:
+        if isinstance(encrypted_content, str):
+            encrypted = base64.b64decode(encrypted_content)
+        else:
+            encrypted = encrypted_content
+        iv = base64.b64decode(iv_base64) if iv_base64 else b""
+    except ValueError:
+        raise DecryptionError("Base64 invalide")
+
+    if iv:
+        decrypted = _cbc_decrypt(encrypted, iv, key)
+    else:
+        decrypted = decrypt_bytes(encrypted, key)
+
+    try:
+        return decrypted.decode('utf-8')
+    except UnicodeDecodeError:
+        raise DecryptionError("Contenu déchiffré invalide (UTF-8)")
+
+
+# Session key cache
+class SessionKeyManager:
+    """
+    AES keys of established DH sessions, derived once per (user_id, epoch).
+
+    `epoch` is bumped by the database every time a session secret changes,
+    so a key can never be served for a secret it was not derived from, even
+    when another worker changed the session. Keys are held in MessageKey
+    bytearrays, with their cipher context, and wiped when they leave the
+    cache: callers that use a key after an await keep a copy.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self._cache = TTLCache(max_size, ttl_seconds, on_evict=self._zeroize)
+
+    def get_key(self, session: dict) -> MessageKey:
+        cache_key = (session['user_id'], session.get('epoch', 0))
+        entry = self._cache.get(cache_key)
+        if entry is None:
+            entry = (session['user_id'], MessageKey(derive_session_aes_key(session)))
+            self._cache.set(cache_key, entry)
+        return entry[1]
+
+    def invalidate_user(self, user_id: int):
+        """Drop (and wipe) the keys of a user whose session changed."""
+        self._cache.invalidate_where(lambda entry: entry[0] == user_id)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+    @staticmethod
+    def _zeroize(entry):
+        entry[1].wipe()
@@ -0,0 +1,1393 @@
+"""
+Storage engines used by the Database class.
+
+Every engine exposes the same small table interface (insert / get / all /
+find / update / remove / truncate) and returns TinyDB ``Document`` objects,
+so callers can keep relying on ``doc.doc_id`` whatever the backend is.
+
+Top-level document fields may hold ``bytes``. SQLite stores them raw in a
+BLOB column; the JSON-based engines (tinydb, wal) write them to disk as
+``{"$bytes": "<base64>"}`` and keep them as bytes in memory.
+"""
+from contextlib import contextmanager
+from typing import Optional, List, Iterable, Sequence, Union, Dict
+from tinydb import TinyDB, Query
+from tinydb.storages import JSONStorage
+from tinydb.table import Document
+from config import settings
+import base64
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+IndexSpec = Union[str, Sequence[str]]
+
+
+def _matches(document: dict, criteria: dict) -> bool:
+    return all(field in document and document[field] == value for field, value in criteria.items())
+
+BYTES_KEY = '$bytes'
+
+
+def _json_default(value):
+    """json.dump hook: bytes become {"$bytes": "<base64>"}."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {BYTES_KEY: base64.b64encode(value).decode('ascii')}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode_bytes_fields(document: dict) -> dict:
+    """Inverse of _json_default on the top-level fields of a loaded document."""
+    for field, value in document.items():
+        if type(value) is dict and len(value) == 1 and BYTES_KEY in value:
+            document[field] = base64.b64decode(value[BYTES_KEY])
+    return document
+
+
+def _decode_tables(data: Optional[dict]) -> Optional[dict]:
+    """_decode_bytes_fields on every document of a {table: {doc_id: document}} file."""
+    for docs in (data or {}).values():
+        for document in docs.values():
+            _decode_bytes_fields(document)
+    return data
+
+
+def _normalize_indexes(indexes: Iterable[IndexSpec]) -> List[tuple]:
+    """Turn ['email', ('document_id', 'user_id')] into a list of field tuples."""
+    return [(index,) if isinstance(index, str) else tuple(index) for index in indexes]
+
+
+class StorageTable:
+    """Engine-neutral table interface."""
+
+    name: str
+
+    def insert(self, fields: dict) -> int:
+        raise NotImplementedError
+
+    def insert_many(self, documents: Iterable[dict]) -> List[int]:
+        """insert() each document, in order. Returns their doc_ids."""
+        return [self.insert(fields) for fields in documents]
+
+    def get(self, doc_id: int) -> Optional[Document]:
+        raise NotImplementedError
+
+    def all(self) -> List[Document]:
+        raise NotImplementedError
+
+    def find(self, **criteria) -> List[Document]:
+        """Return the documents whose fields are equal to every given criterion."""
+        raise NotImplementedError
+
+    def scan(self, after_id: int = 0, limit: int = 500, **criteria) -> List[Document]:
+        """
+        Up to `limit` documents with doc_id > after_id, in doc_id order, to
+        walk a large table chunk by chunk (pass the last doc_id back in).
+        `criteria` restrict the walk like find().
+        """
+        raise NotImplementedError
+
+    def get_many(self, doc_ids: Iterable[int]) -> Dict[int, Document]:
+        """Documents by doc_id, for joins in list endpoints. Unknown IDs are left out."""
+        documents = {}
+        for doc_id in set(doc_ids):
+            document = self.get(doc_id)
+            if document is not None:
+                documents[doc_id] = document
+        return documents
+
+    def find_in(self, field: str, values: Iterable) -> List[Document]:
+        """Documents whose `field` equals one of `values` (not None), in doc_id order."""
+        documents = [document for value in set(values) for document in self.find(**{field: value})]
+        return sorted(documents, key=lambda document: document.doc_id)
+
+    def update(self, fields: dict, doc_ids: Iterable[int]):
+        raise NotImplementedError
+
+    def update_many(self, changes: Dict[int, dict]):
+        """Update each document with its own fields ({doc_id: fields}). Unknown IDs are ignored."""
+        for doc_id, fields in changes.items():
+            self.update(fields, [doc_id])
+
+    def remove(self, doc_ids: Iterable[int]):
+        raise NotImplementedError
+
+    def truncate(self):
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def find_one(self, **criteria) -> Optional[Document]:
+        """Return the first matching document, or None."""
+        result = self.find(**criteria)
+        return result[0] if result else None
+
+    def update_where(self, fields: dict, **criteria):
+        """Update every document matching the criteria."""
+        doc_ids = [doc.doc_id for doc in self.find(**criteria)]
+        if doc_ids:
+            self.update(fields, doc_ids)
+
+    def remove_where(self, **criteria):
+        """Remove every document matching the criteria."""
+        doc_ids = [doc.doc_id for doc in self.find(**criteria)]
+        if doc_ids:
+            self.remove(doc_ids)
+
+
+class StorageEngine:
+    """Base class for storage engines."""
+
+    # Engines that can serve find() from real indexes. The others get the
+    # in-memory hash indexes of indexes.IndexedTable (see Database).
+    native_indexes = False
+
+    # Bumped whenever the engine reloads data committed by another process.
+    # In-memory views of the tables (indexes.IndexedTable) rebuild when it
+    # changes.
+    generation = 0
+
+    def __init__(self):
+        # TinyDB and sqlite3 connections are not safe to share between
+        # threads, so every table operation goes through this lock.
+        self.lock = threading.RLock()
+        self._transaction_depth = 0
+        self._snapshot_depth = 0
+
+    def table(self, name: str, indexes: Iterable[IndexSpec] = ()) -> StorageTable:
+        raise NotImplementedError
+
+    # Transactions are engine-wide and reentrant: only the outermost
+    # begin()/commit() pair reaches the engine hooks, and every write made
+    # in between (from any thread holding the lock) is flushed once, or
+    # undone by the outermost rollback().
+    # begin()/commit()/rollback() must be called with self.lock held.
+
+    def begin(self):
+        if self._transaction_depth == 0:
+            self._begin()
+        self._transaction_depth += 1
+
+    def commit(self):
+        self._transaction_depth -= 1
+        if self._transaction_depth == 0:
+            self._commit()
+
+    def rollback(self):
+        self._transaction_depth -= 1
+        if self._transaction_depth == 0:
+            self._rollback()
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._transaction_depth > 0
+
+    @contextmanager
+    def transaction(self):
+        """Group several table operations into a single flush."""
+        with self.lock:
+            self.begin()
+            try:
+                yield
+            except BaseException:
+                self.rollback()
+                raise
+            else:
+                self.commit()
+
+    @contextmanager
+    def savepoint(self):
+        """
+        Transaction nested in the current one: if the block fails, only its
+        own writes are undone and the enclosing transaction goes on.
+        Outside a transaction this is transaction().
+        """
+        with self.lock:
+            if not self.in_transaction:
+                with self.transaction():
+                    yield
+                return
+            mark = self._savepoint()
+            try:
+                yield
+            except BaseException:
+                self._rollback_to(mark)
+                raise
+            else:
+                self._release(mark)
+
+    @contextmanager
+    def snapshot(self):
+        """
+        Read consistently: other processes cannot commit until the outermost
+        snapshot ends. Inside a transaction this is a no-op.
+        """
+        with self.lock:
+            outermost = self._snapshot_depth == 0 and not self.in_transaction
+            if outermost:
+                self._begin_snapshot()
+            self._snapshot_depth += 1
+            try:
+                yield
+            finally:
+                self._snapshot_depth -= 1
+                if outermost:
+                    self._end_snapshot()
+
+    def _begin(self):
+        pass
+
+    def _commit(self):
+        pass
+
+    def _begin_snapshot(self):
+        pass
+
+    def _end_snapshot(self):
+        pass
+
+    def _rollback(self):
+        raise NotImplementedError
+
+    # Savepoints are released or rolled back in the reverse order they were
+    # taken, always inside a transaction.
+
+    def _savepoint(self):
+        raise NotImplementedError
+
+    def _release(self, mark):
+        raise NotImplementedError
+
+    def _rollback_to(self, mark):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+
+class _UndoJournal:
+    """
+    Previous versions of the documents written during a transaction, for
+    engines whose data lives in memory and has no native rollback.
+
+    Entries are (table, doc_id, previous document or None if it did not
+    exist); doc_id None saves a whole table before a truncate().
+    """
+
+    def __init__(self):
+        self._entries: list = []
+
+    def mark(self) -> int:
+        return len(self._entries)
+
+    def record(self, table: str, doc_id: Optional[int], previous: Optional[dict]):
+        self._entries.append((table, doc_id, previous))
+
+    def undo(self, mark: int) -> list:
+        """Remove and return the entries recorded since `mark`, newest first."""
+        entries = self._entries[mark:]
+        del self._entries[mark:]
+        entries.reverse()
+        return entries
+
+    def clear(self):
+        self._entries = []
+
+
+# ==================== INTER-PROCESS LOCKING ====================
+
+class _FileLock:
+    """
+    Lock shared by every process using the same database (e.g. the workers
+    of `uvicorn --workers N`), held on `<DATABASE_PATH>.lock`.
+
+    The lock file also stores a generation number that writers bump on each
+    commit, so readers know when their in-memory copy of the data is stale.
+    Workers must open the database themselves (uvicorn spawns them): a lock
+    inherited through fork() would be shared with the parent.
+    """
+
+    # msvcrt only has exclusive byte-range locks, taken past the generation
+    _MSVCRT_OFFSET = 64
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def acquire(self, shared: bool = False, blocking: bool = True) -> bool:
+        if fcntl is not None:
+            flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            if not blocking:
+                flags |= fcntl.LOCK_NB
+            try:
+                fcntl.flock(self._fd, flags)
+            except BlockingIOError:
+                return False
+            return True
+
+        os.lseek(self._fd, self._MSVCRT_OFFSET, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.001)
+
+    def release(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self._fd, self._MSVCRT_OFFSET, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+    def read_generation(self) -> int:
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        data = os.read(self._fd, 20)
+        return int(data) if data.strip() else 0
+
+    def write_generation(self, generation: int):
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, b'%020d' % generation)
+
+    def close(self):
+        os.close(self._fd)
+
+
+# ==================== TINYDB (JSON FILE) ====================
+
+class TinyDBTable(StorageTable):
+    def __init__(self, engine: "TinyDBEngine", table):
+        self.name = table.name
+        self._engine = engine
+        self._table = table
+
+    def insert(self, fields: dict) -> int:
+        with self._engine.transaction():
+            doc_id = self._table.insert(fields)
+            self._engine.remember(self.name, doc_id, None)
+            return doc_id
+
+    def insert_many(self, documents: Iterable[dict]) -> List[int]:
+        # One rewrite of the table instead of one per document
+        with self._engine.transaction():
+            doc_ids = self._table.insert_multiple(list(documents))
+            for doc_id in doc_ids:
+                self._engine.remember(self.name, doc_id, None)
+            return doc_ids
+
+    def get(self, doc_id: int) -> Optional[Document]:
+        with self._engine.snapshot():
+            return self._table.get(doc_id=doc_id)
+
+    def all(self) -> List[Document]:
+        with self._engine.snapshot():
+            return self._table.all()
+
+    def find(self, **criteria) -> List[Document]:
+        with self._engine.snapshot():
+            return self._table.search(Query().fragment(criteria))
+
+    def scan(self, after_id: int = 0, limit: int = 500, **criteria) -> List[Document]:
+        with self._engine.snapshot():
+            return heapq.nsmallest(
+                limit, (doc for doc in self._table if doc.doc_id > after_id and _matches(doc, criteria)),
+                key=lambda doc: doc.doc_id
+            )
+
+    def get_many(self, doc_ids: Iterable[int]) -> Dict[int, Document]:
+        # One get() per ID on the cached table: Table.get(doc_ids=) walks the whole table
+        with self._engine.snapshot():
+            return super().get_many(doc_ids)
+
+    def find_in(self, field: str, values: Iterable) -> List[Document]:
+        values = set(values)
+        with self._engine.snapshot():
+            return sorted(
+                (doc for doc in self._table if field in doc and doc[field] in values),
+                key=lambda doc: doc.doc_id
+            )
+
+    def update(self, fields: dict, doc_ids: Iterable[int]):
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return
+        with self._engine.transaction():
+            self._remember(doc_ids)
+            self._table.update(fields, doc_ids=doc_ids)
+
+    def update_many(self, changes: Dict[int, dict]):
+        if not changes:
+            return
+
+        def updater(table: dict):
+            for doc_id, fields in changes.items():
+                if doc_id in table:
+                    table[doc_id].update(fields)
+
+        # One rewrite of the table instead of one per document
+        with self._engine.transaction():
+            self._remember(changes)
+            self._table._update_table(updater)
+
+    def remove(self, doc_ids: Iterable[int]):
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return
+        with self._engine.transaction():
+            self._remember(doc_ids)
+            self._table.remove(doc_ids=doc_ids)
+
+    def truncate(self):
+        with self._engine.transaction():
+            if self._engine.in_savepoint:
+                self._engine.remember(self.name, None, {doc.doc_id: dict(doc) for doc in self._table.all()})
+            self._table.truncate()
+
+    def __len__(self) -> int:
+        with self._engine.snapshot():
+            return len(self._table)
+
+    def _remember(self, doc_ids: Iterable[int]):
+        """Save the documents about to change, for TinyDBEngine._rollback_to()."""
+        if not self._engine.in_savepoint:
+            return
+        for doc_id in doc_ids:
+            document = self._table.get(doc_id=doc_id)
+            if document is not None:
+                self._engine.remember(self.name, doc_id, dict(document))
+
+
+class CachedJSONStorage(JSONStorage):
+    """
+    JSONStorage keeping the last read/written state in memory.
+
+    TinyDB re-reads and re-parses the whole file on every get()/search();
+    with this storage only writes touch the disk.
+    """
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(path, default=_json_default, **kwargs)
+        self._cache = None
+        # While deferred, write() only updates memory until flush()
+        self.deferred = False
+        self.dirty = False
+
+    def read(self):
+        if self._cache is None:
+            self._handle.seek(0, os.SEEK_END)
+            if not self._handle.tell():
+                return None  # Empty file: TinyDB initializes the database
+            self._handle.seek(0)
+            self._cache = _decode_tables(json.load(self._handle))
+        return self._cache
+
+    def write(self, data):
+        self._cache = data
+        if self.deferred:
+            self.dirty = True
+        else:
+            self._write_through()
+
+    def flush(self):
+        if self.dirty:
+            self._write_through()
+
+    def invalidate(self):
+        """Drop the cached state: the next read() loads the file again."""
+        self._cache = None
+
+    def _write_through(self):
+        self.dirty = False
+        try:
+            super().write(self._cache)
+        except BaseException:
+            # TinyDB mutates the cached dict before writing it: force a
+            # reload from disk so memory never drifts from the file.
+            self._cache = None
+            raise
+
+
+class TinyDBEngine(StorageEngine):
+    """
+    Default engine: the whole database lives in a single JSON file.
+
+    Several processes may share the file. Transactions hold the exclusive
+    file lock and reads a shared one; whenever another process committed
+    since our last look, the cached data is reloaded from disk.
+
+    A rolled back transaction reloads the last commit from disk. Inside a
+    savepoint the documents about to change are copied to an undo journal,
+    so rolling back to it costs the number of documents written since.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.db = TinyDB(path, storage=CachedJSONStorage)
+        self._journal = _UndoJournal()
+        self._savepoints = 0
+        self._file_lock = _FileLock(path + '.lock')
+        self._file_lock.acquire(shared=True)
+        try:
+            self._disk_generation = self._file_lock.read_generation()
+        finally:
+            self._file_lock.release()
+
+    def table(self, name: str, indexes: Iterable[IndexSpec] = ()) -> StorageTable:
+        # TinyDB has no secondary indexes, find() is a full scan.
+        return TinyDBTable(self, self.db.table(name))
+
+    def _refresh(self):
+        """Reload the data if another process committed. Needs the file lock."""
+        disk_generation = self._file_lock.read_generation()
+        if disk_generation == self._disk_generation:
+            return
+        self._disk_generation = disk_generation
+        self.db.storage.invalidate()
+        self._reset_tables()
+
+    def _reset_tables(self):
+        """Forget what the TinyDB tables derived from the data, which changed under them."""
+        # TinyDB tables cache query results and their next document ID
+        for table in self.db._tables.values():
+            table.clear_cache()
+            table._next_id = None
+        self.generation += 1
+
+    def _begin(self):
+        self._file_lock.acquire()
+        try:
+            self._refresh()
+        except BaseException:
+            self._release_file_lock()
+            raise
+        self.db.storage.deferred = True
+
+    def _commit(self):
+        storage = self.db.storage
+        storage.deferred = False
+        written = storage.dirty
+        try:
+            storage.flush()
+        finally:
+            if written:
+                self._disk_generation += 1
+                self._file_lock.write_generation(self._disk_generation)
+            self._release_file_lock()
+
+    def _rollback(self):
+        # The file still holds the last commit: drop the writes kept in memory
+        storage = self.db.storage
+        storage.deferred = False
+        storage.dirty = False
+        storage.invalidate()
+        self._reset_tables()
+        self._release_file_lock()
+
+    @property
+    def in_savepoint(self) -> bool:
+        return self._savepoints > 0
+
+    def remember(self, name: str, doc_id: Optional[int], previous: Optional[dict]):
+        """Keep the previous version of a document written in a savepoint (see _rollback_to)."""
+        if self._savepoints:
+            self._journal.record(name, doc_id, previous)
+
+    def _savepoint(self):
+        self._savepoints += 1
+        return self._journal.mark()
+
+    def _release(self, mark):
+        self._savepoints -= 1
+        if not self._savepoints:
+            # Only enclosing savepoints need the entries, the transaction reloads the file
+            self._journal.clear()
+
+    def _rollback_to(self, mark):
+        entries = self._journal.undo(mark)
+        self._savepoints -= 1
+        changes: Dict[str, list] = {}
+        for name, doc_id, previous in entries:
+            changes.setdefault(name, []).append((doc_id, previous))
+        for name, undo in changes.items():
+            def updater(table: dict, undo=undo):
+                for doc_id, previous in undo:
+                    if doc_id is None:
+                        table.clear()
+                        table.update(previous)
+                    elif previous is None:
+                        table.pop(doc_id, None)
+                    else:
+                        table[doc_id] = previous
+
+            self.db.table(name)._update_table(updater)
+        if entries:
+            self._reset_tables()
+
+    def _release_file_lock(self):
+        if self._snapshot_depth:
+            # Transaction nested in a snapshot: go back to the shared lock
+            self._file_lock.acquire(shared=True)
+        else:
+            self._file_lock.release()
+
+    def _begin_snapshot(self):
+        self._file_lock.acquire(shared=True)
+        try:
+            self._refresh()
+        except BaseException:
+            self._file_lock.release()
+            raise
+
+    def _end_snapshot(self):
+        self._file_lock.release()
+
+    def close(self):
+        self.db.close()
+        self._file_lock.close()
+
+
+# ==================== SQLITE (WAL) ====================
+
+def _json_field(field: str) -> str:
+    return f"json_extract(data, '$.{field}')"
+
+
+class SQLiteTable(StorageTable):
+    """
+    One SQL table per TinyDB table: the document is stored as JSON in `data`
+    and every declared index becomes an expression index on json_extract().
+    Bytes fields are concatenated in the `bin` BLOB column, `data` only keeps
+    their {"$bytes": [start, end]} slice.
+    """
+
+    def __init__(self, engine: "SQLiteEngine", name: str, indexes: List[tuple]):
+        self.name = name
+        self._engine = engine
+        self._sql_name = '"' + name.replace('"', '""') + '"'
+
+        with engine.transaction():
+            conn = engine.conn
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self._sql_name} ("
+                "doc_id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL, bin BLOB)"
+            )
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({self._sql_name})")]
+            if 'bin' not in columns:
+                # Database created before bytes fields were supported
+                conn.execute(f"ALTER TABLE {self._sql_name} ADD COLUMN bin BLOB")
+            for fields in indexes:
+                index_name = '"ix_' + name + '_' + '_'.join(fields) + '"'
+                columns = ', '.join(_json_field(field) for field in fields)
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {index_name} ON {self._sql_name} ({columns})"
+                )
+
+    @staticmethod
+    def _document(row) -> Document:
+        document = json.loads(row[1])
+        binary = row[2]
+        if binary is not None:
+            for field, value in document.items():
+                if isinstance(value, dict) and len(value) == 1 and BYTES_KEY in value:
+                    start, end = value[BYTES_KEY]
+                    document[field] = binary[start:end]
+        return Document(document, row[0])
+
+    @staticmethod
+    def _columns(fields: dict) -> tuple:
+        """(data, bin) column values of a document."""
+        parts = []
+        size = 0
+        document = {}
+        for field, value in fields.items():
+            if isinstance(value, (bytes, bytearray, memoryview)):
+                parts.append(value)
+                document[field] = {BYTES_KEY: [size, size + len(value)]}
+                size += len(value)
+            else:
+                document[field] = value
+        return json.dumps(document), (b''.join(parts) if parts else None)
+
+    def insert(self, fields: dict) -> int:
+        with self._engine.transaction():
+            conn = self._engine.conn
+            cursor = conn.execute(
+                f"INSERT INTO {self._sql_name} (data, bin) VALUES (?, ?)", self._columns(fields)
+            )
+            return cursor.lastrowid
+
+    def get(self, doc_id: int) -> Optional[Document]:
+        with self._engine.lock:
+            row = self._engine.conn.execute(
+                f"SELECT doc_id, data, bin FROM {self._sql_name} WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+        return self._document(row) if row else None
+
+    def all(self) -> List[Document]:
+        with self._engine.lock:
+            rows = self._engine.conn.execute(
+                f"SELECT doc_id, data, bin FROM {self._sql_name} ORDER BY doc_id"
+            ).fetchall()
+        return [self._document(row) for row in rows]
+
+    @staticmethod
+    def _where(criteria: dict) -> tuple:
+        clauses = []
+        params = []
+        for field, value in criteria.items():
+            if value is None:
+                clauses.append(f"{_json_field(field)} IS NULL")
+            else:
+                clauses.append(f"{_json_field(field)} = ?")
+                params.append(value)
+        return ' AND '.join(clauses) or '1', params
+
+    def find(self, **criteria) -> List[Document]:
+        where, params = self._where(criteria)
+        with self._engine.lock:
+            rows = self._engine.conn.execute(
+                f"SELECT doc_id, data, bin FROM {self._sql_name} WHERE {where} ORDER BY doc_id", params
+            ).fetchall()
+        return [self._document(row) for row in rows]
+
+    def scan(self, after_id: int = 0, limit: int = 500, **criteria) -> List[Document]:
+        where, params = self._where(criteria)
+        with self._engine.lock:
+            rows = self._engine.conn.execute(
+                f"SELECT doc_id, data, bin FROM {self._sql_name} WHERE doc_id > ? AND {where} "
+                "ORDER BY doc_id LIMIT ?",
+                (after_id, *params, limit)
+            ).fetchall()
+        return [self._document(row) for row in rows]
+
+    # Bound parameters per IN (...) query (SQLITE_MAX_VARIABLE_NUMBER is 999 on old builds)
+    IN_CHUNK_SIZE = 500
+
+    def _select_in(self, column: str, values: Iterable) -> list:
+        values = list(set(values))
+        rows = []
+        with self._engine.lock:
+            for start in range(0, len(values), self.IN_CHUNK_SIZE):
+                chunk = values[start:start + self.IN_CHUNK_SIZE]
+                rows.extend(self._engine.conn.execute(
+                    f"SELECT doc_id, data, bin FROM {self._sql_name} "
+                    f"WHERE {column} IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall())
+        return rows
+
+    def get_many(self, doc_ids: Iterable[int]) -> Dict[int, Document]:
+        return {row[0]: self._document(row) for row in self._select_in('doc_id', doc_ids)}
+
+    def find_in(self, field: str, values: Iterable) -> List[Document]:
+        rows = self._select_in(_json_field(field), (value for value in values if value is not None))
+        return [self._document(row) for row in sorted(rows)]
+
+    def update(self, fields: dict, doc_ids: Iterable[int]):
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return
+        with self._engine.transaction():
+            updated = []
+            for row in self._select_in('doc_id', doc_ids):
+                document = self._document(row)
+                document.update(fields)
+                updated.append((*self._columns(document), row[0]))
+            self._engine.conn.executemany(
+                f"UPDATE {self._sql_name} SET data = ?, bin = ? WHERE doc_id = ?", updated
+            )
+
+    def update_many(self, changes: Dict[int, dict]):
+        if not changes:
+            return
+        with self._engine.transaction():
+            updated = []
+            for row in self._select_in('doc_id', changes):
+                document = self._document(row)
+                document.update(changes[row[0]])
+                updated.append((*self._columns(document), row[0]))
+            self._engine.conn.executemany(
+                f"UPDATE {self._sql_name} SET data = ?, bin = ? WHERE doc_id = ?", updated
+            )
+
+    def remove(self, doc_ids: Iterable[int]):
+        doc_ids = [(doc_id,) for doc_id in doc_ids]
+        if not doc_ids:
+            return
+        with self._engine.transaction():
+            conn = self._engine.conn
+            conn.executemany(f"DELETE FROM {self._sql_name} WHERE doc_id = ?", doc_ids)
+
+    def truncate(self):
+        with self._engine.transaction():
+            conn = self._engine.conn
+            conn.execute(f"DELETE FROM {self._sql_name}")
+
+    def __len__(self) -> int:
+        with self._engine.lock:
+            return self._engine.conn.execute(f"SELECT COUNT(*) FROM {self._sql_name}").fetchone()[0]
+
+
+class SQLiteEngine(StorageEngine):
+    """
+    SQLite in WAL mode: O(log n) indexed lookups and O(row) writes.
+
+    Safe to share between processes: BEGIN IMMEDIATE takes SQLite's write
+    lock up front, so read-modify-write transactions of different workers
+    are serialized, and readers always see the last committed state.
+    """
+
+    native_indexes = True
+
+    # How long a transaction waits for another process holding the write lock
+    BUSY_TIMEOUT_SECONDS = 30
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.conn = sqlite3.connect(
+            path, timeout=self.BUSY_TIMEOUT_SECONDS, check_same_thread=False, isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._savepoints = 0
+
+    def table(self, name: str, indexes: Iterable[IndexSpec] = ()) -> StorageTable:
+        return SQLiteTable(self, name, _normalize_indexes(indexes))
+
+    def _begin(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def _commit(self):
+        self.conn.execute("COMMIT")
+
+    def _rollback(self):
+        self.conn.execute("ROLLBACK")
+
+    def _savepoint(self):
+        self._savepoints += 1
+        name = f"sp{self._savepoints}"
+        self.conn.execute(f"SAVEPOINT {name}")
+        return name
+
+    def _release(self, name):
+        self.conn.execute(f"RELEASE {name}")
+        self._savepoints -= 1
+
+    def _rollback_to(self, name):
+        self.conn.execute(f"ROLLBACK TO {name}")
+        self.conn.execute(f"RELEASE {name}")
+        self._savepoints -= 1
+
+    def close(self):
+        self.conn.close()
+
+
+# ==================== APPEND-ONLY LOG (WAL) ====================
+#
+# Layout for DATABASE_PATH=db.json:
+#   db.json                 snapshot, same format as a TinyDB file
+#   db.json.log             mutations appended since the snapshot
+#   db.json.log.compacting  previous log while a snapshot is being written
+#
+# Each log line is "<crc32 hex> <json list of operations>\n" and holds every
+# mutation made under one acquisition of the engine lock, so a batch is
+# replayed entirely or not at all. Operations store whole documents
+# ("put"), which makes replaying a record twice harmless.
+
+WAL_FSYNC_POLICIES = ('always', 'group', 'os')
+
+
+def _encode_log_record(operations: list) -> bytes:
+    payload = json.dumps(operations, separators=(',', ':'), default=_json_default).encode('utf-8')
+    return b'%08x ' % zlib.crc32(payload) + payload + b'\n'
+
+
+def _decode_log_record(line: bytes) -> Optional[list]:
+    """Return the operations of a log line, or None if it is torn or corrupt."""
+    if not line.endswith(b'\n') or len(line) < 10 or line[8:9] != b' ':
+        return None
+    payload = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(payload):
+            return None
+        operations = json.loads(payload)
+    except ValueError:
+        return None
+    for operation in operations:
+        if operation['op'] == 'put':
+            _decode_bytes_fields(operation['doc'])
+    return operations
+
+
+class _CommitLock:
+    """
+    Reentrant engine lock which writes the operations logged while it was
+    held when the outermost holder releases it, then waits for them to be
+    durable *after* releasing it so that other threads can join the next
+    group commit in the meantime.
+    """
+
+    def __init__(self, engine: "WALEngine"):
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._engine = engine
+
+    def __enter__(self):
+        self._lock.acquire()
+        self._local.depth = getattr(self._local, 'depth', 0) + 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._local.depth -= 1
+        lsn = None
+        try:
+            if self._local.depth == 0:
+                lsn = self._engine._write_pending()
+        finally:
+            self._lock.release()
+        if lsn is not None:
+            self._engine._wait_durable(lsn)
+
+
+class WALTable(StorageTable):
+    def __init__(self, engine: "WALEngine", name: str):
+        self.name = name
+        self._engine = engine
+        self._docs = engine.tables.setdefault(name, {})
+
+    def insert(self, fields: dict) -> int:
+        with self._engine.lock:
+            doc_id = self._engine.next_id(self.name)
+            document = dict(fields)
+            self._engine.remember(self.name, doc_id, None)
+            self._docs[doc_id] = document
+            self._engine.log({'op': 'put', 't': self.name, 'id': doc_id, 'doc': document})
+        return doc_id
+
+    def get(self, doc_id: int) -> Optional[Document]:
+        with self._engine.lock:
+            document = self._docs.get(doc_id)
+        return Document(document, doc_id) if document is not None else None
+
+    def all(self) -> List[Document]:
+        with self._engine.lock:
+            return [Document(document, doc_id) for doc_id, document in self._docs.items()]
+
+    def find(self, **criteria) -> List[Document]:
+        with self._engine.lock:
+            return [
+                Document(document, doc_id) for doc_id, document in self._docs.items()
+                if _matches(document, criteria)
+            ]
+
+    def scan(self, after_id: int = 0, limit: int = 500, **criteria) -> List[Document]:
+        with self._engine.lock:
+            doc_ids = heapq.nsmallest(limit, (
+                doc_id for doc_id, document in self._docs.items()
+                if doc_id > after_id and _matches(document, criteria)
+            ))
+            return [Document(self._docs[doc_id], doc_id) for doc_id in doc_ids]
+
+    def get_many(self, doc_ids: Iterable[int]) -> Dict[int, Document]:
+        with self._engine.lock:
+            return {
+                doc_id: Document(self._docs[doc_id], doc_id) for doc_id in set(doc_ids) if doc_id in self._docs
+            }
+
+    def find_in(self, field: str, values: Iterable) -> List[Document]:
+        values = set(values)
+        with self._engine.lock:
+            doc_ids = sorted(
+                doc_id for doc_id, document in self._docs.items()
+                if field in document and document[field] in values
+            )
+            return [Document(self._docs[doc_id], doc_id) for doc_id in doc_ids]
+
+    def update(self, fields: dict, doc_ids: Iterable[int]):
+        with self._engine.lock:
+            for doc_id in doc_ids:
+                if doc_id not in self._docs:
+                    continue
+                # Never mutate a stored document in place: compaction may be
+                # serializing a shallow copy of the table in the background.
+                document = {**self._docs[doc_id], **fields}
+                self._engine.remember(self.name, doc_id, self._docs[doc_id])
+                self._docs[doc_id] = document
+                self._engine.log({'op': 'put', 't': self.name, 'id': doc_id, 'doc': document})
+
+    def remove(self, doc_ids: Iterable[int]):
+        with self._engine.lock:
+            removed = []
+            for doc_id in doc_ids:
+                document = self._docs.pop(doc_id, None)
+                if document is not None:
+                    self._engine.remember(self.name, doc_id, document)
+                    removed.append(doc_id)
+            if removed:
+                self._engine.log({'op': 'del', 't': self.name, 'ids': removed})
+
+    def truncate(self):
+        with self._engine.lock:
+            self._engine.remember(self.name, None, dict(self._docs))
+            self._docs.clear()
+            self._engine.log({'op': 'clear', 't': self.name})
+
+    def __len__(self) -> int:
+        with self._engine.lock:
+            return len(self._docs)
+
+
+class WALEngine(StorageEngine):
+    """
+    In-memory tables persisted as a snapshot plus an append-only log.
+
+    A write costs O(record) instead of O(database). The log is folded into a
+    new snapshot by a background thread once it grows past
+    WAL_COMPACT_THRESHOLD_BYTES. fsync policies:
+      - always: fsync after every batch
+      - group:  a flusher thread fsyncs every WAL_GROUP_COMMIT_MS and
+                writers wait for the fsync covering their batch
+      - os:     no fsync, the OS decides when data reaches the disk
+
+    A rolled back transaction is undone in memory from an undo journal.
+    Its records are dropped if they were not written yet, otherwise the
+    restored documents are logged after them.
+
+    The tables live in the memory of a single process: opening the same
+    database from a second process (e.g. `uvicorn --workers 2`) fails.
+    """
+
+    def __init__(self, path: str, fsync_policy: str = None,
+                 group_commit_ms: int = None, compact_threshold: int = None):
+        super().__init__()
+        if fsync_policy is None:
+            fsync_policy = settings.WAL_FSYNC_POLICY
+        if group_commit_ms is None:
+            group_commit_ms = settings.WAL_GROUP_COMMIT_MS
+        if compact_threshold is None:
+            compact_threshold = settings.WAL_COMPACT_THRESHOLD_BYTES
+        if fsync_policy not in WAL_FSYNC_POLICIES:
+            raise ValueError(
+                f"Unknown WAL_FSYNC_POLICY '{fsync_policy}' (expected one of: {', '.join(WAL_FSYNC_POLICIES)})"
+            )
+
+        self.snapshot_path = path
+        self.log_path = path + '.log'
+        self.compacting_path = self.log_path + '.compacting'
+        self._process_lock = _FileLock(path + '.lock')
+        if not self._process_lock.acquire(blocking=False):
+            self._process_lock.close()
+            raise RuntimeError(
+                f"{path} is already open in another process. The wal backend is "
+                "single-process: use DATABASE_BACKEND=sqlite or tinydb with several workers."
+            )
+
+        self.fsync_policy = fsync_policy
+        self.group_commit_interval = group_commit_ms / 1000
+        self.compact_threshold = compact_threshold
+
+        self.lock = _CommitLock(self)
+        self.tables: Dict[str, Dict[int, dict]] = {}
+        self._next_ids: Dict[str, int] = {}
+        self._pending: list = []
+        # Operations ever appended to the log, to tell whether a rolled back
+        # write is still pending or must be overwritten in the log
+        self._appended = 0
+        self._journal = _UndoJournal()
+        self._transaction_mark = None
+
+        # Log sequence numbers: total bytes ever appended / known durable
+        self._written_lsn = 0
+        self._synced_lsn = 0
+        self._sync_cond = threading.Condition()
+        self._closed = False
+        self._compaction: Optional[threading.Thread] = None
+
+        self._recover()
+        self._log = open(self.log_path, 'ab')
+
+        if os.path.exists(self.compacting_path):
+            # Crashed during a compaction: fold everything into a fresh
+            # snapshot now, before the next rotation reuses that file name.
+            self._compact()
+
+        self._flusher = None
+        if fsync_policy == 'group':
+            self._flusher = threading.Thread(target=self._flush_loop, name='wal-group-commit', daemon=True)
+            self._flusher.start()
+
+    # ---------- recovery ----------
+
+    def _recover(self):
+        if os.path.exists(self.snapshot_path) and os.path.getsize(self.snapshot_path) > 0:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = _decode_tables(json.load(f))
+            for name, docs in snapshot.items():
+                self.tables[name] = {int(doc_id): document for doc_id, document in docs.items()}
+
+        for name, docs in self.tables.items():
+            self._next_ids[name] = max(docs, default=0) + 1
+
+        self._replay(self.compacting_path)
+        self._replay(self.log_path, truncate_torn_tail=True)
+
+    def _replay(self, path: str, truncate_torn_tail: bool = False):
+        if not os.path.exists(path):
+            return
+        valid_size = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                operations = _decode_log_record(line)
+                if operations is None:
+                    break
+                for operation in operations:
+                    self._apply(operation)
+                valid_size += len(line)
+        if truncate_torn_tail and valid_size < os.path.getsize(path):
+            # A crash interrupted the last append: drop the partial record
+            with open(path, 'r+b') as f:
+                f.truncate(valid_size)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _apply(self, operation: dict):
+        name = operation['t']
+        docs = self.tables.setdefault(name, {})
+        if operation['op'] == 'put':
+            docs[operation['id']] = operation['doc']
+            self._next_ids[name] = max(self._next_ids.get(name, 1), operation['id'] + 1)
+        elif operation['op'] == 'del':
+            for doc_id in operation['ids']:
+                docs.pop(doc_id, None)
+        elif operation['op'] == 'clear':
+            docs.clear()
+
+    # ---------- write path ----------
+
+    def table(self, name: str, indexes: Iterable[IndexSpec] = ()) -> StorageTable:
+        with self.lock:
+            return WALTable(self, name)
+
+    def next_id(self, name: str) -> int:
+        doc_id = self._next_ids.get(name, 1)
+        self._next_ids[name] = doc_id + 1
+        return doc_id
+
+    def log(self, operation: dict):
+        """Queue an operation; it is written when the engine lock is released."""
+        self._pending.append(operation)
+
+    def remember(self, name: str, doc_id: Optional[int], previous: Optional[dict]):
+        """Keep the previous version of a document written in a transaction (see _undo)."""
+        if self.in_transaction:
+            self._journal.record(name, doc_id, previous)
+
+    def _write_pending(self) -> Optional[int]:
+        """
+        Append the queued operations as one record and apply the fsync
+        policy. Called with the lock held; returns the LSN the caller must
+        wait for (group policy) once it has released the lock.
+        """
+        self._append_pending()
+        if self.in_transaction or self._synced_lsn >= self._written_lsn:
+            # Inside a transaction, _commit() makes everything durable at once
+            return None
+        if self.fsync_policy == 'always':
+            self._fsync()
+        elif self.fsync_policy == 'group':
+            with self._sync_cond:
+                self._sync_cond.notify_all()
+            return self._written_lsn
+        return None
+
+    def _append_pending(self):
+        if not self._pending:
+            return
+        record = _encode_log_record(self._pending)
+        self._appended += len(self._pending)
+        self._pending = []
+        self._log.write(record)
+        self._log.flush()
+        self._written_lsn += len(record)
+
+        if self._log.tell() >= self.compact_threshold and self._compaction is None:
+            self._compaction = threading.Thread(target=self._compact, name='wal-compaction', daemon=True)
+            self._compaction.start()
+
+    def _fsync(self):
+        os.fsync(self._log.fileno())
+        with self._sync_cond:
+            self._synced_lsn = self._written_lsn
+            self._sync_cond.notify_all()
+
+    def _begin(self):
+        self._transaction_mark = self._mark()
+
+    def _commit(self):
+        self._journal.clear()
+        self._append_pending()
+        if self.fsync_policy != 'os':
+            self._fsync()
+
+    def _rollback(self):
+        # The restored documents are written when the lock is released,
+        # with the fsync policy of a write made outside a transaction
+        self._undo(self._transaction_mark)
+        self._journal.clear()
+
+    def _savepoint(self):
+        return self._mark()
+
+    def _release(self, mark):
+        # The entries stay in the journal for the enclosing rollback
+        pass
+
+    def _rollback_to(self, mark):
+        self._undo(mark)
+
+    def _mark(self) -> tuple:
+        return self._journal.mark(), self._appended + len(self._pending)
+
+    def _undo(self, mark: tuple):
+        """Bring the tables and the log back to their state at `mark`."""
+        journal_mark, operation_mark = mark
+        entries = self._journal.undo(journal_mark)
+        for name, doc_id, previous in entries:
+            docs = self.tables[name]
+            if doc_id is None:
+                docs.clear()
+                docs.update(previous)
+            elif previous is None:
+                docs.pop(doc_id, None)
+            else:
+                docs[doc_id] = previous
+
+        if operation_mark >= self._appended:
+            # Nothing was written yet: forget the operations. Inserted IDs
+            # are not reused, as after a replay of the log.
+            del self._pending[operation_mark - self._appended:]
+        else:
+            # Already in the log: write the restored documents over them
+            cleared = {name for name, doc_id, _ in entries if doc_id is None}
+            for name in cleared:
+                self.log({'op': 'clear', 't': name})
+                for doc_id, document in self.tables[name].items():
+                    self.log({'op': 'put', 't': name, 'id': doc_id, 'doc': document})
+            for name, doc_id in dict.fromkeys((name, doc_id) for name, doc_id, _ in entries if name not in cleared):
+                document = self.tables[name].get(doc_id)
+                if document is None:
+                    self.log({'op': 'del', 't': name, 'ids': [doc_id]})
+                else:
+                    self.log({'op': 'put', 't': name, 'id': doc_id, 'doc': document})
+        if entries:
+            # In-memory indexes (indexes.IndexedTable) must be rebuilt
+            self.generation += 1
+
+    def _wait_durable(self, lsn: int):
+        with self._sync_cond:
+            while self._synced_lsn < lsn and not self._closed:
+                self._sync_cond.wait()
+
+    def _flush_loop(self):
+        while True:
+            with self._sync_cond:
+                while self._synced_lsn >= self._written_lsn and not self._closed:
+                    self._sync_cond.wait()
+                if self._closed:
+                    return
+            # Let concurrent writers join this commit
+            time.sleep(self.group_commit_interval)
+            self._sync()
+
+    def _sync(self):
+        with self.lock:
+            self._fsync()
+
+    # ---------- compaction ----------
+
+    def _compact(self):
+        """Fold the current log into a new snapshot."""
+        with self.lock:
+            # Documents are replaced, never mutated in place, so shallow
+            # copies are a consistent point-in-time view of the tables.
+            snapshot = {name: dict(docs) for name, docs in self.tables.items()}
+            self._append_pending()
+            self._fsync()
+            self._log.close()
+            if os.path.exists(self.compacting_path):
+                # Left over by a crash: its records are in memory already
+                # and end up in the snapshot written below.
+                os.remove(self.log_path)
+            else:
+                os.replace(self.log_path, self.compacting_path)
+            self._log = open(self.log_path, 'ab')
+
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                name: {str(doc_id): document for doc_id, document in docs.items()}
+                for name, docs in snapshot.items()
+            }, f, default=_json_default)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        _fsync_directory(self.snapshot_path)
+        os.remove(self.compacting_path)
+
+        with self.lock:
+            self._compaction = None
+
+    def close(self):
+        with self.lock:
+            self._append_pending()
+            self._fsync()
+        with self._sync_cond:
+            self._closed = True
+            self._sync_cond.notify_all()
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join()
+        self._log.close()
+        self._process_lock.close()
+
+
+def _fsync_directory(path: str):
+    """Persist a rename by fsyncing the parent directory (no-op on Windows)."""
+    if os.name != 'posix':
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+ENGINES = {
+    'tinydb': TinyDBEngine,
+    'sqlite': SQLiteEngine,
+    'wal': WALEngine,
+}
+
+
+def create_engine(backend: str, path: str) -> StorageEngine:
+    """Instantiate the storage engine selected by DATABASE_BACKEND."""
+    try:
+        engine_class = ENGINES[backend]
+    except KeyError:
+        raise ValueError(
+            f"Unknown DATABASE_BACKEND '{backend}' (expected one of: {', '.join(ENGINES)})"
+        )
+    return engine_class(path)
@@ -0,0 +1,131 @@
+"""
+Shared fixtures.
+
+config.settings is read from the environment when the backend modules are
+first imported, and database.py opens the global `db` at that point, so the
+environment is set up here before anything else is imported: a throwaway
+data directory, dummy mail settings (sending the OTP fails quietly) and no
+background keypair processes.
+
+Run from backend/:  python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+DATA_DIR = tempfile.mkdtemp(prefix='hr-tests-')
+os.environ.update(
+    MAIL_USERNAME='test@example.com',
+    MAIL_PASSWORD='test',
+    MAIL_FROM='test@example.com',
+    MAIL_SERVER='127.0.0.1',
+    MAIL_PORT='1',
+    SECRET_KEY='test-secret-key',
+    DATABASE_PATH=os.path.join(DATA_DIR, 'db.json'),
+    DOCUMENT_BLOB_DIR=os.path.join(DATA_DIR, 'document_blobs'),
+    DH_KEYPAIR_POOL_SIZE='0',
+)
+os.environ.setdefault('DATABASE_BACKEND', 'tinydb')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+BACKENDS = ('tinydb', 'sqlite', 'wal')
+
+ADMIN = ('zeydody@gmail.com', 'admin123')
+HR = ('zakarialaidi6@gmail.com', 'hr123')
+EMPLOYEE = ('abdoumerabet374@gmail.com', 'emp123')
+DELEGATE = ('delegate@example.com', 'delegate123')
+
+
+def open_database(directory, backend: str):
+    """A Database on its own files in `directory`."""
+    from database import Database
+    name = 'db.sqlite3' if backend == 'sqlite' else 'db.json'
+    return Database(os.path.join(str(directory), name), backend)
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request) -> str:
+    return request.param
+
+
+@pytest.fixture
+def database(tmp_path, backend):
+    """An empty Database on each storage engine."""
+    database = open_database(tmp_path, backend)
+    yield database
+    database.close()
+
+
+@pytest.fixture(scope='session')
+def client():
+    """
+    TestClient on the app and its global database. The lifespan closes the
+    database on exit, so there is one client for the whole session.
+    """
+    from fastapi.testclient import TestClient
+    import main
+    with TestClient(main.app) as client:
+        yield client
+
+
+def login(client, email: str, password: str) -> dict:
+    """Log in through /auth/login and the OTP stored for the user. Returns the auth headers."""
+    from database import db
+    response = client.post('/auth/login', json={'email': email, 'password': password})
+    assert response.status_code == 200, response.text
+    otp_code = db.otp_codes.find_one(email=email)['code']
+    response = client.post('/auth/verify-otp', json={'email': email, 'otp_code': otp_code})
+    assert response.status_code == 200, response.text
+    return {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope='session')
+def admin(client) -> dict:
+    return login(client, *ADMIN)
+
+
+@pytest.fixture(scope='session')
+def hr(client) -> dict:
+    return login(client, *HR)
+
+
+@pytest.fixture(scope='session')
+def employee(client) -> dict:
+    return login(client, *EMPLOYEE)
+
+
+@pytest.fixture(scope='session')
+def delegate(client, admin) -> dict:
+    """A second employee, for the delegated rights (see grant())."""
+    response = client.post('/admin/users', headers=admin,
+                           json={'email': DELEGATE[0], 'password': DELEGATE[1], 'role': 'employee'})
+    assert response.status_code == 200, response.text
+    return login(client, *DELEGATE)
+
+
+@contextmanager
+def grant(rights: list, expires_at: str = None):
+    """Delegate `rights` from HR to the delegate user while in the block."""
+    from database import db
+    hr = db.get_user_by_email(HR[0])
+    delegate = db.get_user_by_email(DELEGATE[0])
+    delegation_id = db.create_delegation(hr.doc_id, HR[0], delegate.doc_id, DELEGATE[0], rights,
+                                         False, 1, 0, expires_at, False)
+    try:
+        yield delegation_id
+    finally:
+        db.revoke_delegation(delegation_id)
+
+
+def handshake(client, headers: dict) -> bytes:
+    """Run a modp1536 /handshake/exchange for the user. Returns the derived AES key."""
+    import secrets
+    from security import derive_aes_key_from_secret
+    p = int(client.get('/handshake/params').json()['p'], 16)
+    private_key = secrets.randbelow(p - 3) + 2
+    response = client.post('/handshake/exchange', headers=headers, json={'public_key': hex(pow(2, private_key, p))})
+    assert response.status_code == 200, response.text
+    return derive_aes_key_from_secret(pow(int(response.json()['public_key'], 16), private_key, p))
@@ -0,0 +1,97 @@
+"""Vectorized leave analytics (analytics.report) against the pure Python reference_report."""
+import math
+import random
+import pytest
+from analytics import reference_report
+from tests.test_views import FIRST_DAY, day, random_workload
+
+REASONS = ('Vacances', ' vacances ', 'Maladie', 'RDV  medical', 'rdv medical', 'famille', '')
+BOUNDS = [
+    (None, None),
+    (day(FIRST_DAY + 30), None),
+    (None, day(FIRST_DAY + 60)),
+    (day(FIRST_DAY + 20), day(FIRST_DAY + 90)),
+    # Nothing starts in it
+    (day(FIRST_DAY - 40), day(FIRST_DAY - 10)),
+]
+
+
+def assert_same(actual, expected, path='report'):
+    """Equal, floats up to rounding (sums and percentiles are not computed in the same order)."""
+    if isinstance(expected, dict):
+        assert isinstance(actual, dict) and actual.keys() == expected.keys(), path
+        for key in expected:
+            assert_same(actual[key], expected[key], f'{path}.{key}')
+    elif isinstance(expected, list):
+        assert isinstance(actual, list) and len(actual) == len(expected), path
+        for index, (a, e) in enumerate(zip(actual, expected)):
+            assert_same(a, e, f'{path}[{index}]')
+    elif isinstance(expected, float):
+        assert isinstance(actual, float) and math.isclose(actual, expected, rel_tol=1e-9, abs_tol=1e-9), path
+    else:
+        assert actual == expected and type(actual) is type(expected), path
+
+
+def check_report(database, rng: random.Random = None, bounds=BOUNDS, top=10):
+    requests = database.leave_requests.all()
+    employees = len(database.users.find(role='employee'))
+    for first_day, last_day in bounds:
+        assert_same(
+            database.get_leave_analytics(first_day, last_day, top),
+            reference_report(requests, employees, first_day, last_day, top)
+        )
+
+
+def add_employees(database, count: int = 6):
+    for index in range(1, count + 1):
+        database.create_user(f'e{index}@x.com', 'hash', 'employee')
+
+
+def test_empty_table(database):
+    check_report(database)
+    add_employees(database)
+    check_report(database)
+    report = database.get_leave_analytics()
+    assert report['requests'] == 0
+    assert report['period'] == {'from': None, 'to': None, 'working_days': 0}
+    assert report['by_month'] == [] and report['top_reasons'] == []
+    assert report['approval_latency_hours']['decided'] == 0
+
+
+def test_single_row(database):
+    add_employees(database, 2)
+    # A Friday to the next Tuesday
+    request = database.create_leave_request(1, 'e1@x.com', 'conge', '2031-01-03', '2031-01-07', ' Vacances ', 3)
+    check_report(database)
+    database.update_leave_request_status(request, 'approved', 'ok')
+    check_report(database)
+    report = database.get_leave_analytics()
+    assert report['period'] == {'from': '2031-01-03', 'to': '2031-01-07', 'working_days': 3}
+    assert report['absence_rate']['rate'] == 3 / 6
+    assert [row['days_off'] for row in report['by_weekday']] == [1, 1, 0, 0, 1, 1, 1]
+    assert report['top_reasons'] == [{'reason': 'vacances', 'requests': 1}]
+    assert report['approval_latency_hours']['decided'] == 1
+
+    # Bounds on the start date only: the request ends after last_day
+    check_report(database, bounds=[('2031-01-03', '2031-01-03'), ('2031-01-04', None), (None, '2031-01-02')])
+    assert database.get_leave_analytics('2031-01-04')['requests'] == 0
+
+    database.delete_leave_request(request)
+    check_report(database)
+
+
+@pytest.mark.parametrize('top', [0, 1, 3, 10])
+def test_random_workload_matches_reference(database, top):
+    rng = random.Random(24 + top)
+    add_employees(database)
+    # Various reasons, to rank (ties included) and normalize
+    create = database.create_leave_request
+
+    def create_with_reason(*args):
+        return create(*args[:5], rng.choice(REASONS), *args[6:])
+    database.create_leave_request = create_with_reason
+    try:
+        random_workload(database, rng, 200, lambda database, rng: check_report(database, rng, top=top))
+    finally:
+        del database.create_leave_request
+    assert database.get_leave_analytics()['requests'] == len(database.leave_requests.all())
@@ -0,0 +1,64 @@
+"""AsyncDatabase: database calls run on the I/O pool, off the event loop."""
+import asyncio
+import threading
+import time
+import pytest
+from database import AsyncDatabase
+from tests.conftest import open_database
+
+
+@pytest.fixture
+def async_database(tmp_path, backend):
+    async_database = AsyncDatabase(open_database(tmp_path, backend), max_workers=8)
+    yield async_database
+    async_database.close()
+
+
+def test_methods_are_awaitable(async_database):
+    async def scenario():
+        uid = await async_database.create_user('a@x.com', 'hash', 'employee')
+        user = await async_database.get_user_by_email('a@x.com')
+        return uid, user
+    uid, user = asyncio.run(scenario())
+    assert user.doc_id == uid
+    assert async_database.sync.get_user_by_id(uid)['email'] == 'a@x.com'
+
+
+def test_calls_leave_the_event_loop(async_database):
+    async def scenario():
+        loop_thread = threading.get_ident()
+        thread = await async_database.run(threading.get_ident)
+        # Four blocking calls of 0.2s in parallel while the loop keeps ticking
+        ticks = 0
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+        task = asyncio.create_task(ticker())
+        start = time.perf_counter()
+        await asyncio.gather(*(async_database.run(time.sleep, 0.2) for _ in range(4)))
+        elapsed = time.perf_counter() - start
+        task.cancel()
+        return loop_thread, thread, elapsed, ticks
+    loop_thread, thread, elapsed, ticks = asyncio.run(scenario())
+    assert thread != loop_thread
+    assert elapsed < 0.6
+    assert ticks >= 5
+
+
+def test_concurrent_writes(async_database):
+    async def scenario():
+        await asyncio.gather(*(
+            async_database.record_login_attempt(f'user{i % 4}@x.com', False) for i in range(40)
+        ))
+    asyncio.run(scenario())
+    database = async_database.sync
+    assert [database.login_attempts.find_one(email=f'user{i}@x.com')['failed_count'] for i in range(4)] == [10] * 4
+
+
+def test_private_attributes_are_not_exposed(async_database):
+    with pytest.raises(AttributeError):
+        async_database._publish
+    with pytest.raises(AttributeError):
+        async_database.backend
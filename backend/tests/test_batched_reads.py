@@ -0,0 +1,66 @@
+"""Batched reads of the list endpoints against the per-row getters."""
+import random
+
+
+def test_batched_getters_match_per_row(database):
+    rng = random.Random(20)
+    users = [database.create_user(f'u{i}@x.com', 'hash', 'employee') for i in range(10)]
+    with database.engine.transaction():
+        for i in range(1200):
+            request_id = database.leave_requests.insert({'employee_id': rng.choice(users), 'status': 'pending'})
+            if i % 3:
+                database.communication_auth.insert({
+                    'leave_request_id': request_id, 'employee_id': 3,
+                    'status': 'rejected' if i % 7 == 0 else 'approved'
+                })
+            if i % 11 == 0:
+                # Duplicate authorization: the oldest one wins
+                database.communication_auth.insert({'leave_request_id': request_id, 'employee_id': 3, 'status': 'dup'})
+
+    ids = [request.doc_id for request in database.leave_requests.all()] + [10 ** 7]
+    batched = database.get_communication_auths_by_leave_requests(ids)
+    expected = {}
+    for request_id in ids:
+        auth = database.get_communication_auth_by_leave_request(request_id)
+        if auth is not None:
+            expected[request_id] = auth
+    assert batched == expected
+    assert all(batched[request_id].doc_id == expected[request_id].doc_id for request_id in expected)
+
+    user_ids = list(range(0, 15)) * 3
+    assert database.get_users_by_ids(user_ids) == {
+        user_id: database.get_user_by_id(user_id) for user_id in set(user_ids) if database.get_user_by_id(user_id)
+    }
+    document = database.create_document(users[0], 'u0@x.com', 't', 'c')
+    assert set(database.get_documents_by_ids([document, 999])) == {document}
+
+    raw = database.engine.table('communication_auth')
+    assert [auth.doc_id for auth in raw.find_in('status', ['rejected', 'dup'])] == sorted(
+        auth.doc_id for auth in raw.all() if auth['status'] in ('rejected', 'dup')
+    )
+
+
+def test_list_endpoints_resolve_joins(client, employee, hr, admin):
+    fields = {'type': 'absence', 'reason': 'r', 'days_count': 1}
+    created = []
+    for day in ('2031-03-03', '2031-03-10'):
+        response = client.post('/leave-requests', headers=employee,
+                               json={**fields, 'start_date': day, 'end_date': day})
+        assert response.status_code == 200, response.text
+        created.append(response.json())
+    # A rejected authorization hides the request from HR
+    response = client.put(f"/communication-auth/{created[1]['auth_id']}", headers=admin, json={'action': 'reject'})
+    assert response.status_code == 200, response.text
+    visible = {request['id'] for request in client.get('/leave-requests/all', headers=hr).json()}
+    assert created[0]['request_id'] in visible and created[1]['request_id'] not in visible
+    paged, cursor = set(), None
+    while True:
+        response = client.get('/leave-requests/all', headers=hr,
+                              params={'limit': 1, **({'cursor': cursor} if cursor else {})})
+        paged.update(request['id'] for request in response.json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+    assert paged == visible
+
+    assert client.delete(f"/leave-requests/{created[0]['request_id']}", headers=employee).status_code == 200
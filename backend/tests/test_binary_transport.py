@@ -0,0 +1,85 @@
+"""Raw-bytes ciphertexts: octet-stream submission, framed listings and storage."""
+import base64
+import json
+import os
+import struct
+from security import encrypt_bytes, is_message_blob
+from tests.conftest import handshake, open_database
+from tests.test_message_format import cbc_encrypt
+
+BINARY = 'application/octet-stream'
+
+
+def unframe(data: bytes) -> list:
+    """Split a binary listing into (header, payload) pairs."""
+    frames, offset = [], 0
+    while offset < len(data):
+        header_length, payload_length = struct.unpack_from('>II', data, offset)
+        offset += 8
+        header = json.loads(data[offset:offset + header_length])
+        offset += header_length
+        frames.append((header, data[offset:offset + payload_length]))
+        offset += payload_length
+    return frames
+
+
+def test_submit_and_list(client, employee, hr):
+    from database import db
+    key = handshake(client, employee)
+    as_json = encrypt_bytes(b'{"t": "json"}', key)
+    as_binary = encrypt_bytes(b'{"t": "binary"}', key)
+    response = client.post('/requests/leave', headers=employee,
+                           json={'encrypted_content': base64.b64encode(as_json).decode(), 'iv': ''})
+    assert response.status_code == 200, response.text
+    json_id = response.json()['message_id']
+    response = client.post('/requests/leave', headers={**employee, 'Content-Type': BINARY}, content=as_binary)
+    assert response.status_code == 200, response.text
+    binary_id = response.json()['message_id']
+    cbc_content, cbc_iv = cbc_encrypt('{"t": "cbc"}', key)
+    cbc_id = client.post('/requests/leave', headers=employee,
+                         json={'encrypted_content': cbc_content, 'iv': cbc_iv}).json()['message_id']
+    ids = {json_id, binary_id, cbc_id}
+
+    # Versioned blobs are stored raw whatever the transport, CBC stays Base64
+    assert db.get_message(json_id)['encrypted_content'] == as_json
+    assert db.get_message(binary_id)['encrypted_content'] == as_binary
+    assert db.get_message(cbc_id)['encrypted_content'] == cbc_content
+
+    listed = {m['id']: m for m in client.get('/messages/received', headers=hr).json() if m['id'] in ids}
+    response = client.get('/messages/received', headers={**hr, 'Accept': BINARY})
+    assert response.headers['content-type'] == BINARY
+    framed = {header['id']: (header, payload) for header, payload in unframe(response.content) if header['id'] in ids}
+    assert set(listed) == set(framed) == ids
+    assert framed[json_id][1] == as_json and framed[binary_id][1] == as_binary
+    assert framed[cbc_id][1] == base64.b64decode(cbc_content) and framed[cbc_id][0]['iv'] == cbc_iv
+    for message_id in ids:
+        assert base64.b64decode(listed[message_id]['encrypted_content']) == framed[message_id][1]
+        assert framed[message_id][0]['from_email'] == listed[message_id]['from_email']
+        response = client.post(f'/messages/{message_id}/decrypt', headers=hr)
+        assert response.status_code == 200, response.text
+        client.delete(f'/messages/{message_id}', headers=hr)
+
+
+def test_rejected_bodies(client, employee):
+    headers = {**employee, 'Content-Type': BINARY}
+    assert client.post('/requests/leave', headers=headers, content=b'\x02short').status_code == 400
+    assert client.post('/requests/leave', headers=headers, content=b'\x09' + b'x' * 40).status_code == 400
+    assert client.post('/requests/leave', headers=employee, json={'encrypted_content': '!!!', 'iv': ''}).status_code == 400
+    response = client.post('/requests/leave', headers=employee, json={'iv': ''})
+    assert response.status_code == 422
+    assert response.json()['detail'][0]['loc'][-1] == 'encrypted_content'
+    assert client.post('/requests/leave', headers=employee, content=b'{not json').status_code == 422
+
+
+def test_bytes_persisted(tmp_path, backend):
+    database = open_database(tmp_path, backend)
+    blob = encrypt_bytes(b'{}', os.urandom(32))
+    message_id = database.store_message(1, 2, blob)
+    database.mark_messages_decrypted([message_id])
+    database.close()
+
+    database = open_database(tmp_path, backend)
+    message = database.get_message(message_id)
+    assert message['encrypted_content'] == blob and message['decrypted']
+    assert is_message_blob(message['encrypted_content'])
+    database.close()
@@ -0,0 +1,317 @@
+"""Encrypted document blobs (STREAM construction) and the document content endpoints."""
+import hashlib
+import os
+import tracemalloc
+import pytest
+from blobs import BlobStore, BlobIntegrityError, HEADER_SIZE, TAG_SIZE
+
+CHUNK = 16
+KEY = bytes(range(32))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path), KEY, chunk_size=CHUNK)
+
+
+def write(store: BlobStore, data: bytes, piece: int = 7) -> str:
+    writer = store.create()
+    for offset in range(0, len(data), piece):
+        writer.write(data[offset:offset + piece])
+    blob_id, size = writer.close()
+    assert size == len(data)
+    return blob_id
+
+
+def read_until_error(store: BlobStore, blob_id: str) -> bytes:
+    """Chunks yielded before the integrity error, which must come."""
+    received = b''
+    with pytest.raises(BlobIntegrityError):
+        for chunk in store.read(blob_id):
+            received += chunk
+    return received
+
+
+def encrypted_chunk(index: int) -> slice:
+    start = HEADER_SIZE + index * (CHUNK + TAG_SIZE)
+    return slice(start, start + CHUNK + TAG_SIZE)
+
+
+def rewrite(store: BlobStore, blob_id: str, change):
+    path = store.path(blob_id)
+    with open(path, 'rb') as f:
+        data = bytearray(f.read())
+    with open(path, 'wb') as f:
+        f.write(change(data))
+
+
+@pytest.mark.parametrize('size', [0, 1, CHUNK - 1, CHUNK, CHUNK + 1, 5 * CHUNK, 100])
+def test_round_trip(store, size):
+    data = os.urandom(size)
+    blob_id = write(store, data)
+    assert store.size(blob_id) == size
+    assert b''.join(store.read(blob_id)) == data
+    assert not os.path.exists(store.path(blob_id) + '.tmp')
+
+
+def test_every_range(store):
+    data = os.urandom(3 * CHUNK + 5)
+    blob_id = write(store, data)
+    for start in range(len(data) + 1):
+        for end in range(start, len(data) + 3):
+            chunks = list(store.read(blob_id, start, end))
+            assert b''.join(chunks) == data[start:end], (start, end)
+            assert all(len(chunk) <= CHUNK for chunk in chunks)
+
+
+def test_large_blob_in_bounded_memory(tmp_path):
+    store = BlobStore(str(tmp_path), KEY)
+    size = 16 * 1024 * 1024 + 123
+    piece = os.urandom(256 * 1024)
+    expected = hashlib.sha256()
+    tracemalloc.start()
+    try:
+        writer = store.create()
+        written = 0
+        while written < size:
+            data = piece[:size - written]
+            writer.write(data)
+            expected.update(data)
+            written += len(data)
+        blob_id, _ = writer.close()
+        actual = hashlib.sha256()
+        for chunk in store.read(blob_id):
+            assert len(chunk) <= store.chunk_size
+            actual.update(chunk)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert actual.digest() == expected.digest()
+    # A few pieces and chunks at a time, never the document
+    assert peak < 2 * 1024 * 1024
+
+
+def test_corrupted_chunk_fails_mid_stream(store):
+    data = os.urandom(4 * CHUNK + 3)
+    blob_id = write(store, data)
+
+    def flip(blob: bytearray) -> bytearray:
+        blob[encrypted_chunk(2).start + 5] ^= 1
+        return blob
+    rewrite(store, blob_id, flip)
+    # The chunks before the altered one were already sent
+    assert read_until_error(store, blob_id) == data[:2 * CHUNK]
+    # A range before the damage is still readable
+    assert b''.join(store.read(blob_id, 0, 2 * CHUNK)) == data[:2 * CHUNK]
+
+
+def test_reordered_chunks(store):
+    data = os.urandom(4 * CHUNK + 3)
+    blob_id = write(store, data)
+
+    def swap(blob: bytearray) -> bytearray:
+        first, second = encrypted_chunk(1), encrypted_chunk(2)
+        blob[first], blob[second] = blob[second], blob[first]
+        return blob
+    rewrite(store, blob_id, swap)
+    assert read_until_error(store, blob_id) == data[:CHUNK]
+
+
+def test_truncated_at_a_chunk_boundary(store):
+    blob_id = write(store, os.urandom(4 * CHUNK + 3))
+    # Only the last chunk may be shorter than a full one: caught by the size alone
+    rewrite(store, blob_id, lambda blob: blob[:encrypted_chunk(3).start])
+    with pytest.raises(BlobIntegrityError):
+        store.size(blob_id)
+
+
+def test_truncated_inside_the_last_chunk(store):
+    data = os.urandom(4 * CHUNK + 12)
+    blob_id = write(store, data)
+    rewrite(store, blob_id, lambda blob: blob[:-5])
+    assert store.size(blob_id) == 4 * CHUNK + 7
+    assert read_until_error(store, blob_id) == data[:4 * CHUNK]
+
+
+def test_appended_chunk(store):
+    data = os.urandom(2 * CHUNK + 3)
+    blob_id = write(store, data)
+    rewrite(store, blob_id, lambda blob: blob + blob[encrypted_chunk(0)])
+    assert read_until_error(store, blob_id) == data[:2 * CHUNK]
+
+
+# Inside the header, shorter than a tag, then cut off the end
+@pytest.mark.parametrize('keep', [HEADER_SIZE - 10, HEADER_SIZE + TAG_SIZE - 1, -1, -TAG_SIZE])
+def test_truncated_file(store, keep):
+    blob_id = write(store, os.urandom(CHUNK + 3))
+    rewrite(store, blob_id, lambda blob: blob[:keep])
+    with pytest.raises(BlobIntegrityError):
+        b''.join(store.read(blob_id))
+
+
+def test_blob_swapped_with_another(store):
+    first = write(store, b'first document body')
+    second = write(store, b'second document body')
+    with open(store.path(first), 'rb') as f:
+        content = f.read()
+    rewrite(store, second, lambda blob: content)
+    with pytest.raises(BlobIntegrityError):
+        b''.join(store.read(second))
+
+
+def test_invalid_blob_id_and_abort(store):
+    with pytest.raises(ValueError):
+        store.path('../db')
+    writer = store.create()
+    writer.write(b'x' * 100)
+    writer.abort()
+    assert os.listdir(store.directory) == []
+
+
+# ==================== ENDPOINTS ====================
+
+def raised(error: BaseException, kind: type) -> bool:
+    """`error` is, or groups (anyio task groups), an exception of type `kind`."""
+    return isinstance(error, kind) or any(raised(inner, kind) for inner in getattr(error, 'exceptions', ()))
+
+
+@pytest.fixture
+def document(client, employee):
+    response = client.post('/documents', headers=employee, json={'title': 'Blob', 'content': ''})
+    assert response.status_code == 200, response.text
+    return response.json()['document_id']
+
+
+def upload(client, headers: dict, doc_id: int, data: bytes):
+    def body():
+        for offset in range(0, len(data), 100_000):
+            yield data[offset:offset + 100_000]
+    response = client.put(f'/documents/{doc_id}/content', headers={**headers, 'Content-Type': 'application/pdf'},
+                          content=body())
+    assert response.status_code == 200, response.text
+    assert response.json()['content_size'] == len(data)
+
+
+def test_upload_and_ranges(client, employee, document):
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    upload(client, employee, document, data)
+
+    response = client.get(f'/documents/{document}/content', headers=employee)
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/pdf'
+    assert response.content == data
+
+    size = len(data)
+    cases = {
+        'bytes=10-19': (10, 20),
+        'bytes=65530-65545': (65530, 65546),
+        'bytes=-5': (size - 5, size),
+        f'bytes={size - 3}-': (size - 3, size),
+        f'bytes=0-{size + 100}': (0, size),
+    }
+    for header, (start, end) in cases.items():
+        response = client.get(f'/documents/{document}/content', headers={**employee, 'Range': header})
+        assert response.status_code == 206, header
+        assert response.headers['content-range'] == f'bytes {start}-{end - 1}/{size}'
+        assert response.content == data[start:end]
+
+    response = client.get(f'/documents/{document}/content', headers={**employee, 'Range': f'bytes={size}-'})
+    assert response.status_code == 416
+    assert response.headers['content-range'] == f'bytes */{size}'
+    # Several ranges: the whole body
+    response = client.get(f'/documents/{document}/content', headers={**employee, 'Range': 'bytes=0-1,5-6'})
+    assert response.status_code == 200 and len(response.content) == size
+
+
+def test_replaced_content_deletes_the_old_blob(client, employee, document):
+    import main
+    upload(client, employee, document, b'first')
+    old_blob_id = main.adb.sync.get_document(document)['blob_id']
+    upload(client, employee, document, b'second')
+    assert not os.path.exists(main.document_blobs.path(old_blob_id))
+    assert client.get(f'/documents/{document}/content', headers=employee).content == b'second'
+
+
+def test_altered_blob_through_the_endpoint(client, employee, document):
+    import main
+    chunk_size = main.document_blobs.chunk_size
+    upload(client, employee, document, os.urandom(3 * chunk_size + 10))
+    path = main.document_blobs.path(main.adb.sync.get_document(document)['blob_id'])
+    with open(path, 'r+b') as f:
+        f.seek(HEADER_SIZE + 2 * (chunk_size + TAG_SIZE) + 1)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 1]))
+    # Headers are sent before the altered chunk is reached: the stream fails
+    with pytest.raises(Exception) as error:
+        client.get(f'/documents/{document}/content', headers=employee)
+    assert raised(error.value, BlobIntegrityError)
+    # A range before the damage is served
+    response = client.get(f'/documents/{document}/content', headers={**employee, 'Range': 'bytes=0-99'})
+    assert response.status_code == 206 and len(response.content) == 100
+
+    with open(path, 'r+b') as f:
+        f.truncate(HEADER_SIZE - 1)
+    response = client.get(f'/documents/{document}/content', headers=employee)
+    assert response.status_code == 500
+
+
+def blob_files() -> set:
+    import main
+    return set(os.listdir(main.document_blobs.directory))
+
+
+def test_title_and_content_in_one_write(client, employee, document, monkeypatch):
+    import main
+    from config import settings
+    monkeypatch.setattr(settings, 'DOCUMENT_INLINE_MAX_BYTES', 16)
+    response = client.put(f'/documents/{document}', headers=employee, json={'title': 'New', 'content': 'x' * 100})
+    assert response.status_code == 200, response.text
+    stored = main.adb.sync.get_document(document)
+    assert stored['title'] == 'New' and stored['content'] is None and stored['content_size'] == 100
+    assert b''.join(main.document_blobs.read(stored['blob_id'])) == b'x' * 100
+    files = blob_files()
+
+    # The write fails: neither the title nor the content change, the new blob is dropped
+    def fail(*args, **kwargs):
+        raise RuntimeError('write failed')
+    monkeypatch.setattr(main.adb.sync.documents, 'update', fail)
+    with pytest.raises(RuntimeError):
+        client.put(f'/documents/{document}', headers=employee, json={'title': 'Lost', 'content': 'y' * 100})
+    monkeypatch.undo()
+    assert main.adb.sync.get_document(document) == stored
+    assert blob_files() == files
+
+    # Inline content again: the blob is deleted
+    response = client.put(f'/documents/{document}', headers=employee, json={'content': 'short'})
+    assert response.status_code == 200, response.text
+    assert main.adb.sync.get_document(document)['blob_id'] is None
+    assert stored['blob_id'] + '.blob' not in blob_files()
+
+
+def test_document_deleted_during_the_update(client, employee, document, monkeypatch):
+    import main
+    from config import settings
+    monkeypatch.setattr(settings, 'DOCUMENT_INLINE_MAX_BYTES', 16)
+    store_content = main._store_document_content
+    files = blob_files()
+
+    async def store_then_delete(content):
+        stored = await store_content(content)
+        await main.adb.delete_document(document)
+        return stored
+    monkeypatch.setattr(main, '_store_document_content', store_then_delete)
+    response = client.put(f'/documents/{document}', headers=employee, json={'title': 't', 'content': 'z' * 100})
+    assert response.status_code == 404
+    assert blob_files() == files
+
+
+def test_delete_document_returns_its_blob(client, employee, document):
+    import main
+    # Inline content: no blob
+    assert main.adb.sync.delete_document(document) is None
+    other = client.post('/documents', headers=employee, json={'title': 'Blob', 'content': ''}).json()['document_id']
+    upload(client, employee, other, b'content')
+    blob_id = main.adb.sync.get_document(other)['blob_id']
+    assert main.adb.sync.delete_document(other) == blob_id
+    assert main.adb.sync.delete_document(other) is None
@@ -0,0 +1,99 @@
+"""TTLCache and the cached principals of main.get_current_user."""
+import types
+import pytest
+import cache
+from cache import TTLCache
+from tests.conftest import EMPLOYEE
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """cache.time.monotonic(), moved by hand."""
+    now = [1000.0]
+    monkeypatch.setattr(cache, 'time', types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_ttl_expiry(clock):
+    evicted = []
+    entries = TTLCache(max_size=10, ttl_seconds=60, on_evict=evicted.append)
+    entries.set('a', 1)
+    entries.set('b', 2, ttl_seconds=10)
+    # Never longer than the default TTL
+    entries.set('c', 3, ttl_seconds=600)
+    clock[0] += 9
+    assert (entries.get('a'), entries.get('b'), entries.get('c')) == (1, 2, 3)
+    clock[0] += 2
+    assert entries.get('b') is None and evicted == [2]
+    clock[0] += 50
+    assert entries.get('a') is None and entries.get('c') is None
+    assert evicted == [2, 1, 3]
+    assert entries.stats()['size'] == 0
+    assert (entries.hits, entries.misses) == (3, 3)
+
+
+def test_lru_eviction(clock):
+    evicted = []
+    entries = TTLCache(max_size=3, ttl_seconds=60, on_evict=evicted.append)
+    for key in 'abc':
+        entries.set(key, key.upper())
+    # A hit makes 'a' the most recently used: 'b' goes first
+    assert entries.get('a') == 'A'
+    entries.set('d', 'D')
+    assert evicted == ['B'] and entries.get('b') is None
+    entries.set('e', 'E')
+    assert evicted == ['B', 'C']
+    assert [entries.get(key) for key in 'ade'] == ['A', 'D', 'E']
+    assert entries.stats()['evictions'] == 2
+
+
+def test_replacement_and_invalidation(clock):
+    evicted = []
+    entries = TTLCache(max_size=10, ttl_seconds=60, on_evict=evicted.append)
+    first = {'id': 1}
+    entries.set('a', first)
+    # The same value again is not an eviction
+    entries.set('a', first)
+    assert evicted == []
+    entries.set('a', {'id': 2})
+    assert evicted == [first]
+
+    entries.set('b', {'id': 2})
+    entries.set('c', {'id': 3})
+    entries.invalidate_where(lambda value: value['id'] == 2)
+    assert entries.get('a') is None and entries.get('b') is None and entries.get('c') == {'id': 3}
+    assert evicted == [first, {'id': 2}, {'id': 2}]
+    entries.pop('c')
+    entries.pop('missing')
+    assert evicted[-1] == {'id': 3}
+    entries.set('d', 4)
+    entries.clear()
+    assert evicted[-1] == 4
+    assert entries.stats()['invalidations'] == 4
+
+
+def test_disabled_cache(clock):
+    for entries in (TTLCache(max_size=0, ttl_seconds=60), TTLCache(max_size=10, ttl_seconds=0)):
+        entries.set('a', 1)
+        assert not entries.enabled and entries.get('a') is None
+    entries = TTLCache(max_size=10, ttl_seconds=60)
+    entries.set('a', 1, ttl_seconds=0)
+    assert entries.get('a') is None
+
+
+def test_user_write_invalidates_the_principal(client, employee):
+    import main
+    email = EMPLOYEE[0]
+    assert client.get('/auth/me', headers=employee).status_code == 200
+    principal = main.principal_cache.get(email)
+    assert principal is not None
+    previous_key = principal.get('public_key_certificate')
+
+    main.adb.sync.update_user_public_key(principal['id'], 'new-certificate')
+    try:
+        assert main.principal_cache.get(email) is None
+        # Read again from the database on the next request
+        assert client.get('/auth/me', headers=employee).status_code == 200
+        assert main.principal_cache.get(email)['public_key_certificate'] == 'new-certificate'
+    finally:
+        main.adb.sync.update_user_public_key(principal['id'], previous_key)
@@ -0,0 +1,145 @@
+"""POST /messages/cleanup-incompatible (background job) and GET /jobs/{id}."""
+import threading
+import time
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+from security import encrypt_bytes
+from tests.conftest import HR, EMPLOYEE, handshake
+
+OTHER_KEY = bytes(range(1, 33))
+
+
+@pytest.fixture
+def cleanup(client, hr, employee, monkeypatch):
+    """Small chunks and batches, on the thread pool; yields the HR key and a message factory."""
+    import main
+    from config import settings
+    monkeypatch.setattr(settings, 'CLEANUP_JOB_WORKERS', 1)
+    monkeypatch.setattr(settings, 'CLEANUP_JOB_CHUNK_SIZE', 3)
+    monkeypatch.setattr(settings, 'CLEANUP_JOB_DELETE_BATCH_SIZE', 2)
+    database = main.adb.sync
+    hr_id = database.get_user_by_email(HR[0]).doc_id
+    employee_id = database.get_user_by_email(EMPLOYEE[0]).doc_id
+    key = handshake(client, hr)
+    # Left by other tests: the job would delete them
+    database.delete_messages([message.doc_id for message in database.get_all_messages()])
+
+    def send(count: int, key: bytes) -> list:
+        return [database.store_message(employee_id, hr_id, encrypt_bytes(b'{"n": 1}', key)) for _ in range(count)]
+    yield key, send
+    database.delete_messages([message.doc_id for message in database.get_all_messages()])
+
+
+def start(client, headers: dict) -> dict:
+    response = client.post('/messages/cleanup-incompatible', headers=headers)
+    assert response.status_code == 202, response.text
+    return response.json()
+
+
+def wait(client, headers: dict, job_id: str) -> dict:
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        job = client.get(f'/jobs/{job_id}', headers=headers).json()
+        if job['status'] in ('completed', 'failed'):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+def test_cleanup_job(client, hr, employee, cleanup, monkeypatch):
+    import main
+    key, send = cleanup
+    good, bad = send(4, key), send(5, OTHER_KEY)
+    good += send(2, key)
+
+    # Held until the second POST
+    release = threading.Event()
+    find = main.find_incompatible_messages
+
+    def held(items, aes_key):
+        release.wait(10)
+        return find(items, aes_key)
+    monkeypatch.setattr(main, 'find_incompatible_messages', held)
+    batches = []
+    delete_messages = main.adb.delete_messages
+
+    async def recorded(message_ids):
+        batches.append(list(message_ids))
+        return await delete_messages(message_ids)
+    monkeypatch.setattr(main.adb, 'delete_messages', recorded)
+
+    assert client.post('/messages/cleanup-incompatible', headers=employee).status_code == 403
+    job = start(client, hr)
+    assert job['kind'] == main.CLEANUP_JOB and job['status'] in ('pending', 'running')
+    # Already running: the same job comes back
+    assert start(client, hr)['job_id'] == job['job_id']
+    release.set()
+
+    job = wait(client, hr, job['job_id'])
+    assert job['status'] == 'completed', job
+    assert job['progress'] == {'total': 11, 'scanned': 11, 'incompatible': 5, 'deleted': 5}
+    assert sorted(job['result']['deleted_ids']) == bad and job['result']['deleted_count'] == 5
+    # Deleted as they were found, not all at the end
+    assert len(batches) > 1 and sorted(sum(batches, [])) == bad
+    assert sorted(message.doc_id for message in main.adb.sync.get_all_messages()) == good
+
+    # Finished: a new POST starts another job
+    second = start(client, hr)['job_id']
+    assert second != job['job_id']
+    assert wait(client, hr, second)['progress'] == {'total': 6, 'scanned': 6, 'incompatible': 0, 'deleted': 0}
+
+
+def test_job_stops_when_the_session_changes(client, hr, cleanup, monkeypatch):
+    import main
+    key, send = cleanup
+    bad = send(6, OTHER_KEY)
+    hr_id = main.adb.sync.get_user_by_email(HR[0]).doc_id
+    find = main.find_incompatible_messages
+
+    def rotate_then_find(items, aes_key):
+        # New handshake of HR while the job runs
+        main.adb.sync.update_session_secret(hr_id, hex(987654321))
+        return find(items, aes_key)
+    monkeypatch.setattr(main, 'find_incompatible_messages', rotate_then_find)
+
+    job = wait(client, hr, start(client, hr)['job_id'])
+    assert job['status'] == 'failed'
+    assert 'session' in job['error']
+    assert job['progress']['deleted'] == 0
+    assert sorted(message.doc_id for message in main.adb.sync.get_all_messages()) == bad
+
+
+class BrokenPool(Executor):
+    """A process pool whose workers cannot start."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_exception(BrokenProcessPool('cannot start'))
+        return future
+
+
+def test_falls_back_to_threads(client, hr, cleanup, monkeypatch):
+    import main
+    from config import settings
+    key, send = cleanup
+    good, bad = send(3, key), send(4, OTHER_KEY)
+    monkeypatch.setattr(settings, 'CLEANUP_JOB_WORKERS', 2)
+    monkeypatch.setattr(main, 'ProcessPoolExecutor', BrokenPool)
+
+    job = wait(client, hr, start(client, hr)['job_id'])
+    assert job['status'] == 'completed', job
+    assert sorted(job['result']['deleted_ids']) == bad
+    assert sorted(message.doc_id for message in main.adb.sync.get_all_messages()) == good
+
+
+def test_job_status_access(client, hr, admin, employee, delegate, cleanup):
+    job = wait(client, hr, start(client, hr)['job_id'])
+    assert client.get('/jobs/unknown', headers=hr).status_code == 404
+    assert client.get(f"/jobs/{job['job_id']}", headers=hr).status_code == 200
+    assert client.get(f"/jobs/{job['job_id']}", headers=admin).json()['job_id'] == job['job_id']
+    for headers in (employee, delegate):
+        assert client.get(f"/jobs/{job['job_id']}", headers=headers).status_code == 403
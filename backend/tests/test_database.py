@@ -0,0 +1,125 @@
+"""Database methods on every storage engine."""
+from datetime import datetime, timedelta
+import pytest
+from tests.conftest import open_database
+
+
+def test_users_and_sessions(database):
+    uid = database.create_user('a@x.com', 'hash', 'employee')
+    hr = database.create_user('hr@x.com', 'hash', 'hr_manager')
+    assert database.get_user_by_email('a@x.com').doc_id == uid
+    assert database.get_user_by_id(uid)['email'] == 'a@x.com'
+    assert database.get_user_by_email('nobody@x.com') is None
+    assert [user.doc_id for user in database.get_users_by_role('hr_manager')] == [hr]
+    database.update_user_public_key(uid, 'pk')
+    assert database.get_user_by_id(uid)['public_key_certificate'] == 'pk'
+
+    database.store_dh_params('0x17', '0x2')
+    assert database.get_dh_params()['p'] == '0x17'
+    database.store_session(hr, '0x5')
+    database.update_session_secret(hr, '0xabc')
+    assert database.get_session(hr)['shared_secret'] == '0xabc'
+
+
+def test_otp_and_login_attempts(database):
+    database.store_otp('a@x.com', '123')
+    database.store_otp('a@x.com', '456')
+    assert not database.verify_otp('a@x.com', '123')
+    assert database.verify_otp('a@x.com', '456')
+    assert not database.verify_otp('a@x.com', '456')
+
+    for _ in range(5):
+        database.record_login_attempt('a@x.com', False)
+    assert database.is_login_blocked('a@x.com')[0]
+    database.record_login_attempt('a@x.com', True)
+    assert not database.is_login_blocked('a@x.com')[0]
+
+
+@pytest.mark.parametrize('kind', ['login', 'otp'])
+def test_expired_block_is_reset(database, kind):
+    table = getattr(database, f'{kind}_attempts')
+    record = getattr(database, f'record_{kind}_attempt')
+    is_blocked = getattr(database, f'is_{kind}_blocked')
+    for _ in range(5):
+        record('a@x.com', False)
+    assert is_blocked('a@x.com')[0]
+
+    # Not expired yet: the reset leaves the counter alone
+    getattr(database, f'reset_expired_{kind}_attempts')('a@x.com')
+    assert table.find_one(email='a@x.com')['failed_count'] == 5
+
+    expired = (datetime.utcnow() - timedelta(minutes=6)).isoformat()
+    with database.engine.transaction():
+        table.update_where({'last_attempt': expired}, email='a@x.com')
+    assert is_blocked('a@x.com') == (False, 0)
+    assert table.find_one(email='a@x.com') is None
+    # The counter starts over
+    record('a@x.com', False)
+    assert table.find_one(email='a@x.com')['failed_count'] == 1
+
+
+def test_messages_leave_requests_and_dac(database):
+    uid = database.create_user('a@x.com', 'hash', 'employee')
+    hr = database.create_user('hr@x.com', 'hash', 'hr_manager')
+    message = database.store_message(uid, hr, 'c', 'iv')
+    assert database.get_messages_for_user(hr)[0].doc_id == message
+    assert database.get_message(message)['iv'] == 'iv'
+    database.delete_messages([message])
+    assert database.get_message(message) is None
+
+    request = database.create_leave_request(uid, 'a@x.com', 'conge', '2024-01-01', '2024-01-03', 'r', 3)
+    auth = database.create_communication_auth(request, uid, 'a@x.com')
+    assert database.get_communication_auth_by_leave_request(request).doc_id == auth
+    assert len(database.get_pending_communication_auths()) == 1
+    database.update_communication_auth_status(auth, 'rejected')
+    assert not database.get_pending_communication_auths()
+    database.update_leave_request_status(request, 'approved', 'ok')
+    assert database.get_leave_request(request)['status'] == 'approved'
+    assert len(database.get_leave_requests_by_employee(uid)) == 1
+
+    document = database.create_document(uid, 'a@x.com', 't', 'c')
+    acl = database.create_document_acl(document, hr, 'hr@x.com', ['read'], False, uid, 'a@x.com', False)
+    assert database.get_user_document_acl(document, hr).doc_id == acl
+    assert database.get_user_document_acl(document, uid) is None
+    delegation = database.create_delegation(hr, 'hr@x.com', uid, 'a@x.com', ['view_requests'], False, 1, 0, None, False)
+    assert database.user_has_delegated_right(uid, 'view_requests')
+    database.revoke_delegation(delegation)
+    assert not database.user_has_delegated_right(uid, 'view_requests')
+    database.delete_document(document)
+    assert not database.get_all_document_acls()
+    database.delete_leave_request(request)
+    assert database.get_leave_request(request) is None
+    assert database.verify_indexes() == []
+
+
+def test_leave_stats_recompute(database):
+    uid = database.create_user('a@x.com', 'hash', 'employee')
+    other = database.create_user('b@x.com', 'hash', 'employee')
+    first = database.create_leave_request(uid, 'a@x.com', 'conge', '2024-01-01', '2024-01-03', 'r', 3)
+    database.create_leave_request(uid, 'a@x.com', 'absence', '2024-02-05', '2024-02-05', 'r', 1)
+    database.create_leave_request(other, 'b@x.com', 'conge', '2024-01-10', '2024-01-12', 'r', 3)
+    database.update_leave_request_status(first, 'approved', 'ok')
+    rows = {(row['employee_id'], row['type'], row['month']): row['days'] for row in database.leave_stats._table.all()}
+
+    with database.engine.transaction():
+        database.leave_stats._table.truncate()
+    assert database.verify_leave_stats()
+    # One row per (employee, type) and per (employee, type, month)
+    assert database.recompute_leave_stats() == 6
+    assert database.verify_leave_stats() == []
+    assert {(row['employee_id'], row['type'], row['month']): row['days'] for row in database.leave_stats._table.all()} == rows
+    january = [row for row in database.get_leave_stats(uid, '2024-01') if row['month'] == '2024-01']
+    assert [(row['type'], row['days']['approved']) for row in january] == [('conge', 3)]
+
+
+def test_reopen(tmp_path, backend):
+    database = open_database(tmp_path, backend)
+    uid = database.create_user('a@x.com', 'hash', 'employee')
+    database.create_leave_request(uid, 'a@x.com', 'conge', '2024-01-01', '2024-01-03', 'r', 3)
+    database.close()
+
+    database = open_database(tmp_path, backend)
+    assert database.get_user_by_email('a@x.com').doc_id == uid
+    assert len(database.get_leave_requests_by_employee(uid)) == 1
+    assert database.verify_indexes() == []
+    database.close()
@@ -0,0 +1,125 @@
+"""Known-answer tests of the key agreement: RFC 7748, RFC 5869 and the fixed-base table."""
+import hashlib
+import hmac
+import secrets
+import pytest
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives import hashes
+import dh
+from dh import ModpGroup, MIN_EXPONENT_BITS
+from security import generate_dh_parameters, derive_aes_key_from_x25519, X25519_HKDF_INFO
+
+P, G = generate_dh_parameters()
+
+
+# ==================== RFC 7748 X25519 ====================
+
+# Section 5.2, first scalar multiplication
+SCALAR = bytes.fromhex('a546e36bf0527c9d3b16154b82465edd62144c0ac1fc5a18506a2244ba449ac4')
+U_COORDINATE = bytes.fromhex('e6db6867583030db3594c1a424b15f7c726624ec26b3353b10a903a6d0ab1c4c')
+SCALAR_MULT = bytes.fromhex('c3da55379de9c6908e94ea4df28d084f32eccf03491c71f754b4075577a28552')
+
+# Section 6.1
+ALICE_PRIVATE = bytes.fromhex('77076d0a7318a57d3c16c17251b26645df4c2f87ebc0992ab177fba51db92c2a')
+ALICE_PUBLIC = bytes.fromhex('8520f0098930a754748b7ddcb43ef75a0dbf3a0d26381af4eba4a98eaa9b4e6a')
+BOB_PRIVATE = bytes.fromhex('5dab087e624a8a4b79e17f8b83800ee66f3bb1292618b6fd1c2f8b27ff88e0eb')
+BOB_PUBLIC = bytes.fromhex('de9edb7d7b7dc1b4d35b61c2ece435373f8343c85b78674dadfc7e146f882b4f')
+SHARED_SECRET = bytes.fromhex('4a5d9d5ba4ce2de1728e3bf480350f25e07e21c947d19e3376f09b3c1e161742')
+
+
+def test_x25519_scalar_multiplication():
+    private_key = X25519PrivateKey.from_private_bytes(SCALAR)
+    assert private_key.exchange(X25519PublicKey.from_public_bytes(U_COORDINATE)) == SCALAR_MULT
+
+
+def test_x25519_exchange(monkeypatch):
+    # The server plays Bob, with his key pair instead of a random one
+    bob = X25519PrivateKey.from_private_bytes(BOB_PRIVATE)
+    monkeypatch.setattr(dh.X25519PrivateKey, 'generate', staticmethod(lambda: bob))
+    public_key, shared_secret = dh.x25519_exchange(ALICE_PUBLIC)
+    assert public_key == BOB_PUBLIC
+    assert shared_secret == SHARED_SECRET
+
+
+def test_x25519_rejects_low_order_points():
+    with pytest.raises(ValueError):
+        dh.x25519_exchange(bytes(32))
+
+
+# ==================== RFC 5869 HKDF-SHA256 ====================
+
+def reference_hkdf(ikm: bytes, salt: bytes, info: bytes, length: int) -> bytes:
+    """HKDF written out from the RFC (extract then expand), independent of `cryptography`."""
+    prk = hmac.new(salt or bytes(32), ikm, hashlib.sha256).digest()
+    okm, block = b'', b''
+    for counter in range(1, -(-length // 32) + 1):
+        block = hmac.new(prk, block + info + bytes([counter]), hashlib.sha256).digest()
+        okm += block
+    return okm[:length]
+
+
+HKDF_VECTORS = [
+    # Test case 1: basic test case with SHA-256
+    (bytes.fromhex('0b' * 22), bytes.fromhex('000102030405060708090a0b0c'),
+     bytes.fromhex('f0f1f2f3f4f5f6f7f8f9'), 42,
+     '3cb25f25faacd57a90434f64d0362f2a2d2d0a90cf1a5a4c5db02d56ecc4c5bf34007208d5b887185865'),
+    # Test case 3: zero-length salt and info, as derive_aes_key_from_x25519() (salt=None)
+    (bytes.fromhex('0b' * 22), b'', b'', 42,
+     '8da4e775a563c18f715f802a063c5a31b8a11f5c5ee1879ec3454e5f3c738d2d9d201395faa4b61a96c8'),
+]
+
+
+@pytest.mark.parametrize('ikm, salt, info, length, okm', HKDF_VECTORS)
+def test_hkdf_vectors(ikm, salt, info, length, okm):
+    assert reference_hkdf(ikm, salt, info, length).hex() == okm
+    derived = HKDF(algorithm=hashes.SHA256(), length=length, salt=salt or None, info=info).derive(ikm)
+    assert derived.hex() == okm
+
+
+def test_x25519_key_derivation():
+    expected = reference_hkdf(SHARED_SECRET, b'', X25519_HKDF_INFO, 32)
+    assert derive_aes_key_from_x25519(SHARED_SECRET) == expected
+
+
+# ==================== FIXED-BASE TABLE ====================
+
+@pytest.fixture(scope='module')
+def group():
+    return ModpGroup(P, G)
+
+
+@pytest.mark.parametrize('private_key', [
+    1, 2, 63, 64, 65, 2 ** 64 - 1, 2 ** 255, 2 ** 1530 + 1,
+    # Every 6-bit digit at its maximum, and the largest valid key
+    2 ** 1530 - 1, P - 2, P - 1,
+])
+def test_public_key_edge_cases(group, private_key):
+    assert group.public_key(private_key) == pow(G, private_key, P)
+
+
+@pytest.mark.parametrize('private_key', [0, -5, P, P + 7])
+def test_public_key_out_of_range_falls_back_to_pow(group, private_key):
+    assert group.public_key(private_key) == pow(G, private_key, P)
+
+
+def test_public_key_random(group):
+    short = ModpGroup(P, G, exponent_bits=MIN_EXPONENT_BITS)
+    for _ in range(50):
+        private_key = group.generate_private_key()
+        assert group.public_key(private_key) == pow(G, private_key, P)
+        private_key = short.generate_private_key()
+        assert private_key.bit_length() == MIN_EXPONENT_BITS
+        assert short.public_key(private_key) == pow(G, private_key, P)
+
+
+@pytest.mark.parametrize('window_bits', [1, 4, 5, 8])
+def test_public_key_window_sizes(window_bits):
+    group = ModpGroup(P, G, window_bits=window_bits)
+    for private_key in (3, 2 ** 200 + 12345, secrets.randbelow(P - 3) + 2):
+        assert group.public_key(private_key) == pow(G, private_key, P)
+
+
+def test_shared_secret_agrees(group):
+    a, b = group.generate_private_key(), group.generate_private_key()
+    assert group.shared_secret(group.public_key(b), a) == group.shared_secret(group.public_key(a), b)
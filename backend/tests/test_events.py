@@ -0,0 +1,137 @@
+"""Server push: EventBroker routing and overflow, GET /events limits, events of failed writes."""
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from database import write_operation
+from events import EventBroker, DelegatedRights, RESYNC, encode_event
+
+EMPLOYEE, OTHER, HR, ADMIN, DELEGATE, EXPIRED_DELEGATE = 3, 5, 2, 1, 4, 6
+
+
+def broker_with(delegations: list, max_connections: int = 100, queue_size: int = 64) -> EventBroker:
+    return EventBroker(DelegatedRights(lambda: delegations), max_connections, queue_size)
+
+
+async def received(stream) -> list:
+    """Frames queued on a stream, once the deliveries scheduled on the loop ran."""
+    await asyncio.sleep(0)
+    frames = []
+    while True:
+        frame = await stream.next(0.01)
+        if frame is None:
+            return frames
+        frames.append(frame)
+
+
+def test_recipients():
+    past = (datetime.utcnow() - timedelta(days=1)).isoformat()
+    delegations = [
+        {'delegate_id': DELEGATE, 'rights': ['view_requests'], 'is_active': True, 'expires_at': None},
+        {'delegate_id': EXPIRED_DELEGATE, 'rights': ['view_requests'], 'is_active': True, 'expires_at': past},
+        {'delegate_id': OTHER, 'rights': ['approve_leave'], 'is_active': True, 'expires_at': None},
+    ]
+    broker = broker_with(delegations)
+
+    async def scenario():
+        streams = {
+            user_id: broker.register(user_id, role) for user_id, role in (
+                (EMPLOYEE, 'employee'), (OTHER, 'employee'), (HR, 'hr_manager'), (ADMIN, 'admin'),
+                (DELEGATE, 'employee'), (EXPIRED_DELEGATE, 'employee')
+            )
+        }
+
+        async def recipients(event: dict) -> set:
+            broker.publish(event)
+            frame = encode_event(event['type'], {k: v for k, v in event.items() if k != 'type'})
+            result = set()
+            for user_id, stream in streams.items():
+                frames = await received(stream)
+                assert frames in ([], [frame])
+                if frames:
+                    result.add(user_id)
+            return result
+
+        leave_request = {'type': 'leave_request.status', 'id': 7, 'employee_id': EMPLOYEE, 'status': 'approved'}
+        assert await recipients(leave_request) == {EMPLOYEE, HR, DELEGATE}
+        assert await recipients({'type': 'communication_auth.created', 'id': 1, 'leave_request_id': 7,
+                                 'employee_id': EMPLOYEE, 'status': 'pending_admin'}) == {EMPLOYEE, ADMIN}
+        assert await recipients({'type': 'message.received', 'id': 9, 'to_id': HR}) == {HR, ADMIN}
+        assert await recipients({'type': 'unknown', 'id': 1}) == set()
+
+        # Revoked: no longer a reader once the rights are reloaded
+        delegations[0]['is_active'] = False
+        broker._rights.invalidate()
+        assert await recipients(leave_request) == {EMPLOYEE, HR}
+
+        for stream in streams.values():
+            broker.unregister(stream)
+        assert broker.stats()['connections'] == 0
+        assert await recipients(leave_request) == set()
+    asyncio.run(scenario())
+
+
+def test_slow_client_gets_one_resync():
+    broker = broker_with([], queue_size=4)
+
+    async def scenario():
+        stream = broker.register(EMPLOYEE, 'employee')
+        # Twice the queue and more before the client reads anything
+        for request_id in range(9):
+            broker.publish({'type': 'leave_request.created', 'id': request_id, 'employee_id': EMPLOYEE})
+        assert await received(stream) == [RESYNC]
+        # Then events flow again
+        broker.publish({'type': 'leave_request.created', 'id': 10, 'employee_id': EMPLOYEE})
+        assert await received(stream) == [encode_event('leave_request.created', {'id': 10, 'employee_id': EMPLOYEE})]
+    asyncio.run(scenario())
+
+
+def test_connection_limit():
+    broker = broker_with([], max_connections=2)
+
+    async def scenario():
+        first = broker.register(EMPLOYEE, 'employee')
+        assert not broker.full
+        broker.register(HR, 'hr_manager')
+        assert broker.full
+        broker.unregister(first)
+        broker.unregister(first)
+        assert not broker.full and broker.stats()['connections'] == 1
+    asyncio.run(scenario())
+
+
+def test_events_endpoint_limit(client, employee, monkeypatch):
+    import main
+    assert client.get('/events').status_code == 401
+    monkeypatch.setattr(main.event_broker, '_max_connections', 0)
+    response = client.get('/events', headers=employee)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
+    token = employee['Authorization'].split()[1]
+    assert client.get('/events', params={'token': token}).status_code == 503
+
+
+def test_no_event_for_a_failed_write(database):
+    events = []
+    database.add_event_listener(events.append)
+
+    @write_operation
+    def create_then_fail(database):
+        database.create_leave_request(EMPLOYEE, 'e@x.com', 'conge', '2031-01-06', '2031-01-06', 'r', 1)
+        raise RuntimeError('failed after the insert')
+
+    with pytest.raises(RuntimeError):
+        create_then_fail(database)
+    assert events == [] and database.leave_requests.all() == []
+
+    @write_operation
+    def inner_fails(database):
+        try:
+            create_then_fail(database)
+        except RuntimeError:
+            pass
+        return database.create_leave_request(EMPLOYEE, 'e@x.com', 'conge', '2031-01-07', '2031-01-07', 'r', 1)
+
+    # The failed nested operation is undone with its events, the outer one is published
+    request_id = inner_fails(database)
+    assert [(event['type'], event['id']) for event in events] == [('leave_request.created', request_id)]
+    assert [request.doc_id for request in database.leave_requests.all()] == [request_id]
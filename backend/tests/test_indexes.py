@@ -0,0 +1,67 @@
+"""In-memory hash indexes (IndexedTable) against plain scans."""
+import random
+from indexes import IndexedTable
+from tests.conftest import open_database
+
+
+def test_random_workload_matches_scan(tmp_path):
+    database = open_database(tmp_path, 'tinydb')
+    acls = database.document_acls
+    assert isinstance(acls, IndexedTable)
+    rng = random.Random(2)
+    ids = []
+    for _ in range(400):
+        op = rng.random()
+        if op < 0.5 or not ids:
+            ids.append(database.create_document_acl(
+                rng.randint(1, 5), rng.randint(1, 5), 'e', ['read'], False, 1, 'e', True
+            ))
+        elif op < 0.75:
+            acls.update({'user_id': rng.randint(1, 5)}, [rng.choice(ids)])
+        elif op < 0.85:
+            acls.update_many({rng.choice(ids): {'document_id': rng.randint(1, 5)}})
+        else:
+            database.delete_document_acl(ids.pop(rng.randrange(len(ids))))
+    assert database.verify_indexes() == []
+
+    everything = acls.all()
+    for document_id in range(1, 6):
+        for user_id in range(1, 6):
+            naive = [acl.doc_id for acl in everything
+                     if acl['document_id'] == document_id and acl['user_id'] == user_id]
+            assert [acl.doc_id for acl in acls.find(document_id=document_id, user_id=user_id)] == naive
+        naive = [acl.doc_id for acl in everything if acl['user_id'] == document_id]
+        assert [acl.doc_id for acl in acls.find(user_id=document_id)] == naive
+    assert [acl.doc_id for acl in acls.find_in('user_id', [1, 3])] == [
+        acl.doc_id for acl in everything if acl['user_id'] in (1, 3)
+    ]
+    database.close()
+
+
+def test_rebuilt_after_reload(tmp_path):
+    database = open_database(tmp_path, 'tinydb')
+    uid = database.create_user('a@x.com', 'hash', 'employee')
+    # Simulate a write by another process: the engine reloads and bumps its generation
+    database.users._table.update({'email': 'b@x.com'}, [uid])
+    database.engine.generation += 1
+    assert database.get_user_by_email('a@x.com') is None
+    assert database.get_user_by_email('b@x.com').doc_id == uid
+    assert database.verify_indexes() == []
+    database.close()
+
+
+def test_truncate_clears_indexes(tmp_path):
+    database = open_database(tmp_path, 'tinydb')
+    database.create_user('a@x.com', 'hash', 'employee')
+    database.users.truncate()
+    assert database.get_user_by_email('a@x.com') is None
+    assert database.verify_indexes() == []
+    database.close()
+
+
+def test_verify_reports_stale_index(tmp_path):
+    database = open_database(tmp_path, 'tinydb')
+    database.create_user('a@x.com', 'hash', 'employee')
+    database.users._indexes[0].entries.clear()
+    assert database.verify_indexes()
+    database.close()
@@ -0,0 +1,54 @@
+"""Leave calendar (IntervalIndex) against a full-table date filter."""
+import random
+import pytest
+from tests.conftest import open_database
+from tests.test_views import FIRST_DAY, STATUSES, day, create, prune_change_log, random_workload
+
+
+def naive_between(database, first: str, last: str) -> list:
+    return [
+        request.doc_id for request in database.leave_requests.all()
+        if request['start_date'] <= last and request['end_date'] >= first
+    ]
+
+
+def check_calendar(database, rng: random.Random):
+    for _ in range(5):
+        first = FIRST_DAY + rng.randrange(120)
+        last = first + rng.randrange(30)
+        assert [r.doc_id for r in database.get_leave_requests_between(day(first), day(last))] == \
+            naive_between(database, day(first), day(last))
+
+
+def test_random_workload_matches_full_filter(database):
+    random_workload(database, random.Random(22), 400, check_calendar)
+    # Deletions were pruned from the change log while the calendar followed it
+    assert database.get_pruned_revision() > 0
+
+
+@pytest.mark.parametrize('backend', ['tinydb', 'sqlite'])
+def test_calendar_follows_another_worker(tmp_path, backend):
+    # Two Database objects on one file behave as two worker processes
+    first, second = open_database(tmp_path, backend), open_database(tmp_path, backend)
+    try:
+        rng = random.Random(22)
+        for _ in range(30):
+            create(first, rng, rng.randint(1, 3))
+        check_calendar(first, rng)
+
+        reused = 0
+        for _ in range(20):
+            ids = [request.doc_id for request in second.leave_requests.all()]
+            victim = max(ids)
+            second.delete_leave_request(victim)
+            # TinyDB numbers from the largest ID it reads from the file: the victim's may come back
+            reused += create(second, rng, rng.randint(1, 3)) == victim
+            second.update_leave_request_status(rng.choice(ids[:-1]), rng.choice(STATUSES), None)
+            check_calendar(first, rng)
+        assert reused or backend == 'sqlite'
+        prune_change_log(second)
+        second.delete_leave_request(min(ids))
+        check_calendar(first, rng)
+    finally:
+        second.close()
+        first.close()
@@ -0,0 +1,98 @@
+"""Ephemeral DH keypairs pre-generated by KeypairPool."""
+import asyncio
+import threading
+import time
+import pytest
+from dh import KeypairPool, ModpGroup
+from security import generate_dh_parameters
+from tests.conftest import handshake
+
+P, G = generate_dh_parameters()
+
+
+@pytest.fixture(scope='module')
+def group():
+    return ModpGroup(P, G, exponent_bits=256)
+
+
+def wait_for_depth(pool: KeypairPool, depth: int, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while pool.stats()['depth'] < depth:
+        assert time.monotonic() < deadline, pool.stats()
+        time.sleep(0.05)
+
+
+def test_background_refill(group):
+    pool = KeypairPool(group, size=8, refill_threshold=2, workers=1)
+    try:
+        wait_for_depth(pool, 8)
+        pairs = [pool.take() for _ in range(6)]
+        stats = pool.stats()
+        assert stats['hits'] == 6 and stats['misses'] == 0
+        # Depth fell to the threshold: a refill is on its way
+        assert stats['depth'] + stats['in_flight'] == 8
+        for private_key, public_key in pairs:
+            assert public_key == pow(G, private_key, P)
+            assert private_key.bit_length() == 256
+        assert len({private_key for private_key, _ in pairs}) == 6
+        wait_for_depth(pool, 8)
+        assert pool.stats()['generated'] >= 14
+    finally:
+        pool.close()
+
+
+def test_inline_when_disabled(group):
+    pool = KeypairPool(group, size=0, refill_threshold=0, workers=1)
+    private_key, public_key = pool.take()
+    assert public_key == pow(G, private_key, P)
+    assert pool.stats()['misses'] == 1 and pool.stats()['miss_rate'] == 1.0
+    assert pool._executor is None
+    pool.close()
+
+
+def test_inline_after_close(group):
+    pool = KeypairPool(group, size=4, refill_threshold=1, workers=1)
+    pool.close()
+    private_key, public_key = pool.take()
+    assert public_key == pow(G, private_key, P)
+    assert pool.stats()['misses'] == 1
+
+
+def test_pairs_handed_out_once(group):
+    pool = KeypairPool(group, size=32, refill_threshold=8, workers=1)
+    try:
+        wait_for_depth(pool, 32)
+        taken = []
+        def take(count: int):
+            for _ in range(count):
+                taken.append(pool.take())
+        threads = [threading.Thread(target=take, args=(10,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(taken) == 40
+        assert len({private_key for private_key, _ in taken}) == 40
+        assert pool.stats()['taken'] == 40
+    finally:
+        pool.close()
+
+
+def test_handshake_off_the_event_loop(client, employee, monkeypatch):
+    # The pool is disabled in the tests (DH_KEYPAIR_POOL_SIZE=0): every pair is generated inline
+    import main
+    on_loop = []
+
+    def spy(func):
+        def wrapper(*args):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(func.__name__)
+            except RuntimeError:
+                pass
+            return func(*args)
+        return wrapper
+    monkeypatch.setattr(main, 'generate_dh_keypair', spy(main.generate_dh_keypair))
+    monkeypatch.setattr(main, 'calculate_dh_shared_secret', spy(main.calculate_dh_shared_secret))
+    assert len(handshake(client, employee)) == 32
+    assert on_loop == []
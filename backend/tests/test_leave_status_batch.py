@@ -0,0 +1,79 @@
+"""PUT /leave-requests/status-batch."""
+from tests.conftest import grant
+
+UNKNOWN = 10 ** 7
+
+
+def create_requests(client, employee, days) -> list:
+    ids = []
+    for day in days:
+        response = client.post('/leave-requests', headers=employee, json={
+            'type': 'conge', 'start_date': day, 'end_date': day, 'reason': 'r', 'days_count': 1
+        })
+        assert response.status_code == 200, response.text
+        ids.append(response.json()['request_id'])
+    return ids
+
+
+def status_batch(client, headers: dict, updates: list):
+    return client.put('/leave-requests/status-batch', headers=headers, json={'updates': updates})
+
+
+def test_results_in_request_order(client, employee, hr):
+    import main
+    first, second, third = create_requests(client, employee, ('2033-05-02', '2033-05-03', '2033-05-04'))
+    response = status_batch(client, hr, [
+        {'id': first, 'status': 'approved', 'hr_comment': 'ok'},
+        {'id': UNKNOWN, 'status': 'approved'},
+        {'id': second, 'status': 'rejected'},
+        {'id': first, 'status': 'rejected'},
+    ])
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body['updated'], body['failed']) == (2, 2)
+    assert [(result['id'], result['status'], result['error'] is not None) for result in body['results']] == [
+        (first, 'approved', False), (UNKNOWN, None, True), (second, 'rejected', False), (first, None, True)
+    ]
+
+    requests = [main.adb.sync.get_leave_request(request_id) for request_id in (first, second, third)]
+    # The repeated ID was not applied
+    assert [request['status'] for request in requests] == ['approved', 'rejected', 'pending']
+    assert requests[0]['hr_comment'] == 'ok'
+    # One instant for the whole batch
+    assert requests[0]['updated_at'] == requests[1]['updated_at']
+
+    # The HR view and the leave counters follow
+    approved = {request['id'] for request in client.get('/leave-requests/all', headers=hr,
+                                                        params={'status': 'approved'}).json()}
+    assert first in approved and second not in approved
+    assert main.adb.sync.verify_hr_leave_view() == []
+    assert main.adb.sync.verify_leave_stats() == []
+
+    response = status_batch(client, hr, [])
+    assert response.status_code == 200
+    assert response.json() == {'updated': 0, 'failed': 0, 'results': []}
+    assert client.delete(f'/leave-requests/{third}', headers=employee).status_code == 200
+
+
+def test_rights(client, employee, hr, delegate):
+    [request_id] = create_requests(client, employee, ('2033-06-06',))
+    update = [{'id': request_id, 'status': 'approved'}]
+    assert status_batch(client, employee, update).status_code == 403
+    assert status_batch(client, delegate, update).status_code == 403
+    with grant(['view_requests']):
+        assert status_batch(client, delegate, update).status_code == 403
+    with grant(['approve_leave']):
+        response = status_batch(client, delegate, update)
+        assert response.status_code == 200, response.text
+        assert response.json()['updated'] == 1
+    assert status_batch(client, delegate, update).status_code == 403
+
+
+def test_batch_size_limit(client, hr, monkeypatch):
+    from config import settings
+    monkeypatch.setattr(settings, 'LEAVE_STATUS_BATCH_MAX_SIZE', 2)
+    updates = [{'id': UNKNOWN + index, 'status': 'approved'} for index in range(3)]
+    assert status_batch(client, hr, updates).status_code == 400
+    response = status_batch(client, hr, updates[:2])
+    assert response.status_code == 200
+    assert response.json()['failed'] == 2
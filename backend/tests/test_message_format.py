@@ -0,0 +1,202 @@
+"""Versioned AES-GCM message blobs and the legacy CBC format."""
+import base64
+import json
+import os
+import pytest
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from security import (
+    DecryptionError, MESSAGE_FORMAT_GCM, GCM_NONCE_SIZE, GCM_TAG_SIZE,
+    encrypt_bytes, decrypt_bytes, is_message_blob, aes_encrypt, aes_decrypt, find_incompatible_messages,
+    MessageKey, SessionKeyManager, derive_aes_key_from_secret
+)
+from tests.conftest import handshake
+
+KEY = bytes(range(32))
+OTHER_KEY = bytes(range(1, 33))
+
+
+def cbc_encrypt(plaintext: str, key: bytes) -> tuple:
+    """Legacy format 1, as the old clients produced it."""
+    iv = os.urandom(16)
+    data = plaintext.encode('utf-8')
+    padding = 16 - len(data) % 16
+    encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+    encrypted = encryptor.update(data + bytes([padding]) * padding) + encryptor.finalize()
+    return base64.b64encode(encrypted).decode(), base64.b64encode(iv).decode()
+
+
+def test_blob_layout():
+    blob = encrypt_bytes(b'hello', KEY)
+    assert blob[0] == MESSAGE_FORMAT_GCM
+    assert len(blob) == 1 + GCM_NONCE_SIZE + len(b'hello') + GCM_TAG_SIZE
+    assert is_message_blob(blob)
+    # The version byte is the associated data of AES-256-GCM
+    nonce = blob[1:1 + GCM_NONCE_SIZE]
+    assert AESGCM(KEY).decrypt(nonce, blob[1 + GCM_NONCE_SIZE:], bytes([MESSAGE_FORMAT_GCM])) == b'hello'
+    assert decrypt_bytes(blob, KEY) == b'hello'
+    assert encrypt_bytes(b'hello', KEY) != blob
+
+
+@pytest.mark.parametrize('position', [0, 1, 1 + GCM_NONCE_SIZE, -1])
+def test_tampering_is_detected(position):
+    blob = bytearray(encrypt_bytes(b'hello world', KEY))
+    blob[position] ^= 0x01
+    with pytest.raises(DecryptionError):
+        decrypt_bytes(bytes(blob), KEY)
+
+
+def test_wrong_key_truncation_and_version():
+    blob = encrypt_bytes(b'hello', KEY)
+    with pytest.raises(DecryptionError, match='authentification'):
+        decrypt_bytes(blob, OTHER_KEY)
+    with pytest.raises(DecryptionError, match='tronqué'):
+        decrypt_bytes(blob[:1 + GCM_NONCE_SIZE + GCM_TAG_SIZE - 1], KEY)
+    with pytest.raises(DecryptionError, match='Version'):
+        decrypt_bytes(b'\x07' + blob[1:], KEY)
+    assert not is_message_blob(b'\x07' + blob[1:])
+    assert not is_message_blob(blob[:20])
+
+
+def test_string_api_and_legacy_cbc():
+    encrypted, iv = aes_encrypt('{"a": "é"}', KEY)
+    assert iv == ''
+    assert aes_decrypt(encrypted, iv, KEY) == '{"a": "é"}'
+    assert aes_decrypt(base64.b64decode(encrypted), '', KEY) == '{"a": "é"}'
+
+    encrypted, iv = cbc_encrypt('{"legacy": true}', KEY)
+    assert aes_decrypt(encrypted, iv, KEY) == '{"legacy": true}'
+    with pytest.raises(DecryptionError):
+        json.loads(aes_decrypt(encrypted, iv, OTHER_KEY))
+    with pytest.raises(DecryptionError, match='Base64'):
+        aes_decrypt('not base64!', 'AAAA', KEY)
+
+
+def test_find_incompatible_messages():
+    good_gcm, _ = aes_encrypt('{"ok": 1}', KEY)
+    bad_gcm, _ = aes_encrypt('{"ok": 2}', OTHER_KEY)
+    good_cbc = cbc_encrypt('{"ok": 3}', KEY)
+    bad_cbc = cbc_encrypt('{"ok": 4}', OTHER_KEY)
+    not_json, _ = aes_encrypt('plain text', KEY)
+    messages = [
+        (1, good_gcm, ''), (2, bad_gcm, ''), (3, *good_cbc), (4, *bad_cbc),
+        (5, not_json, ''), (6, base64.b64decode(good_gcm), ''),
+    ]
+    assert find_incompatible_messages(messages, KEY) == [2, 4, 5]
+
+
+def test_session_keys_carry_their_cipher():
+    keys = SessionKeyManager(max_size=2, ttl_seconds=60)
+    session = {'user_id': 7, 'epoch': 1, 'shared_secret': hex(123456789)}
+    key = keys.get_key(session)
+    assert isinstance(key, MessageKey) and bytes(key) == derive_aes_key_from_secret(123456789)
+    assert keys.get_key(session) is key
+    blob = encrypt_bytes(b'hello', key)
+    assert decrypt_bytes(blob, bytes(key)) == b'hello'
+
+    # Invalidation wipes the key and its context, copies stay usable
+    copy = bytes(key)
+    keys.invalidate_user(7)
+    assert key.cipher is None and key == bytearray(32)
+    assert decrypt_bytes(blob, copy) == b'hello'
+    with pytest.raises(DecryptionError):
+        decrypt_bytes(blob, key)
+
+    # Eviction wipes too
+    first = keys.get_key({**session, 'epoch': 2})
+    keys.get_key({**session, 'user_id': 8})
+    keys.get_key({**session, 'user_id': 9})
+    assert first.cipher is None and not any(first)
+
+
+def test_decrypt_endpoint(client, employee, hr):
+    key = handshake(client, employee)
+
+    def send(encrypted_content: str, iv: str = '') -> int:
+        response = client.post('/requests/leave', headers=employee, json={'encrypted_content': encrypted_content, 'iv': iv})
+        assert response.status_code == 200, response.text
+        return response.json()['message_id']
+
+    sent = [send(aes_encrypt('{"t": "gcm"}', key)[0]), send(*cbc_encrypt('{"t": "cbc"}', key))]
+    for message_id, expected in zip(sent, ('gcm', 'cbc')):
+        response = client.post(f'/messages/{message_id}/decrypt', headers=hr)
+        assert response.status_code == 200, response.text
+        assert response.json()['decrypted_content'] == {'t': expected}
+
+    wrong = send(aes_encrypt('{"t": "x"}', OTHER_KEY)[0])
+    tampered = bytearray(base64.b64decode(aes_encrypt('{"t": "x"}', key)[0]))
+    tampered[-1] ^= 1
+    tampered = send(base64.b64encode(bytes(tampered)).decode())
+    for message_id in (wrong, tampered):
+        assert client.post(f'/messages/{message_id}/decrypt', headers=hr).status_code == 400
+
+    response = client.post('/requests/leave', headers=employee, json={'encrypted_content': 'AAAA', 'iv': ''})
+    assert response.status_code == 400
+    for message_id in sent + [wrong, tampered]:
+        assert client.delete(f'/messages/{message_id}', headers=hr).status_code == 200
+
+
+def test_decrypt_batch_survives_session_rotation(client, employee, hr, monkeypatch):
+    import main
+    from config import settings
+    from tests.conftest import HR
+    key = handshake(client, employee)
+    sent = [
+        client.post('/requests/leave', headers=employee,
+                    json={'encrypted_content': aes_encrypt(json.dumps({'n': n}), key)[0], 'iv': ''}).json()['message_id']
+        for n in range(8)
+    ]
+
+    # One message per chunk, two chunks in flight: most are decrypted after the rotation
+    monkeypatch.setattr(settings, 'MESSAGE_DECRYPT_CHUNK_SIZE', 1)
+    monkeypatch.setattr(main, 'message_decrypt_workers', 1)
+    hr_id = main.adb.sync.get_user_by_email(HR[0]).doc_id
+    decrypt_chunk = main._decrypt_message_chunk
+    rotated = []
+
+    def rotate_then_decrypt(chunk, aes_key):
+        if not rotated:
+            # New secret for HR: the cached key of the old epoch is wiped
+            main.adb.sync.update_session_secret(hr_id, hex(123456789))
+            rotated.append(True)
+        return decrypt_chunk(chunk, aes_key)
+    monkeypatch.setattr(main, '_decrypt_message_chunk', rotate_then_decrypt)
+
+    response = client.post('/messages/decrypt-batch', headers=hr, json={'message_ids': sent})
+    assert response.status_code == 200, response.text
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert rotated
+    assert [line.get('decrypted_content') for line in lines[:-1]] == [{'n': n} for n in range(8)]
+    assert lines[-1]['summary'] == {'total': 8, 'decrypted': 8, 'failed': 0}
+    for message_id in sent:
+        assert client.delete(f'/messages/{message_id}', headers=hr).status_code == 200
+
+
+def test_decrypt_all_unread_is_capped(client, employee, hr, monkeypatch):
+    import main
+    from config import settings
+    from tests.conftest import HR
+    hr_id = main.adb.sync.get_user_by_email(HR[0]).doc_id
+    # Left unread by other tests
+    main.adb.sync.mark_messages_decrypted([m.doc_id for m in main.adb.sync.get_unread_messages_for_user(hr_id)])
+    key = handshake(client, employee)
+    sent = [
+        client.post('/requests/leave', headers=employee,
+                    json={'encrypted_content': aes_encrypt(json.dumps({'n': n}), key)[0], 'iv': ''}).json()['message_id']
+        for n in range(5)
+    ]
+    monkeypatch.setattr(settings, 'MESSAGE_DECRYPT_BATCH_MAX_SIZE', 3)
+
+    response = client.post('/messages/decrypt-batch', headers=hr, json={'all_unread': True})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    # The oldest ones
+    assert [line['message_id'] for line in lines[:-1]] == sent[:3]
+    assert lines[-1]['summary'] == {'total': 3, 'decrypted': 3, 'failed': 0, 'more_unread': True}
+    assert [m.doc_id for m in main.adb.sync.get_unread_messages_for_user(hr_id)] == sent[3:]
+
+    response = client.post('/messages/decrypt-batch', headers=hr, json={'all_unread': True})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line['message_id'] for line in lines[:-1]] == sent[3:]
+    assert lines[-1]['summary'] == {'total': 2, 'decrypted': 2, 'failed': 0, 'more_unread': False}
+    for message_id in sent:
+        assert client.delete(f'/messages/{message_id}', headers=hr).status_code == 200
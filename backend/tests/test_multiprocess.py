@@ -0,0 +1,61 @@
+"""Several worker processes sharing one database lose no update."""
+import os
+import subprocess
+import sys
+import textwrap
+import time
+import pytest
+from tests.conftest import open_database
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROCESSES = 4
+ROUNDS = 50
+SHARED_USER = 1
+
+# Read-modify-write of shared rows: the failed login counters and the epoch
+# of one DH session, bumped by every store_session()
+WORKER_SCRIPT = textwrap.dedent('''
+    import os, sys, time
+    sys.path.insert(0, {backend_dir!r})
+    from database import Database
+    database = Database({path!r}, {backend!r})
+    while not os.path.exists({go!r}):
+        time.sleep(0.001)
+    for i in range({rounds}):
+        database.record_login_attempt(f'shared{{i % 3}}@x.com', False)
+        database.store_session({user}, '0x1', hex(i))
+    database.close()
+''')
+
+
+# The WAL engine is single-process by design
+@pytest.mark.parametrize('backend', ['tinydb', 'sqlite'])
+def test_concurrent_increments(tmp_path, backend):
+    name = 'db.sqlite3' if backend == 'sqlite' else 'db.json'
+    path = str(tmp_path / name)
+    go = str(tmp_path / 'go')
+    script = WORKER_SCRIPT.format(
+        backend_dir=BACKEND_DIR, path=path, backend=backend, go=go, rounds=ROUNDS, user=SHARED_USER
+    )
+    # The global Database of each worker must not share the test database
+    env = dict(os.environ, DATABASE_BACKEND=backend, DATABASE_PATH=str(tmp_path / 'global.json'))
+    workers = [
+        subprocess.Popen([sys.executable, '-c', script], env=env, stderr=subprocess.PIPE)
+        for _ in range(PROCESSES)
+    ]
+    # Start them together once every worker has opened the database
+    time.sleep(1)
+    open(go, 'w').close()
+    for worker in workers:
+        _, stderr = worker.communicate(timeout=120)
+        assert worker.returncode == 0, stderr.decode()
+
+    database = open_database(tmp_path, backend)
+    counts = [database.login_attempts.find_one(email=f'shared{k}@x.com')['failed_count'] for k in range(3)]
+    assert sum(counts) == PROCESSES * ROUNDS
+    sessions = database.sessions.find(user_id=SHARED_USER)
+    assert len(sessions) == 1
+    assert sessions[0]['epoch'] == PROCESSES * ROUNDS
+    assert database.verify_indexes() == []
+    database.close()
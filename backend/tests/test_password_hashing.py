@@ -0,0 +1,49 @@
+"""bcrypt on the bounded hashing pool."""
+import asyncio
+import threading
+import security
+from security import PasswordHashingBusy, get_password_hash_async, verify_password_async
+from tests.conftest import EMPLOYEE
+
+
+def test_hash_and_verify_off_the_event_loop():
+    async def scenario():
+        ticks = 0
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+        task = asyncio.create_task(ticker())
+        hashed = await get_password_hash_async('secret')
+        valid = await verify_password_async('secret', hashed)
+        invalid = await verify_password_async('wrong', hashed)
+        task.cancel()
+        return valid, invalid, ticks
+    valid, invalid, ticks = asyncio.run(scenario())
+    assert valid and not invalid
+    # bcrypt takes hundreds of milliseconds: the loop ran meanwhile
+    assert ticks >= 5
+
+
+def test_busy_beyond_max_pending(monkeypatch):
+    monkeypatch.setattr(security, '_password_hash_slots', threading.BoundedSemaphore(2))
+
+    async def scenario():
+        return await asyncio.gather(
+            *(get_password_hash_async('secret') for _ in range(5)), return_exceptions=True
+        )
+    results = asyncio.run(scenario())
+    assert sum(isinstance(result, PasswordHashingBusy) for result in results) == 3
+    assert sum(isinstance(result, str) for result in results) == 2
+    # Slots are given back once the hashes are done
+    assert asyncio.run(get_password_hash_async('secret'))
+
+
+def test_login_answers_503_when_busy(client, monkeypatch):
+    monkeypatch.setattr(security, '_password_hash_slots', threading.BoundedSemaphore(1))
+    assert security._password_hash_slots.acquire(blocking=False)
+    email, password = EMPLOYEE
+    response = client.post('/auth/login', json={'email': email, 'password': password})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
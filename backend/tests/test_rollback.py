@@ -0,0 +1,149 @@
+"""A transaction that raises leaves no trace, in memory, on disk and in the indexes."""
+import pytest
+from tests.conftest import open_database
+from tests.test_storage import open_engine
+
+
+class Boom(Exception):
+    pass
+
+
+def contents(table) -> dict:
+    return {document.doc_id: dict(document) for document in table.all()}
+
+
+def test_rollback_restores_every_write(engine):
+    table = engine.table('items', ['kind'])
+    other = engine.table('others')
+    ids = table.insert_many([{'kind': 'a', 'n': i} for i in range(4)])
+    other.insert({'x': 1})
+    before, other_before = contents(table), contents(other)
+
+    with pytest.raises(Boom):
+        with engine.transaction():
+            table.insert({'kind': 'new'})
+            table.update({'kind': 'b'}, ids[:2])
+            table.update_many({ids[2]: {'n': 20}})
+            table.remove([ids[3]])
+            other.truncate()
+            other.insert({'x': 2})
+            raise Boom()
+    assert not engine.in_transaction
+    assert contents(table) == before and contents(other) == other_before
+    assert [item.doc_id for item in table.find(kind='a')] == ids
+
+    # The engine keeps working, with fresh IDs
+    with engine.transaction():
+        doc_id = table.insert({'kind': 'c'})
+    assert table.get(doc_id)['kind'] == 'c' and len(table) == 5
+
+
+def test_rollback_is_durable(tmp_path, backend):
+    engine = open_engine(tmp_path, backend)
+    table = engine.table('items')
+    kept = table.insert({'n': 1})
+    with pytest.raises(Boom):
+        with engine.transaction():
+            table.update({'n': 2}, [kept])
+            table.insert({'n': 3})
+            raise Boom()
+    table.insert({'n': 4})
+    engine.close()
+
+    engine = open_engine(tmp_path, backend)
+    assert [item['n'] for item in engine.table('items').all()] == [1, 4]
+    engine.close()
+
+
+def test_failed_write_operation_leaves_no_trace(tmp_path, backend, monkeypatch):
+    from config import settings
+    monkeypatch.setattr(settings, 'WRITE_BATCH_WINDOW_MS', 0)
+    database = open_database(tmp_path, backend)
+    uid = database.create_user('a@x.com', 'hash', 'employee')
+    request = database.create_leave_request(uid, 'a@x.com', 'conge', '2024-01-01', '2024-01-03', 'r', 3)
+    revision = database.get_changes('leave_requests', 0, 100)
+
+    def fail(changes):
+        raise Boom()
+    # The status, the change log and the HR view are written before the counters fail
+    monkeypatch.setattr(database.leave_stats, 'apply_many', fail)
+    with pytest.raises(Boom):
+        database.update_leave_request_status(request, 'approved', 'ok')
+    with pytest.raises(Boom):
+        database.create_leave_request(uid, 'a@x.com', 'absence', '2024-02-01', '2024-02-01', 'r', 1)
+    monkeypatch.undo()
+
+    assert [r.doc_id for r in database.get_leave_requests_by_employee(uid)] == [request]
+    assert database.get_leave_request(request)['status'] == 'pending'
+    assert database.get_changes('leave_requests', 0, 100) == revision
+    assert database.verify_indexes() == []
+    assert database.verify_hr_leave_view() == []
+    assert database.verify_leave_stats() == []
+    database.close()
+
+
+def test_savepoint_undoes_only_its_writes(tmp_path, backend):
+    engine = open_engine(tmp_path, backend)
+    table = engine.table('items', ['kind'])
+    kept = table.insert({'kind': 'a', 'n': 0})
+    with engine.transaction():
+        outer = table.insert({'kind': 'a', 'n': 1})
+        with pytest.raises(Boom):
+            with engine.savepoint():
+                table.insert({'kind': 'b', 'n': 2})
+                table.update({'kind': 'b'}, [kept])
+                with engine.savepoint():
+                    table.remove([outer])
+                raise Boom()
+        with pytest.raises(Boom):
+            with engine.savepoint():
+                table.truncate()
+                raise Boom()
+        with engine.savepoint():
+            table.update_many({outer: {'n': 3}})
+        assert contents(table) == {kept: {'kind': 'a', 'n': 0}, outer: {'kind': 'a', 'n': 3}}
+    assert [item.doc_id for item in table.find(kind='a')] == [kept, outer]
+    assert table.find(kind='b') == []
+    engine.close()
+
+    engine = open_engine(tmp_path, backend)
+    assert [item['n'] for item in engine.table('items').all()] == [0, 3]
+    engine.close()
+
+
+def test_failed_write_leaves_the_rest_of_the_batch(tmp_path, backend, monkeypatch):
+    from config import settings
+    with monkeypatch.context() as patch:
+        # Long enough for both writes to share one batch
+        patch.setattr(settings, 'WRITE_BATCH_WINDOW_MS', 500)
+        database = open_database(tmp_path, backend)
+    uid = database.create_user('a@x.com', 'hash', 'employee')
+    request = database.create_leave_request(uid, 'a@x.com', 'conge', '2024-01-01', '2024-01-03', 'r', 3)
+    batches = database.batcher.stats()['batches']
+
+    def fail(changes):
+        raise Boom()
+    with monkeypatch.context() as patch:
+        patch.setattr(database.leave_stats, 'apply_many', fail)
+        with pytest.raises(Boom):
+            database.update_leave_request_status(request, 'approved', 'ok')
+    other = database.create_user('b@x.com', 'hash', 'employee')
+    assert database.batcher.stats()['batches'] == batches + 1
+
+    assert database.get_leave_request(request)['status'] == 'pending'
+    assert database.verify_indexes() == []
+    assert database.verify_hr_leave_view() == []
+    assert database.verify_leave_stats() == []
+    database.close()
+
+    database = open_database(tmp_path, backend)
+    assert database.get_leave_request(request)['status'] == 'pending'
+    assert database.get_user_by_email('b@x.com').doc_id == other
+    database.close()
+
+
+@pytest.fixture
+def engine(tmp_path, backend):
+    engine = open_engine(tmp_path, backend)
+    yield engine
+    engine.close()
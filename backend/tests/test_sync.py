@@ -0,0 +1,191 @@
+"""Incremental sync of the list endpoints (?since=): tombstones, lost visibility, expired cursors."""
+import pytest
+from tests.conftest import ADMIN, HR, EMPLOYEE, open_database
+from tests.test_views import prune_change_log
+
+OTHER_EMPLOYEE = 10 ** 6
+
+
+@pytest.fixture
+def server(client, admin, hr, employee, tmp_path, backend, monkeypatch):
+    """The app on an empty Database of each engine, holding the default users under their IDs."""
+    import main
+    from database import AsyncDatabase
+    database = open_database(tmp_path, backend)
+    for email, _ in (ADMIN, HR, EMPLOYEE):
+        user = main.adb.sync.get_user_by_email(email)
+        assert database.create_user(email, 'hash', user['role']) == user.doc_id
+    monkeypatch.setattr(main, 'adb', AsyncDatabase(database))
+    yield database
+    main.adb.close()
+
+
+def user_id(database, credentials: tuple) -> int:
+    return database.get_user_by_email(credentials[0]).doc_id
+
+
+def sync(client, headers: dict, path: str, since: str = '0', **params) -> tuple:
+    """(rows, X-Sync-Cursor) of one ?since= call."""
+    response = client.get(path, headers=headers, params={'since': since, **params})
+    assert response.status_code == 200, response.text
+    return response.json(), response.headers['X-Sync-Cursor']
+
+
+def ids(rows: list) -> set:
+    return {row['id'] for row in rows if not row.get('deleted')}
+
+
+def tombstones(rows: list) -> set:
+    return {row['id'] for row in rows if row.get('deleted')}
+
+
+def create_request(database, employee_id: int, day: str) -> tuple:
+    request_id = database.create_leave_request(employee_id, f'{employee_id}@x.com', 'conge', day, day, 'r', 1)
+    return request_id, database.create_communication_auth(request_id, employee_id, f'{employee_id}@x.com')
+
+
+def test_leave_requests(server, client, hr, employee):
+    employee_id = user_id(server, EMPLOYEE)
+    first, _ = create_request(server, employee_id, '2031-01-06')
+    second, second_auth = create_request(server, employee_id, '2031-01-07')
+    other, _ = create_request(server, OTHER_EMPLOYEE, '2031-01-08')
+
+    rows, hr_cursor = sync(client, hr, '/leave-requests/all')
+    assert ids(rows) == {first, second, other} and not tombstones(rows)
+    rows, employee_cursor = sync(client, employee, '/leave-requests/my-requests')
+    assert ids(rows) == {first, second} and not tombstones(rows)
+
+    # A rejected authorization hides the request from HR only
+    server.update_communication_auth_status(second_auth, 'rejected')
+    rows, hr_cursor = sync(client, hr, '/leave-requests/all', hr_cursor)
+    assert rows == [{'id': second, 'deleted': True}]
+    rows, employee_cursor = sync(client, employee, '/leave-requests/my-requests', employee_cursor)
+    assert ids(rows) == {second} and not tombstones(rows)
+
+    # Deletions: HR forgets every request, the employee only theirs
+    server.delete_leave_request(first)
+    server.delete_leave_request(other)
+    rows, hr_cursor = sync(client, hr, '/leave-requests/all', hr_cursor)
+    assert rows == [{'id': first, 'deleted': True}, {'id': other, 'deleted': True}]
+    rows, employee_cursor = sync(client, employee, '/leave-requests/my-requests', employee_cursor)
+    assert rows == [{'id': first, 'deleted': True}]
+
+    # Nothing new: the same cursor comes back
+    assert sync(client, hr, '/leave-requests/all', hr_cursor) == ([], hr_cursor)
+
+
+def test_leave_requests_by_status(server, client, hr):
+    employee_id = user_id(server, EMPLOYEE)
+    request_id, _ = create_request(server, employee_id, '2031-01-06')
+    rows, cursor = sync(client, hr, '/leave-requests/all', status='pending')
+    assert ids(rows) == {request_id}
+    # No longer pending: out of the filtered list
+    server.update_leave_request_status(request_id, 'approved', 'ok')
+    rows, _ = sync(client, hr, '/leave-requests/all', cursor, status='pending')
+    assert rows == [{'id': request_id, 'deleted': True}]
+    rows, _ = sync(client, hr, '/leave-requests/all', cursor, status='approved')
+    assert ids(rows) == {request_id}
+
+
+def test_communication_auths(server, client, admin):
+    employee_id = user_id(server, EMPLOYEE)
+    _, first = create_request(server, employee_id, '2031-01-06')
+    _, second = create_request(server, employee_id, '2031-01-07')
+    rows, cursor = sync(client, admin, '/communication-auth/all')
+    assert ids(rows) == {first, second}
+    server.update_communication_auth_status(first, 'approved')
+    rows, cursor = sync(client, admin, '/communication-auth/all', cursor)
+    assert [(row['id'], row['status']) for row in rows] == [(first, 'approved')]
+
+
+def test_messages(server, client, admin, hr):
+    hr_id, admin_id = user_id(server, HR), user_id(server, ADMIN)
+    to_hr = server.store_message(admin_id, hr_id, b'\x02hr', '')
+    to_admin = server.store_message(hr_id, admin_id, b'\x02admin', '')
+    rows, hr_cursor = sync(client, hr, '/messages/received')
+    assert ids(rows) == {to_hr}
+    rows, admin_cursor = sync(client, admin, '/admin/messages')
+    assert ids(rows) == {to_hr, to_admin}
+
+    server.delete_messages([to_hr, to_admin])
+    # The receiver forgets their message, the admin every message
+    rows, _ = sync(client, hr, '/messages/received', hr_cursor)
+    assert rows == [{'id': to_hr, 'deleted': True}]
+    rows, _ = sync(client, admin, '/admin/messages', admin_cursor)
+    assert rows == [{'id': to_hr, 'deleted': True}, {'id': to_admin, 'deleted': True}]
+
+
+def test_documents(server, client, hr, employee):
+    hr_id, employee_id = user_id(server, HR), user_id(server, EMPLOYEE)
+    document = server.create_document(employee_id, EMPLOYEE[0], 'shared', 'c')
+    other = server.create_document(OTHER_EMPLOYEE, 'other@x.com', 'other', 'c')
+    acl = server.create_document_acl(document, hr_id, HR[0], ['read'], False, employee_id, EMPLOYEE[0], False)
+    body, hr_cursor = sync(client, hr, '/documents')
+    assert [row['id'] for row in body['shared_documents']] == [document]
+    body, employee_cursor = sync(client, employee, '/documents')
+    assert [row['id'] for row in body['owned_documents']] == [document]
+
+    # Revoked: HR must drop it, the owner still has it
+    server.delete_document_acl(acl)
+    body, hr_cursor = sync(client, hr, '/documents', hr_cursor)
+    assert body == {'owned_documents': [], 'shared_documents': [], 'deleted_documents': [document]}
+    body, employee_cursor = sync(client, employee, '/documents', employee_cursor)
+    assert [row['id'] for row in body['owned_documents']] == [document] and body['deleted_documents'] == []
+
+    # Shared again, then deleted: the owner and HR forget it, nobody else's
+    server.create_document_acl(document, hr_id, HR[0], ['read'], False, employee_id, EMPLOYEE[0], False)
+    body, hr_cursor = sync(client, hr, '/documents', hr_cursor)
+    assert [row['id'] for row in body['shared_documents']] == [document]
+    server.delete_document(document)
+    server.delete_document(other)
+    for headers, cursor in ((hr, hr_cursor), (employee, employee_cursor)):
+        body, _ = sync(client, headers, '/documents', cursor)
+        assert body == {'owned_documents': [], 'shared_documents': [], 'deleted_documents': [document]}
+
+
+def test_pages_of_changes(server, client, hr):
+    employee_id = user_id(server, EMPLOYEE)
+    created = {create_request(server, employee_id, f'2031-02-{day:02}')[0] for day in range(1, 8)}
+    seen, since = set(), '0'
+    while True:
+        response = client.get('/leave-requests/all', headers=hr, params={'since': since, 'limit': 3})
+        assert response.status_code == 200, response.text
+        assert len(response.json()) <= 3
+        seen |= ids(response.json())
+        since = response.headers['X-Sync-Cursor']
+        # A full page: more may follow from X-Next-Cursor, which is the sync cursor
+        if 'X-Next-Cursor' not in response.headers:
+            break
+        assert response.headers['X-Next-Cursor'] == since
+    assert seen == created
+    assert sync(client, hr, '/leave-requests/all', since) == ([], since)
+
+
+def test_expired_cursor(server, client, hr, employee):
+    employee_id = user_id(server, EMPLOYEE)
+    kept, _ = create_request(server, employee_id, '2031-01-06')
+    _, cursor = sync(client, hr, '/leave-requests/all')
+    deleted, _ = create_request(server, employee_id, '2031-01-07')
+    server.delete_leave_request(deleted)
+    # A later change: the newest revision is never pruned
+    server.update_leave_request_status(kept, 'approved', 'ok')
+    prune_change_log(server)
+    assert server.get_pruned_revision() > 0
+
+    for headers, path in ((hr, '/leave-requests/all'), (employee, '/leave-requests/my-requests')):
+        response = client.get(path, headers=headers, params={'since': cursor})
+        assert response.status_code == 410, response.text
+        # Reloading from 0 always works
+        rows, _ = sync(client, headers, path)
+        assert ids(rows) == {kept} and not tombstones(rows)
+
+
+def test_cursor_parameters(client, hr):
+    response = client.get('/leave-requests/all', headers=hr, params={'since': '0', 'cursor': 'x'})
+    assert response.status_code == 400
+    # A page cursor is not a sync cursor, nor the other way round
+    import main
+    page_cursor, sync_cursor = main._encode_cursor('p', 1), main._encode_cursor('s', 1)
+    assert client.get('/leave-requests/all', headers=hr, params={'since': page_cursor}).status_code == 400
+    assert client.get('/leave-requests/all', headers=hr, params={'cursor': sync_cursor}).status_code == 400
+    assert client.get('/leave-requests/all', headers=hr, params={'since': 'garbage'}).status_code == 400
@@ -0,0 +1,86 @@
+"""HR leave request view (views.py) against the naive full-table query."""
+import random
+from datetime import date, datetime, timedelta
+from intervals import OverlappingLeaveRequestError
+
+STATUSES = ('pending', 'approved', 'rejected')
+FIRST_DAY = date(2031, 1, 1).toordinal()
+
+
+def day(ordinal: int) -> str:
+    return date.fromordinal(ordinal).isoformat()
+
+
+def naive_hr_visible(database, status=None) -> list:
+    """Requests whose oldest authorization was not rejected."""
+    auths = {}
+    for auth in database.communication_auth.all():
+        auths.setdefault(auth['leave_request_id'], auth)
+    return [
+        request.doc_id for request in database.leave_requests.all()
+        if not (request.doc_id in auths and auths[request.doc_id]['status'] == 'rejected')
+        and (status is None or request['status'] == status)
+    ]
+
+
+def check_view(database, rng: random.Random):
+    for status in (None,) + STATUSES:
+        assert [r.doc_id for r in database.get_hr_visible_leave_requests(status)] == naive_hr_visible(database, status)
+    ids = [request.doc_id for request in database.leave_requests.all()]
+    sample = rng.sample(ids, min(len(ids), 5)) + [10 ** 6]
+    assert database.get_hr_visible_leave_request_ids(sample) == set(naive_hr_visible(database)) & set(sample)
+    assert database.verify_hr_leave_view() == []
+
+
+def create(database, rng: random.Random, employee_id: int):
+    first = FIRST_DAY + rng.randrange(120)
+    last = first + rng.randrange(10)
+    try:
+        return database.create_leave_request(
+            employee_id, f'e{employee_id}@x.com', rng.choice(('conge', 'absence')),
+            day(first), day(last), 'r', last - first + 1
+        )
+    except OverlappingLeaveRequestError:
+        return None
+
+
+def prune_change_log(database):
+    """Drop every tombstone of the change log, as the retention period would."""
+    with database.engine.transaction():
+        database.change_log.prune(now=datetime.utcnow() + database.change_log._retention + timedelta(days=1))
+
+
+def random_workload(database, rng: random.Random, steps: int, check):
+    """Creations, status updates, deletions, authorizations and prunes; `check` every 10 steps."""
+    for step in range(steps):
+        ids = [request.doc_id for request in database.leave_requests.all()]
+        op = rng.random()
+        if op < 0.35 or not ids:
+            create(database, rng, rng.randint(1, 6))
+        elif op < 0.55:
+            database.update_leave_request_status(rng.choice(ids), rng.choice(STATUSES), 'ok')
+        elif op < 0.65:
+            database.update_leave_request_statuses([(rng.choice(ids), rng.choice(STATUSES), None) for _ in range(3)])
+        elif op < 0.8:
+            database.delete_leave_request(rng.choice(ids))
+        elif op < 0.9:
+            request = database.get_leave_request(rng.choice(ids))
+            database.create_communication_auth(request.doc_id, request['employee_id'], request['employee_email'])
+        elif op < 0.97:
+            auths = database.get_all_communication_auths()
+            if auths:
+                database.update_communication_auth_status(rng.choice(auths).doc_id, rng.choice(('approved', 'rejected')))
+        else:
+            prune_change_log(database)
+        if step % 10 == 0:
+            check(database, rng)
+    check(database, rng)
+
+
+def test_random_workload_matches_naive_query(database):
+    rng = random.Random(21)
+    random_workload(database, rng, 400, check_view)
+
+    # Rebuilt from scratch, the view is the same
+    assert database.rebuild_hr_leave_view() == len(naive_hr_visible(database))
+    check_view(database, rng)
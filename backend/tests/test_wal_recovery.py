@@ -0,0 +1,154 @@
+"""Crash recovery of the wal engine: torn log records and interrupted compactions."""
+import os
+import subprocess
+import sys
+import textwrap
+import pytest
+from storage import WALEngine
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def open_wal(path: str, compact_threshold: int = 1 << 30) -> WALEngine:
+    return WALEngine(path, 'always', 2, compact_threshold)
+
+
+def contents(engine: WALEngine, name: str = 'items') -> dict:
+    return {document.doc_id: dict(document) for document in engine.table(name).all()}
+
+
+@pytest.fixture
+def path(tmp_path) -> str:
+    return str(tmp_path / 'db.json')
+
+
+def write_records(path: str) -> list:
+    """One log record per write. Returns the log size after each record."""
+    engine = open_wal(path)
+    table = engine.table('items')
+    sizes = []
+    for i in range(5):
+        table.insert({'i': i})
+        sizes.append(os.path.getsize(engine.log_path))
+    table.update({'i': 10}, [2])
+    sizes.append(os.path.getsize(engine.log_path))
+    table.remove([3])
+    sizes.append(os.path.getsize(engine.log_path))
+    engine.close()
+    return sizes
+
+
+@pytest.mark.parametrize('cut', [1, 9, -1])
+def test_torn_last_record_is_dropped(path, cut):
+    sizes = write_records(path)
+    # Cut the last record (remove 3) in its CRC, in its payload or before its newline
+    end = sizes[-2] + cut if cut > 0 else sizes[-1] + cut
+    with open(path + '.log', 'r+b') as f:
+        f.truncate(end)
+
+    engine = open_wal(path)
+    assert contents(engine) == {1: {'i': 0}, 2: {'i': 10}, 3: {'i': 2}, 4: {'i': 3}, 5: {'i': 4}}
+    # The torn tail is removed so that new records follow a valid one
+    assert os.path.getsize(path + '.log') == sizes[-2]
+    assert engine.table('items').insert({'i': 'new'}) == 6
+    engine.close()
+
+    engine = open_wal(path)
+    assert contents(engine)[6] == {'i': 'new'} and len(contents(engine)) == 6
+    engine.close()
+
+
+def test_corrupt_record_stops_the_replay(path):
+    sizes = write_records(path)
+    with open(path + '.log', 'r+b') as f:
+        f.seek(sizes[1] + 12)
+        byte = f.read(1)
+        f.seek(sizes[1] + 12)
+        f.write(bytes([byte[0] ^ 0x01]))
+
+    # Records after a CRC mismatch cannot be trusted: only the first two remain
+    engine = open_wal(path)
+    assert contents(engine) == {1: {'i': 0}, 2: {'i': 1}}
+    assert os.path.getsize(path + '.log') == sizes[1]
+    engine.close()
+
+
+def test_compaction_keeps_everything(path):
+    engine = open_wal(path, compact_threshold=2000)
+    table = engine.table('items')
+    for i in range(300):
+        table.insert({'i': i, 'blob': b'\x00\xff'})
+    table.remove(range(1, 101))
+    expected = contents(engine)
+    engine.close()
+    assert os.path.getsize(path) > 0
+    assert not os.path.exists(path + '.log.compacting')
+
+    engine = open_wal(path)
+    assert contents(engine) == expected
+    engine.close()
+
+
+# Compaction steps a crash can interrupt, by the call killing the process
+CRASH_POINTS = {
+    # The log was rotated, the snapshot is being written
+    'writing_snapshot': ('json', 'dump'),
+    # The new snapshot is complete but not yet in place
+    'replacing_snapshot': ('os', 'replace'),
+    # The snapshot is in place, the rotated log is not yet removed
+    'removing_rotated_log': ('os', 'remove'),
+}
+
+CRASH_SCRIPT = textwrap.dedent('''
+    import json, os, sys
+    sys.path.insert(0, {backend_dir!r})
+    from storage import WALEngine
+    import storage
+
+    engine = WALEngine({path!r}, 'always', 2, 1 << 30)
+    table = engine.table('items')
+    for i in range(200):
+        table.insert({{'i': i}})
+    table.update({{'i': -1}}, [5])
+    table.remove([7])
+
+    module, name = {crash_point!r}
+    target = storage.json if module == 'json' else storage.os
+    original = getattr(target, name)
+    def crash(*args, **kwargs):
+        if name != 'replace' or args[1] == engine.snapshot_path:
+            if name != 'remove' or args[0] == engine.compacting_path:
+                os._exit(3)
+        return original(*args, **kwargs)
+    setattr(target, name, crash)
+    engine._compact()
+    os._exit(0)
+''')
+
+
+@pytest.mark.parametrize('crash_point', sorted(CRASH_POINTS))
+def test_crash_during_compaction(path, crash_point):
+    # A first compaction, so that a previous snapshot exists
+    engine = open_wal(path)
+    table = engine.table('items')
+    table.insert({'i': 'before'})
+    engine._compact()
+    engine.close()
+
+    script = CRASH_SCRIPT.format(backend_dir=BACKEND_DIR, path=path, crash_point=CRASH_POINTS[crash_point])
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, env=os.environ)
+    assert result.returncode == 3, result.stderr.decode()
+
+    expected = {1: {'i': 'before'}}
+    expected.update({doc_id: {'i': doc_id - 2} for doc_id in range(2, 202)})
+    expected[5] = {'i': -1}
+    del expected[7]
+    engine = open_wal(path)
+    assert contents(engine) == expected
+    assert not os.path.exists(path + '.log.compacting')
+    assert engine.table('items').insert({'i': 'after'}) == 202
+    engine.close()
+
+    engine = open_wal(path)
+    assert len(contents(engine)) == 201
+    engine.close()
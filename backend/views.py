@@ -0,0 +1,141 @@
+"""
+Materialized view of the leave requests HR may see (GET /leave-requests/all).
+
+A leave request is visible to HR unless its communication authorization
+(the oldest one) was rejected by the admin. Instead of joining every leave
+request with its authorization on each read, the `hr_leave_requests` table
+keeps one row {leave_request_id, status} per visible request, indexed by
+status, so that "all pending requests" costs the size of the result.
+
+Database refreshes the row of a leave request in the same transaction as
+every write that can change its visibility or status, so the view is as
+durable and as shared between workers as the tables it is derived from.
+rebuild() recomputes it from scratch and verify() compares it with the
+naive query.
+"""
+from typing import Dict, Iterable, List, Optional, Set
+from tinydb.table import Document
+from storage import StorageTable, StorageEngine
+
+
+def is_hr_visible(auth: Optional[dict]) -> bool:
+    """Naive rule: hidden once the admin rejected the communication authorization."""
+    return not (auth and auth['status'] == 'rejected')
+
+
+class HRLeaveRequestView:
+    """HR-visible leave requests, keyed by status."""
+
+    def __init__(self, engine: StorageEngine, view: StorageTable,
+                 leave_requests: StorageTable, communication_auth: StorageTable):
+        self._engine = engine
+        self._view = view
+        self._leave_requests = leave_requests
+        self._communication_auth = communication_auth
+
+    def refresh(self, leave_request_id: int):
+        """Bring the row of one leave request up to date. Call it in the transaction of the write."""
+        with self._engine.transaction():
+            request = self._leave_requests.get(leave_request_id)
+            rows = self._view.find(leave_request_id=leave_request_id)
+            visible = request is not None and is_hr_visible(
+                self._communication_auth.find_one(leave_request_id=leave_request_id)
+            )
+            if not visible:
+                self._view.remove([row.doc_id for row in rows])
+            elif not rows:
+                self._view.insert({'leave_request_id': leave_request_id, 'status': request['status']})
+            elif rows[0]['status'] != request['status']:
+                self._view.update({'status': request['status']}, [rows[0].doc_id])
+
+    def refresh_many(self, leave_request_ids: Iterable[int], requests: Optional[Dict[int, dict]] = None):
+        """
+        refresh() for many leave requests: one read per table, and one
+        update per new status instead of one per row. `requests` are the
+        current documents if the caller already has them.
+        """
+        leave_request_ids = list(leave_request_ids)
+        if not leave_request_ids:
+            return
+        with self._engine.transaction():
+            if requests is None:
+                requests = self._leave_requests.get_many(leave_request_ids)
+            rows: Dict[int, List[Document]] = {}
+            for row in self._view.find_in('leave_request_id', leave_request_ids):
+                rows.setdefault(row['leave_request_id'], []).append(row)
+            auths: Dict[int, Document] = {}
+            for auth in self._communication_auth.find_in('leave_request_id', leave_request_ids):
+                # By increasing ID: keep the oldest, as find_one() does
+                auths.setdefault(auth['leave_request_id'], auth)
+
+            added, removed, updated = [], [], {}
+            for leave_request_id in dict.fromkeys(leave_request_ids):
+                request = requests.get(leave_request_id)
+                current = rows.get(leave_request_id, [])
+                if request is None or not is_hr_visible(auths.get(leave_request_id)):
+                    removed.extend(row.doc_id for row in current)
+                elif not current:
+                    added.append({'leave_request_id': leave_request_id, 'status': request['status']})
+                elif current[0]['status'] != request['status']:
+                    updated.setdefault(request['status'], []).append(current[0].doc_id)
+            self._view.insert_many(added)
+            self._view.remove(removed)
+            for status, doc_ids in updated.items():
+                self._view.update({'status': status}, doc_ids)
+
+    def read(self, status: Optional[str] = None) -> List[Document]:
+        """Visible leave requests (only those with `status` if given), by increasing ID."""
+        with self._engine.snapshot():
+            rows = self._view.find(status=status) if status is not None else self._view.all()
+            requests = self._leave_requests.get_many(row['leave_request_id'] for row in rows)
+        return [requests[request_id] for request_id in sorted(requests)]
+
+    def visible_ids(self, leave_request_ids: Iterable[int], status: Optional[str] = None) -> Set[int]:
+        """The given leave requests that are visible (and have `status` if given)."""
+        return {
+            row['leave_request_id'] for row in self._view.find_in('leave_request_id', leave_request_ids)
+            if status is None or row['status'] == status
+        }
+
+    def _expected(self) -> Dict[int, str]:
+        """The naive query: {leave_request_id: status} of the visible requests."""
+        auths = {}
+        for auth in self._communication_auth.all():
+            auths.setdefault(auth['leave_request_id'], auth)
+        return {
+            request.doc_id: request['status'] for request in self._leave_requests.all()
+            if is_hr_visible(auths.get(request.doc_id))
+        }
+
+    def rebuild(self) -> int:
+        """Recompute the view from the tables. Returns the number of visible requests."""
+        with self._engine.transaction():
+            expected = self._expected()
+            self._view.truncate()
+            self._view.insert_many(
+                {'leave_request_id': leave_request_id, 'status': expected[leave_request_id]}
+                for leave_request_id in sorted(expected)
+            )
+        return len(expected)
+
+    def verify(self) -> List[str]:
+        """Compare the view with the naive query. Returns the mismatches."""
+        with self._engine.snapshot():
+            expected = self._expected()
+            rows = self._view.all()
+        problems = []
+        actual = {}
+        for row in rows:
+            if row['leave_request_id'] in actual:
+                problems.append(f"hr_leave_requests: duplicate row for request {row['leave_request_id']}")
+            actual[row['leave_request_id']] = row['status']
+        for leave_request_id in sorted(expected.keys() | actual.keys()):
+            if expected.get(leave_request_id) != actual.get(leave_request_id):
+                problems.append(
+                    f"hr_leave_requests: request {leave_request_id} "
+                    f"viewed as {actual.get(leave_request_id)}, expected {expected.get(leave_request_id)}"
+                )
+        return problems
+
+    def __len__(self) -> int:
+        return len(self._view)
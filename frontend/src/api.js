@@ -38,8 +38,9 @@ export const getCurrentUser = () =>
 export const getDHParams = () => 
   api.get('/handshake/params');
 
-export const exchangeDHKeys = (public_key) => 
-  api.post('/handshake/exchange', { public_key });
+// group: "modp1536" (default) or "x25519", see getDHParams().data.groups
+export const exchangeDHKeys = (public_key, group = 'modp1536') => 
+  api.post('/handshake/exchange', { public_key, group });
 
 // Messaging endpoints
 export const submitLeaveRequest = (encrypted_content, iv) => 
@@ -140,4 +141,34 @@ export const revokeDelegation = (delegation_id) =>
 export const listUsers = () =>
   api.get('/users/list');
 
+// ================================================================
+// Server push (GET /events, Server-Sent Events)
+// ================================================================
+const EVENT_TYPES = [
+  'leave_request.created', 'leave_request.status',
+  'communication_auth.created', 'communication_auth.status',
+  'message.received', 'resync',
+];
+
+// Calls onEvent(type, data) for every event visible to the user. 'resync'
+// means "refetch everything" (events were missed). Returns the unsubscribe function.
+export const subscribeEvents = (onEvent) => {
+  const token = localStorage.getItem('token');
+  if (!token || typeof EventSource === 'undefined') return () => {};
+
+  const source = new EventSource(`${API_BASE_URL}/events?token=${encodeURIComponent(token)}`);
+  let connected = false;
+  source.addEventListener('ready', () => {
+    // After a reconnection, events may have been missed meanwhile
+    if (connected) onEvent('resync', {});
+    connected = true;
+  });
+  EVENT_TYPES.forEach((type) =>
+    source.addEventListener(type, (event) => onEvent(type, JSON.parse(event.data)))
+  );
+  // Token expired: the stream ends, do not reconnect with it
+  source.addEventListener('expired', () => source.close());
+  return () => source.close();
+};
+
 export default api;
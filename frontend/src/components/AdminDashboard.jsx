@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { createUser, getAllMessages, getPendingCommunicationAuths, getAllCommunicationAuths, updateCommunicationAuth } from '../api';
+import { createUser, getAllMessages, getPendingCommunicationAuths, getAllCommunicationAuths, updateCommunicationAuth, subscribeEvents } from '../api';
 import DACFeatures from './DACFeatures';
 
 const AdminDashboard = ({ user, onLogout }) => {
@@ -21,6 +21,16 @@ const AdminDashboard = ({ user, onLogout }) => {
     fetchPendingAuths();
     fetchAllAuths();
     fetchAllMessages();
+    // Autorisations en attente et messages poussés par le serveur
+    return subscribeEvents((type) => {
+      if (type.startsWith('communication_auth.') || type === 'resync') {
+        fetchPendingAuths();
+        fetchAllAuths();
+      }
+      if (type === 'message.received' || type === 'resync') {
+        fetchAllMessages();
+      }
+    });
   }, []);
 
   const fetchPendingAuths = async () => {
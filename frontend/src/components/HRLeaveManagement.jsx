@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { getAllLeaveRequests, updateLeaveRequestStatus } from '../api';
+import { getAllLeaveRequests, updateLeaveRequestStatus, subscribeEvents } from '../api';
 
 const HRLeaveManagement = ({ isDelegated = false, canApprove = true }) => {
   const [requests, setRequests] = useState([]);
@@ -12,6 +12,12 @@ const HRLeaveManagement = ({ isDelegated = false, canApprove = true }) => {
 
   useEffect(() => {
     fetchAllRequests();
+    // Nouvelles demandes et changements de statut poussés par le serveur
+    return subscribeEvents((type) => {
+      if (type.startsWith('leave_request.') || type === 'resync') {
+        fetchAllRequests();
+      }
+    });
   }, []);
 
   const fetchAllRequests = async () => {
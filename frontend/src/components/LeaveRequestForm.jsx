@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { createLeaveRequest, getMyLeaveRequests, deleteLeaveRequest } from '../api';
+import { createLeaveRequest, getMyLeaveRequests, deleteLeaveRequest, subscribeEvents } from '../api';
 
 const LeaveRequestForm = () => {
   const [formData, setFormData] = useState({
@@ -16,6 +16,12 @@ const LeaveRequestForm = () => {
 
   useEffect(() => {
     fetchMyRequests();
+    // Statut mis à jour par le serveur (RH, admin) sans recharger la page
+    return subscribeEvents((type) => {
+      if (type.startsWith('leave_request.') || type === 'resync') {
+        fetchMyRequests();
+      }
+    });
   }, []);
 
   const fetchMyRequests = async () => {
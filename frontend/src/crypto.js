@@ -84,50 +84,110 @@ export const deriveAESKey = async (sharedSecret) => {
   return crypto.subtle.importKey(
     'raw',
     hashBuffer,
-    { name: 'AES-CBC' },
+    { name: 'AES-GCM' },
+    false,
+    ['encrypt', 'decrypt']
+  );
+};
+
+// X25519 key agreement: used when /handshake/params lists "x25519" in `groups`
+// (much cheaper than modPow). Must match X25519_HKDF_INFO in backend/security.py
+export const X25519_HKDF_INFO = 'hr-system handshake x25519 aes-256';
+
+const bytesToHex = (bytes) =>
+  Array.from(bytes).map(b => b.toString(16).padStart(2, '0')).join('');
+
+const hexToBytes = (hex) => {
+  const clean = hex.startsWith('0x') ? hex.slice(2) : hex;
+  return Uint8Array.from(clean.match(/../g), byte => parseInt(byte, 16));
+};
+
+export const generateX25519KeyPair = () =>
+  crypto.subtle.generateKey({ name: 'X25519' }, false, ['deriveBits']);
+
+// Hex public key to send to /handshake/exchange with group "x25519"
+export const exportX25519PublicKey = async (publicKey) =>
+  bytesToHex(new Uint8Array(await crypto.subtle.exportKey('raw', publicKey)));
+
+// AES key from our private key and the server's public key (HKDF-SHA256)
+export const deriveX25519AESKey = async (privateKey, serverPublicKeyHex) => {
+  const serverPublicKey = await crypto.subtle.importKey(
+    'raw',
+    hexToBytes(serverPublicKeyHex),
+    { name: 'X25519' },
+    false,
+    []
+  );
+  const sharedSecret = await crypto.subtle.deriveBits(
+    { name: 'X25519', public: serverPublicKey },
+    privateKey,
+    256
+  );
+  const hkdfKey = await crypto.subtle.importKey('raw', sharedSecret, 'HKDF', false, ['deriveKey']);
+  return crypto.subtle.deriveKey(
+    {
+      name: 'HKDF',
+      hash: 'SHA-256',
+      salt: new Uint8Array(32),
+      info: new TextEncoder().encode(X25519_HKDF_INFO)
+    },
+    hkdfKey,
+    { name: 'AES-GCM', length: 256 },
     false,
     ['encrypt', 'decrypt']
   );
 };
 
 // AES Encryption
+// Versioned message format, must match backend/security.py:
+//   0x02 || nonce (12 bytes) || AES-256-GCM ciphertext || tag, version byte as AAD.
+// The blob is sent as `encrypted_content` with an empty `iv`.
+export const MESSAGE_FORMAT_GCM = 0x02;
+const GCM_NONCE_SIZE = 12;
+
+const bytesToBase64 = (bytes) => {
+  let binary = '';
+  for (let i = 0; i < bytes.length; i += 0x8000) {
+    binary += String.fromCharCode(...bytes.subarray(i, i + 0x8000));
+  }
+  return btoa(binary);
+};
+
 export const aesEncrypt = async (plaintext, aesKey) => {
-  // Generate random IV
-  const iv = crypto.getRandomValues(new Uint8Array(16));
-  
-  // Convert plaintext to bytes
-  const encoder = new TextEncoder();
-  const plaintextBytes = encoder.encode(plaintext);
-  
-  // Encrypt
+  const header = new Uint8Array([MESSAGE_FORMAT_GCM]);
+  const nonce = crypto.getRandomValues(new Uint8Array(GCM_NONCE_SIZE));
+
   const encryptedBuffer = await crypto.subtle.encrypt(
-    { name: 'AES-CBC', iv },
+    { name: 'AES-GCM', iv: nonce, additionalData: header },
     aesKey,
-    plaintextBytes
+    new TextEncoder().encode(plaintext)
   );
-  
-  // Convert to base64
-  const encryptedArray = new Uint8Array(encryptedBuffer);
-  const encryptedBase64 = btoa(String.fromCharCode(...encryptedArray));
-  const ivBase64 = btoa(String.fromCharCode(...iv));
-  
-  return { encrypted: encryptedBase64, iv: ivBase64 };
+
+  const blob = new Uint8Array(1 + GCM_NONCE_SIZE + encryptedBuffer.byteLength);
+  blob.set(header, 0);
+  blob.set(nonce, 1);
+  blob.set(new Uint8Array(encryptedBuffer), 1 + GCM_NONCE_SIZE);
+
+  return { encrypted: bytesToBase64(blob), iv: '' };
 };
 
-// AES Decryption
+// AES Decryption (versioned blobs only: legacy AES-CBC messages are
+// decrypted by the backend)
 export const aesDecrypt = async (encryptedBase64, ivBase64, aesKey) => {
-  // Convert from base64
-  const encryptedBytes = Uint8Array.from(atob(encryptedBase64), c => c.charCodeAt(0));
-  const iv = Uint8Array.from(atob(ivBase64), c => c.charCodeAt(0));
-  
-  // Decrypt
+  if (ivBase64) {
+    throw new Error('Legacy AES-CBC message: not supported by this client');
+  }
+  const blob = Uint8Array.from(atob(encryptedBase64), c => c.charCodeAt(0));
+  if (blob[0] !== MESSAGE_FORMAT_GCM) {
+    throw new Error(`Unknown message format version: ${blob[0]}`);
+  }
+
+  // Rejects (OperationError) on a wrong key or tampered message
   const decryptedBuffer = await crypto.subtle.decrypt(
-    { name: 'AES-CBC', iv },
+    { name: 'AES-GCM', iv: blob.subarray(1, 1 + GCM_NONCE_SIZE), additionalData: blob.subarray(0, 1) },
     aesKey,
-    encryptedBytes
+    blob.subarray(1 + GCM_NONCE_SIZE)
   );
-  
-  // Convert to string
-  const decoder = new TextDecoder();
-  return decoder.decode(decryptedBuffer);
+
+  return new TextDecoder().decode(decryptedBuffer);
 };